@@ -61,6 +61,10 @@ import six.moves.http_client as httplib
 import socket
 import sys
 import threading
+import time
+
+from metrics import CALLS, XAPI_CALL_SECONDS
+
 translation = gettext.translation('xen-xm', fallback = True)
 
 API_VERSION_1_1 = '1.1'
@@ -155,21 +159,26 @@ class Session(xmlrpclib.ServerProxy):
                 self._logout()
                 return None
             else:
-                retry_count = 0
-                while retry_count < 3:
-                    full_params = (self._session,) + params
-                    result = _parse_result(getattr(self, methodname)(*full_params))
-                    if result is _RECONNECT_AND_RETRY:
-                        retry_count += 1
-                        if self.last_login_method:
-                            self._login(self.last_login_method,
-                                        self.last_login_params)
+                start = time.perf_counter()
+                CALLS.xapi += 1
+                try:
+                    retry_count = 0
+                    while retry_count < 3:
+                        full_params = (self._session,) + params
+                        result = _parse_result(getattr(self, methodname)(*full_params))
+                        if result is _RECONNECT_AND_RETRY:
+                            retry_count += 1
+                            if self.last_login_method:
+                                self._login(self.last_login_method,
+                                            self.last_login_params)
+                            else:
+                                raise xmlrpclib.Fault(401, 'You must log in')
                         else:
-                            raise xmlrpclib.Fault(401, 'You must log in')
-                    else:
-                        return result
-                raise xmlrpclib.Fault(
-                    500, 'Tried 3 times to get a valid session, but failed')
+                            return result
+                    raise xmlrpclib.Fault(
+                        500, 'Tried 3 times to get a valid session, but failed')
+                finally:
+                    XAPI_CALL_SECONDS.labels(methodname).observe(time.perf_counter() - start)
 
 
 
@@ -0,0 +1,145 @@
+'''
+Benchmark of VNC console proxy (handlers/rest/consoleproxy.py) against a local fake RFB server.
+
+The fake server answers CONNECT with 200 OK, sends RFB version and then streams framebuffer-like data in
+chunks of --chunk bytes. A WebSocket client reads everything through the proxy and counts frames.
+Run from backend directory:
+
+    python -m benchmarks.console_proxy --megabytes 64
+    python -m benchmarks.console_proxy --min-read 1024 --max-read 1024  # fixed 1 KiB reads, like the old proxy
+
+Results are printed as JSON
+'''
+import argparse
+import asyncio
+import base64
+import json
+import time
+
+import tornado.ioloop
+import tornado.web
+import tornado.websocket
+
+from handlers.rest.consoleproxy import ConsoleProxy, open_upstream, MIN_READ_SIZE, MAX_READ_SIZE
+
+RFB_VERSION = b'RFB 003.008\n'
+
+
+async def start_fake_rfb_server(total_bytes, chunk):
+    async def handle(reader, writer):
+        await reader.readuntil(b'\r\n\r\n')
+        writer.write(b'HTTP/1.1 200 OK\r\n\r\n' + RFB_VERSION)
+        payload = b'\xaa' * chunk
+        sent = 0
+        while sent < total_bytes:
+            writer.write(payload)
+            sent += chunk
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+class BenchmarkConsoleHandler(tornado.websocket.WebSocketHandler):
+    def initialize(self, upstream_url, settings, results):
+        self.upstream_url = upstream_url
+        self.settings_ = settings
+        self.results = results
+        self.proxy = None
+
+    def get_compression_options(self):
+        return {} if self.settings_['compression'] else None
+
+    async def open(self):
+        reader, writer = await open_upstream(self.upstream_url, base64.encodebytes(b'root:password'), 'localhost')
+        self.proxy = ConsoleProxy(reader, writer, lambda data: self.write_message(data, binary=True),
+                                  min_read_size=self.settings_['min_read'], max_read_size=self.settings_['max_read'],
+                                  coalesce_delay=self.settings_['coalesce_delay'])
+        tornado.ioloop.IOLoop.current().spawn_callback(self.server_reading)
+
+    async def server_reading(self):
+        try:
+            await self.proxy.server_to_client()
+        finally:
+            self.close()
+
+    async def on_message(self, message):
+        await self.proxy.client_to_server(message)
+
+    def on_close(self):
+        if self.proxy:
+            self.proxy.close()
+            self.results['stats'] = self.proxy.stats.as_dict()
+
+
+async def run(args):
+    total_bytes = args.megabytes * 1024 * 1024
+    rfb_server, rfb_port = await start_fake_rfb_server(total_bytes, args.chunk)
+    settings = {
+        'compression': args.compression,
+        'min_read': args.min_read,
+        'max_read': args.max_read,
+        'coalesce_delay': args.coalesce_delay,
+    }
+    results = {}
+    app = tornado.web.Application([
+        (r'/console', BenchmarkConsoleHandler, dict(upstream_url=f'http://127.0.0.1:{rfb_port}/console?ref=OpaqueRef:bench',
+                                                    settings=settings, results=results)),
+    ])
+    http_server = app.listen(0, address='127.0.0.1')
+    proxy_port = list(http_server._sockets.values())[0].getsockname()[1]
+
+    start = time.monotonic()
+    client = await tornado.websocket.websocket_connect(f'ws://127.0.0.1:{proxy_port}/console',
+                                                       compression_options={} if args.compression else None)
+    received = 0
+    messages = 0
+    first_message_latency = None
+    while True:
+        message = await client.read_message()
+        if message is None:
+            break
+        if first_message_latency is None:
+            first_message_latency = time.monotonic() - start
+        if args.slow_client:
+            await asyncio.sleep(args.slow_client)
+        received += len(message)
+        messages += 1
+    elapsed = time.monotonic() - start
+
+    http_server.stop()
+    rfb_server.close()
+    await asyncio.sleep(0.1) # let on_close run
+
+    return {
+        'settings': settings,
+        'megabytes': args.megabytes,
+        'chunk': args.chunk,
+        'received_bytes': received,
+        'messages': messages,
+        'average_message_size': received / messages if messages else 0,
+        'elapsed': elapsed,
+        'throughput_mib_s': received / elapsed / 1024 / 1024,
+        'first_message_latency': first_message_latency,
+        'proxy_stats': results.get('stats'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--megabytes', type=int, default=64, help="Amount of data sent by fake RFB server")
+    parser.add_argument('--chunk', type=int, default=1460, help="Size of fake RFB server writes")
+    parser.add_argument('--min-read', type=int, default=MIN_READ_SIZE)
+    parser.add_argument('--max-read', type=int, default=MAX_READ_SIZE)
+    parser.add_argument('--coalesce-delay', type=float, default=0.0, help="Seconds to wait for more data after a short read")
+    parser.add_argument('--compression', action='store_true', help="Enable permessage-deflate")
+    parser.add_argument('--slow-client', type=float, default=0.0, help="Seconds to sleep after every received message")
+    args = parser.parse_args()
+
+    result = tornado.ioloop.IOLoop.current().run_sync(lambda: run(args))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,397 @@
+'''
+Benchmark of Xen event ingestion: EventLoop.process_xen_events -> EventQueue -> XenObject.process_event -> RethinkDB.
+
+The real event loop reads events from the XAPI simulator (xentools/xapisim.py) over XML-RPC and writes them to
+a local RethinkDB (the benchmark database is recreated, --database must not be a production one).
+Changes are applied to the simulator in batches of --batch changes of --mix kinds, or replayed from a file of
+event.from batches recorded from a real XenServer with --record.
+Run from backend directory:
+
+    python -m benchmarks.event_ingestion --vms 1000 --batches 50 --batch 200 --mix vm_metrics=5,vm_power=1
+    python -m benchmarks.event_ingestion --record events.jsonl --xen-url https://xenserver --xen-username root --xen-password ... --duration 600
+    python -m benchmarks.event_ingestion --replay events.jsonl
+
+Reported: events per second, per-class latency from EventQueue.put to processing end and processing time
+percentiles, RethinkDB queries and writes per event, and time to consistency: time from a VM change in XAPI
+until the change is readable from RethinkDB. Results are printed as JSON and saved with --output
+'''
+import argparse
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List
+from unittest.mock import patch
+from xmlrpc.client import DateTime
+
+from benchmarks.stats import summarize, write_results
+from xentools.xapisim import DEFAULT_MIX, LoadGenerator, XAPIServer, XAPISimulator, parse_mix, populate
+
+WRITE_STATEMENTS = ('insert', 'update', 'delete', 'replace')
+
+
+def encode_value(value):
+    if isinstance(value, DateTime):
+        return {'__datetime__': value.value}
+    raise TypeError(f"Can't encode {value!r}")
+
+
+def decode_value(obj):
+    if '__datetime__' in obj and len(obj) == 1:
+        return DateTime(obj['__datetime__'])
+    return obj
+
+
+def load_batches(file_name) -> List[List[dict]]:
+    '''
+    Read event.from batches (one JSON object with events per line) written by record
+    '''
+    with open(file_name) as file:
+        return [json.loads(line, object_hook=decode_value)['events'] for line in file if line.strip()]
+
+
+def record(url, username, password, duration, file_name):
+    '''
+    Save event.from batches of a XenServer for replaying: the first one contains all objects
+    '''
+    import XenAPI
+    session = XenAPI.Session(url, ignore_ssl=True)
+    session.xenapi.login_with_password(username, password)
+    token = ''
+    batches = events = 0
+    deadline = time.monotonic() + duration
+    try:
+        with open(file_name, 'w') as file:
+            while not batches or time.monotonic() < deadline:
+                result = session.xenapi.event_from(['*'], token, 1.0)
+                token = result['token']
+                if result['events']:
+                    file.write(json.dumps({'events': result['events']}, default=encode_value) + '\n')
+                    batches += 1
+                    events += len(result['events'])
+    finally:
+        session.xenapi.session.logout()
+    return {'batches': batches, 'events': events, 'file': file_name}
+
+
+class IngestionStats:
+    '''
+    Collects per-class latencies and RethinkDB queries made while processing events
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.events = defaultdict(int)
+            self.latency = defaultdict(list)
+            self.processing = defaultdict(list)
+            self.queries = defaultdict(int)
+            self.writes = defaultdict(int)
+            self.started = time.monotonic()
+
+    def on_query(self, term):
+        event_class = getattr(self.local, 'event_class', None)
+        if event_class is None:
+            return
+        with self.lock:
+            self.queries[event_class] += 1
+            if getattr(term, 'statement', None) in WRITE_STATEMENTS:
+                self.writes[event_class] += 1
+
+    def on_processed(self, event_class, enqueued, dequeued):
+        finished = time.monotonic()
+        with self.lock:
+            self.events[event_class] += 1
+            self.latency[event_class].append(finished - enqueued)
+            self.processing[event_class].append(finished - dequeued)
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            total = sum(self.events.values())
+            return {
+                'events': total,
+                'seconds': elapsed,
+                'events_per_second': total / elapsed if elapsed else 0,
+                'db_queries_per_event': sum(self.queries.values()) / total if total else 0,
+                'db_writes_per_event': sum(self.writes.values()) / total if total else 0,
+                'classes': {
+                    event_class: {
+                        'events': count,
+                        'latency_ms': summarize(self.latency[event_class]),
+                        'processing_ms': summarize(self.processing[event_class]),
+                        'db_queries_per_event': self.queries[event_class] / count,
+                        'db_writes_per_event': self.writes[event_class] / count,
+                    } for event_class, count in sorted(self.events.items())
+                },
+            }
+
+
+def instrumented_queue(stats : IngestionStats, num_workers : int):
+    '''
+    EventQueue that reports to stats. Every event is taken by a worker with get() and finished with task_done()
+    in the same thread, see EventQueue.process_events
+    '''
+    from xenadapter.event_queue import EventQueue
+
+    class InstrumentedEventQueue(EventQueue):
+        def put(self, item, block=True, timeout=None):
+            item['_enqueued'] = time.monotonic()
+            super().put(item, block, timeout)
+
+        def get(self, block=True, timeout=None):
+            item = super().get(block, timeout)
+            stats.local.event = item
+            stats.local.event_class = item['class']
+            stats.local.dequeued = time.monotonic()
+            return item
+
+        def task_done(self):
+            event = stats.local.event
+            stats.local.event_class = None
+            stats.on_processed(event['class'], event['_enqueued'], stats.local.dequeued)
+            super().task_done()
+
+    return InstrumentedEventQueue(num_workers=num_workers)
+
+
+@contextmanager
+def count_queries(stats : IngestionStats):
+    from rethinkdb.net import Connection
+    original = Connection._start
+
+    def _start(self, term, **global_optargs):
+        stats.on_query(term)
+        return original(self, term, **global_optargs)
+
+    with patch.object(Connection, '_start', _start):
+        yield
+
+
+class ConsistencyProbes:
+    '''
+    Measures time from a change of VM name_label in XAPI until it's read from RethinkDB
+    '''
+    def __init__(self, poll_interval=0.002, timeout=30.0):
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.pending : Dict[str, tuple] = {} # ref -> (name_label, time of change)
+        self.times : List[float] = []
+        self.timeouts = 0
+        self.superseded = 0 # Probes overwritten by a newer probe of the same VM before they were seen
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='consistency-probes', daemon=True)
+
+    def add(self, ref, name_label):
+        with self._lock:
+            if ref in self.pending:
+                self.superseded += 1
+            self.pending[ref] = (name_label, time.monotonic())
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        deadline = time.monotonic() + self.timeout
+        while self.pending and time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+        self._stop.set()
+        self._thread.join()
+        self.timeouts += len(self.pending)
+
+    def _run(self):
+        from connman import ReDBConnection
+        import constants.re as re
+        with ReDBConnection().get_connection():
+            while not self._stop.is_set():
+                with self._lock:
+                    refs = list(self.pending)
+                if refs:
+                    rows = re.db.table('vms').get_all(*refs).pluck('ref', 'name_label').coerce_to('array').run()
+                    now = time.monotonic()
+                    with self._lock:
+                        for row in rows:
+                            probe = self.pending.get(row['ref'])
+                            if probe and probe[0] == row['name_label']:
+                                self.times.append(now - probe[1])
+                                del self.pending[row['ref']]
+                            elif probe and now - probe[1] > self.timeout:
+                                self.timeouts += 1
+                                del self.pending[row['ref']]
+                self._stop.wait(self.poll_interval)
+
+    def as_dict(self) -> dict:
+        return {'probes': len(self.times) + self.timeouts + self.superseded, 'timeouts': self.timeouts,
+                'superseded': self.superseded, 'ms': summarize(self.times)}
+
+
+def set_option(name, value, group):
+    from tornado.options import define, options as opts
+    if name in opts:
+        setattr(opts, name, value)
+    else:
+        define(name, group=group, default=value, type=type(value))
+
+
+def configure(args, url):
+    from connman import ReDBConnection
+    set_option('debug', False, 'debug')
+    set_option('url', url, 'xenadapter')
+    set_option('username', 'root', 'xenadapter')
+    set_option('password', 'benchmark', 'xenadapter')
+    set_option('database', args.database, 'rethinkdb')
+    set_option('host', args.db_host, 'rethinkdb')
+    set_option('port', args.db_port, 'rethinkdb')
+    set_option('log_events', args.log_events, 'ioloop')
+    set_option('log_file_name', args.log_file, 'log')
+    ReDBConnection().set_options(args.db_host, args.db_port)
+
+    from createdbs import create_dbs
+    create_dbs()
+
+
+def wait_drained(simulator : XAPISimulator, queue, timeout=60.0):
+    '''
+    Wait until every event emitted so far has been read by the event loop and processed
+    '''
+    deadline = time.monotonic() + timeout
+    with simulator._lock:
+        token = simulator._event_id
+    while simulator.served_token < token:
+        if time.monotonic() > deadline:
+            raise TimeoutError("Event loop doesn't read events")
+        time.sleep(0.001)
+    # Events returned by event.from are put into queue before the next call
+    calls = simulator.event_from_calls
+    while simulator.event_from_calls <= calls:
+        if time.monotonic() > deadline:
+            raise TimeoutError("Event loop doesn't read events")
+        time.sleep(0.001)
+    queue.join()
+
+
+def run(args) -> dict:
+    import constants
+    import eventloop
+
+    simulator = XAPISimulator(task_duration=args.task_duration)
+    server = XAPIServer(simulator)
+    server.start()
+    configure(args, server.url)
+
+    rng = random.Random(args.seed)
+    if args.replay:
+        initial, *batches = load_batches(args.replay)
+        for event in initial:
+            simulator.apply_event(event)
+    else:
+        populate(simulator, hosts=args.hosts, srs=args.srs, networks=args.networks, templates=args.templates,
+                 vms=args.vms, disks_per_vm=args.disks_per_vm, running=args.running, seed=args.seed)
+        batches = None
+    generator = LoadGenerator(simulator, rate=1, mix=parse_mix(args.mix) or DEFAULT_MIX, seed=args.seed)
+
+    stats = IngestionStats()
+    queues = []
+
+    def make_queue():
+        queues.append(instrumented_queue(stats, args.workers))
+        return queues[-1]
+
+    result = {'settings': vars(args)}
+    with count_queries(stats), patch.object(eventloop, 'EventQueue', make_queue):
+        loop = eventloop.EventLoop(None, None)
+        constants.need_exit.clear()
+        constants.xen_events_run.set()
+        constants.first_batch_of_events.clear()
+        thread = threading.Thread(target=loop.process_xen_events, name='process_xen_events', daemon=True)
+        thread.start()
+        if not constants.first_batch_of_events.wait(args.timeout):
+            raise TimeoutError("Initial batch of events hasn't been processed")
+        result['initial_load'] = stats.as_dict()
+
+        probes = ConsistencyProbes(timeout=args.timeout)
+        probes.start()
+        stats.reset()
+        changes = 0
+        count = len(batches) if batches is not None else args.batches
+        for number in range(count):
+            with simulator._lock: # Changes of a batch are read by one event.from call
+                if batches is not None:
+                    for event in batches[number]:
+                        simulator.apply_event(event)
+                    changes += len(batches[number])
+                else:
+                    for _ in range(args.batch):
+                        generator.step()
+                    changes += args.batch
+                vms = [ref for ref, vm in simulator.objects['VM'].items() if not vm['is_a_template']]
+                if args.probes and vms and not number % args.probes:
+                    vm = rng.choice(vms)
+                    name_label = f'probe {number}'
+                    simulator.modify('VM', vm, name_label=name_label)
+                    probes.add(vm, name_label)
+            if args.interval:
+                time.sleep(args.interval)
+
+        wait_drained(simulator, queues[-1], args.timeout)
+        result['load'] = {**stats.as_dict(), 'batches': count, 'changes': changes}
+        probes.stop()
+        result['time_to_consistency'] = probes.as_dict()
+
+        constants.need_exit.set()
+        thread.join(args.timeout)
+
+    server.shutdown()
+    server.server_close()
+    result['xapi_calls'] = simulator.calls
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hosts', type=int, default=4)
+    parser.add_argument('--srs', type=int, default=2)
+    parser.add_argument('--networks', type=int, default=2)
+    parser.add_argument('--templates', type=int, default=10)
+    parser.add_argument('--vms', type=int, default=500)
+    parser.add_argument('--disks-per-vm', type=int, default=1)
+    parser.add_argument('--running', type=float, default=0.5, help="Fraction of running VMs")
+    parser.add_argument('--batches', type=int, default=20, help="Number of batches of changes")
+    parser.add_argument('--batch', type=int, default=100, help="Changes in a batch")
+    parser.add_argument('--interval', type=float, default=0.0, help="Seconds between batches")
+    parser.add_argument('--mix', default='', help="Weights of kinds of changes, e.g. vm_metrics=5,vm_power=1")
+    parser.add_argument('--probes', type=int, default=1, help="Make a consistency probe every N batches, 0 - none")
+    parser.add_argument('--task-duration', type=float, default=0.0, help="Seconds an Async task (VM power change) stays pending")
+    parser.add_argument('--workers', type=int, default=2, help="EventQueue workers")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--replay', help="Replay event.from batches from file instead of generating changes")
+    parser.add_argument('--record', help="Record event.from batches of a XenServer to file and exit")
+    parser.add_argument('--xen-url')
+    parser.add_argument('--xen-username', default='root')
+    parser.add_argument('--xen-password')
+    parser.add_argument('--duration', type=float, default=60.0, help="Seconds to record")
+    parser.add_argument('--database', default='vmemperor_benchmark', help="RethinkDB database, it's recreated")
+    parser.add_argument('--db-host', default='localhost')
+    parser.add_argument('--db-port', type=int, default=28015)
+    parser.add_argument('--log-events', default='none', help="log_events option: comma-separated classes of events to log")
+    parser.add_argument('--log-file', default='event_ingestion.log')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--output', help="Save results as JSON")
+    args = parser.parse_args()
+
+    if args.record:
+        if not args.xen_url:
+            parser.error("--record requires --xen-url")
+        write_results(record(args.xen_url, args.xen_username, args.xen_password, args.duration, args.record))
+        return
+    write_results(run(args), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,458 @@
+'''
+Benchmark of GraphQL API latency: /graphql queries and /subscriptions (graphql-ws) served by vmemperor.make_app.
+
+The real application is started on a random port together with the event loop and the access monitor. They read
+a synthetic pool from the XAPI simulator (xentools/xapisim.py) into a local RethinkDB (the benchmark database is recreated,
+--database must not be a production one). VMs are shared among --users ACL-restricted users, every VM and its disks
+belong to one of them, and --tasks VM power tasks are run before measurements so that there is something to list.
+Requests are made as admin (logged in with /adminauth) and as restricted users (--admin-share of them as admin).
+Run from backend directory:
+
+    python -m benchmarks.graphql_latency --vms 5000 --users 50 --requests 2000 --concurrency 32 --subscribers 500
+    python -m benchmarks.graphql_latency --operations vm=8,vms=1,tasks=1 --page 50
+
+Reported: per operation and role latency percentiles, errors and throughput of --requests queries made by
+--concurrency clients, RethinkDB queries per operation (measured by running each operation alone), and update
+delivery lag of subscriptions: time from a VM change in XAPI until it's received by every subscriber that can see the VM.
+Results are printed as JSON and saved with --output
+'''
+import argparse
+import asyncio
+import json
+import pickle
+import random
+import threading
+import time
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from typing import Dict, List, Mapping, NamedTuple
+from unittest.mock import patch
+
+from benchmarks.event_ingestion import configure, count_queries, set_option, wait_drained
+from benchmarks.stats import summarize, write_results
+from xentools.xapisim import XAPIServer, XAPISimulator, LoadGenerator, parse_mix, populate
+
+VM_FIELDS = '''
+    ref
+    nameLabel
+    powerState
+    VCPUsAtStartup
+    memoryStaticMax
+    myActions
+    VBDs {
+      ref
+      type
+      userdevice
+      VDI {
+        ref
+        nameLabel
+        virtualSize
+      }
+    }
+    VIFs {
+      ref
+      MAC
+      ip
+      network {
+        ref
+        nameLabel
+      }
+    }
+'''
+
+OPERATIONS = {
+    'vms': f'query Vms($first: Int) {{ vms(first: $first) {{ {VM_FIELDS} }} }}',
+    'vm': f'query Vm($ref: ID!) {{ vm(ref: $ref) {{ {VM_FIELDS} }} }}',
+    'tasks': 'query Tasks($first: Int) { tasks(first: $first) { ref nameLabel status progress created finished '
+             'objectRef objectType action myActions } }',
+}
+DEFAULT_OPERATIONS = {'vms': 1, 'vm': 8, 'tasks': 1}
+
+VMS_SUBSCRIPTION = 'subscription { vms { changeType value { ... on GVM { ref nameLabel powerState } ... on Deleted { ref } } } }'
+PROBE_PREFIX = 'lag probe'
+
+
+class Client(NamedTuple):
+    role: str # admin or user
+    name: str
+    token: str # value of "user" secure cookie, also used as graphql-ws authToken
+    vms: List[str] # VMs the client can see
+
+    @property
+    def headers(self) -> dict:
+        return {'Cookie': f'user="{self.token}"', 'Content-Type': 'application/json'}
+
+
+def assign_owners(simulator : XAPISimulator, vms : List[str], users : List[str]) -> Dict[str, str]:
+    '''
+    Give every VM and its disks to one of users (round robin), as VM.manage_actions does
+    :return: user ID of owner by VM ref
+    '''
+    from xenadapter.vm import VM
+    from xenadapter.vdi import VDI
+    owners = {}
+    if not users:
+        return owners
+    with simulator._lock:
+        for i, vm in enumerate(vms):
+            user = f'users/{users[i % len(users)]}'
+            record = simulator.objects['VM'][vm]
+            simulator.modify('VM', vm, other_config=VM.other_config_with_actions(record['other_config'], VM.Actions.ALL, user))
+            for vbd in record['VBDs']:
+                vdi = simulator.objects['VBD'][vbd]['VDI']
+                if vdi in simulator.objects['VDI']:
+                    simulator.modify('VDI', vdi, other_config=VDI.other_config_with_actions(
+                        simulator.objects['VDI'][vdi]['other_config'], VDI.Actions.ALL, user))
+            owners[vm] = user
+    return owners
+
+
+def run_tasks(simulator : XAPISimulator, vms : List[str], count : int, rng : random.Random, timeout=60.0):
+    '''
+    Start or shut down count VMs with Async calls, so that the event loop saves their tasks
+    '''
+    tasks = []
+    for vm in rng.sample(vms, min(count, len(vms))):
+        if simulator.objects['VM'][vm]['power_state'] == 'Running':
+            tasks.append(simulator.call_async('Async.VM.hard_shutdown', (vm,)))
+        else:
+            tasks.append(simulator.call_async('Async.VM.start', (vm, False, False)))
+    deadline = time.monotonic() + timeout
+    while any(simulator.objects['task'][task]['status'] == 'pending' for task in tasks):
+        if time.monotonic() > deadline:
+            raise TimeoutError("Tasks haven't finished")
+        time.sleep(0.01)
+
+
+def wait_access_rights(owners : Mapping[str, str], timeout=60.0):
+    '''
+    Wait until the access monitor fills vms_user table
+    '''
+    import constants.re as re
+    from connman import ReDBConnection
+    deadline = time.monotonic() + timeout
+    with ReDBConnection().get_connection():
+        while re.db.table('vms_user').count().run() < len(owners):
+            if time.monotonic() > deadline:
+                raise TimeoutError("Access monitor hasn't filled vms_user")
+            time.sleep(0.05)
+
+
+class QueryStats:
+    '''
+    Latencies and errors of GraphQL operations by operation and role
+    '''
+    def __init__(self):
+        self.times = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def on_query(self, term):
+        with self._lock:
+            self.queries += 1
+
+    def on_response(self, operation, role, latency, ok):
+        self.times[operation, role].append(latency)
+        if not ok:
+            self.errors[operation, role] += 1
+
+    def as_dict(self) -> dict:
+        result = defaultdict(dict)
+        for (operation, role), times in self.times.items():
+            result[operation][role] = {'requests': len(times), 'errors': self.errors[operation, role],
+                                       'ms': summarize(times)}
+        return dict(result)
+
+
+class LagProbes:
+    '''
+    Delivery lag of subscription updates: VMs are renamed in XAPI, subscribers record when the new name arrives
+    '''
+    def __init__(self):
+        self.sent = {} # name_label -> (VM ref, time)
+        self.expected = 0
+        self.lags = []
+        self._seen = set() # (subscriber, name_label): other changes of a probed VM repeat its name_label
+
+    def send(self, name_label, vm, subscribers):
+        self.sent[name_label] = (vm, time.monotonic())
+        self.expected += subscribers
+
+    def on_update(self, subscriber, value):
+        name_label = (value or {}).get('nameLabel')
+        if name_label not in self.sent or (subscriber, name_label) in self._seen:
+            return
+        self._seen.add((subscriber, name_label))
+        self.lags.append(time.monotonic() - self.sent[name_label][1])
+
+    @property
+    def done(self) -> bool:
+        return len(self.lags) >= self.expected
+
+    def as_dict(self) -> dict:
+        return {'probes': len(self.sent), 'expected': self.expected, 'received': len(self.lags),
+                'lag_ms': summarize(self.lags)}
+
+
+async def login_admin(url, username, password) -> str:
+    from tornado.httpclient import AsyncHTTPClient
+    from urllib.parse import urlencode
+    response = await AsyncHTTPClient().fetch(f'{url}/adminauth', method='POST',
+                                             body=urlencode({'username': username, 'password': password}))
+    return SimpleCookie(response.headers['Set-Cookie'])['user'].value
+
+
+def user_token(app, user_id) -> str:
+    from authentication import DummyAuth
+    from tornado.web import create_signed_value
+    return create_signed_value(app.settings['cookie_secret'], 'user',
+                               pickle.dumps(DummyAuth(id=user_id, name=user_id))).decode()
+
+
+async def execute(http, url, client : Client, operation : str, args, rng : random.Random) -> bool:
+    if operation == 'vm':
+        variables = {'ref': rng.choice(client.vms)}
+    else:
+        variables = {'first': args.page or None}
+    body = json.dumps({'query': OPERATIONS[operation], 'variables': variables})
+    response = await http.fetch(f'{url}/graphql', method='POST', body=body, headers=client.headers, raise_error=False)
+    return response.code == 200 and not json.loads(response.body).get('errors')
+
+
+async def profile_queries(http, url, clients : Mapping[str, Client], operations, args, rng) -> dict:
+    '''
+    Run every operation alone and count RethinkDB queries it makes
+    '''
+    stats = QueryStats()
+    result = defaultdict(dict)
+    with count_queries(stats):
+        for operation in operations:
+            for role, client in clients.items():
+                before = stats.queries
+                for _ in range(args.profile):
+                    await execute(http, url, client, operation, args, rng)
+                result[operation][role] = (stats.queries - before) / args.profile
+    return dict(result)
+
+
+async def measure_queries(http, url, clients : List[Client], operations : Mapping[str, float], args, rng) -> dict:
+    stats = QueryStats()
+    names, weights = list(operations), list(operations.values())
+    remaining = args.requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            operation = rng.choices(names, weights=weights)[0]
+            client = clients[0] if rng.random() < args.admin_share else rng.choice(clients[1:] or clients)
+            start = time.monotonic()
+            ok = await execute(http, url, client, operation, args, rng)
+            stats.on_response(operation, client.role, time.monotonic() - start, ok)
+
+    start = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.monotonic() - start
+    return {'operations': stats.as_dict(), 'requests': args.requests, 'seconds': elapsed,
+            'requests_per_second': args.requests / elapsed}
+
+
+async def subscribe(url, number, client : Client, probes : LagProbes, timeout):
+    from tornado.websocket import websocket_connect
+    connection = await websocket_connect(f'{url}/subscriptions', subprotocols=['graphql-ws'])
+    connection.write_message(json.dumps({'type': 'connection_init', 'payload': {'authToken': client.token}}))
+    message = json.loads(await asyncio.wait_for(connection.read_message(), timeout))
+    if message['type'] != 'connection_ack':
+        raise RuntimeError(f"Subscription as {client.name} is not acknowledged: {message}")
+    connection.write_message(json.dumps({'id': '1', 'type': 'start', 'payload': {'query': VMS_SUBSCRIPTION}}))
+
+    async def read():
+        while True:
+            message = await connection.read_message()
+            if message is None:
+                return
+            message = json.loads(message)
+            if message['type'] == 'data' and message['payload'].get('data'):
+                probes.on_update(number, message['payload']['data']['vms']['value'])
+
+    asyncio.ensure_future(read())
+    return connection
+
+
+async def measure_subscriptions(url, clients : List[Client], owners : Mapping[str, str], simulator : XAPISimulator,
+                                args, rng) -> dict:
+    probes = LagProbes()
+    subscribers = [clients[0] if rng.random() < args.admin_share else rng.choice(clients[1:] or clients)
+                   for _ in range(args.subscribers)]
+    start = time.monotonic()
+    connections = await asyncio.gather(*(subscribe(url, number, client, probes, args.timeout)
+                                           for number, client in enumerate(subscribers)))
+    connected = time.monotonic() - start
+    await asyncio.sleep(args.settle) # changefeeds are created after start messages are received
+
+    generator = LoadGenerator(simulator, rate=args.load_rate, seed=args.seed) if args.load_rate else None
+    if generator:
+        generator.start()
+    vms = list(owners) or [ref for ref, vm in simulator.objects['VM'].items() if not vm['is_a_template']]
+    for number in range(args.probes):
+        vm = rng.choice(vms)
+        audience = sum(1 for client in subscribers if client.role == 'admin' or f'users/{client.name}' == owners.get(vm))
+        name_label = f'{PROBE_PREFIX} {number}'
+        probes.send(name_label, vm, audience)
+        simulator.modify('VM', vm, name_label=name_label)
+        await asyncio.sleep(args.probe_interval)
+
+    deadline = time.monotonic() + args.timeout
+    while not probes.done and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    if generator:
+        generator.stop()
+    for connection in connections:
+        connection.close()
+    return {**probes.as_dict(), 'subscribers': len(subscribers), 'connect_seconds': connected}
+
+
+def serve(app, ready : threading.Event, loops : list):
+    '''
+    Run the application in its own IOLoop so that the benchmark clients don't share a thread with it
+    '''
+    import tornado.httpserver
+    import tornado.ioloop
+    from tornado.testing import bind_unused_port
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    sock, port = bind_unused_port()
+    server = tornado.httpserver.HTTPServer(app)
+    server.add_sockets([sock])
+    loops.append((tornado.ioloop.IOLoop.current(), port))
+    ready.set()
+    tornado.ioloop.IOLoop.current().start()
+    server.stop()
+
+
+def run(args) -> dict:
+    from concurrent.futures import ThreadPoolExecutor
+    from tornado.httpclient import AsyncHTTPClient
+    from tornado.platform.asyncio import AnyThreadEventLoopPolicy
+    import constants
+    import constants.auth
+    import eventloop
+    from authentication import DummyAuth
+    from vmemperor import make_app
+
+    asyncio.set_event_loop_policy(AnyThreadEventLoopPolicy())
+    simulator = XAPISimulator(task_duration=args.task_duration)
+    server = XAPIServer(simulator)
+    server.start()
+    configure(args, server.url)
+    set_option('graphql_error_log_file', args.log_file, 'graphql')
+    set_option('vmemperor_host', 'localhost', 'vmemperor')
+    constants.auth.name = DummyAuth.__name__
+
+    rng = random.Random(args.seed)
+    refs = populate(simulator, hosts=args.hosts, srs=args.srs, networks=args.networks, templates=args.templates,
+                    vms=args.vms, disks_per_vm=args.disks_per_vm, running=args.running, seed=args.seed)
+    users = [f'bench{i}' for i in range(args.users)]
+    owners = assign_owners(simulator, refs['VM'], users)
+
+    executor = ThreadPoolExecutor(max_workers=args.executor_workers)
+    queues = []
+
+    def make_queue():
+        queues.append(eventloop.EventQueue())
+        return queues[-1]
+
+    result = {'settings': vars(args)}
+    with patch.object(eventloop, 'EventQueue', make_queue):
+        loop = eventloop.EventLoop(executor, DummyAuth)
+        constants.need_exit.clear()
+        constants.xen_events_run.set()
+        constants.first_batch_of_events.clear()
+        threads = [threading.Thread(target=target, name=target.__name__, daemon=True)
+                   for target in (loop.process_xen_events, loop.do_access_monitor)]
+        for thread in threads:
+            thread.start()
+        if not constants.first_batch_of_events.wait(args.timeout):
+            raise TimeoutError("Initial batch of events hasn't been processed")
+        run_tasks(simulator, refs['VM'], args.tasks, rng, args.timeout)
+        wait_drained(simulator, queues[-1], args.timeout)
+        wait_access_rights(owners, args.timeout)
+        result['objects'] = {cls: len(objects) for cls, objects in simulator.objects.items() if objects}
+
+        app = make_app(executor, auth_class=DummyAuth)
+        ready, loops = threading.Event(), []
+        server_thread = threading.Thread(target=serve, args=(app, ready, loops), name='graphql_server', daemon=True)
+        server_thread.start()
+        ready.wait()
+        app_loop, port = loops[0]
+        url = f'http://localhost:{port}'
+
+        async def measure():
+            http = AsyncHTTPClient(force_instance=True, max_clients=args.concurrency)
+            admin = Client('admin', 'root', await login_admin(url, 'root', 'benchmark'), refs['VM'])
+            clients = [admin]
+            for user in users:
+                vms = [vm for vm, owner in owners.items() if owner == f'users/{user}']
+                if vms:
+                    clients.append(Client('user', user, user_token(app, user), vms))
+            operations = parse_mix(args.operations) or DEFAULT_OPERATIONS
+            result['db_queries_per_operation'] = await profile_queries(
+                http, url, {client.role: client for client in clients[:2]}, operations, args, rng)
+            result['queries'] = await measure_queries(http, url, clients, operations, args, rng)
+            if args.subscribers:
+                result['subscriptions'] = await measure_subscriptions(
+                    url.replace('http', 'ws', 1), clients, owners, simulator, args, rng)
+            http.close()
+
+        asyncio.get_event_loop().run_until_complete(measure())
+
+        constants.need_exit.set()
+        app_loop.add_callback(app_loop.stop)
+        for thread in threads + [server_thread]:
+            thread.join(args.timeout)
+
+    executor.shutdown(wait=False)
+    server.shutdown()
+    server.server_close()
+    result['xapi_calls'] = simulator.calls
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hosts', type=int, default=4)
+    parser.add_argument('--srs', type=int, default=2)
+    parser.add_argument('--networks', type=int, default=4)
+    parser.add_argument('--templates', type=int, default=10)
+    parser.add_argument('--vms', type=int, default=2000)
+    parser.add_argument('--disks-per-vm', type=int, default=2)
+    parser.add_argument('--running', type=float, default=0.5, help="Fraction of running VMs")
+    parser.add_argument('--tasks', type=int, default=500, help="VM power tasks run before measurements")
+    parser.add_argument('--task-duration', type=float, default=0.5, help="Seconds an Async task (VM power change) stays pending")
+    parser.add_argument('--users', type=int, default=20, help="ACL-restricted users, VMs are shared among them")
+    parser.add_argument('--admin-share', type=float, default=0.2, help="Fraction of requests and subscribers that are admin")
+    parser.add_argument('--operations', default='', help="Weights of operations, e.g. vm=8,vms=1,tasks=1")
+    parser.add_argument('--page', type=int, default=0, help="'first' argument of vms and tasks queries, 0 - everything")
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16, help="Requests made at once")
+    parser.add_argument('--profile', type=int, default=5, help="Runs of every operation alone to count RethinkDB queries")
+    parser.add_argument('--subscribers', type=int, default=200, help="graphql-ws connections subscribed to vms, 0 - none")
+    parser.add_argument('--settle', type=float, default=2.0, help="Seconds to wait for subscriptions to start")
+    parser.add_argument('--probes', type=int, default=50, help="VM renames which delivery lag is measured for")
+    parser.add_argument('--probe-interval', type=float, default=0.1)
+    parser.add_argument('--load-rate', type=float, default=0.0, help="Background changes per second while subscribed")
+    parser.add_argument('--executor-workers', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--database', default='vmemperor_benchmark', help="RethinkDB database, it's recreated")
+    parser.add_argument('--db-host', default='localhost')
+    parser.add_argument('--db-port', type=int, default=28015)
+    parser.add_argument('--log-events', default='none', help="log_events option: comma-separated classes of events to log")
+    parser.add_argument('--log-file', default='graphql_latency.log')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--output', help="Save results as JSON")
+    args = parser.parse_args()
+    write_results(run(args), args.output)
+
+
+if __name__ == '__main__':
+    main()
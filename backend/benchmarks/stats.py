@@ -0,0 +1,29 @@
+'''
+Helpers shared by benchmarks: latency summaries and saving results
+'''
+import json
+from typing import Optional, Sequence
+
+
+def summarize(values : Sequence[float], scale=1000.0, points=(50, 90, 99)) -> Optional[dict]:
+    '''
+    Percentiles (nearest rank), mean and max of values multiplied by scale (seconds to milliseconds by default)
+    '''
+    if not values:
+        return None
+    ordered = sorted(values)
+    summary = {f'p{point}': ordered[min(len(ordered) - 1, int(len(ordered) * point / 100))] * scale for point in points}
+    summary['mean'] = sum(ordered) / len(ordered) * scale
+    summary['max'] = ordered[-1] * scale
+    return summary
+
+
+def write_results(result : dict, output : Optional[str] = None):
+    '''
+    Print results as JSON and save them to output, so that runs can be compared
+    '''
+    text = json.dumps(result, indent=2, sort_keys=True)
+    print(text)
+    if output:
+        with open(output, 'w') as file:
+            file.write(text + '\n')
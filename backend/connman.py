@@ -5,6 +5,7 @@ import threading
 
 import constants.re as re
 import singleton
+from metrics import RETHINKDB_CONNECTIONS_IDLE, RETHINKDB_CONNECTIONS_OPENED, timed_connection
 from loggable import Loggable
 import asyncio
 
@@ -19,6 +20,7 @@ class ReDBConnection(Loggable, metaclass=singleton.Singleton):
         self.user : str = None
         self.password : str = None
         self.init_log()
+        RETHINKDB_CONNECTIONS_IDLE.set_function(self.conn_queue_async.qsize)
 
     def set_options(self, host, port, db=None, user='admin', password=None):
         self.host = host
@@ -38,9 +40,11 @@ class ReDBConnection(Loggable, metaclass=singleton.Singleton):
             async def __aenter__(myself):
                 r = RethinkDB()
                 r.set_loop_type('asyncio')
+                r.connection_type = timed_connection(r.connection_type)
                 if not hasattr(myself, 'conn') or not myself.conn or not myself.conn.is_open():
 
                     myself.conn = await r.connect(self.host, self.port, self.db, user=self.user, password=self.password)
+                    RETHINKDB_CONNECTIONS_OPENED.labels('asyncio').inc()
                     self.log.debug(f"Connecting using connection: {id(myself)} (AsyncIO)")
 
                 if not myself.conn.is_open():
@@ -65,9 +69,11 @@ class ReDBConnection(Loggable, metaclass=singleton.Singleton):
         class Connection:
             def __init__(myself):
                 r = RethinkDB()
+                r.connection_type = timed_connection(r.connection_type)
 
                 if not hasattr(myself, 'conn') or not myself.conn  or not myself.conn.is_open():
                     myself.conn = r.connect(self.host, self.port, self.db, user=self.user, password=self.password,)
+                    RETHINKDB_CONNECTIONS_OPENED.labels('sync').inc()
                     self.log.debug(f"Connecting"
                                    f" using synchronous connection:"
                                    f" {id(myself)}")
@@ -12,21 +12,22 @@ class ConsoleList(metaclass=DBCreator):
         re.db.table(cls.TABLE_NAME).wait().run()
 
     @classmethod
-    def create_secret(self, url):
+    def create_secret(self, url, view_only=False):
         secret = token_urlsafe()
         re.db.table(self.TABLE_NAME).insert({
             "id" : secret,
-            "url" : url
+            "url" : url,
+            "view_only": view_only,
         }, conflict="error").run()
         return secret
 
     @classmethod
-    async def get_url_by_secret(self, connection, secret):
+    async def get_by_secret(self, connection, secret):
         '''
-        This method is asynchronous since it is used by WebSocket method
+        This method is asynchronous since it is used by WebSocket method. The secret is removed after use
         :param connection:
         :param secret:
-        :return:
+        :return: dict with url and view_only or None
         '''
         if not secret:
             return None
@@ -35,4 +36,11 @@ class ConsoleList(metaclass=DBCreator):
         if not data:
             return None
         await query.delete().run(connection)
+        return data
+
+    @classmethod
+    async def get_url_by_secret(self, connection, secret):
+        data = await self.get_by_secret(connection, secret)
+        if not data:
+            return None
         return data['url']
\ No newline at end of file
@@ -27,7 +27,7 @@ def create_dbs():
         else:
             table_list = re.db.table_list().run()
             for table in table_list:
-                if table == Task.db_table_name or table == Task.pending_db_table_name:
+                if table in (Task.db_table_name, Task.pending_db_table_name, Task.archive_db_table_name):
                     continue
                 re.db.table_drop(table).run()
 
@@ -2,6 +2,7 @@ from typing import Type, List, Union
 
 import constants.re as re
 from authentication import BasicAuthenticator
+from customtask.statuswriter import TaskStatusWriter
 from rethinkdb_tools.helper import CHECK_ER
 from xenadapter import Task
 
@@ -10,6 +11,8 @@ class CustomTask:
     '''
     Represents a VMEmperor task in task table
     Behaves just like a Xen Task. Supports cancellation (See xenadapter.Task.cancel)
+    Updates are written by TaskStatusWriter: progress, result and description updates are coalesced,
+    status changes are written immediately
     '''
     def __init__(self, id : str, object_type : Type , object_ref : Union[str, List[str]], action: str, user_authenticator: BasicAuthenticator):
         self.id = id
@@ -27,7 +30,7 @@ class CustomTask:
             'object_ref': object_ref,
             "action": action,
             "error_info": self.error_info,
-            "created" : re.r.now().run(),
+            "created" : re.r.now(),
             "name_label": f'{object_type.__name__}.{action}',
             "name_description": "",
             "uuid": id,
@@ -44,7 +47,7 @@ class CustomTask:
         if status:
             record['status'] = status
             if status not in ('pending', 'cancelling'):
-                record['finished'] = re.r.now().run()
+                record['finished'] = re.r.now()
             else:
                 record['finished'] = None
         if progress:
@@ -53,15 +56,25 @@ class CustomTask:
             record['result'] = result
         if error_info_add:
             self.error_info.append(error_info_add)
-            record['error_info'] = self.error_info
+            record['error_info'] = list(self.error_info)
 
+        TaskStatusWriter().update(record, urgent=bool(status))
 
-        CHECK_ER(re.db.table(Task.db_table_name).insert(record, conflict='update').run())
+    def set_install_state(self, state : str, **details):
+        '''
+        Persist a step of VM installation in the install field (see xenadapter.vminstall)
+        '''
+        self.install = {**getattr(self, 'install', {}), **details, 'state': state}
+        TaskStatusWriter().update({"ref": self.id, "install": dict(self.install)}, urgent=True)
 
     def set_cancel_handler(self, handler):
+        '''
+        :param handler: returns False when there's nothing to cancel at the moment (i.e. a queued playbook has just started
+        and has not installed its own handler yet), then the task status is kept and ValueError is raised
+        '''
         def handler_with_status():
-            self.set_status(status='cancelling')
-            handler()
+            if handler() is False:
+                raise ValueError(f"Task {self.id} can't be cancelled at the moment, try again")
             self.set_status(status='cancelled')
 
         Task.CancelHandlers[self.id] = handler_with_status
@@ -70,6 +83,5 @@ class CustomTask:
         del Task.CancelHandlers[self.id]
 
     def set_name_description(self, name_description):
-        record = {"ref": self.id, "name_description": name_description}
-        CHECK_ER(re.db.table(Task.db_table_name).insert(record, conflict='update').run())
+        TaskStatusWriter().update({"ref": self.id, "name_description": name_description})
 
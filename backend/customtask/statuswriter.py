@@ -0,0 +1,107 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sentry_sdk import capture_exception
+
+import constants.re as re
+from connman import ReDBConnection
+from loggable import Loggable
+from rethinkdb_tools.helper import CHECK_ER
+from singleton import Singleton
+
+DEFAULT_FLUSH_INTERVAL = 0.5
+MAX_RETRY_DELAY = 30.0
+
+
+class TaskStatusWriter(Loggable, metaclass=Singleton):
+    '''
+    Buffers updates of task records.
+    Updates of the same task coming within flush_interval are merged into one record,
+    records of all tasks are written in a single insert. Urgent updates (i.e. status changes) are written at once
+    together with everything buffered before them, so that the order of updates is kept.
+
+    Buffered updates are written by a single flusher thread, which keeps its RethinkDB connection.
+    Records that fail to be written are buffered again and retried with a growing delay (up to MAX_RETRY_DELAY),
+    failures of urgent updates are also raised to the caller
+    '''
+    def __repr__(self):
+        return "TaskStatusWriter"
+
+    def __init__(self, flush_interval : Optional[float] = None, table_name : Optional[str] = None):
+        from tornado.options import options as opts
+        from xenadapter.task import Task
+        self.flush_interval = flush_interval if flush_interval is not None else opts.task_progress_interval
+        self.table_name = table_name or Task.db_table_name
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._write_lock = threading.Lock() # Keeps writes in order
+        self._pending : Dict[str, dict] = {}
+        self._due : Optional[float] = None # time.monotonic() of the next flush by the flusher thread
+        self._retry_delay = self.flush_interval
+        self._flusher : Optional[threading.Thread] = None
+        self.writes = 0
+        self.updates = 0
+        self.init_log()
+
+    def update(self, record : dict, urgent=False):
+        '''
+        :param record: Task record with ref field. Fields are merged into the record buffered for this task
+        :param urgent: Write without waiting. Raises if the write fails, records are still retried later
+        '''
+        with self._lock:
+            self.updates += 1
+            self._pending.setdefault(record['ref'], {}).update(record)
+            if not urgent:
+                self._schedule(self.flush_interval)
+
+        if urgent:
+            self.flush(raise_errors=True)
+
+    def _schedule(self, delay : float):
+        '''
+        Make the flusher thread flush in delay seconds unless it's going to flush earlier. Call with self._lock held
+        '''
+        due = time.monotonic() + delay
+        if self._due is not None and self._due <= due:
+            return
+        self._due = due
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name='TaskStatusWriter', daemon=True)
+            self._flusher.start()
+        self._condition.notify()
+
+    def _flush_loop(self):
+        while True:
+            with self._condition:
+                while self._due is None or self._due > time.monotonic():
+                    self._condition.wait(None if self._due is None else self._due - time.monotonic())
+            self.flush()
+
+    def flush(self, raise_errors=False):
+        with self._write_lock:
+            with self._lock:
+                records : List[dict] = list(self._pending.values())
+                self._pending.clear()
+                self._due = None
+
+            if not records:
+                return
+            try:
+                with ReDBConnection().get_connection():
+                    CHECK_ER(re.db.table(self.table_name).insert(records, conflict='update').run())
+                self.writes += 1
+                self._retry_delay = self.flush_interval
+            except Exception as e:
+                self.log.error(f"Unable to write {len(records)} task records, retrying in {self._retry_delay} s: {e}")
+                capture_exception(e)
+                with self._lock:
+                    # Updates that came while we were writing are newer than the failed ones
+                    pending = self._pending
+                    self._pending = {record['ref']: record for record in records}
+                    for ref, record in pending.items():
+                        self._pending.setdefault(ref, {}).update(record)
+                    self._schedule(self._retry_delay)
+                self._retry_delay = min(self._retry_delay * 2, MAX_RETRY_DELAY)
+                if raise_errors:
+                    raise
@@ -2,6 +2,7 @@ import json
 import threading
 import time
 import traceback
+from pathlib import Path
 
 from rethinkdb.errors import ReqlTimeoutError
 from sentry_sdk import capture_exception
@@ -12,9 +13,11 @@ from connman import ReDBConnection
 from constants import re as re
 from exc import XenAdapterAPIError
 from loggable import Loggable
-from playbookloader import PlaybookLoader
+from playbookloader import PlaybookLoader, PlaybookWatcher
 from rethinkdb_tools import db_classes
 from rethinkdb_tools.helper import CHECK_ER
+from taskcompactor import TaskCompactor
+from utils.usersearch import USER_SEARCH_INDEX
 from xenadapter.event_queue import EventQueue
 from xentools.xenadapterpool import XenAdapterPool
 import tornado.ioloop
@@ -48,6 +51,7 @@ class EventLoop(Loggable):
                 groups = self.authenticator.get_all_groups(log=log)
                 re.db.table('users').insert(users, conflict='update').run()
                 re.db.table('groups').insert(groups, conflict='update').run()
+                USER_SEARCH_INDEX.update(users, groups)
                 while True:
                     if constants.need_exit.is_set():
                         return
@@ -65,6 +69,7 @@ class EventLoop(Loggable):
                     new_groups = self.authenticator.get_all_groups(log=log)
                     re.db.table('users').insert(new_users, conflict='update').run()
                     re.db.table('groups').insert(new_groups, conflict='update').run()
+                    USER_SEARCH_INDEX.update(new_users, new_groups)
 
                     new_users_set = set(map(lambda item: item['id'], new_users))
                     users_set = set(map(lambda item: item['id'], users))
@@ -84,6 +89,33 @@ class EventLoop(Loggable):
             capture_exception(e)
             tornado.ioloop.IOLoop.current().run_in_executor(self.executor, self.do_user_table)
 
+    def do_task_compaction(self):
+        '''
+        Periodically removes old finished tasks from the tasks table, see TaskCompactor
+        '''
+        try:
+            compactor = TaskCompactor(opts.task_retention_days, opts.task_retention_per_object,
+                                      opts.task_archive, opts.task_archive_file)
+        except ValueError as e:
+            self.log.error(f"Task compaction disabled: {e}")
+            return
+
+        while True:
+            try:
+                with ReDBConnection().get_connection():
+                    compactor.compact()
+            except Exception as e: # A failed pass is retried after task_compaction_interval
+                self.log.error(f"Exception in task_compaction: {e}")
+                capture_exception(e)
+
+            delay = 0
+            while opts.task_compaction_interval > delay:
+                if constants.need_exit.is_set():
+                    return
+                sleep_time = 2
+                time.sleep(sleep_time)
+                delay += sleep_time
+
     def do_pending_tasks(self):
         from xenadapter import Task
         try:
@@ -239,10 +271,54 @@ class EventLoop(Loggable):
         self.log.debug("Starting load_playbooks. You can re-trigger playbook loading by sending USR1 signal")
         while True:
             constants.load_playbooks.wait()
-            with ReDBConnection().get_connection():
-                re.db.table_create(PlaybookLoader.PLAYBOOK_TABLE_NAME, durability='soft').run()
-                PlaybookLoader.load_playbooks()
             constants.load_playbooks.clear()
+            try:
+                with ReDBConnection().get_connection():
+                    if PlaybookLoader.PLAYBOOK_TABLE_NAME not in re.db.table_list().run():
+                        re.db.table_create(PlaybookLoader.PLAYBOOK_TABLE_NAME, durability='soft').run()
+                    start = time.monotonic()
+                    result = PlaybookLoader.sync_playbooks()
+                    self.log.info(f"Playbooks synced in {time.monotonic() - start:.3f} s: loaded: {result.loaded}, "
+                                  f"removed: {result.removed}, unchanged: {len(result.unchanged)}")
+            except Exception as e:
+                self.log.error(f"Exception in load_playbooks: {e}")
+                capture_exception(e)
+
+    def resume_installs(self):
+        from xenadapter.vminstall import InstallTracker
+        with ReDBConnection().get_connection():
+            InstallTracker().resume()
+
+    def fill_warm_pools(self):
+        from warmpool import WarmPool
+        try:
+            with ReDBConnection().get_connection():
+                WarmPool().start()
+        except Exception as e:
+            self.log.error(f"Unable to start warm pools: {e}")
+            capture_exception(e)
+
+    def do_watch_playbooks(self):
+        '''
+        Trigger load_playbooks when files in ansible_dir change. Enabled by ansible_watch option
+        '''
+        try:
+            watcher = PlaybookWatcher(Path(opts.ansible_dir))
+        except OSError as e:
+            self.log.error(f"Unable to watch {opts.ansible_dir}: {e}. Send USR1 signal to reload playbooks")
+            return
+
+        self.log.debug(f"Started {watcher}")
+        try:
+            while not constants.need_exit.is_set():
+                if watcher.wait(2):
+                    constants.load_playbooks.set()
+        except Exception as e:
+            self.log.error(f"Exception in watch_playbooks: {e}")
+            capture_exception(e)
+            tornado.ioloop.IOLoop.current().run_in_executor(self.executor, self.do_watch_playbooks)
+        finally:
+            watcher.close()
 
     def process_xen_events(self):
         self.log.debug(f"Started process_xen_events in thread {threading.get_ident()}")
@@ -3,8 +3,12 @@ from __future__ import annotations
 from tornadoql.tornadoql import GraphQLSubscriptionHandler as BaseGQLSubscriptionHandler, GraphQLHandler as BaseGQLHandler
 import pickle
 
+from tornado.options import options as opts
+
 from authentication import BasicAuthenticator
 from handlers.base import BaseHandler, BaseWSHandler
+from handlers.graphql.utils.loaders import Loaders
+from tornadoql.tracing import TRACE_HEADER
 from xentools.xenadapter import XenAdapter
 from typing import _Protocol
 from logging import Logger
@@ -15,6 +19,7 @@ class ContextProtocol(_Protocol):
     actions_log : Logger #XenAdapter actions log, for VM installs, logs in action.log
     xen: XenAdapter # XenAdapter used for synchronous operations. It is initalized when a request is accepted and finalized when request is served
     user_authenticator: BasicAuthenticator # Current user
+    loaders: Loaders # Per-request batching loaders, see handlers/graphql/utils/loaders.py. Not available in subscriptions
 
 
 
@@ -29,6 +34,22 @@ class GraphQLHandler(BaseHandler, BaseGQLHandler):
 
     def prepare(self):
         super().prepare()
+        self.request.loaders = Loaders(self.request)
+
+    @property
+    def trace_requested(self) -> bool:
+        if self.request.headers.get(TRACE_HEADER) != '1':
+            return False
+        user_auth = getattr(self.request, 'user_authenticator', None)
+        return user_auth is not None and user_auth.is_admin()
+
+    @property
+    def trace_sample_rate(self) -> float:
+        return opts.graphql_trace_sample_rate
+
+    @property
+    def slow_query_threshold(self) -> float:
+        return opts.graphql_slow_query_threshold
 
 
 
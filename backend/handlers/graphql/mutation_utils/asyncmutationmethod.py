@@ -1,4 +1,3 @@
-import threading
 from typing import Optional, Callable
 
 import tornado.ioloop
@@ -6,7 +5,7 @@ import tornado.ioloop
 from authentication import BasicAuthenticator
 from connman import ReDBConnection
 from handlers.graphql.graphql_handler import ContextProtocol
-import constants.re as re
+from taskwatcher import TaskWatcher
 from xenadapter import Task
 from xenadapter.xenobject import XenObject
 
@@ -14,13 +13,11 @@ PostMutationHookType = Optional[Callable[[str, ContextProtocol], None]]
 
 class AsyncMutationMethod:
     @staticmethod
-    def post_call(taskId, object : XenObject, action: str, ctx: ContextProtocol,  post_mutation_hook: PostMutationHookType):
+    def post_call(taskId, object : XenObject, action: str, ctx: ContextProtocol):
         '''
-
+        Sets up caller field of a task
         :param taskId:
         :param object: xen object that is the mutation subject
-        :param post_mutation_hook: a hook
-        that runs with task result as argument if task is successful
         :param action: string representation of an action that is used in task DB table
         :return:
         '''
@@ -32,33 +29,28 @@ class AsyncMutationMethod:
 
         with ReDBConnection().get_connection():
             Task.add_pending_task(ctx.xen, taskId, type(object), object.ref, action, True, who)
-            if post_mutation_hook:
-                cur = re.db.table('tasks').get_all(taskId).pluck('status', 'result').changes(include_initial=True).run()
-                while True:
-                    try:
-                        val = cur.next()['new_val']
-                    except KeyError:
-                        return
-                    if val and val['status'] == 'success':
-                        post_mutation_hook(val['result'], ctx)
-                        return
-                    elif not val or val['status'] not in ('pending', 'cancelling'):
-                        return
 
 
     @staticmethod
     def call(object : XenObject, action : str, ctx: ContextProtocol, args : tuple = (), post_mutation_hook: PostMutationHookType  = None):
         """
-        Calls a (async) action, returns a task ID, creates a new thread where it sets up caller field and optionally runs post_mutation_hook
+        Calls a (async) action, returns a task ID, sets up caller field in a separate thread.
+        post_mutation_hook is run by TaskWatcher with task result as argument if task is successful
         :param action:
         :param ctx:
-        :param post_mutation_hook:
+        :param post_mutation_hook: a hook
         :return:
         """
 
         taskId = getattr(object, f'async_{action}')(*args)
+        if post_mutation_hook:
+            def on_finish(record):
+                if record and record['status'] == 'success':
+                    post_mutation_hook(record['result'], ctx)
+
+            TaskWatcher().watch(taskId, on_finish)
         tornado.ioloop.IOLoop.current().run_in_executor(ctx.executor,
-                                                        lambda : AsyncMutationMethod.post_call(taskId, object, action, ctx, post_mutation_hook))
+                                                        lambda : AsyncMutationMethod.post_call(taskId, object, action, ctx))
         return taskId
 
 
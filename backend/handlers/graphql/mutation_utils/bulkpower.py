@@ -0,0 +1,96 @@
+import json
+import threading
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from serflag import SerFlag
+
+import constants.re as re
+from customtask.customtask import CustomTask
+from handlers.graphql.graphql_handler import ContextProtocol
+from powerdispatcher import PowerDispatcher, PowerJob
+from utils.quota import before_vm_start_resume_many, before_vm_unpause_many
+
+# Returns either a reason why VM can't be operated or a tuple of method name, access action, method arguments and host ref
+PowerChoice = Union[str, Tuple[str, SerFlag, tuple, Optional[str]]]
+PowerChooser = Callable[[dict], PowerChoice]
+
+# Methods that require quota checks (see utils.quota.before_vm_start_resume)
+STARTING_METHODS = ('start', 'start_on', 'resume', 'resume_on')
+
+
+def perform_bulk_power(ctx: ContextProtocol, refs: List[str], operation: str, choose: PowerChooser) -> Tuple[Optional[str], Dict[str, str]]:
+    '''
+    Check access and quotas of VMs refs in a batch and dispatch power operations with PowerDispatcher.
+    Progress is reported through a single CustomTask, its result is a JSON document with an entry for every VM:
+    {"ref": {"task": "Xen task ref", "status": "success"/"failure", "error": "..."}}
+
+    :param operation: task action name
+    :param choose: called with VM record (ref, power_state and _resident_on_ fields)
+    :return: parent task ID (None if nothing is dispatched) and reasons for refs that are skipped
+    '''
+    from xenadapter.vm import VM
+
+    refs = list(dict.fromkeys(refs))
+    records = {item['ref']: item for item in
+               re.db.table(VM.db_table_name).get_all(*refs).pluck('ref', 'power_state', '_resident_on_').run()} if refs else {}
+    denied : Dict[str, str] = {}
+    choices = {}
+    for ref in refs:
+        if ref not in records:
+            denied[ref] = f"VM {ref} does not exist"
+            continue
+        choice = choose(records[ref])
+        if isinstance(choice, str):
+            denied[ref] = choice
+        else:
+            choices[ref] = choice
+
+    by_action : Dict[SerFlag, List[str]] = {}
+    for ref, (_, action, _, _) in choices.items():
+        by_action.setdefault(action, []).append(ref)
+    for action, action_refs in by_action.items():
+        for ref, granted in zip(action_refs, VM.check_access_many(ctx.user_authenticator, action_refs, action)):
+            if not granted:
+                denied[ref] = f"Access to action {action} for VM {ref} is not granted"
+                del choices[ref]
+
+    quota_errors = {
+        **before_vm_start_resume_many([ref for ref, choice in choices.items() if choice[0] in STARTING_METHODS]),
+        **before_vm_unpause_many([ref for ref, choice in choices.items() if choice[0] == 'unpause']),
+    }
+    for ref, error in quota_errors.items():
+        if error:
+            denied[ref] = error
+            del choices[ref]
+
+    if not choices:
+        return None, denied
+
+    if ctx.user_authenticator.is_admin():
+        who = ctx.user_authenticator.get_id()
+    else:
+        who = 'users/' + ctx.user_authenticator.get_id()
+
+    task_id = str(uuid.uuid4())
+    task = CustomTask(task_id, VM, list(choices), operation, ctx.user_authenticator)
+    lock = threading.Lock()
+    results = {}
+
+    def on_finish(job: PowerJob):
+        with lock:
+            results[job.vm_ref] = {"task": job.task_id, "status": job.status, "error": job.error}
+            done = len(results) == len(choices)
+            progress = len(results) / len(choices)
+        if not done:
+            task.set_status(progress=progress)
+            return
+
+        failed = [ref for ref, result in results.items() if result['status'] != 'success']
+        error = f"{len(failed)} of {len(choices)} VMs failed: " + '; '.join(f"{ref}: {results[ref]['error']}" for ref in failed) \
+            if failed else None
+        task.set_status(status='failure' if failed else 'success', progress=1.0, result=json.dumps(results), error_info_add=error)
+
+    PowerDispatcher().submit([PowerJob(ref, host, method, args, who, on_finish)
+                              for ref, (method, _, args, host) in choices.items()])
+    return task_id, denied
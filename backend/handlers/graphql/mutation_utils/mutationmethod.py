@@ -1,15 +1,33 @@
 import json
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import Callable, Sequence, Any, Optional, Tuple, Union, List, Generic, TypeVar
 from serflag import SerFlag
 from handlers.graphql.graphql_handler import ContextProtocol
 from handlers.graphql.utils.string import camelcase
-from xenadapter.task import get_userids
+from connman import ReDBConnection
+from rethinkdb_tools.helper import CHECK_ER
+from xenadapter.task import get_user_actions, userids_with_action
 from xenadapter.xenobject import XenObject
 from functools import partial
 import constants.re as re
 from sentry_sdk import capture_exception
+from xentools.xenadapterpool import XenAdapterPool
+
+# Runs setters of MutationMethods marked as concurrent
+_CONCURRENT_SETTERS = ThreadPoolExecutor(max_workers=8, thread_name_prefix='setter')
+
+
+def server_time(moment: float):
+    '''
+    :param moment: time.monotonic() value
+    :return: ReQL expression of server time at that moment, so that timestamps don't need a round-trip each
+    '''
+    return re.r.now().sub(time.monotonic() - moment)
+
+
 def call_mutation_from_string(mutable_object, changes, function):
     def f():
         old_value = {function: getattr(mutable_object, f'get_{function}')()}
@@ -35,6 +53,8 @@ class MutationMethod:
          and 2nd is a validator, taking user input and returning a tuple of validation result and reason
         access_action: An access action required for performing this mutation. None means this mutation is for administrators only
         deps: Tuple of dependencies:  lambdas that are called with our object as first argument and returning tuple of Boolean and reason string
+        concurrent: This mutation doesn't depend on other mutations of the same object and may be run simultaneously with them
+        (with its own XenAPI session)
     '''
     Input = TypeVar('Input')
     InputArgument = TypeVar('InputArgument')
@@ -43,6 +63,7 @@ class MutationMethod:
     func: Union[str, Tuple[MutationFunction, MutationCheckerFunction]]
     access_action: Optional[SerFlag]
     deps: Tuple[Callable[["XenObject"], Tuple[bool, str]]] = tuple()
+    concurrent: bool = False
 
 def call_mutation_from_function(mutable_object, changes, function: MutationMethod.MutationFunction):
     return partial(function, changes, mutable_object)
@@ -121,55 +142,98 @@ class MutationHelper:
         '''
 
         tasks : List[dict] = []
+        user_actions = None
+        who = "users/" + self.ctx.user_authenticator.get_id() if not self.ctx.user_authenticator.is_admin() else None
+        object_ref = self.mutable_object.ref
+        object_type = self.mutable_object.__class__
         for item in self.mutations:
+            created = time.monotonic()
             function_or_error = self.prepare_mutations_for_item(item, changes)
 
             if not function_or_error:
                 continue
+            if user_actions is None:
+                user_actions = get_user_actions(object_type, object_ref)
+
             new_uuid = str(uuid.uuid4())
             action = item.access_action.serialize()[0]
-            who = "users/" + self.ctx.user_authenticator.get_id() if not self.ctx.user_authenticator.is_admin() else None
-            object_ref = self.mutable_object.ref
-            object_type = self.mutable_object.__class__
             task = {
                 "ref": new_uuid,
                 "object_ref": object_ref,
                 "object_type": object_type.__name__,
                 "action": action,
                 "error_info" : [],
-                "created": re.r.now().run(),
+                "created": created,
                 "name_label": f"{object_type.__name__}.{action}",
                 "name_description": "",
                 "uuid": new_uuid,
                 "progress": 1,
                 "resident_on": None,
                 "who": who,
-                "access" : {user: ['remove'] for user in get_userids(object_type, object_ref, action)}
+                "access" : {user: ['remove'] for user in userids_with_action(user_actions, action)}
             }
             if isinstance(function_or_error, str):
                 task['status'] = 'failure'
                 task['error_info'].append(function_or_error)
-                task['finished'] = re.r.now().run()
-                re.db.table('tasks').insert(task).run()
+                task['finished'] = time.monotonic()
+                self.insert_tasks([task])
                 return False, function_or_error
             else:
                 task['call'] = function_or_error
+                task['item'] = item
                 tasks.append(task)
 
+        concurrent = [(task, _CONCURRENT_SETTERS.submit(self.run_concurrently, task['item'], changes))
+                      for task in tasks if task['item'].concurrent]
         for task in tasks:
-            try:
-                new_value, old_value = task['call']()
-                task['status'] = 'success'
-                task['result'] = json.dumps({"old_val": old_value, "new_val": new_value})
-                task['finished'] = re.r.now().run()
-            except Exception as e:
-                capture_exception(e)
-                task['status'] = 'failure'
-                task['error_info'].append(str(e))
-                task['result'] = ""
-                task['finished'] = re.r.now().run()
-            finally:
-                del task['call']
-                re.db.table('tasks').insert(task).run()
+            if not task['item'].concurrent:
+                self.finish_task(task, task['call'])
+        for task, future in concurrent:
+            self.finish_task(task, future.result)
 
+        self.insert_tasks(tasks)
         return True, None
+
+    def run_concurrently(self, item: MutationMethod, changes: MutationMethod.Input):
+        '''
+        Run a mutation in another thread with a XenAdapter of its own, as XenAPI session can't be shared between threads
+        '''
+        xen = XenAdapterPool().get()
+        try:
+            with ReDBConnection().get_connection():
+                mutable_object = type(self.mutable_object)(xen, self.mutable_object.ref)
+                if isinstance(item.func, str):
+                    return call_mutation_from_string(mutable_object, changes, item.func)()
+                else:
+                    return call_mutation_from_function(mutable_object, changes, item.func[0])()
+        finally:
+            XenAdapterPool().unget(xen)
+
+    @staticmethod
+    def finish_task(task: dict, call: Callable[[], Tuple[Any, Any]]):
+        try:
+            new_value, old_value = call()
+            task['status'] = 'success'
+            task['result'] = json.dumps({"old_val": old_value, "new_val": new_value})
+        except Exception as e:
+            capture_exception(e)
+            task['status'] = 'failure'
+            task['error_info'].append(str(e))
+            task['result'] = ""
+        finally:
+            task['finished'] = time.monotonic()
+            del task['call']
+            del task['item']
+
+    @staticmethod
+    def insert_tasks(tasks: List[dict]):
+        '''
+        Insert task records in a single query. created and finished fields are time.monotonic() values
+        and are converted to server time here
+        '''
+        if not tasks:
+            return
+        for task in tasks:
+            task['created'] = server_time(task['created'])
+            task['finished'] = server_time(task['finished'])
+        CHECK_ER(re.db.table('tasks').insert(tasks).run())
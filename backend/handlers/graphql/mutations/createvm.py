@@ -9,6 +9,7 @@ from handlers.graphql.types.input.newvdi import NewVDI
 from handlers.graphql.types.input.vm import AutoInstall, VMInput
 from utils.quota import quota_memory_error, quota_vcpu_count_error, quota_vdi_size_error
 from utils.user import check_user_input
+from xenadapter import vminstall
 from xenadapter.vdi import VDI
 from xenadapter.network import Network
 
@@ -20,6 +21,7 @@ from xenadapter.template import Template
 import tornado.ioloop
 from xentools.xenadapterpool import XenAdapterPool
 from handlers.graphql.types.vm import SetDisksEntry
+from warmpool import WarmPool
 
 
 def createvm(ctx : ContextProtocol, task_id : str,
@@ -65,7 +67,13 @@ def createvm(ctx : ContextProtocol, task_id : str,
                     return
 
             tmpl = kwargs['Template']
-            vm = tmpl.clone_as_vm(f"New VM for {user}")
+            task.set_install_state(vminstall.CLONE, template=tmpl.ref)
+            vm = WarmPool().claim_vm(xen, tmpl.get_uuid(), [(entry.SR.get_uuid(), entry.size) for entry in provision_config])
+            provisioned = vm is not None
+            if provisioned:
+                vm.set_name_label(f"New VM for {user}")
+            else:
+                vm = tmpl.clone_as_vm(f"New VM for {user}")
             task.set_status(progress=0.1, result=vm.ref)
 
             vm.create(
@@ -75,7 +83,8 @@ def createvm(ctx : ContextProtocol, task_id : str,
                 template=tmpl,
                 iso=kwargs.get('VDI'),
                 install_params=install_params,
-                options=options
+                options=options,
+                provisioned=provisioned
             )
         finally:
             XenAdapterPool().unget(xen)
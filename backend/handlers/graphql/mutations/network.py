@@ -4,8 +4,8 @@ from handlers.graphql.utils.editmutation import create_edit_mutation
 from xenadapter import Network
 
 mutations = [
-    MutationMethod(func="name_label", access_action=Network.Actions.rename),
-    MutationMethod(func="name_description", access_action=Network.Actions.rename),
+    MutationMethod(func="name_label", access_action=Network.Actions.rename, concurrent=True),
+    MutationMethod(func="name_description", access_action=Network.Actions.rename, concurrent=True),
 ]
 
 NetworkMutation = create_edit_mutation("NetworkMutation", "network", NetworkInput, Network, mutations)
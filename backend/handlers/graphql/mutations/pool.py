@@ -4,8 +4,8 @@ from handlers.graphql.utils.editmutation import create_edit_mutation
 from xenadapter import Pool
 
 mutations = [
-    MutationMethod(func="name_label", access_action=Pool.Actions.rename),
-    MutationMethod(func="name_description", access_action=Pool.Actions.rename),
+    MutationMethod(func="name_label", access_action=Pool.Actions.rename, concurrent=True),
+    MutationMethod(func="name_description", access_action=Pool.Actions.rename, concurrent=True),
 ]
 
 PoolMutation = create_edit_mutation("PoolMutation", "pool", PoolInput, Pool, mutations)
@@ -4,8 +4,8 @@ from handlers.graphql.types.input.sr import SRInput
 from xenadapter import SR
 
 mutations = [
-    MutationMethod(func="name_label", access_action=SR.Actions.rename),
-    MutationMethod(func="name_description", access_action=SR.Actions.rename),
+    MutationMethod(func="name_label", access_action=SR.Actions.rename, concurrent=True),
+    MutationMethod(func="name_description", access_action=SR.Actions.rename, concurrent=True),
 ]
 
 SRMutation = create_edit_mutation("SRMutation", "sr", SRInput, SR, mutations)
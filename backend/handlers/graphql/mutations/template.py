@@ -72,8 +72,8 @@ def install_options_validator(input: TemplateInput, *args,  **kwargs):
     return True, None
 
 mutations = [
-            MutationMethod(func="name_label", access_action=Template.Actions.rename),
-            MutationMethod(func="name_description", access_action=Template.Actions.rename),
+            MutationMethod(func="name_label", access_action=Template.Actions.rename, concurrent=True),
+            MutationMethod(func="name_description", access_action=Template.Actions.rename, concurrent=True),
             MutationMethod(func="domain_type", access_action=Template.Actions.change_domain_type),
             MutationMethod(func=(set_subtype_from_input("platform"), platform_validator), access_action=Template.Actions.changing_VCPUs),
             MutationMethod(func=(set_VCPUs, vcpus_input_validator), access_action=Template.Actions.changing_VCPUs),
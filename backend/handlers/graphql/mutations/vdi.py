@@ -12,8 +12,8 @@ from xenadapter import VDI, SR
 
 mutations = [
     MutationMethod(func=(set_main_owner, main_owner_validator), access_action=VDI.Actions.ALL),
-    MutationMethod(func="name_label", access_action=VDI.Actions.rename),
-    MutationMethod(func="name_description", access_action=VDI.Actions.rename),
+    MutationMethod(func="name_label", access_action=VDI.Actions.rename, concurrent=True),
+    MutationMethod(func="name_description", access_action=VDI.Actions.rename, concurrent=True),
 ]
 
 VDIMutation = create_edit_mutation("VDIMutation", "vdi", VDIInput, VDI, mutations)
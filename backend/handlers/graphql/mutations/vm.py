@@ -5,20 +5,21 @@ import graphene
 from authentication import with_authentication, with_default_authentication, return_if_access_is_not_granted
 from handlers.graphql.graphql_handler import ContextProtocol
 from handlers.graphql.mutation_utils.asyncmutationmethod import AsyncMutationMethod
+from handlers.graphql.mutation_utils.bulkpower import perform_bulk_power, PowerChoice
 from handlers.graphql.mutation_utils.mutationmethod import MutationMethod
 from handlers.graphql.mutations.abstractvm import vcpus_input_validator, memory_input_validator, platform_validator
 from handlers.graphql.mutations.quotaobject import set_main_owner, main_owner_validator
 from utils.quota import before_vm_start_resume, before_vm_unpause
 from xenadapter.abstractvm import set_memory, set_VCPUs
-from handlers.graphql.types.base.objecttype import InputObjectType
+from handlers.graphql.types.base.objecttype import InputObjectType, ObjectType
 from handlers.graphql.utils.editmutation import create_edit_mutation, create_async_mutation
 from handlers.graphql.types.input.vm import VMInput
 from xenadapter.xenobject import set_subtype_from_input
 from xenadapter.vm import VM
 
 mutations = [
-            MutationMethod(func="name_label", access_action=VM.Actions.rename),
-            MutationMethod(func="name_description", access_action=VM.Actions.rename),
+            MutationMethod(func="name_label", access_action=VM.Actions.rename, concurrent=True),
+            MutationMethod(func="name_description", access_action=VM.Actions.rename, concurrent=True),
             MutationMethod(func="domain_type", access_action=VM.Actions.change_domain_type),
             MutationMethod(func=(set_subtype_from_input("platform"), platform_validator), access_action=VM.Actions.changing_VCPUs),
             MutationMethod(func=(set_VCPUs, vcpus_input_validator), access_action=VM.Actions.changing_VCPUs),
@@ -217,4 +218,105 @@ class VMSnapshotMutation(graphene.Mutation):
     @with_authentication(access_class=VM, access_action=VM.Actions.snapshot)
     @return_if_access_is_not_granted([("VM", "ref", VM.Actions.snapshot)])
     def mutate(root, info, ref, name_label, VM):
-        return VMSnapshotMutation(taskId=AsyncMutationMethod.call(VM, 'snapshot', info.context, (name_label, )), granted=True)
\ No newline at end of file
+        return VMSnapshotMutation(taskId=AsyncMutationMethod.call(VM, 'snapshot', info.context, (name_label, )), granted=True)
+
+
+class VMBulkDenied(ObjectType):
+    ref = graphene.ID(required=True)
+    reason = graphene.String(required=True)
+
+
+def create_bulk_power_mutation(name: str, arguments: dict, choose, operation: str):
+    """
+    Creates a mutation performing a power operation on many VMs (see perform_bulk_power)
+    :param arguments: mutation arguments besides refs
+    :param choose: called with VM record and mutation arguments, returns PowerChoice
+    :param operation: parent task action
+    """
+    Arguments = type('Arguments', (), {
+        "refs": graphene.Argument(graphene.List(graphene.NonNull(graphene.ID)), required=True),
+        **arguments,
+    })
+
+    @with_default_authentication
+    def mutate(root, info, refs, **kwargs):
+        task_id, denied = perform_bulk_power(info.context, refs, operation, lambda record: choose(record, **kwargs))
+        return type(name, (), dict(
+            granted=task_id is not None,
+            task_id=task_id,
+            reason=None if task_id else "None of the VMs can be operated",
+            denied=[{"ref": ref, "reason": reason} for ref, reason in denied.items()]))
+
+    return type(name, (graphene.Mutation, ), {
+        "task_id": graphene.ID(required=False, description="Task ID of the whole operation"),
+        "granted": graphene.Boolean(required=True, description="Shows if the operation is started for at least one VM"),
+        "reason": graphene.String(),
+        "denied": graphene.Field(graphene.List(VMBulkDenied), required=True, description="VMs that are skipped and why"),
+        "Arguments": Arguments,
+        "mutate": mutate
+    })
+
+
+def choose_start(record, options: VMStartInput = None) -> PowerChoice:
+    paused = options.paused if options else False
+    force = options.force if options else False
+    host = options.host if options else None
+    if record['power_state'] == "Halted":
+        if host:
+            return 'start_on', VM.Actions.start_on, (host, paused, force), host
+        return 'start', VM.Actions.start, (paused, force), None
+    elif record['power_state'] == 'Suspended':
+        if host:
+            return 'resume_on', VM.Actions.resume_on, (host, paused, force), host
+        return 'resume', VM.Actions.resume, (paused, force), None
+    return f"Power state is {record['power_state']}, expected: Halted or Suspended"
+
+
+def wrong_power_state(record, *expected : str) -> Optional[str]:
+    if record['power_state'] in expected:
+        return None
+    *others, last = expected
+    return f"Power state is {record['power_state']}, expected: {', '.join(others) + ' or ' if others else ''}{last}"
+
+
+def choose_shutdown(record, force: Optional[ShutdownForce] = None) -> PowerChoice:
+    if force == ShutdownForce.HARD:
+        method = 'hard_shutdown'
+    elif force == ShutdownForce.CLEAN:
+        method = 'clean_shutdown'
+    else:
+        method = 'shutdown'
+    reason = wrong_power_state(record, 'Running') if method == 'clean_shutdown' \
+        else wrong_power_state(record, 'Running', 'Paused', 'Suspended')
+    return reason or (method, getattr(VM.Actions, method), (), record.get('_resident_on_'))
+
+
+def choose_reboot(record, force: ShutdownForce = ShutdownForce.CLEAN) -> PowerChoice:
+    if force == ShutdownForce.HARD:
+        method = 'hard_reboot'
+        reason = wrong_power_state(record, 'Running', 'Paused')
+    else:
+        method = 'clean_reboot'
+        reason = wrong_power_state(record, 'Running')
+    return reason or (method, getattr(VM.Actions, method), (), record.get('_resident_on_'))
+
+
+def choose_pause(record) -> PowerChoice:
+    if record['power_state'] == "Running":
+        return 'pause', VM.Actions.pause, (), record.get('_resident_on_')
+    elif record['power_state'] == "Paused":
+        return 'unpause', VM.Actions.unpause, (), record.get('_resident_on_')
+    return f"Power state is {record['power_state']}, expected: Running or Paused"
+
+
+def choose_suspend(record) -> PowerChoice:
+    return wrong_power_state(record, 'Running') or ('suspend', VM.Actions.suspend, (), record.get('_resident_on_'))
+
+
+VMStartManyMutation = create_bulk_power_mutation("VMStartManyMutation", {"options": graphene.Argument(VMStartInput)}, choose_start, "start")
+VMShutdownManyMutation = create_bulk_power_mutation("VMShutdownManyMutation",
+    {"force": graphene.Argument(ShutdownForce, description="Force shutdown in a hard or clean way")}, choose_shutdown, "shutdown")
+VMRebootManyMutation = create_bulk_power_mutation("VMRebootManyMutation",
+    {"force": graphene.Argument(ShutdownForce, description="Force reboot in a hard or clean way. Default: clean")}, choose_reboot, "reboot")
+VMPauseManyMutation = create_bulk_power_mutation("VMPauseManyMutation", {}, choose_pause, "pause")
+VMSuspendManyMutation = create_bulk_power_mutation("VMSuspendManyMutation", {}, choose_suspend, "suspend")
@@ -1,5 +1,7 @@
 from authentication import with_default_authentication
+from handlers.graphql.utils.paging import ListQuery
 from handlers.graphql.utils.querybuilder.querybuilder import QueryBuilder
+from handlers.graphql.utils.type import get_xentype
 
 
 def resolve_tasks():
@@ -21,17 +23,18 @@ def resolve_tasks():
         :param kwargs:
         start_date: Start of date range when task was created
         end_date: End of date range when task was created
+        and keyword arguments for pagination, sorting and filtering, see paging.list_arguments
         :return:
         '''
         start_date = kwargs.get('start_date')
         end_date = kwargs.get('end_date')
-        builder = QueryBuilder(id=None, user_authenticator=info.context.user_authenticator, info=info)
-        # patch builder.query
-
+        list_query = ListQuery.from_arguments(get_xentype(info.return_type), kwargs)
+        # date filters should be applied before the page is cut
         if start_date:
-            builder.query = builder.query.filter(lambda item: start_date < item['created'])
+            list_query.filters.append(f"lambda item: re.r.iso8601({start_date.isoformat()!r}, default_timezone='+00:00') < item['created']")
         if end_date:
-            builder.query = builder.query.filter(lambda item: item['created'] < end_date)
+            list_query.filters.append(f"lambda item: item['created'] < re.r.iso8601({end_date.isoformat()!r}, default_timezone='+00:00')")
+        builder = QueryBuilder(id=None, user_authenticator=info.context.user_authenticator, info=info, list_query=list_query)
         return builder.run_query()
 
     return resolver
\ No newline at end of file
@@ -4,8 +4,10 @@ from authentication import with_default_authentication
 from handlers.graphql.graphql_handler import ContextProtocol
 from handlers.graphql.utils.query import resolve_table
 from handlers.graphql.resolvers import with_connection
+from handlers.graphql.utils.loaders import get_loaders
 import constants.re as re
 from utils.user import ANY_USER, get_user_object
+from utils.usersearch import USER_SEARCH_INDEX, DEFAULT_LIMIT
 
 
 def resolve_users(*args, **kwargs):
@@ -42,6 +44,10 @@ def resolve_user(field_name="user_id"):
 
         if not id:
             return None
+
+        loaders = get_loaders(info.context)
+        if loaders:
+            return loaders.users.load(id)
         return get_user_object(id)
 
 
@@ -69,12 +75,23 @@ def resolve_current_user(root, info : ResolveInfo):
 
 
 @with_default_authentication
-def resolve_filter_users(root, info, query):
+def resolve_filter_users(root, info, query, limit=DEFAULT_LIMIT):
+    '''
+    Search users and groups by username or name. Uses in-memory index (see utils/usersearch.py),
+    falling back to DB until the index is populated by EventLoop.do_user_table
+    '''
+    if USER_SEARCH_INDEX.ready:
+        ret = USER_SEARCH_INDEX.search(query, limit)
+        ret.append(ANY_USER)
+        return ret
+
     q = re.db.table('users').filter(lambda user: user['username'].match(query).or_(user['name'].match(query))).merge(lambda user: {
         'id': 'users/' + user['id']
     }).union(re.db.table('groups').filter(lambda user: user['username'].match(query).or_(user['name'].match(query))).merge(lambda user: {
         'id': 'groups/' + user['id']
     }))
+    if limit is not None:
+        q = q.limit(limit)
     ret = q.coerce_to('array').run()
     ret.append(ANY_USER)
     return ret
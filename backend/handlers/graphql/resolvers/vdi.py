@@ -36,17 +36,13 @@ def resolve_isos_for_install(root, info, *args, **kwargs):
     :return:
     '''
     ctx : ContextProtocol = info.context
+    # content_type and is_tools_sr are denormalized into VDI records, see VDI.process_record
     if ctx.user_authenticator.is_admin():
-        return re.db.table('vdis').filter(lambda item: item['content_type'] == 'iso')\
-            .filter(lambda item: re.db.table('srs').get(item['SR'])['is_tools_sr'] == False)\
-            .run()
+        return re.db.table('vdis').get_all(['iso', False], index='install_iso').coerce_to('array').run()
     else:
         entities = list(user_entities(ctx.user_authenticator))
-        return re.db.table('vdis_user').get_all(*entities, index='userid')\
-            .filter(lambda item: re.db.table('vdis')\
-            .get(item['ref'])['content_type'] == 'iso')\
-            .filter(lambda  item: re.db.table('srs')\
-            .get(re.db.table('vdis').get(item['ref'])['SR'])['is_tools_sr'] == False)\
-            .merge(lambda item: re.db.table('vdis').get(item['ref']))\
-            .run()
+        visible_refs = re.db.table('vdis_user').get_all(*entities, index='userid')['ref'].distinct()
+        return re.db.table('vdis').get_all(re.r.args(visible_refs))\
+            .filter({'content_type': 'iso', 'is_tools_sr': False})\
+            .coerce_to('array').run()
 
@@ -13,7 +13,8 @@ from handlers.graphql.mutations.pool import PoolMutation
 from handlers.graphql.mutations.quota import QuotaMutation
 from handlers.graphql.mutations.task import TaskRemoveMutation
 from handlers.graphql.mutations.vm import VMDestroyMutation, VMSuspendMutation, VMPauseMutation, VMRebootMutation, \
-    VMShutdownMutation, VMStartMutation, VMMutation, VMSnapshotMutation
+    VMShutdownMutation, VMStartMutation, VMMutation, VMSnapshotMutation, VMStartManyMutation, VMShutdownManyMutation, \
+    VMRebootManyMutation, VMPauseManyMutation, VMSuspendManyMutation
 from handlers.graphql.mutations.vmsnapshot import VMRevertMutation, VMSnapshotDestroyMutation
 from handlers.graphql.resolvers.console import resolve_console
 from handlers.graphql.resolvers.quota import resolve_quotas, resolve_quota, resolve_quota_left, resolve_quota_usage
@@ -24,6 +25,8 @@ from handlers.graphql.mutations.sr import SRMutation, SRDestroyMutation
 from handlers.graphql.mutations.vdi import VDIMutation, VDIDestroyMutation, VDICreateMutation
 from handlers.graphql.types.vbd import GVBD
 from handlers.graphql.types.vmsnapshot import GVMSnapshot
+from handlers.graphql.utils.paging import list_arguments
+from utils.usersearch import DEFAULT_LIMIT
 from handlers.graphql.utils.query import resolve_all, resolve_one
 from handlers.graphql.utils.querybuilder.changefeedbuilder import ChangefeedBuilder
 from handlers.graphql.utils.querybuilder.querybuilder import QueryBuilder
@@ -31,7 +34,7 @@ from handlers.graphql.utils.subscription import MakeSubscription, resolve_xen_it
     MakeSubscriptionWithChangeType, resolve_all_xen_items_changes
 from handlers.graphql.resolvers.user import resolve_users, resolve_groups, resolve_user, resolve_filter_users, \
     resolve_current_user
-from handlers.graphql.types.playbook import GPlaybook, resolve_playbooks, resolve_playbook
+from handlers.graphql.types.playbook import GPlaybook, resolve_playbooks, resolve_playbook, resolve_playbook_inventory
 from handlers.graphql.types.playbooklauncher import PlaybookLaunchMutation
 from handlers.graphql.types.user import User, CurrentUserInformation
 from xenadapter.vdi import VDI
@@ -51,27 +54,27 @@ r = RethinkDB()
 
 class Query(ObjectType):
 
-    vms = graphene.List(GVM, required=True, resolver=resolve_all(), description="All VMs available to user")
+    vms = graphene.List(GVM, required=True, resolver=resolve_all(), **list_arguments(), description="All VMs available to user")
     vm = graphene.Field(GVM, ref=graphene.NonNull(graphene.ID), resolver=resolve_one(), description="Information about a VM")
 
     vm_snapshot = graphene.Field(GVMSnapshot, ref=graphene.NonNull(graphene.ID), resolver=resolve_one(), description="Information about a VM Snapshot")
-    templates = graphene.List(GTemplate, required=True, resolver=resolve_all(), description="All Templates available to user")
+    templates = graphene.List(GTemplate, required=True, resolver=resolve_all(), **list_arguments(), description="All Templates available to user")
     template = graphene.Field(GTemplate,  ref=graphene.NonNull(graphene.ID), resolver=resolve_one(), description="Information about a Template")
 
-    hosts = graphene.List(GHost, required=True, resolver=resolve_all(), description="All hosts in the pool")
+    hosts = graphene.List(GHost, required=True, resolver=resolve_all(), **list_arguments(), description="All hosts in the pool")
     host = graphene.Field(GHost,  ref=graphene.NonNull(graphene.ID), resolver=resolve_one(), description="Information about a host in the pool")
 
-    pools = graphene.List(GPool, required=True, resolver=resolve_all(), description="All pools in the system")
+    pools = graphene.List(GPool, required=True, resolver=resolve_all(), **list_arguments(), description="All pools in the system")
     pool = graphene.Field(GPool, ref=graphene.NonNull(graphene.ID), resolver=resolve_one(), description="Information about a pool")
 
-    networks = graphene.List(GNetwork, required=True, resolver=resolve_all(), description="All Networks available to user")
+    networks = graphene.List(GNetwork, required=True, resolver=resolve_all(), **list_arguments(), description="All Networks available to user")
     network = graphene.Field(GNetwork,  ref=graphene.NonNull(graphene.ID), resolver=resolve_one(), description="Information about a single network")
 
-    srs = graphene.List(GSR, required=True, resolver=resolve_all(),
+    srs = graphene.List(GSR, required=True, resolver=resolve_all(), **list_arguments(),
                              description="All Storage repositories available to user")
     sr = graphene.Field(GSR,  ref=graphene.NonNull(graphene.ID), resolver=resolve_one(), description="Information about a single storage repository")
 
-    vdis = graphene.Field(graphene.List(GVDI), only_isos=graphene.Boolean(description="True - print only ISO images; False - print everything but ISO images; null - print everything"), required=True, resolver=VDI.resolve_all(), description="All Virtual Disk Images (hard disks), available for user")
+    vdis = graphene.Field(graphene.List(GVDI), only_isos=graphene.Boolean(description="True - print only ISO images; False - print everything but ISO images; null - print everything"), required=True, resolver=VDI.resolve_all(), **list_arguments(), description="All Virtual Disk Images (hard disks), available for user")
     vdi = graphene.Field(GVDI, ref=graphene.NonNull(graphene.ID), resolver=resolve_one(), description="Information about a single virtual disk image (hard disk)")
 
     vbd = graphene.Field(GVBD, ref=graphene.NonNull(graphene.ID), resolver=resolve_vbd, description="Information about a virtual block device of a VM")
@@ -80,11 +83,15 @@ class Query(ObjectType):
     playbooks = graphene.List(GPlaybook,  required=True, resolver=resolve_playbooks, description="List of Ansible-powered playbooks")
     playbook = graphene.Field(GPlaybook, id=graphene.ID(), resolver=resolve_playbook,
                               description="Information about Ansible-powered playbook")
+    playbook_inventory = graphene.Field(graphene.JSONString, required=True, vms=graphene.NonNull(graphene.List(graphene.NonNull(graphene.ID))),
+                                        resolver=resolve_playbook_inventory,
+                                        description="Ansible dynamic inventory (JSON) for VMs, as used by playbook launches")
 
-    tasks = graphene.Field(graphene.List(GTask), required=True, start_date = graphene.DateTime(), end_date = graphene.DateTime(),  resolver=resolve_tasks(), description="All Tasks available to user")
+    tasks = graphene.Field(graphene.List(GTask), required=True, start_date = graphene.DateTime(), end_date = graphene.DateTime(),  resolver=resolve_tasks(), **list_arguments(), description="All Tasks available to user")
     task = graphene.Field(GTask, ref=graphene.NonNull(graphene.ID), resolver=resolve_one(), description="Single Task")
 
     console = graphene.Field(graphene.String, required=False, vm_ref=graphene.NonNull(graphene.ID),
+                             view_only=graphene.Boolean(default_value=False, description="Join shared console without keyboard and mouse control"),
                              description="One-time link to RFB console for a VM", resolver=resolve_console)
 
     users = graphene.List(User, required=True,
@@ -94,7 +101,8 @@ class Query(ObjectType):
     user = graphene.Field(User, description="User or group information", id=graphene.ID(), resolver=resolve_user())
     current_user = graphene.Field(CurrentUserInformation, description="current user or group information", resolver=resolve_current_user)
 
-    find_user = graphene.Field(graphene.List(User), query=graphene.NonNull(graphene.String), required=True, resolver=resolve_filter_users)
+    find_user = graphene.Field(graphene.List(User), query=graphene.NonNull(graphene.String), required=True, resolver=resolve_filter_users,
+                               limit=graphene.Int(default_value=DEFAULT_LIMIT, description="Maximum number of users and groups to return"))
 
     quotas = graphene.Field(graphene.List(Quota), required=True, resolver=resolve_quotas)
     quota = graphene.Field(Quota, required=True, resolver=resolve_quota, user=graphene.NonNull(graphene.String))
@@ -119,6 +127,11 @@ class Mutation(ObjectType):
     vm_pause = VMPauseMutation.Field(description="If VM is Running, pause VM. If Paused, unpause VM")
     vm_suspend = VMSuspendMutation.Field(description="If VM is Running, suspend VM. If Suspended, resume VM")
     vm_snapshot = VMSnapshotMutation.Field(description="Make a snapshot")
+    vm_start_many = VMStartManyMutation.Field(description="Start (or resume) many VMs")
+    vm_shutdown_many = VMShutdownManyMutation.Field(description="Shut down many VMs")
+    vm_reboot_many = VMRebootManyMutation.Field(description="Reboot many VMs")
+    vm_pause_many = VMPauseManyMutation.Field(description="Pause Running VMs and unpause Paused VMs")
+    vm_suspend_many = VMSuspendManyMutation.Field(description="Suspend many VMs")
 
     vm_revert = VMRevertMutation.Field(description="Restore VM state from a snapshot")
     vm_snapshot_destroy = VMSnapshotDestroyMutation.Field(description="Destroy a VM Snapshot")
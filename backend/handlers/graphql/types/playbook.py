@@ -4,6 +4,7 @@ from graphene.types.resolver import dict_resolver
 from authentication import with_default_authentication
 from handlers.graphql.resolvers import with_connection
 from handlers.graphql.types.base.objecttype import ObjectType
+from playbookinventory import get_inventory_hosts, dynamic_inventory
 from playbookloader import PlaybookLoader
 from handlers.graphql.types.vm import OSVersion
 import rethinkdb
@@ -50,3 +51,14 @@ def resolve_playbooks(root, info):
 
     return data
 
+
+@with_default_authentication
+@with_connection
+def resolve_playbook_inventory(root, info, vms):
+    '''
+    Ansible dynamic inventory of VMs that user can launch playbooks on. VMs without an IP address on 'ansible_networks' are skipped
+    '''
+    from xenadapter.vm import VM
+    allowed = VM.check_access_many(info.context.user_authenticator, vms, VM.Actions.launch_playbook)
+    hosts, _ = get_inventory_hosts([ref for ref, ok in zip(vms, allowed) if ok], opts.ansible_networks)
+    return dynamic_inventory(hosts)
@@ -22,9 +22,9 @@ from customtask.customtask import CustomTask
 from handlers.graphql.graphql_handler import ContextProtocol
 from handlers.graphql.resolvers import with_connection
 from loggable import Loggable
+from playbookinventory import get_inventory_hosts, static_inventory
 from playbookloader import PlaybookLoader
-from xenadapter import VIF
-from xenadapter.network import Network
+from playbookscheduler import PlaybookScheduler, PlaybookJob, PlaybookQueueFull, link_tree, replace_file
 from xenadapter.vm import VM
 from rethinkdb import RethinkDB
 from tornado.options import options as opts
@@ -39,18 +39,16 @@ def launch_playbook(ctx: ContextProtocol,  task : CustomTask, playbook_id, vms:
             "playbookId": playbook_id,
             "variables": variables
         }))
-        def check_access(vm):
-            if not vm.check_access(ctx.user_authenticator, VM.Actions.launch_playbook):
-                task.set_status(status='failure', error_info_add=f"Access denied: user: users/{ctx.user_authenticator.get_id()}")
-                return False
-            else:
-                return True
         if vms:
-            vms = list(filter(lambda ref: check_access(VM(xen=ctx.xen, ref=ref)), vms))
+            allowed = VM.check_access_many(ctx.user_authenticator, vms, VM.Actions.launch_playbook)
+            if not all(allowed):
+                task.set_status(status='failure', error_info_add=f"Access denied: user: users/{ctx.user_authenticator.get_id()}")
+            vms = [ref for ref, ok in zip(vms, allowed) if ok]
         else:
             vms = []
         temp_dir = constants.tmpdir_path + task.id
         try:
+            task.set_status(progress=0.1)
             table = re.db.table(PlaybookLoader.PLAYBOOK_TABLE_NAME)
             playbook = table.get(playbook_id).run()
             try:
@@ -59,11 +57,10 @@ def launch_playbook(ctx: ContextProtocol,  task : CustomTask, playbook_id, vms:
                 task.set_status(status='failure', error_info_add=f"Cannot create temporary directory {temp_dir}: {str(e)}")
                 return
 
-            from distutils.dir_util import copy_tree
             playbook_dir = playbook['playbook_dir']
-            logging.debug(f"Copying {playbook_dir} into temporary directory")
+            logging.debug(f"Linking {playbook_dir} into temporary directory")
             try:
-                copy_tree(playbook_dir, temp_dir)
+                link_tree(Path(playbook_dir), Path(temp_dir))
             except Exception as e:
                 task.set_status(status='failure', error_info_add=f"Cannot copy {playbook_dir} into {temp_dir}: {str(e)}")
                 return
@@ -72,37 +69,14 @@ def launch_playbook(ctx: ContextProtocol,  task : CustomTask, playbook_id, vms:
 
             if not playbook['inventory']:
                 hosts_file = 'hosts'
-                yaml_hosts = {'all': {'hosts': {}}}
-                for ref in vms:
-                    vm = VM(ctx.xen, ref=ref)
-                    for vif_ref in vm.get_VIFs():
-                        vif = VIF(ctx.xen, ref=vif_ref)
-                        network = Network(ctx.xen, ref=vif.get_network())
-                        if not network:
-                            continue
-
-                        if network and network.get_uuid() not in opts.ansible_networks and network.ref not in opts.ansible_networks:
-                            logging.debug(f"{network} is not a network configured for Ansible. This is probably okay")
-                            continue
-                        ip = vif.get_ipv4()
-                        if not ip:
-                            logging.warning(f"Could not get an IP to connect to {vm}: {network}. This is probably not okay, install Xen drivers")
-                            continue
-
-                        other_config = vm.get_other_config()
-                        user = other_config.get('first_user', 'root')
-                        yaml_hosts['all']['hosts'][vm.get_name_label()] = {
-                            'ansible_user': user,
-                            'ansible_host': ip
-                        }
-                        break
-                    else:
-                        logging.warning(
-                            f"Ignoring {vm}: not connected to any of 'ansible_networks'. Check your configuration")
-                        task.set_status(status="failure", error_info_add=f"Could not connect to {vm}: Not connected to Ansible network")
+                hosts, unreachable = get_inventory_hosts(vms, opts.ansible_networks)
+                for ref in unreachable:
+                    logging.warning(f"Ignoring VM {ref}: no IP address on any of 'ansible_networks'. Check your configuration and Xen drivers")
+                    task.set_status(status="failure", error_info_add=f"Could not connect to VM {ref}: Not connected to Ansible network")
+                yaml_hosts = static_inventory(hosts)
                 if yaml_hosts['all']['hosts']:
                     # Create ansible execution task
-                    with open(temp_path.joinpath(hosts_file), 'w') as file:
+                    with open(replace_file(temp_path.joinpath(hosts_file)), 'w') as file:
                         yaml.dump(yaml_hosts, file)
                         logging.debug(f"Hosts file created at {file.name}")
                 else:
@@ -122,7 +96,7 @@ def launch_playbook(ctx: ContextProtocol,  task : CustomTask, playbook_id, vms:
                     logging.debug(f"Loading file {file_name}")
                     with open(file_name, 'r') as file:
                         original_variables = yaml.load(file)
-                    with open(file_name, 'w') as file:
+                    with open(replace_file(file_name), 'w') as file:
                         yaml.dump({**original_variables, **this_variables}, file)
 
                     logging.info(f'File {file_name} patched')
@@ -172,11 +146,13 @@ class PlaybookLaunchMutation(graphene.Mutation):
 
         variables = graphene.Argument(graphene.JSONString,
                                       description="JSON with key-value pairs representing Playbook variables changed by user")
+        priority = graphene.Argument(graphene.Int, default_value=0,
+                                     description="Playbooks with higher priority are started first. Only administrators can set priority above 0")
 
     @staticmethod
     @with_default_authentication
     @with_connection
-    def mutate(root, info, id, vms=None, variables=None):
+    def mutate(root, info, id, vms=None, variables=None, priority=0):
         '''
         Lauch a specified playbooks
         :param root:
@@ -184,6 +160,7 @@ class PlaybookLaunchMutation(graphene.Mutation):
         :param id: Playbook to launch
         :param vms: VM refs to launch playbook on. If None, don't generate an inventory file
         :param variables:
+        :param priority: Position in PlaybookScheduler queue
         :return:
         '''
         ctx : ContextProtocol = info.context
@@ -191,10 +168,19 @@ class PlaybookLaunchMutation(graphene.Mutation):
         data = table.get(id).pluck('id').coerce_to('array').run()
         if not data:
             raise ValueError(f"No such playbook: {id}")
+        if priority > 0 and not ctx.user_authenticator.is_admin():
+            raise ValueError("Only administrators can set priority above 0")
         task_id = str(uuid.uuid4())
         task = CustomTask(id=task_id, object_type=VM, object_ref=';'.join(vms), action=VM.Actions.launch_playbook.serialize()[0], user_authenticator=ctx.user_authenticator)
-        tornado.ioloop.IOLoop.current().run_in_executor(ctx.executor,
-                                                        lambda: launch_playbook(ctx, task, id, vms, variables))
+        scheduler = PlaybookScheduler()
+        job = PlaybookJob(task_id, lambda: launch_playbook(ctx, task, id, vms, variables), priority)
+        task.set_cancel_handler(lambda: scheduler.cancel(job)) # False if the job has started. Replaced by launch_playbook then
+        try:
+            scheduler.submit(job)
+        except PlaybookQueueFull as e:
+            task.unset_cancel_handler()
+            task.set_status(status='failure', error_info_add=str(e))
+            raise ValueError(str(e))
 
 
         return PlaybookLaunchMutation(task_id=task_id)
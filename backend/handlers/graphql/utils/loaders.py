@@ -0,0 +1,64 @@
+from functools import wraps
+from typing import Callable, List, Dict, Type, Optional
+
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from connman import ReDBConnection
+from utils.user import get_user_objects
+
+
+def with_db_connection(method):
+    '''
+    Batch functions are called when graphql-core waits for pending promises, i.e. outside of resolvers' with_connection
+    '''
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        with ReDBConnection().get_connection():
+            return method(*args, **kwargs)
+
+    return wrapper
+
+
+class BatchLoader(DataLoader):
+    '''
+    DataLoader that resolves all keys requested during one execution tick with a single call of batch_function.
+    Results are cached for a lifetime of the loader (i.e. for a request)
+    :param batch_function: takes a list of keys and returns a list of values in the same order
+    '''
+    def __init__(self, batch_function: Callable[[List], List], **kwargs):
+        super().__init__(**kwargs)
+        self.batch_function = batch_function
+
+    def batch_load_fn(self, keys):
+        return Promise.resolve(self.batch_function(keys))
+
+
+class Loaders:
+    '''
+    Per-request set of loaders, available in resolvers as info.context.loaders
+    '''
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.users = BatchLoader(with_db_connection(get_user_objects))
+        self._access: Dict[Type["XenObject"], BatchLoader] = {}
+
+    def access(self, xentype: Type["XenObject"]) -> BatchLoader:
+        '''
+        Loader that maps refs of xentype objects to booleans: whether current user can view them
+        '''
+        if xentype not in self._access:
+            @with_db_connection
+            def check_access(refs):
+                return xentype.check_access_many(self.ctx.user_authenticator, refs, action=None)
+
+            self._access[xentype] = BatchLoader(check_access)
+
+        return self._access[xentype]
+
+
+def get_loaders(ctx) -> Optional[Loaders]:
+    '''
+    Returns request loaders or None if context has no loaders (e.g. subscriptions which outlive their data)
+    '''
+    return getattr(ctx, 'loaders', None)
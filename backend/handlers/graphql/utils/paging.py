@@ -1,4 +1,157 @@
+import re as regex
+from typing import Optional, List, Mapping
+
+import graphene
+
 DEFAULT_PAGE_SIZE=20
 
 def do_paging(query, page, page_size=DEFAULT_PAGE_SIZE):
     return query.slice((page - 1) * page_size, page_size)
+
+
+def sort_key(row, field):
+    '''
+    Key of compound index sort_<field>, see XenObject.create_db. Unset fields (i.e. main_owner of unowned objects)
+    are sorted as empty strings: null keys aren't indexed, so such objects would be missing from sorted lists
+    '''
+    return [row[field].default(''), row['ref']]
+
+
+def sort_key_string(row : str, field : str) -> str:
+    '''
+    :return: sort_key as a ReQL string for QueryBuilder
+    '''
+    return f"[{row}['{field}'].default(''), {row}['ref']]"
+
+
+class ListOrderField(graphene.Enum):
+    name_label = 'name_label'
+    power_state = 'power_state'
+    main_owner = 'main_owner'
+    created = 'created'
+
+
+class ListFilter(graphene.InputObjectType):
+    name_label = graphene.String(description="Case-insensitive substring of name_label")
+    power_state = graphene.String(description="Exact power state, i.e. Running, Halted, Paused or Suspended")
+    main_owner = graphene.String(description="Main owner's user ID in form users/USER_ID or groups/GROUP_ID")
+
+
+def list_arguments():
+    '''
+    Keyword arguments for list fields that are resolved with ListQuery
+    :return: dict of graphene arguments
+    '''
+    return dict(
+        first=graphene.Int(description="Maximum number of items to return"),
+        after=graphene.ID(description="Ref of the last item of the previous page"),
+        order_by=graphene.Argument(ListOrderField, description="Field to sort by. Default: ref"),
+        desc=graphene.Boolean(description="Sort in descending order"),
+        filter=graphene.Argument(ListFilter),
+    )
+
+
+class ListQuery:
+    '''
+    Compiles list arguments (see list_arguments) into a ReQL string for QueryBuilder.
+    Pagination is keyset-based: "after" is a ref of the last seen item, next page starts right after
+    its [order_by field, ref] key, so pages don't shift when objects are added or removed.
+    If the "after" item itself has been removed, its key is unknown and the list starts over.
+
+    When we can read from the table directly (admin queries), compound indexes sort_<field> ([field, ref], see XenObject.create_db)
+    are used, so that only the requested page is read. Otherwise (ACL queries) items are sorted and limited on server before
+    dependent objects are merged in.
+    '''
+    def __init__(self, xentype, first : Optional[int] = None, after : Optional[str] = None,
+                 order_by : Optional[str] = None, desc : bool = False, filter : Optional[Mapping] = None):
+        if order_by and order_by not in xentype.SORT_FIELDS:
+            raise ValueError(f"{xentype.__name__} can't be sorted by {order_by}. Available fields: {', '.join(xentype.SORT_FIELDS)}")
+        if first is not None and first < 0:
+            raise ValueError(f"first should be non-negative, got {first}")
+
+        self.xentype = xentype
+        self.first = first
+        self.after = after
+        self.order_by = order_by
+        self.desc = desc
+        self.filters : List[str] = [] # ReQL lambdas as strings
+        for key, value in (filter or {}).items():
+            if value is None:
+                continue
+            if key == 'name_label':
+                self.filters.append(f"lambda item: item['name_label'].match({'(?i)' + regex.escape(value)!r})")
+            else:
+                self.filters.append(f"lambda item: item['{key}'] == {value!r}")
+
+    @classmethod
+    def from_arguments(cls, xentype, kwargs : Mapping) -> "ListQuery":
+        return cls(xentype, **{key: kwargs.get(key) for key in list_arguments()})
+
+    def __bool__(self):
+        return bool(self.first is not None or self.after or self.order_by or self.desc or self.filters)
+
+    def __repr__(self):
+        return f"ListQuery <{self.table_string()}>"
+
+    def _after_key(self):
+        if not self.order_by:
+            return repr(self.after)
+        restart = 're.r.maxval' if self.desc else 're.r.minval'
+        return f"re.db.table('{self.xentype.db_table_name}').get({self.after!r})" \
+               f".do(lambda after: re.r.branch(after.eq(None), {restart}, {sort_key_string('after', self.order_by)}))"
+
+    def _filter_and_limit(self):
+        query = [f".filter({item})" for item in self.filters]
+        if self.first is not None:
+            query.append(f".limit({self.first})")
+        return query
+
+    def table_string(self) -> str:
+        '''
+        :return: ReQL string to be applied to re.db.table(xentype.db_table_name)
+        '''
+        if not self.first and not self.after and not self.order_by and not self.desc:
+            return ''.join(self._filter_and_limit())
+
+        index = f"sort_{self.order_by}" if self.order_by else 'ref'
+        query = []
+        if self.after:
+            if self.desc:
+                query.append(f".between(re.r.minval, {self._after_key()}, right_bound='open', index='{index}')")
+            else:
+                query.append(f".between({self._after_key()}, re.r.maxval, left_bound='open', index='{index}')")
+
+        if self.desc:
+            query.append(f".order_by(index=re.r.desc('{index}'))")
+        else:
+            query.append(f".order_by(index='{index}')")
+
+        query.extend(self._filter_and_limit())
+        return ''.join(query)
+
+    def array_string(self) -> str:
+        '''
+        :return: ReQL string to be applied to an array of records
+        '''
+        if self.order_by:
+            key = f"lambda item: {sort_key_string('item', self.order_by)}"
+            after_key = self._after_key()
+            item_key = f"re.r.expr({sort_key_string('item', self.order_by)})"
+        else:
+            key = "lambda item: item['ref']"
+            after_key = repr(self.after)
+            item_key = "item['ref']"
+
+        query = []
+        if self.after:
+            operator = '<' if self.desc else '>'
+            query.append(f".filter(lambda item: {item_key} {operator} {after_key})")
+
+        if self.first is not None or self.after or self.order_by or self.desc:
+            if self.desc:
+                query.append(f".order_by(re.r.desc({key}))")
+            else:
+                query.append(f".order_by({key})")
+
+        query.extend(self._filter_and_limit())
+        return ''.join(query)
@@ -7,7 +7,7 @@ from authentication import with_default_authentication
 from constants import re as re
 from handlers.graphql.graphql_handler import ContextProtocol
 from handlers.graphql.types.base.objecttype import ObjectType
-from handlers.graphql.utils.paging import do_paging
+from handlers.graphql.utils.paging import do_paging, ListQuery
 from handlers.graphql.utils.string import underscore
 from handlers.graphql.utils.querybuilder.querybuilder import QueryBuilder
 from handlers.graphql.utils.type import get_xentype, check_access_of_return_value
@@ -141,11 +141,12 @@ def resolve_all():
 
         :param root:
         :param info:
-        :param kwargs: Optional keyword arguments for pagination: "page" and "page_size"
+        :param kwargs: Optional keyword arguments for pagination, sorting and filtering, see paging.list_arguments
 
         :return:
         '''
-        builder = QueryBuilder(id=None, user_authenticator=info.context.user_authenticator, info=info)
+        list_query = ListQuery.from_arguments(get_xentype(info.return_type), kwargs)
+        builder = QueryBuilder(id=None, user_authenticator=info.context.user_authenticator, info=info, list_query=list_query)
         return builder.run_query()
 
     return resolver
@@ -7,6 +7,7 @@ import itertools
 from rethinkdb.errors import ReqlNonExistenceError
 
 from authentication import BasicAuthenticator
+from handlers.graphql.utils.paging import ListQuery
 from handlers.graphql.utils.querybuilder.get_fields import get_fields
 from utils.user import user_entities
 import constants.re as re
@@ -19,7 +20,7 @@ class QueryBuilder:
     sophisticated GraphQL query ("ref" fields).
 
     '''
-    def __init__(self, id: Optional[Union[str, Collection]], info: ResolveInfo, user_authenticator: Optional[BasicAuthenticator] = None, additional_string = None, select_subfield=None):
+    def __init__(self, id: Optional[Union[str, Collection]], info: ResolveInfo, user_authenticator: Optional[BasicAuthenticator] = None, additional_string = None, select_subfield=None, list_query : Optional[ListQuery] = None):
         '''
 
         :param queue: Queue to put results into. If None, yield_values acts as generator
@@ -28,11 +29,13 @@ class QueryBuilder:
         :param user_authenticator: Build query for all items with user table. This param is only used if id is None
          :param additional_string Add string to query. This may be used to support filtering, etc. NB: Don't use with subscriptions.
          :param select_subfield. A list representing path to subfield that is supposed to be analyzed in info
+         :param list_query: Pagination, sorting and filtering for querying ALL objects. Applied before dependent objects are merged. NB: Don't use with subscriptions.
         '''
         self.fields = get_fields(info, select_subfield)
         self.authenticator = user_authenticator
         self.id = id
         self.paths = {} # Key - JSONPath expression, value - database table name. Contains dependent paths
+        self.list_query = list_query
         self.query, self.query_string = self.build_query(additional_string)
 
     def __repr__(self):
@@ -191,11 +194,15 @@ class QueryBuilder:
                 query.append(','.join((f"'{item}'" for item in self.id)))
                 query.append(add_my_actions_for_admin(xenobject_type, list=True))
             else:
+                if self.list_query:
+                    query.append(self.list_query.table_string())
                 query.append(add_my_actions_for_admin(xenobject_type, list=True))
         else:
             query = []
             if not self.id:
                 query.append(get_all_user_items(xenobject_type.db_table_name))
+                if self.list_query:
+                    query.append(self.list_query.array_string())
             elif isinstance(self.id, str):
                 query.append(get_one_user_item_by_id(xenobject_type.db_table_name))
             elif isinstance(self.id, Iterable):
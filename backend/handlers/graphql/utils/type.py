@@ -4,6 +4,7 @@ from graphql import ResolveInfo
 
 
 from handlers.graphql.graphql_handler import ContextProtocol
+from handlers.graphql.utils.loaders import get_loaders
 
 
 def get_xentype(type):
@@ -24,6 +25,11 @@ def check_access_of_return_value(ctx : ContextProtocol, ret, type : Type["XenObj
     '''
     if ctx.user_authenticator.is_admin() or not ret:
         return ret
+
+    loaders = get_loaders(ctx)
+    if loaders:
+        return loaders.access(type).load(ret['ref']).then(lambda granted: ret if granted else None)
+
     type_object = type(xen=ctx.xen, ref=ret['ref'])
 
     if not type_object.check_access(ctx.user_authenticator, action=None):
@@ -16,6 +16,9 @@ from tornado.websocket import WebSocketClosedError
 from connman import ReDBConnection
 from consolelist import ConsoleList
 from handlers.base import BaseWSHandler
+from handlers.rest.consolebroker import ConsoleViewer, ConsoleSession, CONSOLE_BROKER
+from handlers.rest.consoleproxy import ConsoleProxy, ConsoleConnectError, CONSOLE_TOTALS, open_upstream
+from handlers.rest.rfb import RFBError
 from xenadapter.vm import VM
 
 
@@ -32,7 +35,15 @@ class ConsoleHandler(BaseWSHandler):
                                              (username,
                                               password).encode())
         self.reader, self.writer = None, None
+        self.proxy : ConsoleProxy = None
+        self.viewer : ConsoleViewer = None
+        self.session : ConsoleSession = None
 
+    def get_compression_options(self):
+        # permessage-deflate. VNC encodings such as Tight and ZRLE are already compressed, so it's off by default
+        if opts.console_compression:
+            return {}
+        return None
 
     async def open(self):
         '''
@@ -51,41 +62,46 @@ class ConsoleHandler(BaseWSHandler):
 
 
         async with ReDBConnection().get_async_connection() as conn:
-            url = await ConsoleList.get_url_by_secret(conn, secret)
-        if url is None:
+            console = await ConsoleList.get_by_secret(conn, secret)
+        if console is None:
             self.close()
             return
-        vnc_url_parsed = urlsplit(url)
-        port = vnc_url_parsed.port
-
-        if port is None:
-            port = 80 # TODO: If scheme is HTTPS, use 443
-        self.log.debug(f"Opening connection to {vnc_url_parsed.hostname}:{port}")
-        self.reader, self.writer =  await asyncio.open_connection(vnc_url_parsed.hostname, port)
-        self.halt = False
-        self.translate = False
-        self.key = None
-
-        uri = f'{vnc_url_parsed.path}?{vnc_url_parsed.query}'
-        lines = [
-            'CONNECT {0} HTTP/1.1'.format(uri),  # HTTP 1.1 creates Keep-alive connection
-            'Host: {0}'.format(opts.vmemperor_host),
-            #   'Authorization: Basic {0}'.format(self.auth_token),
-        ]
-        self.writer.write('\r\n'.join(lines).encode())
-        self.writer.write(b'\r\nAuthorization: Basic ' + self.auth_token)
-        self.writer.write(b'\r\n\r\n')
+
+        url = console['url']
+        if opts.console_shared:
+            await self.join_session(url, console.get('view_only', False))
+            return
+
+        self.log.debug(f"Opening connection to {url}")
+        try:
+            self.reader, self.writer = await open_upstream(url, self.auth_token, opts.vmemperor_host)
+        except (ConsoleConnectError, OSError) as e:
+            self.log.error(f"Unable to open VNC Console {self.request.uri}: Error: {e}")
+            self.close()
+            return
+
+        self.proxy = ConsoleProxy(self.reader, self.writer, lambda data: self.write_message(data, binary=True))
         tornado.ioloop.IOLoop.current().spawn_callback(self.server_reading)
 
-    async def on_message(self, message):
-        assert (isinstance(message, bytes))
-        self.writer.write(message)
+    async def join_session(self, url, view_only):
+        self.viewer = ConsoleViewer(lambda data: self.write_message(data, binary=True), self.close, view_only=view_only)
         try:
-            await self.writer.drain()
-        except (ConnectionResetError, BrokenPipeError):
-            self.halt = True
+            self.session = await CONSOLE_BROKER.join(url, self.auth_token, opts.vmemperor_host, self.viewer)
+        except (ConsoleConnectError, RFBError, OSError, asyncio.IncompleteReadError) as e:
+            self.log.error(f"Unable to open VNC Console {self.request.uri}: Error: {e}")
+            self.viewer.close()
             return
 
+        if self.viewer.closed: # Client went away while we were connecting
+            self.session.detach(self.viewer)
+
+    async def on_message(self, message):
+        assert (isinstance(message, bytes))
+        if self.proxy:
+            await self.proxy.client_to_server(message)
+        elif self.session:
+            await self.session.viewer_message(self.viewer, message)
+
     def select_subprotocol(self, subprotocols):
         if 'binary' in subprotocols:
             proto = 'binary'
@@ -97,43 +113,26 @@ class ConsoleHandler(BaseWSHandler):
 
     async def server_reading(self):
         try:
-            data_sent = False
-            http_header_read = False
-            while self.halt is False:
-                if not data_sent:
-                    data = await self.reader.read(100)
-                    if not http_header_read:
-                        notok = b'200 OK' not in data
-                        if notok:
-                            self.log.error(f"Unable to open VNC Console {self.request.uri}: Error: {data}")
-                            self.close()
-                            return
-                        else:
-                            http_header_read = True
-
-                    try:
-                        index = data.index(b'RFB')
-                    except ValueError:
-                        self.log.warning("server_reading: 200 OK returned, but no RFB in first data message. Continuing")
-                        continue
-
-                    data = data[index:]
-                    data_sent = True
-                else:
-                    data = await self.reader.read(1024)
-                try:
-                    self.write_message(data, binary=True)
-                except WebSocketClosedError as e:
-                    return
-                if self.reader.at_eof():
-                    return
-
+            await self.proxy.server_to_client()
         except Exception as e:
             self.log.error(f"Exception: {e}")
             capture_exception(e)
+        finally:
+            self.close()
 
     def on_close(self):
-        self.halt = True
-        if self.writer:
+        if self.proxy:
+            self.proxy.close()
+            CONSOLE_TOTALS.add(self.proxy.stats)
+            self.log.info(f"Console {self.request.path} closed: {self.proxy.stats.as_dict()}")
+            self.proxy = None
+        elif self.session:
+            self.session.detach(self.viewer)
+            self.viewer.close()
+            CONSOLE_TOTALS.add(self.viewer.stats)
+            self.log.info(f"Console {self.request.path} viewer closed: {self.viewer.stats.as_dict()}")
+            self.session = None
+        elif self.viewer:
+            self.viewer.close()
+        elif self.writer:
             self.writer.close()
-
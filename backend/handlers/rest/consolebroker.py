@@ -0,0 +1,287 @@
+import asyncio
+import time
+from typing import Callable, Awaitable, Dict, List, Optional
+
+import tornado.ioloop
+from tornado.iostream import StreamClosedError
+from tornado.websocket import WebSocketClosedError
+
+from handlers.rest.consoleproxy import ConsoleStats, open_upstream, MAX_READ_SIZE
+from handlers.rest.rfb import ServerInit, ServerHandshake, ClientMessageSplitter, ServerMessageSplitter, RFBError, \
+    client_handshake, framebuffer_update_request, FRAMEBUFFER_UPDATE, FRAMEBUFFER_UPDATE_REQUEST, INPUT_MESSAGES
+from loggable import Loggable
+
+MAX_VIEWER_BUFFER = 16 * 1024 * 1024
+
+
+class ConsoleViewer:
+    '''
+    One WebSocket client of a shared console session. Data for the client is queued and sent by a separate coroutine,
+    so a slow viewer doesn't hold back the others. A viewer with more than max_buffer bytes queued is disconnected.
+    :param send: coroutine function that sends bytes to the client
+    :param close: function that closes client connection
+    :param view_only: if True, viewer's input is never forwarded to VM
+    '''
+    def __init__(self, send : Callable[[bytes], Awaitable], close : Callable[[], None], view_only=False, max_buffer=MAX_VIEWER_BUFFER):
+        self.send = send
+        self._close = close
+        self.view_only = view_only
+        self.max_buffer = max_buffer
+        self.stats = ConsoleStats()
+        self.handshake : Optional[ServerHandshake] = None
+        self.splitter = ClientMessageSplitter()
+        self.buffered = 0
+        self.closed = False
+        self._queue = asyncio.Queue()
+        tornado.ioloop.IOLoop.current().spawn_callback(self._write_loop)
+
+    def __repr__(self):
+        return f"ConsoleViewer <{'view only' if self.view_only else 'control'}>"
+
+    def push(self, data : bytes):
+        if self.closed or not data:
+            return
+        self.buffered += len(data)
+        if self.buffered > self.max_buffer:
+            self.close()
+            return
+        self._queue.put_nowait(data)
+
+    async def _write_loop(self):
+        while True:
+            data = await self._queue.get()
+            if data is None:
+                return
+            start = time.monotonic()
+            try:
+                await self.send(data)
+            except (WebSocketClosedError, StreamClosedError):
+                self.close()
+                return
+            self.buffered -= len(data)
+            self.stats.record_down(len(data), time.monotonic() - start)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.put_nowait(None)
+        self._close()
+
+
+class ConsoleSession(Loggable):
+    '''
+    One upstream RFB connection shared by any number of viewers.
+
+    The session performs the handshake with the VNC server itself, choosing a pixel format and a set of encodings
+    ServerMessageSplitter understands, so that it always knows where server messages end.
+    Every viewer gets a local handshake with a copy of ServerInit and starts receiving the server stream at the next message
+    boundary, after which a full (non-incremental) framebuffer update is requested for it.
+
+    Viewers' SetPixelFormat and SetEncodings are dropped. Incremental update requests are forwarded only when
+    no request is outstanding, since a single update is sent to everyone. Key, pointer and clipboard events are forwarded
+    only from the controller: the earliest joined viewer that is not view-only. When the controller leaves, the next one is promoted
+    '''
+    def __init__(self, key, reader : asyncio.StreamReader, writer : asyncio.StreamWriter, server_init : ServerInit, on_finish=None):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.server_init = server_init
+        self.on_finish = on_finish
+        self.splitter = ServerMessageSplitter(server_init.bytes_per_pixel, (server_init.width, server_init.height))
+        self.viewers : List[ConsoleViewer] = [] # Receiving server stream, in order of joining
+        self.pending : List[ConsoleViewer] = [] # Handshake done, waiting for a message boundary
+        self.handshaking : List[ConsoleViewer] = []
+        self.controller : Optional[ConsoleViewer] = None
+        self.update_requested = False
+        self.stats = ConsoleStats() # Upstream traffic
+        self.finished = False
+        self.init_log()
+
+    def __repr__(self):
+        return f"ConsoleSession <{self.key}: {len(self)} viewers>"
+
+    def __len__(self):
+        return len(self.viewers) + len(self.pending) + len(self.handshaking)
+
+    def _all_viewers(self):
+        return [*self.viewers, *self.pending, *self.handshaking]
+
+    def attach(self, viewer : ConsoleViewer):
+        viewer.handshake = ServerHandshake(self._current_server_init())
+        self.handshaking.append(viewer)
+        viewer.push(viewer.handshake.greeting())
+
+    def detach(self, viewer : ConsoleViewer):
+        for viewers in (self.viewers, self.pending, self.handshaking):
+            if viewer in viewers:
+                viewers.remove(viewer)
+        if viewer is self.controller:
+            self._elect_controller()
+        if not len(self):
+            self.close()
+
+    def _current_server_init(self) -> ServerInit:
+        width, height = self.splitter.desktop_size
+        return ServerInit(width, height, self.server_init.pixel_format, self.server_init.name)
+
+    def _elect_controller(self):
+        self.controller = next((viewer for viewer in (*self.viewers, *self.pending) if not viewer.view_only), None)
+        if self.controller:
+            self.log.debug(f"{self.controller} is now controlling")
+
+    async def _send_upstream(self, data : bytes):
+        self.stats.record_up(len(data))
+        self.writer.write(data)
+        try:
+            await self.writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            self.close()
+
+    async def _request_full_update(self):
+        width, height = self.splitter.desktop_size
+        self.update_requested = True
+        await self._send_upstream(framebuffer_update_request(False, width, height))
+
+    async def viewer_message(self, viewer : ConsoleViewer, message : bytes):
+        '''
+        Handle bytes received from viewer
+        '''
+        viewer.stats.record_up(len(message))
+        try:
+            if viewer in self.handshaking:
+                viewer.push(viewer.handshake.feed(message))
+                if not viewer.handshake.done:
+                    return
+                self.handshaking.remove(viewer)
+                if self.splitter.at_boundary:
+                    self.viewers.append(viewer)
+                else:
+                    self.pending.append(viewer)
+                if not self.controller and not viewer.view_only:
+                    self._elect_controller()
+                await self._request_full_update()
+                message = viewer.handshake.leftover
+                if not message:
+                    return
+
+            messages = viewer.splitter.feed(message)
+        except RFBError as e:
+            self.log.warning(f"Closing {viewer}: {e}")
+            viewer.close()
+            return
+
+        for item in messages:
+            message_type = item[0]
+            if message_type in INPUT_MESSAGES:
+                if viewer is self.controller:
+                    await self._send_upstream(item)
+            elif message_type == FRAMEBUFFER_UPDATE_REQUEST:
+                if not item[1]: # non-incremental
+                    self.update_requested = True
+                    await self._send_upstream(item)
+                elif not self.update_requested:
+                    self.update_requested = True
+                    await self._send_upstream(item)
+            # SetPixelFormat and SetEncodings are set by session for everyone
+
+    async def run(self):
+        '''
+        Read server stream and fan it out to viewers until VNC server closes connection or close() is called
+        '''
+        try:
+            while not self.finished:
+                data = await self.reader.read(MAX_READ_SIZE)
+                if not data:
+                    break
+                self.stats.record_down(len(data), 0)
+
+                try:
+                    boundaries = self.splitter.feed(data)
+                except RFBError as e:
+                    self.log.error(f"Unable to parse server stream of {self.key}: {e}")
+                    break
+
+                for viewer in self.viewers:
+                    viewer.push(data)
+
+                if self.pending and boundaries:
+                    offset = boundaries[0][0]
+                    for viewer in self.pending:
+                        viewer.push(data[offset:])
+                    self.viewers.extend(self.pending)
+                    self.pending.clear()
+
+                if any(message_type == FRAMEBUFFER_UPDATE for _, message_type in boundaries):
+                    self.update_requested = False
+        finally:
+            self.close()
+
+    def close(self):
+        if self.finished:
+            return
+        self.finished = True
+        self.writer.close()
+        for viewer in self._all_viewers():
+            viewer.close()
+        if self.on_finish:
+            self.on_finish(self)
+        self.log.info(f"Console {self.key} closed: upstream: {self.stats.as_dict()}")
+
+
+class ConsoleBroker:
+    '''
+    Keeps one ConsoleSession per console location, so that all viewers of the same VM console share a single
+    upstream connection to XenServer
+    '''
+    def __init__(self):
+        self.sessions : Dict[str, ConsoleSession] = {}
+        self._opening : Dict[str, asyncio.Future] = {}
+
+    def __repr__(self):
+        return f"ConsoleBroker <{len(self.sessions)} sessions>"
+
+    async def _open(self, url, auth_token, host) -> ConsoleSession:
+        reader, writer = await open_upstream(url, auth_token, host)
+        try:
+            server_init = await client_handshake(reader, writer)
+        except:
+            writer.close()
+            raise
+        session = ConsoleSession(url, reader, writer, server_init, on_finish=self._session_finished)
+        session.log.debug(f"Opened: {server_init}")
+        tornado.ioloop.IOLoop.current().spawn_callback(session.run)
+        return session
+
+    def _session_finished(self, session : ConsoleSession):
+        if self.sessions.get(session.key) is session:
+            del self.sessions[session.key]
+
+    async def join(self, url : str, auth_token : bytes, host : str, viewer : ConsoleViewer) -> ConsoleSession:
+        '''
+        Attach viewer to the session of console url, opening it if necessary
+        :raise ConsoleConnectError, RFBError, OSError if upstream connection can't be opened
+        '''
+        session = self.sessions.get(url)
+        if session is None or session.finished:
+            opening = self._opening.get(url)
+            if opening is None:
+                opening = asyncio.ensure_future(self._open(url, auth_token, host))
+                self._opening[url] = opening
+                try:
+                    session = await opening
+                    self.sessions[url] = session
+                finally:
+                    del self._opening[url]
+            else:
+                session = await asyncio.shield(opening)
+
+        session.attach(viewer)
+        return session
+
+    @property
+    def viewer_count(self):
+        return sum(len(session) for session in self.sessions.values())
+
+
+CONSOLE_BROKER = ConsoleBroker()
@@ -0,0 +1,187 @@
+import asyncio
+import time
+from typing import Callable, Awaitable, Optional, Tuple
+from urllib.parse import urlsplit
+
+from tornado.iostream import StreamClosedError
+from tornado.websocket import WebSocketClosedError
+
+MIN_READ_SIZE = 4096
+MAX_READ_SIZE = 256 * 1024
+
+
+class ConsoleConnectError(Exception):
+    pass
+
+
+class ConsoleStats:
+    '''
+    Per-console traffic counters. "down" is VNC server -> browser, "up" is browser -> VNC server.
+    Send latency is time spent awaiting WebSocket writes, i.e. how long a slow client holds the proxy back
+    '''
+    def __init__(self):
+        self.started = time.monotonic()
+        self.bytes_down = 0
+        self.frames_down = 0
+        self.bytes_up = 0
+        self.messages_up = 0
+        self.send_time = 0.0
+        self.max_send_latency = 0.0
+
+    def __repr__(self):
+        return f"ConsoleStats <{self.as_dict()}>"
+
+    def record_down(self, size, latency):
+        self.bytes_down += size
+        self.frames_down += 1
+        self.send_time += latency
+        if latency > self.max_send_latency:
+            self.max_send_latency = latency
+
+    def record_up(self, size):
+        self.bytes_up += size
+        self.messages_up += 1
+
+    def add(self, other : "ConsoleStats"):
+        self.bytes_down += other.bytes_down
+        self.frames_down += other.frames_down
+        self.bytes_up += other.bytes_up
+        self.messages_up += other.messages_up
+        self.send_time += other.send_time
+        self.max_send_latency = max(self.max_send_latency, other.max_send_latency)
+
+    def as_dict(self):
+        return {
+            "duration": time.monotonic() - self.started,
+            "bytes_down": self.bytes_down,
+            "frames_down": self.frames_down,
+            "average_frame_size": self.bytes_down / self.frames_down if self.frames_down else 0,
+            "bytes_up": self.bytes_up,
+            "messages_up": self.messages_up,
+            "average_send_latency": self.send_time / self.frames_down if self.frames_down else 0,
+            "max_send_latency": self.max_send_latency,
+        }
+
+
+CONSOLE_TOTALS = ConsoleStats() # Counters of all closed consoles
+
+
+async def open_upstream(url : str, auth_token : bytes, host : str) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    '''
+    Open a connection to XenServer console URL using HTTP CONNECT.
+    :param url: console location as returned by XAPI
+    :param auth_token: base64-encoded "user:password"
+    :param host: value for Host header
+    :return: reader and writer positioned at the start of RFB stream
+    :raise ConsoleConnectError if XenServer does not reply with 200 OK
+    '''
+    vnc_url_parsed = urlsplit(url)
+    port = vnc_url_parsed.port
+    if port is None:
+        port = 80 # TODO: If scheme is HTTPS, use 443
+
+    reader, writer = await asyncio.open_connection(vnc_url_parsed.hostname, port, limit=MAX_READ_SIZE)
+    uri = f'{vnc_url_parsed.path}?{vnc_url_parsed.query}'
+    lines = [
+        'CONNECT {0} HTTP/1.1'.format(uri),  # HTTP 1.1 creates Keep-alive connection
+        'Host: {0}'.format(host),
+    ]
+    writer.write('\r\n'.join(lines).encode())
+    writer.write(b'\r\nAuthorization: Basic ' + auth_token.strip())
+    writer.write(b'\r\n\r\n')
+    await writer.drain()
+
+    try:
+        header = await reader.readuntil(b'\r\n\r\n')
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+        writer.close()
+        raise ConsoleConnectError(f"Unable to read CONNECT response: {e}")
+
+    status_line = header.split(b'\r\n', 1)[0]
+    if b' 200 ' not in status_line + b' ':
+        writer.close()
+        raise ConsoleConnectError(f"Unable to open VNC console: {status_line.decode(errors='replace')}")
+
+    return reader, writer
+
+
+class ConsoleProxy:
+    '''
+    Moves RFB data between a VNC server connection and a WebSocket.
+
+    Server -> client: read size adapts to the stream: it doubles (up to max_read_size) while reads fill the buffer
+    and halves (down to min_read_size) when they are mostly empty, so that a full-screen update goes out in a few large
+    WebSocket frames instead of thousands of small ones. Optionally, after a short read we wait up to coalesce_delay seconds
+    for more data to join the same frame.
+    Each send is awaited before the next read, so a slow client slows down reading from the VNC server (via TCP flow control)
+    instead of growing our write buffer.
+
+    :param send: coroutine function that sends bytes to the client, i.e. lambda data: handler.write_message(data, binary=True)
+    '''
+    def __init__(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter, send : Callable[[bytes], Awaitable],
+                 stats : Optional[ConsoleStats] = None, min_read_size=MIN_READ_SIZE, max_read_size=MAX_READ_SIZE, coalesce_delay=0.0):
+        self.reader = reader
+        self.writer = writer
+        self.send = send
+        self.stats = stats or ConsoleStats()
+        self.min_read_size = min_read_size
+        self.max_read_size = max_read_size
+        self.coalesce_delay = coalesce_delay
+        self.halt = False
+
+    async def _read(self, read_size) -> bytes:
+        data = await self.reader.read(read_size)
+        if not data or not self.coalesce_delay or len(data) >= read_size:
+            return data
+
+        chunks = [data]
+        size = len(data)
+        deadline = time.monotonic() + self.coalesce_delay
+        while size < read_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                more = await asyncio.wait_for(self.reader.read(read_size - size), timeout)
+            except asyncio.TimeoutError:
+                break
+            if not more:
+                break
+            chunks.append(more)
+            size += len(more)
+
+        return b''.join(chunks)
+
+    async def server_to_client(self):
+        '''
+        Run until VNC server closes connection, client goes away or close() is called
+        '''
+        read_size = self.min_read_size
+        while not self.halt:
+            data = await self._read(read_size)
+            if not data:
+                return
+
+            if len(data) >= read_size:
+                read_size = min(read_size * 2, self.max_read_size)
+            elif len(data) < read_size // 4:
+                read_size = max(read_size // 2, self.min_read_size)
+
+            start = time.monotonic()
+            try:
+                await self.send(data)
+            except (WebSocketClosedError, StreamClosedError):
+                return
+            self.stats.record_down(len(data), time.monotonic() - start)
+
+    async def client_to_server(self, message : bytes):
+        self.stats.record_up(len(message))
+        self.writer.write(message)
+        try:
+            await self.writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            self.halt = True
+
+    def close(self):
+        self.halt = True
+        self.writer.close()
@@ -0,0 +1,205 @@
+import asyncio
+import os
+import pathlib
+from typing import Callable, Dict, Optional, Set
+
+from utils.inotify import Inotify, IN_MODIFY, IN_CLOSE_WRITE, IN_CREATE, IN_MOVED_TO, IN_IGNORED, IN_ONLYDIR
+
+READ_SIZE = 64 * 1024
+POLL_INTERVAL = 1.0
+
+# Called with the file offset of data and data. Data ends with a newline unless a single line is longer than READ_SIZE
+LogSubscriber = Callable[[int, bytes], None]
+
+
+class LogTailer:
+    '''
+    Follows one log file and sends whole lines to all subscribers. The file may not exist yet.
+    If the file is truncated or replaced, it's read from the beginning again
+    '''
+    def __init__(self, path : pathlib.Path):
+        self.path = path
+        self.subscribers : Set[LogSubscriber] = set()
+        self.position = 0
+        self.file = None
+        self.joining = 0 # Subscribers still receiving old lines
+
+    def __repr__(self):
+        return f"LogTailer <{self.path}: {self.position} bytes, {len(self.subscribers)} subscribers>"
+
+    def _open(self) -> bool:
+        if self.file is None:
+            try:
+                self.file = open(self.path, 'rb')
+            except FileNotFoundError:
+                return False
+        return True
+
+    def reopen(self):
+        self.close()
+        self.position = 0
+        self.read_new()
+
+    def _read_lines(self, start, end=None) -> bytes:
+        size = READ_SIZE if end is None else min(READ_SIZE, end - start)
+        self.file.seek(start)
+        data = self.file.read(size)
+        if len(data) < size and not data.endswith(b'\n'):
+            # Incomplete last line, wait until it's finished
+            data = data[:data.rfind(b'\n') + 1]
+        elif len(data) == size:
+            last_newline = data.rfind(b'\n')
+            if last_newline >= 0:
+                data = data[:last_newline + 1]
+        return data
+
+    def read_new(self):
+        '''
+        Read lines appended since the last call and send them to subscribers
+        '''
+        if not self._open():
+            return
+        if os.fstat(self.file.fileno()).st_size < self.position:
+            self.position = 0
+        while True:
+            data = self._read_lines(self.position)
+            if not data:
+                return
+            offset = self.position
+            self.position += len(data)
+            for subscriber in list(self.subscribers):
+                subscriber(offset, data)
+
+    async def subscribe(self, subscriber : LogSubscriber, offset=0):
+        '''
+        Send subscriber everything from offset up to the current position, then add it to subscribers
+        '''
+        self.joining += 1
+        try:
+            self.read_new()
+            if offset > self.position:
+                offset = 0
+            while offset < self.position and self.file:
+                data = self._read_lines(offset, self.position)
+                if not data:
+                    break
+                subscriber(offset, data)
+                offset += len(data)
+                await asyncio.sleep(0) # Let others run while a long log is sent. read_new may move self.position meanwhile
+        finally:
+            self.joining -= 1
+
+        self.subscribers.add(subscriber)
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class LogStreamer:
+    '''
+    Keeps one LogTailer per log file, shared by all WebSocket clients watching it.
+    Tailers are woken up by inotify watches on their directories; if inotify is not available, they're polled every poll_interval seconds.
+    A tailer is closed when its last subscriber leaves
+    '''
+    def __init__(self, poll_interval=POLL_INTERVAL, use_inotify=True):
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.tailers : Dict[pathlib.Path, LogTailer] = {}
+        self._inotify : Optional[Inotify] = None
+        self._watches : Dict[pathlib.Path, int] = {} # Key: directory, value: watch descriptor
+        self._watch_dirs : Dict[int, pathlib.Path] = {}
+        self._poll_task = None
+
+    def __repr__(self):
+        return f"LogStreamer <{len(self.tailers)} files, {'inotify' if self._inotify else 'polling'}>"
+
+    def _start_watching(self):
+        if self._inotify or self._poll_task:
+            return
+        if self.use_inotify:
+            try:
+                self._inotify = Inotify()
+                asyncio.get_event_loop().add_reader(self._inotify.fileno(), self._on_inotify)
+                return
+            except OSError:
+                self._inotify = None
+        self._poll_task = asyncio.ensure_future(self._poll())
+
+    def _stop_watching(self):
+        if self._inotify:
+            asyncio.get_event_loop().remove_reader(self._inotify.fileno())
+            self._inotify.close()
+            self._inotify = None
+            self._watches.clear()
+            self._watch_dirs.clear()
+        if self._poll_task:
+            self._poll_task.cancel()
+            self._poll_task = None
+
+    def _watch(self, directory : pathlib.Path):
+        if not self._inotify or directory in self._watches:
+            return
+        wd = self._inotify.add_watch(directory, IN_MODIFY | IN_CLOSE_WRITE | IN_CREATE | IN_MOVED_TO | IN_ONLYDIR)
+        self._watches[directory] = wd
+        self._watch_dirs[wd] = directory
+
+    def _unwatch(self, directory : pathlib.Path):
+        if not self._inotify or directory not in self._watches:
+            return
+        if any(path.parent == directory for path in self.tailers):
+            return
+        wd = self._watches.pop(directory)
+        del self._watch_dirs[wd]
+        self._inotify.remove_watch(wd)
+
+    def _on_inotify(self):
+        for event in self._inotify.read_events():
+            directory = self._watch_dirs.get(event.wd)
+            if directory is None:
+                continue
+            if event.mask & IN_IGNORED: # Directory is gone
+                del self._watch_dirs[event.wd]
+                del self._watches[directory]
+                continue
+            tailer = self.tailers.get(directory / event.name)
+            if tailer is None:
+                continue
+            if event.mask & (IN_CREATE | IN_MOVED_TO):
+                tailer.reopen()
+            else:
+                tailer.read_new()
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for tailer in list(self.tailers.values()):
+                tailer.read_new()
+
+    async def subscribe(self, path : pathlib.Path, subscriber : LogSubscriber, offset=0) -> LogTailer:
+        '''
+        Start sending lines of file at path to subscriber beginning with offset
+        :raise OSError if directory of path can't be watched
+        '''
+        self._start_watching()
+        tailer = self.tailers.get(path)
+        if tailer is None:
+            self._watch(path.parent)
+            tailer = LogTailer(path)
+            self.tailers[path] = tailer
+        await tailer.subscribe(subscriber, offset)
+        return tailer
+
+    def unsubscribe(self, tailer : LogTailer, subscriber : LogSubscriber):
+        tailer.subscribers.discard(subscriber)
+        if tailer.subscribers or tailer.joining or self.tailers.get(tailer.path) is not tailer:
+            return
+        tailer.close()
+        del self.tailers[tailer.path]
+        self._unwatch(tailer.path.parent)
+        if not self.tailers:
+            self._stop_watching()
+
+
+LOG_STREAMER = LogStreamer()
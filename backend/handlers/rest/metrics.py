@@ -0,0 +1,13 @@
+import tornado.web
+
+from metrics import REGISTRY
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    '''
+    Prometheus scrape endpoint. Doesn't take a XenAdapter from pool nor wait for the first batch of Xen events,
+    unlike handlers derived from BaseHandler, so that it answers while the service is starting or overloaded
+    '''
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(REGISTRY.render())
@@ -1,48 +1,88 @@
+import json
 import pathlib
+from functools import partial
 from urllib.parse import urlparse, parse_qs
-import tailer
-from tornado import ioloop
 
 from tornado.options import options
+from tornado.websocket import WebSocketClosedError
+
 from handlers.base import BaseWSHandler
+from handlers.rest.logstreamer import LOG_STREAMER
 
 
 class PlaybookLogHandler(BaseWSHandler):
+    '''
+    Streams stdout and stderr of a playbook run. Arguments:
+    id: playbook task ID
+    format: 'text' (default): one message per line, or 'json': {"stream": "stdout", "offset": <offset after this line>, "line": "..."}
+    stdout_offset, stderr_offset: byte offsets to resume from, i.e. the last received offsets of JSON format
+    '''
+    STREAMS = ('stdout', 'stderr')
+
     def check_origin(self, origin):
         return True
 
-    def read_file(self, file : pathlib.Path):
-        with open(file.resolve(), 'r') as file_handle:
-            for line in tailer.follow(file_handle):
-                if line:
-                    self.write_message(line)
-
+    def initialize(self, pool_executor):
+        super().initialize(pool_executor=pool_executor)
+        self.subscriptions = []
+        self.json = False
+        self.closed = False
 
+    def send_lines(self, stream, offset, data : bytes):
+        if self.closed:
+            return
+        end = offset + len(data)
+        lines = data.split(b'\n')
+        if not lines[-1]:
+            lines.pop()
+        try:
+            for line in lines:
+                offset = min(offset + len(line) + 1, end) # Last part of an overlong line has no newline
+                text = line.decode(errors='replace')
+                if self.json:
+                    self.write_message(json.dumps({"stream": stream, "offset": offset, "line": text}))
+                else:
+                    self.write_message(text)
+        except WebSocketClosedError:
+            self.closed = True
 
     async def open(self):
-        url_parsed = urlparse(self.request.uri)
+        query = parse_qs(urlparse(self.request.uri).query)
         try:
-            id = parse_qs(url_parsed.query)['id'][0]
+            id = query['id'][0]
         except KeyError:
             await self.write_message("No argument id")
             self.close()
             return
 
-        log_dir = pathlib.Path(options.ansible_logs).joinpath(id)
-        if not log_dir.is_dir():
-            await self.write_message(f"{log_dir} is not a directory")
+        log_root = pathlib.Path(options.ansible_logs).resolve()
+        log_dir = log_root.joinpath(id).resolve()
+        if log_root not in log_dir.parents or not log_dir.is_dir():
+            await self.write_message(f"{id} is not a playbook log directory")
             self.close()
             return
-        stdout = pathlib.Path(log_dir / 'stdout')
-        if not stdout.is_file():
-            await self.write_message(f"{stdout} is not a file")
-        stderr = pathlib.Path(log_dir / 'stderr')
-        if not stderr.is_file():
-            await self.write_message(f"{stdout} is not a file")
-
-        ioloop.IOLoop.current().run_in_executor(self.executor, self.read_file, stdout)
-        ioloop.IOLoop.current().run_in_executor(self.executor, self.read_file, stderr)
 
+        self.json = query.get('format', ['text'])[0] == 'json'
+        try:
+            offsets = {stream: int(query.get(f'{stream}_offset', [0])[0]) for stream in self.STREAMS}
+        except ValueError:
+            await self.write_message("Offsets should be integers")
+            self.close()
+            return
 
+        for stream in self.STREAMS:
+            subscriber = partial(self.send_lines, stream)
+            tailer = await LOG_STREAMER.subscribe(log_dir / stream, subscriber, offsets[stream])
+            self.subscriptions.append((tailer, subscriber))
+            if self.closed: # Client went away while we were sending old lines
+                self.unsubscribe()
+                return
 
+    def unsubscribe(self):
+        for tailer, subscriber in self.subscriptions:
+            LOG_STREAMER.unsubscribe(tailer, subscriber)
+        self.subscriptions.clear()
 
+    def on_close(self):
+        self.closed = True
+        self.unsubscribe()
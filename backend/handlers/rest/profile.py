@@ -0,0 +1,40 @@
+import asyncio
+import math
+import pickle
+
+import tornado.web
+
+from authentication import AdministratorAuthenticator
+from profiler import Profiler
+
+
+class ProfileHandler(tornado.web.RequestHandler):
+    '''
+    Profiles all threads (see profiler.py), administrator only. Arguments:
+    duration: seconds, profile_duration option by default
+    Responds when profiling is done with paths of the collapsed stacks file and the thread dump.
+    Like MetricsHandler, it doesn't derive from BaseHandler, so that it works while the service is stalled
+    '''
+    async def post(self):
+        user = self.get_secure_cookie('user')
+        if not user:
+            self.set_status(401)
+            self.write({'status': 'error', 'message': 'not authorized'})
+            return
+        if not isinstance(pickle.loads(user), AdministratorAuthenticator):
+            self.set_status(403)
+            self.write({'status': 'error', 'message': 'administrator required'})
+            return
+
+        duration = self.get_argument('duration', None)
+        try:
+            duration = float(duration) if duration is not None else None
+        except ValueError:
+            duration = math.nan
+        if duration is not None and not (math.isfinite(duration) and duration > 0):
+            self.set_status(400)
+            self.write({'status': 'error', 'message': 'duration should be a positive number of seconds'})
+            return
+
+        files = await asyncio.wrap_future(Profiler().start(duration))
+        self.write({'status': 'ok', 'stacks': str(files.stacks), 'threads': str(files.threads), 'samples': files.samples})
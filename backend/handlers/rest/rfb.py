@@ -0,0 +1,333 @@
+'''
+Minimal RFB (VNC) protocol support for console broker: handshakes and splitting streams into messages.
+See RFC 6143
+'''
+import asyncio
+import struct
+from typing import List, Optional, Tuple
+
+RFB_VERSION_3_3 = b'RFB 003.003\n'
+RFB_VERSION_3_7 = b'RFB 003.007\n'
+RFB_VERSION_3_8 = b'RFB 003.008\n'
+
+SECURITY_NONE = 1
+
+# Encodings
+ENCODING_RAW = 0
+ENCODING_COPYRECT = 1
+ENCODING_HEXTILE = 5
+ENCODING_ZRLE = 16
+ENCODING_CURSOR = -239
+ENCODING_LAST_RECT = -224
+ENCODING_DESKTOP_SIZE = -223
+
+# Only encodings that ServerMessageSplitter is able to skip over. Supported by every noVNC version
+BROKER_ENCODINGS = (ENCODING_HEXTILE, ENCODING_COPYRECT, ENCODING_RAW, ENCODING_DESKTOP_SIZE)
+
+# 32 bpp, depth 24, little endian, true colour, RGB max 255, shifts 0/8/16. This is what noVNC asks for
+BROKER_PIXEL_FORMAT = struct.pack('!BBBBHHHBBB3x', 32, 24, 0, 1, 255, 255, 255, 0, 8, 16)
+
+# Server to client message types
+FRAMEBUFFER_UPDATE = 0
+SET_COLOUR_MAP_ENTRIES = 1
+BELL = 2
+SERVER_CUT_TEXT = 3
+
+# Client to server message types
+SET_PIXEL_FORMAT = 0
+SET_ENCODINGS = 2
+FRAMEBUFFER_UPDATE_REQUEST = 3
+KEY_EVENT = 4
+POINTER_EVENT = 5
+CLIENT_CUT_TEXT = 6
+
+INPUT_MESSAGES = (KEY_EVENT, POINTER_EVENT, CLIENT_CUT_TEXT)
+
+
+class RFBError(Exception):
+    pass
+
+
+class ServerInit:
+    def __init__(self, width, height, pixel_format, name : bytes):
+        self.width = width
+        self.height = height
+        self.pixel_format = pixel_format
+        self.name = name
+
+    def __repr__(self):
+        return f"ServerInit <{self.width}x{self.height} {self.name}>"
+
+    @property
+    def bytes_per_pixel(self):
+        return self.pixel_format[0] // 8
+
+    def pack(self) -> bytes:
+        return struct.pack('!HH', self.width, self.height) + self.pixel_format + struct.pack('!I', len(self.name)) + self.name
+
+
+def set_pixel_format(pixel_format : bytes) -> bytes:
+    return struct.pack('!B3x', SET_PIXEL_FORMAT) + pixel_format
+
+
+def set_encodings(encodings) -> bytes:
+    return struct.pack(f'!BxH{len(encodings)}i', SET_ENCODINGS, len(encodings), *encodings)
+
+
+def framebuffer_update_request(incremental, width, height, x=0, y=0) -> bytes:
+    return struct.pack('!BBHHHH', FRAMEBUFFER_UPDATE_REQUEST, 1 if incremental else 0, x, y, width, height)
+
+
+async def client_handshake(reader : asyncio.StreamReader, writer : asyncio.StreamWriter) -> ServerInit:
+    '''
+    Perform a handshake with a VNC server as a shared client without authentication,
+    then switch it to BROKER_PIXEL_FORMAT and BROKER_ENCODINGS
+    :return: ServerInit with BROKER_PIXEL_FORMAT
+    '''
+    server_version = await reader.readexactly(12)
+    if not server_version.startswith(b'RFB '):
+        raise RFBError(f"Not a RFB server: {server_version}")
+    version = min(server_version, RFB_VERSION_3_8)
+    if version not in (RFB_VERSION_3_3, RFB_VERSION_3_7, RFB_VERSION_3_8):
+        version = RFB_VERSION_3_3
+    writer.write(version)
+
+    if version == RFB_VERSION_3_3:
+        security_type, = struct.unpack('!I', await reader.readexactly(4))
+        if security_type != SECURITY_NONE:
+            raise RFBError(f"Unsupported security type: {security_type}")
+    else:
+        count, = struct.unpack('!B', await reader.readexactly(1))
+        if count == 0:
+            length, = struct.unpack('!I', await reader.readexactly(4))
+            raise RFBError(f"Connection refused: {await reader.readexactly(length)}")
+        security_types = await reader.readexactly(count)
+        if SECURITY_NONE not in security_types:
+            raise RFBError(f"Unsupported security types: {list(security_types)}")
+        writer.write(struct.pack('!B', SECURITY_NONE))
+        if version == RFB_VERSION_3_8:
+            result, = struct.unpack('!I', await reader.readexactly(4))
+            if result != 0:
+                raise RFBError(f"Security handshake failed: {result}")
+
+    writer.write(b'\x01') # ClientInit: shared flag
+    width, height = struct.unpack('!HH', await reader.readexactly(4))
+    await reader.readexactly(16) # server's pixel format
+    name_length, = struct.unpack('!I', await reader.readexactly(4))
+    name = await reader.readexactly(name_length)
+
+    writer.write(set_pixel_format(BROKER_PIXEL_FORMAT))
+    writer.write(set_encodings(BROKER_ENCODINGS))
+    await writer.drain()
+    return ServerInit(width, height, BROKER_PIXEL_FORMAT, name)
+
+
+class ServerHandshake:
+    '''
+    Server side of RFB handshake without authentication, driven by incoming bytes.
+    feed() returns bytes to send to the client. When done is True, leftover contains client's bytes after ClientInit
+    '''
+    def __init__(self, server_init : ServerInit):
+        self.server_init = server_init
+        self.buffer = b''
+        self.version = None
+        self.state = 'version'
+        self.done = False
+        self.leftover = b''
+
+    def greeting(self) -> bytes:
+        return RFB_VERSION_3_8
+
+    def feed(self, data : bytes) -> bytes:
+        self.buffer += data
+        out = []
+        while not self.done:
+            if self.state == 'version':
+                if len(self.buffer) < 12:
+                    break
+                self.version, self.buffer = self.buffer[:12], self.buffer[12:]
+                if self.version == RFB_VERSION_3_3:
+                    out.append(struct.pack('!I', SECURITY_NONE))
+                    self.state = 'client_init'
+                elif self.version in (RFB_VERSION_3_7, RFB_VERSION_3_8):
+                    out.append(struct.pack('!BB', 1, SECURITY_NONE))
+                    self.state = 'security'
+                else:
+                    raise RFBError(f"Unsupported client version: {self.version}")
+            elif self.state == 'security':
+                if len(self.buffer) < 1:
+                    break
+                security_type, self.buffer = self.buffer[0], self.buffer[1:]
+                if security_type != SECURITY_NONE:
+                    raise RFBError(f"Unsupported security type: {security_type}")
+                if self.version == RFB_VERSION_3_8:
+                    out.append(struct.pack('!I', 0))
+                self.state = 'client_init'
+            elif self.state == 'client_init':
+                if len(self.buffer) < 1:
+                    break
+                self.buffer = self.buffer[1:] # shared flag: everyone shares our upstream connection anyway
+                out.append(self.server_init.pack())
+                self.done = True
+                self.leftover, self.buffer = self.buffer, b''
+
+        return b''.join(out)
+
+
+class ClientMessageSplitter:
+    '''
+    Splits client to server stream into messages
+    '''
+    def __init__(self):
+        self.buffer = b''
+
+    @staticmethod
+    def _message_length(buffer) -> Optional[int]:
+        message_type = buffer[0]
+        if message_type == SET_PIXEL_FORMAT:
+            return 20
+        if message_type == SET_ENCODINGS:
+            if len(buffer) < 4:
+                return None
+            count, = struct.unpack_from('!H', buffer, 2)
+            return 4 + 4 * count
+        if message_type == FRAMEBUFFER_UPDATE_REQUEST:
+            return 10
+        if message_type == KEY_EVENT:
+            return 8
+        if message_type == POINTER_EVENT:
+            return 6
+        if message_type == CLIENT_CUT_TEXT:
+            if len(buffer) < 8:
+                return None
+            length, = struct.unpack_from('!I', buffer, 4)
+            return 8 + length
+        raise RFBError(f"Unsupported client message type: {message_type}")
+
+    def feed(self, data : bytes) -> List[bytes]:
+        self.buffer += data
+        messages = []
+        while self.buffer:
+            length = self._message_length(self.buffer)
+            if length is None or len(self.buffer) < length:
+                break
+            messages.append(self.buffer[:length])
+            self.buffer = self.buffer[length:]
+        return messages
+
+
+class ServerMessageSplitter:
+    '''
+    Finds message boundaries in server to client stream without buffering message bodies.
+    The parser is a generator that yields a positive number to get that many bytes, a negative number to skip that many bytes,
+    or 0 to report end of a message.
+    at_boundary is True when everything fed so far consists of complete messages.
+    desktop_size is updated when server reports a new framebuffer size with DesktopSize pseudo-encoding
+    '''
+    def __init__(self, bytes_per_pixel, desktop_size : Tuple[int, int] = None):
+        self.bpp = bytes_per_pixel
+        self.desktop_size = desktop_size
+        self.at_boundary = True
+        self._parser = self._parse()
+        self._need = next(self._parser)
+        self._pending = bytearray()
+        self._message_type = None
+
+    def feed(self, data : bytes) -> List[Tuple[int, int]]:
+        '''
+        :return: list of (offset in data right after message end, message type)
+        '''
+        boundaries = []
+        position = 0
+        length = len(data)
+        while True:
+            if self._need == 0:
+                boundaries.append((position, self._message_type))
+                self.at_boundary = True
+                self._need = next(self._parser)
+                continue
+            if position >= length:
+                break
+            self.at_boundary = False
+            if self._need < 0:
+                skip = min(-self._need, length - position)
+                position += skip
+                self._need += skip
+                if self._need == 0:
+                    self._need = self._parser.send(None)
+            else:
+                take = min(self._need - len(self._pending), length - position)
+                self._pending += data[position:position + take]
+                position += take
+                if len(self._pending) == self._need:
+                    chunk = bytes(self._pending)
+                    self._pending.clear()
+                    self._need = self._parser.send(chunk)
+
+        return boundaries
+
+    def _skip(self, count):
+        if count:
+            yield -count
+
+    def _parse(self):
+        bpp = self.bpp
+        while True:
+            message_type, = yield 1
+            self._message_type = message_type
+            if message_type == FRAMEBUFFER_UPDATE:
+                rects, = struct.unpack('!xH', (yield 3))
+                for _ in range(rects):
+                    x, y, width, height, encoding = struct.unpack('!HHHHi', (yield 12))
+                    if encoding == ENCODING_RAW:
+                        yield from self._skip(width * height * bpp)
+                    elif encoding == ENCODING_COPYRECT:
+                        yield from self._skip(4)
+                    elif encoding == ENCODING_HEXTILE:
+                        yield from self._hextile(width, height)
+                    elif encoding == ENCODING_ZRLE:
+                        length, = struct.unpack('!I', (yield 4))
+                        yield from self._skip(length)
+                    elif encoding == ENCODING_CURSOR:
+                        yield from self._skip(width * height * bpp + (width + 7) // 8 * height)
+                    elif encoding == ENCODING_DESKTOP_SIZE:
+                        self.desktop_size = width, height
+                    elif encoding == ENCODING_LAST_RECT:
+                        break
+                    else:
+                        raise RFBError(f"Unsupported encoding: {encoding}")
+            elif message_type == SET_COLOUR_MAP_ENTRIES:
+                first, count = struct.unpack('!xHH', (yield 5))
+                yield from self._skip(6 * count)
+            elif message_type == BELL:
+                pass
+            elif message_type == SERVER_CUT_TEXT:
+                length, = struct.unpack('!3xI', (yield 7))
+                yield from self._skip(length)
+            else:
+                raise RFBError(f"Unsupported server message type: {message_type}")
+
+            yield 0
+
+    def _hextile(self, width, height):
+        bpp = self.bpp
+        for tile_y in range(0, height, 16):
+            tile_height = min(16, height - tile_y)
+            for tile_x in range(0, width, 16):
+                tile_width = min(16, width - tile_x)
+                subencoding, = (yield 1)
+                if subencoding & 1: # Raw
+                    yield from self._skip(tile_width * tile_height * bpp)
+                    continue
+                skip = 0
+                if subencoding & 2: # BackgroundSpecified
+                    skip += bpp
+                if subencoding & 4: # ForegroundSpecified
+                    skip += bpp
+                yield from self._skip(skip)
+                if subencoding & 8: # AnySubrects
+                    subrects, = (yield 1)
+                    if subencoding & 16: # SubrectsColoured
+                        yield from self._skip(subrects * (bpp + 2))
+                    else:
+                        yield from self._skip(subrects * 2)
@@ -0,0 +1,370 @@
+'''
+Runtime metrics exported in Prometheus text format by /metrics (see handlers/rest/metrics.py).
+Metric classes mimic prometheus_client: Counter, Gauge and Histogram, optionally with labels:
+
+>>> XAPI_CALL_SECONDS.labels('VM.get_record').observe(0.002)
+
+Values that other objects already keep (queue sizes, cache hits) are read when metrics are scraped, see set_function
+'''
+import bisect
+import math
+import threading
+import time
+import weakref
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+
+def format_value(value) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    return repr(float(value))
+
+
+def escape_label(value : str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_labels(labels : Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(str(value))}"' for name, value in labels) + '}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics : Dict[str, "Metric"] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric : "Metric"):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        '''
+        :return: all metrics in Prometheus text exposition format (version 0.0.4)
+        '''
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Value:
+    '''
+    Value of a metric with a particular set of labels
+    '''
+    def __init__(self):
+        self._value = 0.0
+        self._function : Callable[[], float] = None
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self._value += amount
+
+    def set_function(self, function : Callable[[], float]):
+        '''
+        Read value from function when metrics are scraped
+        '''
+        self._function = function
+
+    def get(self) -> float:
+        if self._function:
+            return self._function()
+        return self._value
+
+
+class GaugeValue(Value):
+    def set(self, value):
+        self._value = value
+
+    def dec(self, amount=1.0):
+        self.inc(-amount)
+
+
+class HistogramValue:
+    def __init__(self, upper_bounds : Sequence[float]):
+        self.upper_bounds = upper_bounds
+        self.buckets = [0] * len(upper_bounds)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value : float):
+        index = bisect.bisect_left(self.upper_bounds, value)
+        with self._lock:
+            self.buckets[index] += 1
+            self.sum += value
+
+    def time(self) -> "Timer":
+        return Timer(self)
+
+
+class Timer:
+    '''
+    Context manager observing time spent in its body
+    '''
+    def __init__(self, histogram : HistogramValue):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Metric:
+    type : str = None
+    value_class : type = None
+
+    def __init__(self, name : str, documentation : str, labelnames : Sequence[str] = (), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._values[()] = self._new_value()
+        if registry:
+            registry.register(self)
+
+    def __repr__(self):
+        return f"{type(self).__name__} <{self.name}>"
+
+    def _new_value(self):
+        return self.value_class()
+
+    def labels(self, *values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} has labels {self.labelnames}, got {values}")
+        values = tuple(str(value) for value in values)
+        try:
+            return self._values[values]
+        except KeyError:
+            with self._lock:
+                return self._values.setdefault(values, self._new_value())
+
+    def _items(self) -> List[Tuple[List[Tuple[str, str]], object]]:
+        with self._lock:
+            items = list(self._values.items())
+        return [(list(zip(self.labelnames, values)), value) for values, value in sorted(items)]
+
+    def samples(self) -> Iterator[Tuple[str, List[Tuple[str, str]], float]]:
+        for labels, value in self._items():
+            yield self.name, labels, value.get()
+
+    # Shortcuts for metrics without labels
+    def inc(self, amount=1.0):
+        self._values[()].inc(amount)
+
+    def set_function(self, function : Callable[[], float]):
+        self._values[()].set_function(function)
+
+
+class Counter(Metric):
+    type = 'counter'
+    value_class = Value
+
+
+class Gauge(Metric):
+    type = 'gauge'
+    value_class = GaugeValue
+
+    def set(self, value):
+        self._values[()].set(value)
+
+    def dec(self, amount=1.0):
+        self._values[()].dec(amount)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name : str, documentation : str, labelnames : Sequence[str] = (), buckets=DEFAULT_BUCKETS,
+                 registry=REGISTRY):
+        self.upper_bounds = tuple(sorted(buckets))
+        if self.upper_bounds[-1] != math.inf:
+            self.upper_bounds += (math.inf, )
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_value(self):
+        return HistogramValue(self.upper_bounds)
+
+    def observe(self, value : float):
+        self._values[()].observe(value)
+
+    def time(self) -> Timer:
+        return self._values[()].time()
+
+    def samples(self):
+        for labels, value in self._items():
+            with value._lock:
+                buckets, total = list(value.buckets), value.sum
+            count = 0
+            for bound, bucket in zip(value.upper_bounds, buckets):
+                count += bucket
+                yield f'{self.name}_bucket', labels + [('le', format_value(bound))], count
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+
+EVENT_QUEUE_DEPTH = Gauge('vmemperor_event_queue_depth', "Xen events waiting to be processed")
+EVENT_PROCESSING_SECONDS = Histogram('vmemperor_event_processing_seconds', "Time to process a Xen event", ['event_class'])
+EVENT_LAG_SECONDS = Histogram('vmemperor_event_lag_seconds',
+                              "Time from receiving a Xen event with event.from until it's processed", ['event_class'])
+
+RETHINKDB_QUERY_SECONDS = Histogram('vmemperor_rethinkdb_query_seconds',
+                                    "Time from sending a RethinkDB query until its first response, by calling function", ['site'])
+RETHINKDB_CHANGEFEEDS = Gauge('vmemperor_rethinkdb_changefeeds', "Open changefeed cursors")
+RETHINKDB_CONNECTIONS_OPENED = Counter('vmemperor_rethinkdb_connections_opened_total', "RethinkDB connections opened", ['kind'])
+RETHINKDB_CONNECTIONS_IDLE = Gauge('vmemperor_rethinkdb_connections_idle', "Asyncio RethinkDB connections waiting in pool")
+
+XAPI_CALL_SECONDS = Histogram('vmemperor_xapi_call_seconds', "XenAPI call time", ['method'])
+XEN_ADAPTERS_CREATED = Counter('vmemperor_xenadapters_created_total', "XenAdapters created by XenAdapterPool", ['kind'])
+XEN_ADAPTERS_IDLE = Gauge('vmemperor_xenadapters_idle', "XenAdapters waiting in XenAdapterPool", ['kind'])
+
+GRAPHQL_RESOLVE_SECONDS = Histogram('vmemperor_graphql_resolve_seconds', "Time to resolve a top-level GraphQL field", ['field'])
+GRAPHQL_SUBSCRIPTIONS = Gauge('vmemperor_graphql_subscriptions', "Active GraphQL subscriptions")
+
+EXECUTOR_QUEUE_DEPTH = Gauge('vmemperor_executor_queue_depth', "Jobs waiting for a thread of the Tornado executor")
+EXECUTOR_THREADS = Gauge('vmemperor_executor_threads', "Threads started by the Tornado executor")
+
+CONSOLE_SESSIONS = Gauge('vmemperor_console_sessions', "Upstream VNC connections")
+CONSOLE_VIEWERS = Gauge('vmemperor_console_viewers', "Console WebSocket clients")
+CONSOLE_BYTES = Counter('vmemperor_console_bytes_total', "Bytes proxied by closed consoles", ['direction'])
+DOCUMENT_CACHE_SIZE = Gauge('vmemperor_graphql_document_cache_size', "Parsed GraphQL documents in cache")
+DOCUMENT_CACHE_LOOKUPS = Counter('vmemperor_graphql_document_cache_lookups_total', "GraphQL document cache lookups", ['result'])
+PLAYBOOKS = Gauge('vmemperor_playbooks', "Playbook runs", ['state'])
+POWER_OPERATIONS = Gauge('vmemperor_power_operations', "Bulk VM power operations", ['state'])
+LOG_TAILERS = Gauge('vmemperor_log_tailers', "Playbook log files streamed to WebSocket clients")
+WATCHED_RECORDS = Gauge('vmemperor_watched_records', "Records watched for completion", ['watcher'])
+TASK_STATUS_WRITES = Counter('vmemperor_task_status_writes_total', "Batched task status writes of TaskStatusWriter")
+TASK_STATUS_UPDATES = Counter('vmemperor_task_status_updates_total', "Task status updates given to TaskStatusWriter")
+WARM_VMS = Gauge('vmemperor_warm_vms', "VMs in warm pools", ['state'])
+
+class CallCounters(threading.local):
+    '''
+    RethinkDB queries and XAPI calls made by the current thread, used to attribute them to GraphQL resolvers (see tornadoql/tracing.py)
+    '''
+    reql = 0
+    xapi = 0
+
+
+CALLS = CallCounters()
+
+_changefeeds = weakref.WeakSet()
+RETHINKDB_CHANGEFEEDS.set_function(lambda: sum(1 for cursor in list(_changefeeds) if cursor.error is None))
+
+
+def call_site(depth : int) -> str:
+    import sys
+    frame = sys._getframe(depth + 1)
+    return f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}"
+
+
+def is_changefeed(term) -> bool:
+    from rethinkdb.ast import Changes
+    return isinstance(term, Changes) or any(is_changefeed(arg) for arg in getattr(term, '_args', ()))
+
+
+def _track(term, result):
+    from rethinkdb.net import Cursor
+    if isinstance(result, Cursor) and is_changefeed(term):
+        _changefeeds.add(result)
+    return result
+
+
+async def _timed_async(term, coroutine, site, start):
+    try:
+        return _track(term, await coroutine)
+    finally:
+        RETHINKDB_QUERY_SECONDS.labels(site).observe(time.perf_counter() - start)
+
+
+_connection_types = {}
+
+
+def timed_connection(connection_type : type) -> type:
+    '''
+    :return: subclass of a RethinkDB connection class (sync or asyncio) that reports query times to RETHINKDB_QUERY_SECONDS
+    labeled with the function that called run(), and changefeed cursors to RETHINKDB_CHANGEFEEDS
+    '''
+    # RethinkDB.set_loop_type loads the module of asyncio connection class again every time, so classes are told by name
+    key = connection_type.__module__, connection_type.__qualname__
+    if key in _connection_types:
+        return _connection_types[key]
+
+    import asyncio
+
+    class TimedConnection(connection_type):
+        def _start(self, term, **global_optargs):
+            site = call_site(2) # caller of RqlQuery.run
+            CALLS.reql += 1
+            start = time.perf_counter()
+            result = super()._start(term, **global_optargs)
+            if asyncio.iscoroutine(result):
+                return _timed_async(term, result, site, start)
+            RETHINKDB_QUERY_SECONDS.labels(site).observe(time.perf_counter() - start)
+            return _track(term, result)
+
+    TimedConnection.__name__ = f'Timed{connection_type.__name__}'
+    _connection_types[key] = TimedConnection
+    return TimedConnection
+
+
+def watch_runtime(executor=None):
+    '''
+    Read values of long-living objects when metrics are scraped. Singletons that haven't been created report 0
+    '''
+    from singleton import Singleton
+    from tornadoql.tornadoql import SETTINGS
+    from tornadoql.document_cache import DOCUMENT_CACHE
+    from handlers.rest.consolebroker import CONSOLE_BROKER
+    from handlers.rest.consoleproxy import CONSOLE_TOTALS
+    from handlers.rest.logstreamer import LOG_STREAMER
+    from playbookscheduler import PlaybookScheduler
+    from powerdispatcher import PowerDispatcher
+    from taskwatcher import TaskWatcher
+    from xenadapter.vminstall import InstallTracker
+    from customtask.statuswriter import TaskStatusWriter
+    from warmpool import WarmPool
+
+    def singleton_value(cls, attribute):
+        return lambda: getattr(Singleton._instances[cls], attribute) if cls in Singleton._instances else 0
+
+    if executor is not None and hasattr(executor, '_work_queue'):
+        EXECUTOR_QUEUE_DEPTH.set_function(executor._work_queue.qsize)
+        EXECUTOR_THREADS.set_function(lambda: len(executor._threads))
+    GRAPHQL_SUBSCRIPTIONS.set_function(lambda: sum(len(subscriptions) for subscriptions in list(SETTINGS['subscriptions'].values())))
+    CONSOLE_SESSIONS.set_function(lambda: len(CONSOLE_BROKER.sessions))
+    CONSOLE_VIEWERS.set_function(lambda: CONSOLE_BROKER.viewer_count)
+    CONSOLE_BYTES.labels('down').set_function(lambda: CONSOLE_TOTALS.bytes_down)
+    CONSOLE_BYTES.labels('up').set_function(lambda: CONSOLE_TOTALS.bytes_up)
+    DOCUMENT_CACHE_SIZE.set_function(lambda: len(DOCUMENT_CACHE))
+    DOCUMENT_CACHE_LOOKUPS.labels('hit').set_function(lambda: DOCUMENT_CACHE.hits)
+    DOCUMENT_CACHE_LOOKUPS.labels('miss').set_function(lambda: DOCUMENT_CACHE.misses)
+    LOG_TAILERS.set_function(lambda: len(LOG_STREAMER.tailers))
+    for state in ('queued', 'running'):
+        PLAYBOOKS.labels(state).set_function(singleton_value(PlaybookScheduler, state))
+        POWER_OPERATIONS.labels(state).set_function(singleton_value(PowerDispatcher, state))
+    WATCHED_RECORDS.labels('tasks').set_function(singleton_value(TaskWatcher, 'watched'))
+    WATCHED_RECORDS.labels('installs').set_function(singleton_value(InstallTracker, 'watched'))
+    TASK_STATUS_WRITES.set_function(singleton_value(TaskStatusWriter, 'writes'))
+    TASK_STATUS_UPDATES.set_function(singleton_value(TaskStatusWriter, 'updates'))
+    for state in ('ready', 'building'):
+        WARM_VMS.labels(state).set_function(singleton_value(WarmPool, state))
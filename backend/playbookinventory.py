@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
+
+import constants.re as re
+
+DEFAULT_ANSIBLE_USER = 'root'
+
+
+def inventory_query(vm_refs : List[str], networks : Iterable[str]):
+    '''
+    A single join of vifs, nets and vms: one row for every VIF of vm_refs that is connected to one of networks
+    (by network UUID or ref)
+    '''
+    from xenadapter.vif import VIF
+    from xenadapter.network import Network
+    from xenadapter.vm import VM
+
+    networks = list(networks)
+    return re.db.table(VIF.db_table_name).get_all(*vm_refs, index='VM')\
+        .eq_join('network', re.db.table(Network.db_table_name))\
+        .filter(lambda row: re.r.expr(networks).contains(row['right']['uuid']) | re.r.expr(networks).contains(row['right']['ref']))\
+        .map(lambda row: {
+            'VM': row['left']['VM'],
+            'device': row['left']['device'],
+            'ipv4': row['left']['ipv4'].default(None),
+        })\
+        .eq_join('VM', re.db.table(VM.db_table_name))\
+        .map(lambda row: {
+            'VM': row['left']['VM'],
+            'device': row['left']['device'],
+            'ipv4': row['left']['ipv4'],
+            'name_label': row['right']['name_label'],
+            'first_user': row['right']['_first_user_'].default(None),
+        })
+
+
+def build_hosts(vm_refs : List[str], rows : Iterable[dict]) -> Tuple[Dict[str, dict], List[str]]:
+    '''
+    Choose a connection address for every VM: IPv4 of its first VIF (by device number) on an Ansible network that has one
+    :param rows: result of inventory_query
+    :return: hosts (key: VM name label, value: host variables) and refs of VMs we can't connect to
+    '''
+    by_vm = {}
+    for row in rows:
+        by_vm.setdefault(row['VM'], []).append(row)
+
+    hosts = OrderedDict()
+    unreachable = []
+    for ref in vm_refs:
+        candidates = sorted(by_vm.get(ref, []), key=lambda row: int(row['device']) if str(row['device']).isdigit() else row['device'])
+        row = next((row for row in candidates if row['ipv4']), None)
+        if not row:
+            unreachable.append(ref)
+            continue
+        hosts[row['name_label']] = {
+            'ansible_user': row['first_user'] or DEFAULT_ANSIBLE_USER,
+            'ansible_host': row['ipv4'],
+        }
+
+    return hosts, unreachable
+
+
+def get_inventory_hosts(vm_refs : List[str], networks : Iterable[str]) -> Tuple[Dict[str, dict], List[str]]:
+    '''
+    Requires a RethinkDB connection
+    :return: see build_hosts
+    '''
+    if not vm_refs:
+        return OrderedDict(), []
+    rows = inventory_query(vm_refs, networks).coerce_to('array').run()
+    return build_hosts(vm_refs, rows)
+
+
+def static_inventory(hosts : Dict[str, dict]) -> dict:
+    '''
+    Inventory for a YAML hosts file
+    '''
+    return {'all': {'hosts': dict(hosts)}}
+
+
+def dynamic_inventory(hosts : Dict[str, dict]) -> dict:
+    '''
+    Inventory in Ansible dynamic inventory script format (ansible-playbook -i script.sh, where the script prints this as JSON)
+    '''
+    return {
+        'all': {'hosts': list(hosts)},
+        '_meta': {'hostvars': dict(hosts)},
+    }
@@ -1,35 +1,153 @@
+import hashlib
+import select
 from ruamel import yaml
 from pathlib import Path, PurePath
 import json
+from typing import Dict, List, NamedTuple, Optional
+
 from loggable import Loggable
 import traceback
 
+from utils.inotify import Inotify, IN_MODIFY, IN_CLOSE_WRITE, IN_CREATE, IN_DELETE, IN_MOVED_FROM, IN_MOVED_TO, IN_ONLYDIR
+
+
+class PlaybookFingerprint(NamedTuple):
+    stat: tuple # mtimes and sizes of files that make up a playbook record
+    hash: str # SHA-256 of their contents
+
+
+class SyncResult(NamedTuple):
+    loaded: List[str]
+    removed: List[str]
+    unchanged: List[str]
+
+
 class PlaybookLoader (Loggable):
     """
     This class is used for loading playbooks into rethinkdb
     """
     _PLAYBOOK_VMEMPEROR_CONF : str = 'vmemperor.conf'
     PLAYBOOK_TABLE_NAME: str ='playbooks'
+    VARIABLES_DIRS = ('host_vars', 'group_vars')
+    # Files a playbook record is made of. Other files of a playbook directory are only used when a playbook is launched
+    FINGERPRINT_FILES = (_PLAYBOOK_VMEMPEROR_CONF, 'host_vars/all', 'group_vars/all')
 
     _DEFAULT_CONFIG = {
         "inventory": None,
         "single": False,
     }
 
+    _fingerprints : Dict[str, PlaybookFingerprint] = {} # Key: playbook ID, value: fingerprint of its record in DB
+
 
     @staticmethod
     def load_playbooks():
+        """
+        Load every playbook in ansible_dir. Use sync_playbooks to reload only changed playbooks
+        """
         from tornado.options import options as opts
         directory = Path(opts.ansible_dir)
         for item in directory.iterdir():
             PlaybookLoader(item)
 
+    @classmethod
+    def stat_signature(cls, playbook_dir : Path) -> tuple:
+        signature = [playbook_dir.stat().st_mtime_ns]
+        for name in cls.FINGERPRINT_FILES:
+            try:
+                stat = playbook_dir.joinpath(name).stat()
+                signature.append((name, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append((name, None, None))
+        return tuple(signature)
+
+    @classmethod
+    def content_hash(cls, playbook_dir : Path) -> str:
+        digest = hashlib.sha256()
+        for name in cls.FINGERPRINT_FILES:
+            digest.update(name.encode() + b'\0')
+            try:
+                digest.update(playbook_dir.joinpath(name).read_bytes())
+            except FileNotFoundError:
+                digest.update(b'\1missing')
+            digest.update(b'\0')
+        # The playbook file is only checked for existence
+        digest.update(json.dumps(sorted(item.name for item in playbook_dir.iterdir() if item.is_file())).encode())
+        return digest.hexdigest()
+
+    @classmethod
+    def sync_playbooks(cls, directory : Optional[Path] = None) -> SyncResult:
+        """
+        Bring playbooks table in sync with ansible_dir: re-parse only playbooks whose fingerprint has changed,
+        upsert their records and delete records of removed or broken playbooks.
+        A fingerprint is checked by file modification times and sizes first; the content hash is computed only if they differ,
+        so touching a file doesn't cause re-parsing. Requires a RethinkDB connection
+        """
+        from tornado.options import options as opts
+        import constants.re as re
+        from rethinkdb_tools.helper import CHECK_ER
+        if directory is None:
+            directory = Path(opts.ansible_dir)
+
+        table = re.db.table(cls.PLAYBOOK_TABLE_NAME)
+        in_db = set(table.pluck('id')['id'].coerce_to('array').run())
+        for id in list(cls._fingerprints):
+            if id not in in_db: # table has been re-created
+                del cls._fingerprints[id]
+
+        upsert = []
+        loaded, unchanged, seen = [], [], set()
+        for item in sorted(directory.iterdir()):
+            if not item.is_dir():
+                continue
+            id = item.name
+            old = cls._fingerprints.get(id)
+            try:
+                stat = cls.stat_signature(item)
+                if old and old.stat == stat:
+                    seen.add(id)
+                    unchanged.append(id)
+                    continue
+                content_hash = cls.content_hash(item)
+            except OSError:
+                continue
+            if old and old.hash == content_hash:
+                cls._fingerprints[id] = PlaybookFingerprint(stat, content_hash)
+                seen.add(id)
+                unchanged.append(id)
+                continue
+
+            loader = PlaybookLoader(item, save=False)
+            if not loader.loaded:
+                continue
+            upsert.append(loader.get_config())
+            cls._fingerprints[id] = PlaybookFingerprint(stat, content_hash)
+            seen.add(id)
+            loaded.append(id)
+
+        if upsert:
+            CHECK_ER(table.insert(upsert, conflict='replace').run())
+
+        removed = sorted((in_db | set(cls._fingerprints)) - seen)
+        if removed:
+            CHECK_ER(table.get_all(*removed).delete().run())
+            for id in removed:
+                cls._fingerprints.pop(id, None)
+
+        return SyncResult(loaded, removed, unchanged)
+
     def __repr__(self):
         return "PlaybookLoader"
 
-    def __init__(self, playbook_name):
+    def __init__(self, playbook_name, save=True):
+        """
+        Parse a playbook directory
+        :param playbook_name: playbook directory
+        :param save: Insert the playbook record into DB
+        """
         from tornado.options import options as opts
         self.init_log()
+        self.loaded = False
 
         playbook_dir = Path(playbook_name)
         playbook_name = playbook_dir.name
@@ -61,7 +179,7 @@ class PlaybookLoader (Loggable):
             keys = self.config['variables'].keys()
             self.variables_locations = {}
             self.vars = {}
-            for var in ('host_vars', 'group_vars'):
+            for var in self.VARIABLES_DIRS:
                 self.variables_locations[var] = []
                 host_vars_file = playbook_dir.joinpath(var, 'all')
                 if not host_vars_file.is_file():
@@ -87,9 +205,11 @@ class PlaybookLoader (Loggable):
             self.config['playbook_dir'] = str(playbook_dir.absolute())
             self.config['id'] = playbook_dir.name
             self.config['variables_locations'] = self.variables_locations
+            self.loaded = True
 
-            table = r.db(opts.database).table(self.PLAYBOOK_TABLE_NAME)
-            table.insert(self.config).run()
+            if save:
+                table = r.db(opts.database).table(self.PLAYBOOK_TABLE_NAME)
+                table.insert(self.config, conflict='replace').run()
             self.log.debug(f"Loaded playbook {self.config['id']}")
         except Exception as e:
             self.log.error(f"Exception: {e} at {traceback.print_exc()}")
@@ -150,3 +270,50 @@ class PlaybookEncoder(json.JSONEncoder):
 
 
 
+
+
+class PlaybookWatcher:
+    """
+    Watches ansible_dir, playbook directories and their variables directories with inotify.
+    wait() returns True when something has changed there
+    :raise OSError if inotify is not available
+    """
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+
+    def __init__(self, directory : Path):
+        self.directory = directory
+        self.inotify = Inotify()
+        self.rewatch()
+
+    def __repr__(self):
+        return f"PlaybookWatcher <{self.directory}>"
+
+    def rewatch(self):
+        """
+        Add watches for new directories. Watches of removed directories are removed by kernel
+        """
+        self.inotify.add_watch(self.directory, self.MASK)
+        for playbook_dir in self.directory.iterdir():
+            if not playbook_dir.is_dir():
+                continue
+            for directory in (playbook_dir, *(playbook_dir / name for name in PlaybookLoader.VARIABLES_DIRS)):
+                try:
+                    self.inotify.add_watch(directory, self.MASK)
+                except OSError: # No such directory or not a directory
+                    continue
+
+    def wait(self, timeout, debounce=0.2) -> bool:
+        """
+        Wait for changes up to timeout seconds. Changes coming within debounce seconds from each other are returned together
+        """
+        readable, _, _ = select.select([self.inotify], [], [], timeout)
+        if not readable:
+            return False
+        self.inotify.read_events()
+        while select.select([self.inotify], [], [], debounce)[0]:
+            self.inotify.read_events()
+        self.rewatch()
+        return True
+
+    def close(self):
+        self.inotify.close()
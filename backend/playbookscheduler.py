@@ -0,0 +1,173 @@
+import heapq
+import itertools
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from sentry_sdk import capture_exception
+
+from customtask.statuswriter import TaskStatusWriter
+from loggable import Loggable
+from singleton import Singleton
+
+DEFAULT_MAX_RUNNING = 4
+DEFAULT_MAX_QUEUED = 1000
+
+
+class PlaybookQueueFull(Exception):
+    pass
+
+
+def link_tree(source : Path, destination : Path):
+    '''
+    Recreate directory tree of source in destination with files hardlinked instead of copied.
+    Files are copied if hardlinking is not possible (i.e. source and destination are on different filesystems).
+    Never write into linked files: use replace_file to change them
+    '''
+    for directory, dirnames, filenames in os.walk(source):
+        target_dir = destination / Path(directory).relative_to(source)
+        target_dir.mkdir(parents=True, exist_ok=True)
+        for filename in filenames:
+            source_file = os.path.join(directory, filename)
+            target_file = target_dir / filename
+            try:
+                os.link(source_file, target_file)
+            except OSError:
+                shutil.copy2(source_file, target_file)
+
+
+def replace_file(path : Path) -> Path:
+    '''
+    Unlink path so that it can be opened for writing without changing the file it's hardlinked to
+    '''
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+    return path
+
+
+class PlaybookJob:
+    '''
+    :param task_id: ID of CustomTask of this job, used to report queue position as negative progress
+    :param run: function that runs the playbook
+    :param priority: jobs with higher priority are started first, jobs with the same priority are started in order of submission
+    '''
+    def __init__(self, task_id : str, run : Callable[[], None], priority=0):
+        self.task_id = task_id
+        self.run = run
+        self.priority = priority
+        self.position : Optional[int] = None
+
+    def __repr__(self):
+        return f"PlaybookJob <{self.task_id}, priority {self.priority}>"
+
+
+class PlaybookScheduler(Loggable, metaclass=Singleton):
+    '''
+    Runs playbook jobs at most max_running at once, keeping up to max_queued jobs waiting in priority order.
+    While a job waits, its task progress is set to -N where N is its position in queue (-1 means "next to run").
+    Positions of waiting jobs are written by TaskStatusWriter whenever the queue changes
+    '''
+    def __repr__(self):
+        return "PlaybookScheduler"
+
+    def __init__(self, max_running=None, max_queued=None):
+        from tornado.options import options as opts
+        self.max_running = max_running or opts.ansible_max_running
+        self.max_queued = max_queued or opts.ansible_max_queued
+        self._lock = threading.Lock()
+        self._queue : List = [] # heap of (-priority, sequence number, job)
+        self._counter = itertools.count()
+        self._running = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.max_running, thread_name_prefix='playbook')
+        self.init_log()
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def submit(self, job : PlaybookJob):
+        '''
+        :raise PlaybookQueueFull if max_queued jobs are already waiting
+        '''
+        with self._lock:
+            if len(self._queue) >= self.max_queued:
+                raise PlaybookQueueFull(f"Playbook queue is full: {len(self._queue)} jobs are waiting")
+            heapq.heappush(self._queue, (-job.priority, next(self._counter), job))
+            started = self._dispatch()
+
+        self._start(started)
+        self._update_positions()
+
+    def cancel(self, job : PlaybookJob) -> bool:
+        '''
+        Remove a waiting job from queue
+        :return: False if the job is not waiting (i.e. it's already running)
+        '''
+        with self._lock:
+            for index, (_, _, queued_job) in enumerate(self._queue):
+                if queued_job is job:
+                    del self._queue[index]
+                    heapq.heapify(self._queue)
+                    break
+            else:
+                return False
+
+        self._update_positions()
+        return True
+
+    def _dispatch(self) -> List[PlaybookJob]:
+        started = []
+        while self._queue and self._running < self.max_running:
+            _, _, job = heapq.heappop(self._queue)
+            job.position = None
+            self._running += 1
+            started.append(job)
+        return started
+
+    def _update_positions(self):
+        '''
+        Update positions of waiting jobs and report those that have changed.
+        Positions are reported under the lock, so that they're buffered before progress of jobs that are dispatched afterwards
+        '''
+        with self._lock:
+            changed = []
+            for position, (_, _, job) in enumerate(sorted(self._queue), start=1):
+                if job.position != position:
+                    job.position = position
+                    changed.append(job)
+            self.report_positions(changed)
+
+    def _start(self, jobs : List[PlaybookJob]):
+        for job in jobs:
+            self.log.debug(f"Starting {job}")
+            self._executor.submit(self._run, job)
+
+    def _run(self, job : PlaybookJob):
+        try:
+            job.run()
+        except Exception as e:
+            self.log.error(f"{job} failed: {e}")
+            capture_exception(e)
+        finally:
+            with self._lock:
+                self._running -= 1
+                started = self._dispatch()
+            self._start(started)
+            self._update_positions()
+
+    def report_positions(self, jobs : List[PlaybookJob]):
+        '''
+        Called with self._lock held, so it only buffers updates
+        '''
+        for job in jobs:
+            if job.position:
+                TaskStatusWriter().update({"ref": job.task_id, "progress": -job.position})
@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List, Optional
+
+from sentry_sdk import capture_exception
+
+from connman import ReDBConnection
+from exc import XenAdapterAPIError
+from loggable import Loggable
+from singleton import Singleton
+
+DEFAULT_MAX_PER_HOST = 4
+DEFAULT_MAX_PER_POOL = 16
+TASK_POLL_INTERVAL = 0.5
+
+
+class PowerJob:
+    '''
+    A power operation on a single VM
+    :param vm_ref: VM to operate on
+    :param host: Host ref the operation runs on: the host the VM is resident on or is started on,
+    None if XenServer chooses it (such operations are limited by pool limit only)
+    :param method: VM method name: it's called as Async.VM.<method>(vm_ref, *args)
+    :param who: Task caller (see Task.add_pending_task)
+    :param on_finish: called with the job when it's finished: status is either 'success' or 'failure', error is set on failure
+    '''
+    def __init__(self, vm_ref : str, host : Optional[str], method : str, args : tuple = (), who : Optional[str] = None,
+                 on_finish : Callable[["PowerJob"], None] = None):
+        self.vm_ref = vm_ref
+        self.host = host
+        self.method = method
+        self.args = args
+        self.who = who
+        self.on_finish = on_finish
+        self.task_id : Optional[str] = None
+        self.status : Optional[str] = None
+        self.error : Optional[str] = None
+
+    def __repr__(self):
+        return f"PowerJob <{self.method} {self.vm_ref} on {self.host}>"
+
+
+class PowerDispatcher(Loggable, metaclass=Singleton):
+    '''
+    Runs VM power operations (Async.VM.* calls) with at most max_per_host operations running on a host
+    and max_per_pool operations running in the pool. Jobs wait in order of submission,
+    a job whose host is busy doesn't keep jobs for other hosts waiting
+    '''
+    def __repr__(self):
+        return "PowerDispatcher"
+
+    def __init__(self, max_per_host=None, max_per_pool=None):
+        from tornado.options import options as opts
+        self.max_per_host = max_per_host or opts.power_max_per_host
+        self.max_per_pool = max_per_pool or opts.power_max_per_pool
+        self._lock = threading.Lock()
+        self._queue : Deque[PowerJob] = deque()
+        self._running_per_host : Dict[Optional[str], int] = {}
+        self._running = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.max_per_pool, thread_name_prefix='power')
+        self.init_log()
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def submit(self, jobs : List[PowerJob]):
+        with self._lock:
+            self._queue.extend(jobs)
+            started = self._dispatch()
+        self._start(started)
+
+    def _dispatch(self) -> List[PowerJob]:
+        started = []
+        waiting = deque()
+        while self._queue and self._running < self.max_per_pool:
+            job = self._queue.popleft()
+            if job.host and self._running_per_host.get(job.host, 0) >= self.max_per_host:
+                waiting.append(job)
+                continue
+            self._running += 1
+            self._running_per_host[job.host] = self._running_per_host.get(job.host, 0) + 1
+            started.append(job)
+        waiting.extend(self._queue)
+        self._queue = waiting
+        return started
+
+    def _start(self, jobs : List[PowerJob]):
+        for job in jobs:
+            self._executor.submit(self._run, job)
+
+    def _run(self, job : PowerJob):
+        try:
+            self.perform(job)
+        except XenAdapterAPIError as e:
+            job.status, job.error = 'failure', e.message
+        except Exception as e:
+            self.log.error(f"{job} failed: {e}")
+            capture_exception(e)
+            job.status, job.error = 'failure', str(e)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._running_per_host[job.host] -= 1
+                if not self._running_per_host[job.host]:
+                    del self._running_per_host[job.host]
+                started = self._dispatch()
+            self._start(started)
+            if job.on_finish:
+                try:
+                    job.on_finish(job)
+                except Exception as e:
+                    self.log.error(f"Exception in on_finish of {job}: {e}")
+                    capture_exception(e)
+
+    def perform(self, job : PowerJob):
+        '''
+        Start the operation and wait for its XenAPI task to finish
+        '''
+        from xentools.xenadapterpool import XenAdapterPool
+        from xenadapter.task import Task
+        from xenadapter.vm import VM
+
+        xen = XenAdapterPool().get()
+        try:
+            with ReDBConnection().get_connection():
+                vm = VM(xen, job.vm_ref)
+                job.task_id = getattr(vm, f'async_{job.method}')(*job.args)
+                Task.add_pending_task(xen, job.task_id, VM, job.vm_ref, job.method, True, job.who)
+
+            while True:
+                status = xen.api.task.get_status(job.task_id)
+                if status not in ('pending', 'cancelling'):
+                    break
+                time.sleep(TASK_POLL_INTERVAL)
+
+            job.status = 'success' if status == 'success' else 'failure'
+            if job.status == 'failure':
+                job.error = ', '.join(xen.api.task.get_error_info(job.task_id)) or status
+        finally:
+            XenAdapterPool().unget(xen)
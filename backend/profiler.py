@@ -0,0 +1,134 @@
+import math
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import Future
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+from loggable import Loggable
+from singleton import Singleton
+
+DEFAULT_DURATION = 30.0
+DEFAULT_INTERVAL = 0.01
+MAX_DURATION = 600.0
+
+
+class ProfileFiles(NamedTuple):
+    stacks: Path # Collapsed stacks, one "thread;outer frame;...;inner frame count" line per stack, see https://github.com/brendangregg/FlameGraph
+    threads: Path # Thread dump taken when profiling started
+    samples: int
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})'
+
+
+def collapse(thread_name : str, frame) -> str:
+    stack = []
+    while frame is not None:
+        stack.append(frame_name(frame))
+        frame = frame.f_back
+    stack.append(thread_name)
+    return ';'.join(reversed(stack))
+
+
+def thread_names() -> Dict[int, str]:
+    return {thread.ident: thread.name for thread in threading.enumerate()}
+
+
+def thread_dump(exclude : Optional[int] = None) -> str:
+    names = thread_names()
+    dump = []
+    for ident, frame in sys._current_frames().items():
+        if ident == exclude:
+            continue
+        dump.append(f'Thread {names.get(ident, "<unknown>")} ({ident}):\n')
+        dump.extend(traceback.format_stack(frame))
+        dump.append('\n')
+    return ''.join(dump)
+
+
+class Profiler(Loggable, metaclass=Singleton):
+    '''
+    Stack-sampling profiler of all threads (event processing, access monitor, executor threads, IOLoop).
+    Samples stacks with sys._current_frames() from its own thread, so it runs while the executor is exhausted
+    or the IOLoop is stalled, and profiled code runs unmodified. Started with SIGQUIT (see vmemperor.event_loop)
+    or with /profile (see handlers/rest/profile.py), one profile at a time
+    '''
+    def __repr__(self):
+        return "Profiler"
+
+    def __init__(self, directory : Optional[str] = None, interval : Optional[float] = None):
+        from tornado.options import options as opts
+        self.directory = Path(directory or opts.profile_dir)
+        self.interval = interval if interval is not None else opts.profile_interval
+        self._lock = threading.Lock()
+        self._running : Optional[Future] = None
+        self.init_log()
+
+    def start(self, duration : Optional[float] = None) -> Future:
+        '''
+        Starts profiling unless a profile is being taken already
+        :param duration: seconds, profile_duration option by default, at most MAX_DURATION
+        :return: Future of ProfileFiles of the profile being taken
+        :raise ValueError if duration is not a positive number
+        '''
+        from tornado.options import options as opts
+        if duration is None:
+            duration = opts.profile_duration
+        if not (math.isfinite(duration) and duration > 0):
+            raise ValueError(f"Profile duration should be a positive number of seconds, got {duration}")
+        duration = min(duration, MAX_DURATION)
+        with self._lock:
+            if self._running and not self._running.done():
+                return self._running
+            future = self._running = Future()
+
+        thread = threading.Thread(target=self._run, args=(duration, future), name='Profiler', daemon=True)
+        thread.start()
+        return future
+
+    def _run(self, duration, future):
+        try:
+            future.set_result(self.profile(duration))
+        except Exception as e:
+            self.log.error(f"Profiling failed: {e}", exc_info=True)
+            future.set_exception(e)
+
+    def profile(self, duration : float) -> ProfileFiles:
+        own_ident = threading.get_ident()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        files = ProfileFiles(self.directory / f'{name}.collapsed', self.directory / f'{name}.threads.txt', 0)
+        files.threads.write_text(thread_dump(exclude=own_ident))
+        self.log.info(f"Profiling all threads for {duration} s, thread dump: {files.threads}")
+
+        stacks = Counter()
+        samples = 0
+        names = thread_names()
+        end = time.monotonic() + duration
+        while True:
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                if ident not in names:
+                    names = thread_names()
+                stacks[collapse(names.get(ident, str(ident)), frame)] += 1
+            samples += 1
+            frame = None # Don't keep frames of other threads alive while sleeping
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(self.interval, remaining))
+
+        with files.stacks.open('w') as file:
+            for stack, count in stacks.most_common():
+                file.write(f'{stack} {count}\n')
+        self.log.info(f"Profile of {samples} samples written: {files.stacks}")
+        return files._replace(samples=samples)
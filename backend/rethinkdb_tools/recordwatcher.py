@@ -0,0 +1,135 @@
+import asyncio
+from typing import Callable, Dict, List, Optional, Sequence, Set
+
+from sentry_sdk import capture_exception
+
+import constants.re as re
+from connman import ReDBConnection
+from loggable import Loggable
+
+RECONNECT_DELAY = 2
+
+# Callback is called with record (watched fields) or None if the record has been removed before reaching its final state
+RecordCallback = Callable[[Optional[dict]], None]
+
+
+class RecordWatcher(Loggable):
+    '''
+    Runs callbacks when records of a table reach their final state (see is_done). The whole table is watched
+    with a single changefeed on the IOLoop, so that waiting for a record costs neither a thread nor a RethinkDB connection.
+    Callbacks are run in the default executor with a RethinkDB connection
+    Subclasses define table_name, fields (including 'ref') and is_done
+    '''
+    table_name : str = None
+    fields : Sequence[str] = ('ref', )
+
+    def __init__(self):
+        self._loop : Optional[asyncio.AbstractEventLoop] = None
+        self._callbacks : Dict[str, List[RecordCallback]] = {}
+        self._unchecked : Set[str] = set() # Records that could reach their final state before we started to watch them
+        self._wakeup : Optional[asyncio.Event] = None
+        self.init_log()
+
+    def is_done(self, record : dict) -> bool:
+        '''
+        Called on IOLoop for every change of watched records
+        '''
+        raise NotImplementedError
+
+    @property
+    def watched(self) -> int:
+        return len(self._callbacks)
+
+    def start(self, loop : asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._wakeup = asyncio.Event(loop=loop)
+        asyncio.run_coroutine_threadsafe(self._run(), loop)
+
+    def watch(self, ref : str, callback : RecordCallback):
+        '''
+        Run callback when record ref is done. Can be called from any thread
+        '''
+        if not self._loop:
+            raise RuntimeError(f"{self} is not started")
+        self._loop.call_soon_threadsafe(self._register, ref, callback)
+
+    def _register(self, ref : str, callback : RecordCallback):
+        self._callbacks.setdefault(ref, []).append(callback)
+        self._unchecked.add(ref)
+        self._wakeup.set()
+
+    def _on_change(self, ref : str, record : Optional[dict]):
+        if ref not in self._callbacks:
+            return
+        if record and not self.is_done(record):
+            return
+        for callback in self._callbacks.pop(ref):
+            self._loop.run_in_executor(None, self._run_callback, callback, record)
+
+    def _run_callback(self, callback : RecordCallback, record : Optional[dict]):
+        try:
+            with ReDBConnection().get_connection():
+                callback(record)
+        except Exception as e:
+            self.log.error(f"Exception in callback of {record and record['ref']}: {e}")
+            capture_exception(e)
+
+    async def _run(self):
+        while True:
+            try:
+                async with ReDBConnection().get_async_connection() as conn:
+                    changes = await re.db.table(self.table_name).pluck(*self.fields).changes().run(conn)
+                    # Records could change while we were (re)connecting
+                    self._unchecked.update(self._callbacks)
+                    self._wakeup.set()
+                    checker = asyncio.ensure_future(self._check_unchecked())
+                    try:
+                        while True:
+                            change = await changes.next()
+                            if not change:
+                                break
+                            if change.get('new_val'):
+                                self._on_change(change['new_val']['ref'], change['new_val'])
+                            elif change.get('old_val'):
+                                self._on_change(change['old_val']['ref'], None)
+                    finally:
+                        checker.cancel()
+            except Exception as e:
+                self.log.error(f"Exception in {self.table_name} changefeed: {e}, reconnecting in {RECONNECT_DELAY} s")
+                capture_exception(e)
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _check_unchecked(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            refs = list(self._unchecked)
+            self._unchecked.clear()
+            if not refs:
+                continue
+            try:
+                async with ReDBConnection().get_async_connection() as conn:
+                    records = await re.db.table(self.table_name).get_all(*refs).pluck(*self.fields).coerce_to('array').run(conn)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep checking: records that are done by now would not appear in the changefeed anymore
+                self.log.error(f"Exception while checking {len(refs)} {self.table_name} records: {e}, retrying in {RECONNECT_DELAY} s")
+                capture_exception(e)
+                self._unchecked.update(refs)
+                await asyncio.sleep(RECONNECT_DELAY)
+                self._wakeup.set()
+                continue
+            found = set()
+            for record in records:
+                found.add(record['ref'])
+                self._on_change(record['ref'], record)
+            for ref in refs:
+                if ref not in found:
+                    self._on_missing(ref)
+
+    def _on_missing(self, ref : str):
+        '''
+        Called when a watched record does not exist (yet)
+        '''
+        pass
@@ -0,0 +1,132 @@
+import gzip
+import json
+import time
+from typing import List, Iterable
+
+from rethinkdb import RethinkDB
+
+import constants
+import constants.re as re
+from datetimeencoder import DateTimeEncoder
+from loggable import Loggable
+from rethinkdb_tools.helper import CHECK_ER
+
+r = RethinkDB()
+
+ARCHIVE_NONE = 'none'
+ARCHIVE_TABLE = 'table'
+ARCHIVE_FILE = 'file'
+
+BATCH_SIZE = 1000
+FINISHED_STATUSES = ('success', 'failure', 'cancelled')
+
+
+def is_finished(task):
+    return r.expr(FINISHED_STATUSES).contains(task['status'])
+
+
+def write_jsonl_archive(file_name : str, docs : Iterable[dict]):
+    '''
+    Append docs to a gzip-compressed JSON Lines file. Every call appends a new gzip member, which is still a valid gzip stream
+    for zcat and gzip.open
+    '''
+    with gzip.open(file_name, 'at', encoding='utf-8') as file:
+        for doc in docs:
+            file.write(json.dumps(doc, cls=DateTimeEncoder))
+            file.write('\n')
+
+
+class TaskCompactor(Loggable):
+    '''
+    Removes finished tasks from the tasks table (which is never dropped by create_dbs), optionally archiving them.
+    A finished task is removed when it's older than retention_days or when its object has more than
+    retention_per_object newer finished tasks. Pending tasks are never touched.
+
+    Archived tasks are either moved into Task.archive_db_table_name (archive='table'),
+    appended to a gzipped JSON Lines file (archive='file') or just deleted (archive='none')
+    '''
+    def __repr__(self):
+        return "TaskCompactor"
+
+    def __init__(self, retention_days : int, retention_per_object : int, archive : str = ARCHIVE_TABLE, archive_file : str = None):
+        if archive not in (ARCHIVE_NONE, ARCHIVE_TABLE, ARCHIVE_FILE):
+            raise ValueError(f"Unsupported archive type: {archive}. Use one of: {ARCHIVE_NONE}, {ARCHIVE_TABLE}, {ARCHIVE_FILE}")
+        if archive == ARCHIVE_FILE and not archive_file:
+            raise ValueError("archive_file should be set for archive type 'file'")
+
+        self.retention_days = retention_days
+        self.retention_per_object = retention_per_object
+        self.archive = archive
+        self.archive_file = archive_file
+        self.init_log()
+
+    def expired_query(self):
+        from xenadapter.task import Task
+        return re.db.table(Task.db_table_name)\
+            .between(r.minval, r.now().sub(self.retention_days * 24 * 60 * 60), index='created')\
+            .filter(is_finished)
+
+    def overflowing_objects_query(self):
+        from xenadapter.task import Task
+        # group(index=...) is only allowed on a table, not on a filtered selection
+        return re.db.table(Task.db_table_name)\
+            .filter(is_finished)\
+            .group('object_ref').count().ungroup()\
+            .filter(lambda group: group['reduction'] > self.retention_per_object)['group']
+
+    def overflowing_object_refs(self) -> List[str]:
+        return self.overflowing_objects_query().coerce_to('array').run()
+
+    def overflow_query(self, object_ref : str):
+        from xenadapter.task import Task
+        return re.db.table(Task.db_table_name)\
+            .get_all(object_ref, index='object_ref')\
+            .filter(is_finished)\
+            .order_by(r.desc('created'))\
+            .skip(self.retention_per_object)
+
+    def archive_tasks(self, docs : List[dict]):
+        '''
+        Archive docs and then delete them from the tasks table. If we crash in between, tasks would be archived twice,
+        but never lost
+        '''
+        from xenadapter.task import Task
+        if not docs:
+            return
+
+        if self.archive == ARCHIVE_TABLE:
+            CHECK_ER(re.db.table(Task.archive_db_table_name).insert(docs, conflict='replace').run())
+        elif self.archive == ARCHIVE_FILE:
+            write_jsonl_archive(self.archive_file, docs)
+
+        CHECK_ER(re.db.table(Task.db_table_name).get_all(*[doc['ref'] for doc in docs]).delete().run())
+
+    def _compact_query(self, query) -> int:
+        total = 0
+        while not constants.need_exit.is_set():
+            docs = query.limit(BATCH_SIZE).coerce_to('array').run()
+            self.archive_tasks(docs)
+            total += len(docs)
+            if len(docs) < BATCH_SIZE:
+                break
+
+        return total
+
+    def compact(self) -> int:
+        '''
+        Run one compaction pass. Requires a RethinkDB connection
+        :return: number of removed tasks
+        '''
+        start = time.monotonic()
+        total = 0
+        if self.retention_days:
+            total += self._compact_query(self.expired_query())
+
+        if self.retention_per_object:
+            for object_ref in self.overflowing_object_refs():
+                if constants.need_exit.is_set():
+                    break
+                total += self._compact_query(self.overflow_query(object_ref))
+
+        self.log.info(f"Compacted {total} tasks (archive: {self.archive}) in {time.monotonic() - start:.2f} s")
+        return total
@@ -0,0 +1,25 @@
+from typing import Callable, Optional
+
+from rethinkdb_tools.recordwatcher import RecordWatcher
+from singleton import Singleton
+
+# Callback is called with task record (TaskWatcher.fields) or None if the task has been removed before finishing
+TaskCallback = Callable[[Optional[dict]], None]
+
+
+def is_finished(status: str) -> bool:
+    return status not in ('pending', 'cancelling')
+
+
+class TaskWatcher(RecordWatcher, metaclass=Singleton):
+    '''
+    Runs callbacks when tasks finish. See RecordWatcher
+    '''
+    table_name = 'tasks'
+    fields = ('ref', 'status', 'result', 'error_info')
+
+    def __repr__(self):
+        return "TaskWatcher"
+
+    def is_done(self, record : dict) -> bool:
+        return is_finished(record['status'])
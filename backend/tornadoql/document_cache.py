@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict
+from functools import partial
+from hashlib import sha256
+from typing import Optional, Mapping
+
+from graphql.backend.base import GraphQLBackend, GraphQLDocument
+from graphql.execution import execute, ExecutionResult
+from graphql.language.base import parse
+from graphql.validation import validate
+
+DEFAULT_CACHE_SIZE = 1024
+
+
+class PersistedQueryNotFound(Exception):
+    '''
+    Raised when a client sends only a query hash and we don't know such a query (yet).
+    Apollo client re-sends the full query text after receiving this error
+    '''
+    def __init__(self):
+        super().__init__("PersistedQueryNotFound")
+
+
+class PersistedQueryHashMismatch(Exception):
+    def __init__(self, sha256_hash):
+        super().__init__(f"provided sha256Hash does not match query: {sha256_hash}")
+
+
+def execute_validated(schema, document_ast, validation_errors, *args, **kwargs):
+    '''
+    Like graphql.backend.core.execute_and_validate, but validation errors are computed once per document
+    '''
+    if validation_errors:
+        return ExecutionResult(errors=validation_errors, invalid=True)
+
+    return execute(schema, document_ast, *args, **kwargs)
+
+
+class DocumentCache(GraphQLBackend):
+    '''
+    GraphQL backend that keeps parsed and validated documents in an LRU cache keyed by sha256 of query text.
+    The same hashes are used as Apollo persisted query IDs: if a client sends
+    >>> {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": "<hash>"}}}
+    without a query, we look the document up by its hash
+    '''
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self._documents = OrderedDict()  # Key: sha256 of query, value: GraphQLDocument
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f"DocumentCache <{len(self._documents)}/{self.max_size} documents, {self.hits} hits, {self.misses} misses>"
+
+    def __len__(self):
+        return len(self._documents)
+
+    @staticmethod
+    def query_hash(query: str) -> str:
+        return sha256(query.encode('utf-8')).hexdigest()
+
+    def _get(self, key):
+        with self._lock:
+            document = self._documents.get(key)
+            if document is not None:
+                self._documents.move_to_end(key)
+            return document
+
+    def _put(self, key, document):
+        with self._lock:
+            self._documents[key] = document
+            self._documents.move_to_end(key)
+            while len(self._documents) > self.max_size:
+                self._documents.popitem(last=False)
+
+    def get_query(self, sha256_hash: str) -> Optional[str]:
+        '''
+        Get query text by its hash (if it's cached)
+        '''
+        document = self._get(sha256_hash)
+        if document is None:
+            return None
+        return document.document_string
+
+    def resolve_query(self, query: Optional[str], extensions: Optional[Mapping]) -> Optional[str]:
+        '''
+        Returns query text for a request, taking persisted query extension into account
+        :param query: query text sent by the client, may be None when persisted query is used
+        :param extensions: "extensions" field of the request
+        :return: query text
+        :raise PersistedQueryNotFound: if client sent only an unknown hash
+        :raise PersistedQueryHashMismatch: if client sent both a query and a hash and they don't match
+        '''
+        try:
+            sha256_hash = extensions['persistedQuery']['sha256Hash']
+        except (KeyError, TypeError):
+            return query
+
+        if query:
+            if self.query_hash(query) != sha256_hash:
+                raise PersistedQueryHashMismatch(sha256_hash)
+            return query
+
+        query = self.get_query(sha256_hash)
+        if query is None:
+            raise PersistedQueryNotFound()
+        return query
+
+    def document_from_string(self, schema, request_string):
+        key = self.query_hash(request_string)
+        document = self._get(key)
+        if document is not None and document.schema is schema:
+            self.hits += 1
+            return document
+
+        self.misses += 1
+        document_ast = parse(request_string)
+        validation_errors = validate(schema, document_ast)
+        document = GraphQLDocument(
+            schema=schema,
+            document_string=request_string,
+            document_ast=document_ast,
+            execute=partial(execute_validated, schema, document_ast, validation_errors)
+        )
+        self._put(key, document)
+        return document
+
+
+DOCUMENT_CACHE = DocumentCache()
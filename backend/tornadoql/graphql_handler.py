@@ -2,7 +2,9 @@
 
 from __future__ import absolute_import, division, print_function
 
+import random
 import sys
+import time
 import traceback
 from functools import wraps
 
@@ -13,8 +15,10 @@ from tornado.log import app_log
 from graphql.error import GraphQLError
 from graphql.error import format_error as format_graphql_error
 
+from tornadoql.document_cache import DOCUMENT_CACHE, PersistedQueryNotFound, PersistedQueryHashMismatch
 from tornadoql.logging_middleware import GraphQLLog
 from tornadoql.middlewares import MIDDLEWARE
+from tornadoql.tracing import Trace
 
 from datetime import  datetime
 
@@ -81,6 +85,10 @@ class GQLHandler(web.RequestHandler):
         return self.handle_graphql()
 
     def handle_graphql(self):
+        trace_requested = self.trace_requested
+        trace = Trace() if trace_requested or random.random() < self.trace_sample_rate else None
+        self.request.trace = trace
+        start = time.perf_counter()
         result = self.execute_graphql()
         app_log.debug('GraphQL result data: %s errors: %s invalid %s',
                       result.data, result.errors, result.invalid)
@@ -98,19 +106,44 @@ class GQLHandler(web.RequestHandler):
 
 
         response = {'data': result.data}
-        self.write(json_encode(response))
+        body = json_encode(response)
+        if trace:
+            trace.finish(len(body))
+            if trace_requested:
+                response['extensions'] = {'tracing': trace.as_extension()}
+                body = json_encode(response)
+        self.write(body)
+        self.log_slow_request(time.perf_counter() - start, len(body), trace)
+
+    def log_slow_request(self, duration, response_size, trace):
+        threshold = self.slow_query_threshold
+        if not threshold or duration < threshold:
+            return
+        operation = self.graphql_request.get('operationName') or 'anonymous operation'
+        message = f'Slow GraphQL request ({operation}): {duration:.3f} s, response: {response_size} bytes'
+        if trace:
+            message += '. Slowest fields: ' + '; '.join(
+                f"{field['field']} x{field['count']}: {field['duration'] * 1000:.1f} ms, {field['reql']} ReQL queries, "
+                f"{field['xapi']} XAPI calls" for field in trace.fields()[:10])
+        app_log.warning(message)
 
 
 
     def execute_graphql(self):
         graphql_req = self.graphql_request
         app_log.debug('graphql request: %s', graphql_req)
+        try:
+            query = self.document_cache.resolve_query(graphql_req.get('query'), graphql_req.get('extensions'))
+        except (PersistedQueryNotFound, PersistedQueryHashMismatch) as e:
+            raise ExecutionError(errors=[e])
+
         return self.schema.execute(
-            graphql_req.get('query'),
+            query,
             variable_values=graphql_req.get('variables'),
             operation_name=graphql_req.get('operationName'),
             context_value=self.context,
-            middleware=self.middleware
+            middleware=self.middleware,
+            backend=self.document_cache
         )
 
     @property
@@ -129,6 +162,31 @@ class GQLHandler(web.RequestHandler):
     def middleware(self):
         return MIDDLEWARE
 
+    @property
+    def trace_requested(self) -> bool:
+        '''
+        Reimplement this to send traces of resolvers to the client in response extensions, see tornadoql/tracing.py
+        '''
+        return False
+
+    @property
+    def trace_sample_rate(self) -> float:
+        '''
+        Fraction of requests traced to be logged if slow
+        '''
+        return 0.0
+
+    @property
+    def slow_query_threshold(self) -> float:
+        '''
+        Requests slower than this (seconds) are logged, None - don't log
+        '''
+        return None
+
+    @property
+    def document_cache(self):
+        return DOCUMENT_CACHE
+
     @property
     def context(self):
         return self.request
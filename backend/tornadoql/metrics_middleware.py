@@ -0,0 +1,18 @@
+import time
+
+from metrics import GRAPHQL_RESOLVE_SECONDS
+
+
+class GraphQLMetrics:
+    '''
+    Reports resolve time of top-level fields (queries, mutations and subscriptions) to GRAPHQL_RESOLVE_SECONDS.
+    Nested fields are not timed: a list query resolves thousands of them
+    '''
+    def resolve(next, root, info, *args, **kwargs):
+        if len(info.path) > 1:
+            return next(root, info, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return next(root, info, *args, **kwargs)
+        finally:
+            GRAPHQL_RESOLVE_SECONDS.labels(f'{info.parent_type.name}.{info.field_name}').observe(time.perf_counter() - start)
@@ -1,3 +1,5 @@
 from tornadoql.logging_middleware import GraphQLLog
+from tornadoql.metrics_middleware import GraphQLMetrics
+from tornadoql.tracing_middleware import GraphQLTracing
 
-MIDDLEWARE = [GraphQLLog]
\ No newline at end of file
+MIDDLEWARE = [GraphQLLog, GraphQLMetrics, GraphQLTracing]
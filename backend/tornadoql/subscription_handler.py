@@ -18,6 +18,7 @@ from graphql.execution.executors.asyncio import AsyncioExecutor
 import asyncio
 
 from loggable import Loggable
+from tornadoql.document_cache import DOCUMENT_CACHE, PersistedQueryNotFound, PersistedQueryHashMismatch
 from tornadoql.middlewares import MIDDLEWARE
 from tornadoql.print_graphql_exception import print_graphql_exception
 
@@ -77,6 +78,10 @@ class GQLSubscriptionHandler(websocket.WebSocketHandler, Loggable):
     def middleware(self):
         return MIDDLEWARE
 
+    @property
+    def document_cache(self):
+        return DOCUMENT_CACHE
+
     @property
     def schema(self):
         raise NotImplementedError('schema must be provided')
@@ -143,7 +148,7 @@ class GQLSubscriptionHandler(websocket.WebSocketHandler, Loggable):
 
     def get_graphql_params(self, payload):
         return {
-            'request_string': payload.get('query'),
+            'request_string': self.document_cache.resolve_query(payload.get('query'), payload.get('extensions')),
             'variable_values': payload.get('variables'),
             'operation_name': payload.get('operationName'),
             'context_value': payload.get('context'),
@@ -184,7 +189,10 @@ class GQLSubscriptionHandler(websocket.WebSocketHandler, Loggable):
         elif op_type == GQL_START:
             assert isinstance(payload, dict), "The payload must be a dict"
 
-            params = self.get_graphql_params(payload)
+            try:
+                params = self.get_graphql_params(payload)
+            except (PersistedQueryNotFound, PersistedQueryHashMismatch) as e:
+                return self.send_error(op_id, e)
             if not isinstance(params, dict):
                 error = Exception(
                     "Invalid params returned from get_graphql_params! return values must be a dict.")
@@ -228,7 +236,8 @@ class GQLSubscriptionHandler(websocket.WebSocketHandler, Loggable):
             execution_result = graphql(
                 self.schema, **params, allow_subscriptions=True,
                 context=self.context,
-                executor=executor
+                executor=executor,
+                backend=self.document_cache
             )
             if not isinstance(execution_result, Observable):
                 execution_info = json.dumps({
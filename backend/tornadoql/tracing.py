@@ -0,0 +1,87 @@
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import List
+
+TRACE_HEADER = 'X-GraphQL-Trace' # Set to 1 to get a trace in response extensions
+
+
+def isoformat(timestamp : float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+class ResolverTrace:
+    __slots__ = ('path', 'parent_type', 'field_name', 'return_type', 'start', 'duration', 'reql', 'xapi')
+
+    def __init__(self, info, start, duration, reql, xapi):
+        self.path = info.path
+        self.parent_type = info.parent_type
+        self.field_name = info.field_name
+        self.return_type = info.return_type
+        self.start = start
+        self.duration = duration
+        self.reql = reql
+        self.xapi = xapi
+
+
+class Trace:
+    '''
+    Resolver times of a GraphQL request with RethinkDB queries and XAPI calls made by each resolver,
+    see GraphQLTracing middleware. Nested fields are resolved after their parent resolver returns,
+    so resolver times and calls don't include the ones of nested fields
+    '''
+    def __init__(self):
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.response_size = None
+        self.resolvers : List[ResolverTrace] = []
+
+    def __repr__(self):
+        return f"Trace <{len(self.resolvers)} resolvers>"
+
+    def add(self, info, start, end, reql, xapi):
+        self.resolvers.append(ResolverTrace(info, start - self._start, end - start, reql, xapi))
+
+    def finish(self, response_size : int):
+        self.duration = time.perf_counter() - self._start
+        self.response_size = response_size
+
+    def as_extension(self) -> dict:
+        '''
+        :return: Apollo Tracing (https://github.com/apollographql/apollo-tracing) with RethinkDB queries and XAPI calls
+        of resolvers and response size in bytes
+        '''
+        return {
+            'version': 1,
+            'startTime': isoformat(self.started),
+            'endTime': isoformat(self.started + self.duration),
+            'duration': int(self.duration * 1e9),
+            'responseSize': self.response_size,
+            'execution': {
+                'resolvers': [{
+                    'path': resolver.path,
+                    'parentType': str(resolver.parent_type),
+                    'fieldName': resolver.field_name,
+                    'returnType': str(resolver.return_type),
+                    'startOffset': int(resolver.start * 1e9),
+                    'duration': int(resolver.duration * 1e9),
+                    'reql': resolver.reql,
+                    'xapi': resolver.xapi,
+                } for resolver in self.resolvers]
+            }
+        }
+
+    def fields(self) -> List[dict]:
+        '''
+        :return: resolver times and calls summed up by field (e.g. every GVM.VBDs of a vms query), slowest first
+        '''
+        fields = defaultdict(lambda: {'count': 0, 'duration': 0.0, 'reql': 0, 'xapi': 0})
+        for resolver in self.resolvers:
+            field = fields[f'{resolver.parent_type}.{resolver.field_name}']
+            field['count'] += 1
+            field['duration'] += resolver.duration
+            field['reql'] += resolver.reql
+            field['xapi'] += resolver.xapi
+        return sorted(({'field': name, **field} for name, field in fields.items()),
+                      key=lambda field: field['duration'], reverse=True)
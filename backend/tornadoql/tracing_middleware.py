@@ -0,0 +1,19 @@
+import time
+
+from metrics import CALLS
+
+
+class GraphQLTracing:
+    '''
+    Records resolvers of requests that have a Trace in their context (request.trace), see GQLHandler.handle_graphql
+    '''
+    def resolve(next, root, info, *args, **kwargs):
+        trace = getattr(info.context, 'trace', None)
+        if trace is None:
+            return next(root, info, *args, **kwargs)
+        reql, xapi = CALLS.reql, CALLS.xapi
+        start = time.perf_counter()
+        try:
+            return next(root, info, *args, **kwargs)
+        finally:
+            trace.add(info, start, time.perf_counter(), CALLS.reql - reql, CALLS.xapi - xapi)
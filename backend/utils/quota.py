@@ -1,3 +1,5 @@
+from typing import Dict, List, Optional
+
 from rethinkdb.errors import ReqlNonExistenceError
 
 import constants.re as re
@@ -85,20 +87,24 @@ def check_vcpu_count(user_id: str):
 
     return vcpu_count - get_used_vcpu_count(user_id)
 
-def quota_memory_error(vm_info, main_owner):
-    memory_left = check_memory(main_owner)
+def memory_left_error(memory_left, vm_info):
     if memory_left is not None:
         memory_expected_left  = memory_left - vm_info['memory_static_max']
         if memory_expected_left < 0:
             return f'Unable to allocate memory: memory quota will be exceeded by {-(memory_expected_left/1024/1024)} Mb'
 
-def quota_vcpu_count_error(vm_info, main_owner):
-    vcpus_left = check_vcpu_count(main_owner)
+def vcpus_left_error(vcpus_left, vm_info):
     if vcpus_left is not None:
         vcpus_expected_left = vcpus_left - vm_info['VCPUs_max']
         if vcpus_expected_left < 0:
             return f'Unable to allocate VCPUs: VCPUs quota will be exceeded by {-vcpus_expected_left} VCPUs'
 
+def quota_memory_error(vm_info, main_owner):
+    return memory_left_error(check_memory(main_owner), vm_info)
+
+def quota_vcpu_count_error(vm_info, main_owner):
+    return vcpus_left_error(check_vcpu_count(main_owner), vm_info)
+
 def quota_vdi_size_error(size, main_owner):
     """
     Perform a VDI size check for main_owner against disk of size bytes
@@ -146,3 +152,58 @@ def before_vm_unpause(ref: str):
 
     return quota_vcpu_count_error(vm_info, main_owner)
 
+
+def before_vm_start_resume_many(refs: List[str]) -> Dict[str, Optional[str]]:
+    '''
+    Batch version of before_vm_start_resume. VMs are checked in order of refs as if they were started one after another,
+    so that VMs of the same owner that fit into quota one by one but not together are reported
+    :return: key: ref, value: None if OK, string error message if not OK
+    '''
+    return _quota_errors_many(refs, ('Halted', 'Suspended'), check_memory=True)
+
+
+def before_vm_unpause_many(refs: List[str]) -> Dict[str, Optional[str]]:
+    '''
+    Batch version of before_vm_unpause
+    '''
+    return _quota_errors_many(refs, ('Paused', ), check_memory=False)
+
+
+def _quota_errors_many(refs: List[str], power_states, check_memory) -> Dict[str, Optional[str]]:
+    if not refs:
+        return {}
+    vm_infos = {item['ref']: item for item in
+                re.db.table('vms').get_all(*refs).pluck('ref', 'power_state', 'memory_static_max', 'VCPUs_max', 'main_owner').run()}
+    owners = {vm_info['main_owner'] for vm_info in vm_infos.values()
+              if vm_info.get('main_owner') and vm_info['power_state'] in power_states}
+    if not owners:
+        return {ref: None for ref in refs}
+
+    quotas = {item['user_id']: item for item in re.db.table('quotas').get_all(*owners).run()}
+    owners = [owner for owner, quota in quotas.items() if (check_memory and quota.get('memory')) or quota.get('vcpu_count')]
+    usage = {}
+    if owners:
+        usage = re.db.table('vms').get_all(*owners, index='main_owner')\
+            .filter((re.r.row['power_state'] == 'Paused') | (re.r.row['power_state'] == 'Running'))\
+            .group('main_owner')\
+            .map(lambda item: {'memory': item['memory_static_max'], 'vcpus': item['VCPUs_max']})\
+            .reduce(lambda left, right: {'memory': left['memory'] + right['memory'], 'vcpus': left['vcpus'] + right['vcpus']})\
+            .run()
+
+    used = {owner: dict(usage.get(owner, {'memory': 0, 'vcpus': 0})) for owner in owners}
+    errors = {}
+    for ref in refs:
+        errors[ref] = None
+        vm_info = vm_infos.get(ref)
+        if not vm_info or vm_info['power_state'] not in power_states or vm_info.get('main_owner') not in used:
+            continue
+        owner = vm_info['main_owner']
+        quota = quotas[owner]
+        memory_left = quota['memory'] - used[owner]['memory'] if check_memory and quota.get('memory') else None
+        vcpus_left = quota['vcpu_count'] - used[owner]['vcpus'] if quota.get('vcpu_count') else None
+        errors[ref] = memory_left_error(memory_left, vm_info) or vcpus_left_error(vcpus_left, vm_info)
+        if not errors[ref] and check_memory: # Paused VMs are counted in usage already
+            used[owner]['memory'] += vm_info['memory_static_max']
+            used[owner]['vcpus'] += vm_info['VCPUs_max']
+
+    return errors
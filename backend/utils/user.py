@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from authentication import BasicAuthenticator
 from constants import re as re
 
@@ -30,23 +32,35 @@ ANY_USER = {
                 }
 
 
+USER_TABLES = {
+    "users/": "users",
+    "groups/": "groups"
+}
+
+
 def get_user_object(id):
-    tables = {
-        "users/": "users",
-        "groups/": "groups"
-    }
-    # remember that for loop variables are of function scope
-    for item, value in tables.items():
-        if id.startswith(item):
-            db_id = id.replace(item, "")
-            table_name = value
-            break
-    else:
-        if id == "any":
-            return ANY_USER
-        return None
-    record = re.db.table(table_name).get(db_id).run()
-    if not record or not len(record):
-        return None
-    record["id"] = id
-    return record
\ No newline at end of file
+    return get_user_objects([id])[0]
+
+
+def get_user_objects(ids : List[str]) -> List[Optional[dict]]:
+    '''
+    Batch version of get_user_object: fetches users and groups with at most one get_all per table
+    :param ids: user ids in form "users/USER_ID", "groups/GROUP_ID" or "any"
+    :return: user records in order of ids, None in place of nonexistent users
+    '''
+    db_ids = {table_name: set() for table_name in USER_TABLES.values()}
+    for id in ids:
+        for prefix, table_name in USER_TABLES.items():
+            if id.startswith(prefix):
+                db_ids[table_name].add(id[len(prefix):])
+                break
+
+    records = {}
+    for prefix, table_name in USER_TABLES.items():
+        if not db_ids[table_name]:
+            continue
+        for record in re.db.table(table_name).get_all(*db_ids[table_name]).run():
+            record["id"] = prefix + record["id"]
+            records[record["id"]] = record
+
+    return [ANY_USER if id == "any" else records.get(id) for id in ids]
@@ -0,0 +1,133 @@
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple, Iterable, Optional
+
+DEFAULT_LIMIT = 50
+
+# Ranks: lower is better
+RANK_EXACT = 0
+RANK_USERNAME_PREFIX = 1
+RANK_WORD_PREFIX = 2
+RANK_SUBSTRING = 3
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class UserSearchIndex:
+    '''
+    In-memory index of users and groups for find_user query. Matching is case-insensitive:
+    queries shorter than 3 characters match prefixes of username and name words,
+    longer queries match substrings of username or name (candidates are found by trigrams).
+
+    Updated by EventLoop.do_user_table with users and groups as they are stored in DB (ids without users/ or groups/ prefix)
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records: Dict[str, dict] = {} # Key: users/ID or groups/ID, value: record with prefixed id
+        self._keys: Dict[str, Tuple[str, str]] = {} # Key: id, value: lowercase username and name
+        self._trigrams: Dict[str, Set[str]] = defaultdict(set) # Key: trigram, value: ids
+        self._words: List[Tuple[str, str]] = [] # Sorted list of (lowercase word, id) for prefix search
+        self.ready = False
+
+    def __repr__(self):
+        return f"UserSearchIndex <{len(self._records)} entries>"
+
+    def __len__(self):
+        return len(self._records)
+
+    @staticmethod
+    def _words_of(username, name) -> Set[str]:
+        return {username, *name.split()}
+
+    def _add(self, id, record):
+        username = (record.get('username') or '').lower()
+        name = (record.get('name') or '').lower()
+        self._records[id] = record
+        self._keys[id] = username, name
+        for trigram in trigrams(username) | trigrams(name):
+            self._trigrams[trigram].add(id)
+        for word in self._words_of(username, name):
+            insort(self._words, (word, id))
+
+    def _remove(self, id):
+        username, name = self._keys.pop(id)
+        del self._records[id]
+        for trigram in trigrams(username) | trigrams(name):
+            ids = self._trigrams[trigram]
+            ids.discard(id)
+            if not ids:
+                del self._trigrams[trigram]
+        for word in self._words_of(username, name):
+            index = bisect_left(self._words, (word, id))
+            if index < len(self._words) and self._words[index] == (word, id):
+                del self._words[index]
+
+    def update(self, users: Iterable[dict], groups: Iterable[dict]):
+        '''
+        Synchronize index with a complete list of users and groups. Only added, changed and removed entries are reindexed
+        '''
+        new_records = {}
+        for prefix, items in (('users/', users), ('groups/', groups)):
+            for item in items:
+                id = f"{prefix}{item['id']}"
+                new_records[id] = {**item, 'id': id}
+
+        with self._lock:
+            for id in [id for id in self._records if id not in new_records]:
+                self._remove(id)
+            for id, record in new_records.items():
+                old_record = self._records.get(id)
+                if old_record == record:
+                    continue
+                if old_record is not None:
+                    self._remove(id)
+                self._add(id, record)
+            self.ready = True
+
+    def _candidates(self, query) -> Set[str]:
+        if not query:
+            return set(self._records)
+        if len(query) < 3:
+            ids = set()
+            index = bisect_left(self._words, (query, ''))
+            while index < len(self._words) and self._words[index][0].startswith(query):
+                ids.add(self._words[index][1])
+                index += 1
+            return ids
+
+        sets = sorted((self._trigrams.get(trigram, set()) for trigram in trigrams(query)), key=len)
+        ids = set(sets[0])
+        for item in sets[1:]:
+            ids &= item
+            if not ids:
+                break
+        return {id for id in ids if query in self._keys[id][0] or query in self._keys[id][1]}
+
+    def _rank(self, id, query) -> int:
+        username, name = self._keys[id]
+        if query in (username, name):
+            return RANK_EXACT
+        if username.startswith(query):
+            return RANK_USERNAME_PREFIX
+        if any(word.startswith(query) for word in name.split()):
+            return RANK_WORD_PREFIX
+        return RANK_SUBSTRING
+
+    def search(self, query: str, limit: Optional[int] = DEFAULT_LIMIT) -> List[dict]:
+        '''
+        :param query: search string
+        :param limit: maximum number of results, None for no limit
+        :return: user and group records, best matches first
+        '''
+        query = query.strip().lower()
+        with self._lock:
+            ranked = sorted(((self._rank(id, query), self._keys[id][0], id) for id in self._candidates(query)))
+            if limit is not None:
+                ranked = ranked[:limit]
+            return [self._records[id] for _, _, id in ranked]
+
+
+USER_SEARCH_INDEX = UserSearchIndex()
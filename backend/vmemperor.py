@@ -6,6 +6,7 @@ import signal
 import atexit
 import constants
 import constants.auth
+import metrics
 from connman import ReDBConnection
 import handlers.graphql.graphql_handler as gql_handler
 from createdbs import create_dbs
@@ -16,9 +17,19 @@ from handlers.rest.autoinstall import AutoInstall
 from handlers.graphql.root import schema
 from handlers.rest.console import ConsoleHandler
 from handlers.rest.logout import LogOut
+from handlers.rest.metrics import MetricsHandler
 from handlers.rest.playbooklog import PlaybookLogHandler
 from handlers.rest.poollistpublic import PoolListPublic
 from handlers.rest.postinst import Postinst
+from handlers.rest.profile import ProfileHandler
+from customtask.statuswriter import DEFAULT_FLUSH_INTERVAL, TaskStatusWriter
+from playbookscheduler import DEFAULT_MAX_RUNNING, DEFAULT_MAX_QUEUED
+from powerdispatcher import DEFAULT_MAX_PER_HOST, DEFAULT_MAX_PER_POOL
+from profiler import DEFAULT_DURATION as DEFAULT_PROFILE_DURATION, DEFAULT_INTERVAL as DEFAULT_PROFILE_INTERVAL, Profiler
+from taskwatcher import TaskWatcher
+from warmpool import DEFAULT_MAX_BUILDING
+from xenadapter.vminstall import InstallTracker
+from tornadoql.document_cache import DOCUMENT_CACHE
 from xentools.xenadapter import XenAdapter
 import tornado.web
 import tornado.httpserver
@@ -55,8 +66,16 @@ def event_loop(executor, authenticator=None, ioloop=None):
     ioloop.run_in_executor(executor, loop_object.process_xen_events)
     constants.load_playbooks.set()
     ioloop.run_in_executor(executor, loop_object.load_playbooks)
+    if opts.ansible_watch:
+        ioloop.run_in_executor(executor, loop_object.do_watch_playbooks)
 
     ioloop.run_in_executor(executor, loop_object.do_pending_tasks)
+    TaskWatcher().start(ioloop.asyncio_loop)
+    InstallTracker().start(ioloop.asyncio_loop)
+    ioloop.run_in_executor(executor, loop_object.resume_installs)
+    ioloop.run_in_executor(executor, loop_object.do_task_compaction)
+    if opts.warm_pools_file:
+        ioloop.run_in_executor(executor, loop_object.fill_warm_pools)
 
     def usr2_signal_handler(num, stackframe):
         '''
@@ -79,8 +98,22 @@ def event_loop(executor, authenticator=None, ioloop=None):
         '''
         constants.load_playbooks.set()
 
+    def quit_signal_handler(num, stackframe):
+        '''
+        Send QUIT signal to profile all threads for profile_duration seconds,
+        collapsed stacks and a thread dump are written to profile_dir
+        :param num:
+        :param stackframe:
+        :return:
+        '''
+        try:
+            Profiler().start()
+        except ValueError as e: # Invalid profile_duration
+            logger.error(f"Unable to start profiling: {e}")
+
     signal.signal(signal.SIGUSR2, usr2_signal_handler)
     signal.signal(signal.SIGUSR1, usr1_signal_handler)
+    signal.signal(signal.SIGQUIT, quit_signal_handler)
 
 
     return ioloop
@@ -128,6 +161,8 @@ def make_app(executor, auth_class=None, debug=False):
         (r'/console.*', ConsoleHandler, dict(pool_executor=executor)),
         (r'/pblog.*', PlaybookLogHandler, dict(pool_executor=executor)),
         (r'/list_pools', PoolListPublic, dict(pool_executor=executor)),
+        (r'/metrics', MetricsHandler),
+        (r'/profile', ProfileHandler),
         (r'/adminauth', AdminAuth, dict(pool_executor=executor, authenticator=auth_class)),
         (r'/graphql', gql_handler.GraphQLHandler, dict(pool_executor=executor, graphiql=False, schema=schema)),
         (r'/graphiql', gql_handler.GraphQLHandler, dict(pool_executor=executor, graphiql=True, schema=schema)),
@@ -135,6 +170,7 @@ def make_app(executor, auth_class=None, debug=False):
     ], **settings)
 
     app.auth_class = auth_class
+    metrics.watch_runtime(executor)
 
     from auth.sqlalchemyauthenticator import SqlAlchemyAuthenticator, User, Group
     if opts.debug and app.auth_class.__name__ == SqlAlchemyAuthenticator.__name__:
@@ -175,9 +211,30 @@ def read_settings():
     define('ansible_dir', group='ansible', default='../ansible')
     define('ansible_logs', group='ansible', default='/var/log/vmemperor/ansible')
     define('ansible_networks', group='ansible', default='', multiple=True)
+    define('ansible_max_running', group='ansible', type=int, default=DEFAULT_MAX_RUNNING) # Playbooks running at once
+    define('ansible_max_queued', group='ansible', type=int, default=DEFAULT_MAX_QUEUED) # Playbooks waiting to run, further launches fail
+    define('ansible_watch', group='ansible', type=bool, default=False) # Reload playbooks when ansible_dir changes (inotify), in addition to USR1 signal
     define('graphql_error_log_file', group='graphql', default='graphql_errors.log')
+    define('graphql_document_cache_size', group='graphql', type=int, default=1024)
+    define('graphql_trace_sample_rate', group='graphql', type=float, default=0.0) # Fraction of GraphQL requests traced per resolver, traces of slow ones are logged
+    define('graphql_slow_query_threshold', group='graphql', type=float, default=1.0) # seconds, slower GraphQL requests are logged, 0 - don't log
+    define('console_compression', group='console', type=bool, default=False) # permessage-deflate for VNC console WebSockets
+    define('console_shared', group='console', type=bool, default=True) # Share one upstream VNC connection among all viewers of a VM console
     define('sentry_dsn', group='vmemperor', default='')
+    define('power_max_per_host', group='power', type=int, default=DEFAULT_MAX_PER_HOST) # VM power operations running on a host at once
+    define('power_max_per_pool', group='power', type=int, default=DEFAULT_MAX_PER_POOL) # VM power operations running in pool at once
+    define('task_retention_days', group='tasks', type=int, default=30) # 0 - keep forever
+    define('task_retention_per_object', group='tasks', type=int, default=100) # 0 - unlimited
+    define('task_archive', group='tasks', default='table') # table, file or none
+    define('task_archive_file', group='tasks', default='/var/log/vmemperor/tasks.jsonl.gz')
+    define('task_compaction_interval', group='tasks', type=int, default=3600) # seconds
+    define('task_progress_interval', group='tasks', type=float, default=DEFAULT_FLUSH_INTERVAL) # seconds, progress updates of a task within it are written once
+    define('warm_pools_file', group='warmpool', default='') # JSON file with warm pool declarations (see warmpool.load_specs), empty - disabled
+    define('warm_pool_max_building', group='warmpool', type=int, default=DEFAULT_MAX_BUILDING) # Warm VMs being cloned and provisioned at once
     define('log_dir', group='vmemperor', default='/var/log/vmemperor')
+    define('profile_dir', group='profile', default='/var/log/vmemperor/profiles') # Collapsed stacks and thread dumps of QUIT signal and /profile
+    define('profile_duration', group='profile', type=float, default=DEFAULT_PROFILE_DURATION) # seconds
+    define('profile_interval', group='profile', type=float, default=DEFAULT_PROFILE_INTERVAL) # seconds between stack samples
 
     from os import path
 
@@ -192,6 +249,7 @@ def read_settings():
     rotateLogs()
     sentry_sdk.init(opts.sentry_dsn)
     constants.ansible_pubkey = path.expanduser(opts.ansible_pubkey)
+    DOCUMENT_CACHE.max_size = opts.graphql_document_cache_size
     ReDBConnection().set_options(opts.host, opts.port)
     if not os.access(constants.ansible_pubkey, os.R_OK):
         logger.warning(
@@ -200,6 +258,7 @@ def read_settings():
     def on_exit():
         constants.xen_events_run.set()
         constants.need_exit.set()
+        TaskStatusWriter().flush()
 
     atexit.register(on_exit)
     # do log rotation
@@ -0,0 +1,213 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import XenAPI
+from sentry_sdk import capture_exception
+
+from connman import ReDBConnection
+from exc import XenAdapterAPIError
+from loggable import Loggable
+from singleton import Singleton
+from xenadapter.vm import VM
+from xentools.xenadapterpool import XenAdapterPool
+
+DEFAULT_MAX_BUILDING = 2
+
+# Disk layout: (SR UUID, size in bytes) for each disk in order of CreateVM disks argument
+DiskLayout = Tuple[Tuple[str, int], ...]
+
+
+class WarmPoolSpec(NamedTuple):
+    name: str
+    template: str # Template UUID
+    size: int # Number of VMs kept ready
+    disks: DiskLayout
+
+
+def disk_layout(disks : Sequence[Tuple[str, int]]) -> DiskLayout:
+    return tuple((sr, int(size)) for sr, size in disks)
+
+
+def load_specs(file_name : str) -> List[WarmPoolSpec]:
+    '''
+    Read warm pool declarations from a JSON file, i.e.
+    [{"name": "ubuntu", "template": "<template UUID>", "size": 3, "disks": [{"SR": "<SR UUID>", "size": 10737418240}]}]
+    '''
+    with open(file_name) as file:
+        items = json.load(file)
+
+    specs = [WarmPoolSpec(name=item['name'], template=item['template'], size=int(item['size']),
+                          disks=disk_layout((disk['SR'], disk['size']) for disk in item.get('disks', [])))
+             for item in items]
+    names = [spec.name for spec in specs]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate warm pool names in {file_name}: {', '.join(sorted(duplicates))}")
+    return specs
+
+
+class WarmPool(Loggable, metaclass=Singleton):
+    '''
+    Keeps pre-cloned, provisioned and halted VMs for templates declared in warm_pools_file, so that createvm
+    claims one of them instead of cloning a template and provisioning disks.
+    Warm VMs and their disks are marked with VM.WARM_POOL_KEY and VDI.WARM_POOL_KEY and are not stored in the DB
+    (see VM.filter_record and VDI.filter_record), so they're invisible to users until claimed. Pools are refilled in background with at most max_building VMs being built at once
+    '''
+    def __repr__(self):
+        return "WarmPool"
+
+    def __init__(self, specs : Optional[Sequence[WarmPoolSpec]] = None, max_building=None):
+        from tornado.options import options as opts
+        if specs is None:
+            specs = load_specs(opts.warm_pools_file) if opts.warm_pools_file else []
+        self.specs : Dict[str, WarmPoolSpec] = {spec.name: spec for spec in specs}
+        self.max_building = max_building or opts.warm_pool_max_building
+        self._lock = threading.Lock()
+        self._ready : Dict[str, List[str]] = {name: [] for name in self.specs}
+        self._building : Dict[str, int] = dict.fromkeys(self.specs, 0)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_building, thread_name_prefix='warm-pool')
+        self.init_log()
+
+    @property
+    def ready(self) -> int:
+        return sum(len(refs) for refs in self._ready.values())
+
+    @property
+    def building(self) -> int:
+        return sum(self._building.values())
+
+    def match(self, template_uuid : str, disks : Sequence[Tuple[str, int]]) -> Optional[WarmPoolSpec]:
+        disks = disk_layout(disks)
+        for spec in self.specs.values():
+            if spec.template == template_uuid and spec.disks == disks:
+                return spec
+        return None
+
+    def claim(self, template_uuid : str, disks : Sequence[Tuple[str, int]]) -> Optional[str]:
+        '''
+        Take a ready VM built from a template with a disk layout. Triggers refilling
+        :return: VM ref, None if there's no such pool or it's empty
+        '''
+        spec = self.match(template_uuid, disks)
+        if not spec:
+            return None
+        with self._lock:
+            ready = self._ready[spec.name]
+            ref = ready.pop(0) if ready else None
+        self.refill()
+        return ref
+
+    def claim_vm(self, xen, template_uuid : str, disks : Sequence[Tuple[str, int]]) -> Optional[VM]:
+        '''
+        Claim a VM (see claim) and remove its warm pool marks so that it is stored in DB.
+        VMs that have been removed from XenServer behind our back are skipped
+        '''
+        while True:
+            ref = self.claim(template_uuid, disks)
+            if not ref:
+                return None
+            try:
+                vm = VM(xen, ref)
+                vm.leave_warm_pool()
+            except (XenAdapterAPIError, XenAPI.Failure) as e:
+                self.log.warning(f"Unable to claim warm VM {ref}: {e}")
+                continue
+            self.log.info(f"Claimed warm VM {ref}")
+            return vm
+
+    def refill(self):
+        '''
+        Start building VMs for pools that are not full
+        '''
+        builds = []
+        with self._lock:
+            for name, spec in self.specs.items():
+                missing = spec.size - len(self._ready[name]) - self._building[name]
+                for _ in range(missing):
+                    self._building[name] += 1
+                    builds.append(spec)
+        for spec in builds:
+            self._executor.submit(self._build, spec)
+
+    def start(self):
+        '''
+        Called on startup: pick up warm VMs left by previous runs, remove unfinished and excess ones, then fill pools
+        '''
+        xen = XenAdapterPool().get()
+        try:
+            self.scan(xen)
+        finally:
+            XenAdapterPool().unget(xen)
+        self.refill()
+        self.log.info(f"Warm pools: {', '.join(f'{name}: {len(refs)} ready' for name, refs in self._ready.items())}")
+
+    def scan(self, xen):
+        records = xen.api.VM.get_all_records_where('field "is_a_template" = "false"')
+        stale = []
+        with self._lock:
+            for ref, record in records.items():
+                other_config = record['other_config']
+                name = other_config.get(VM.WARM_POOL_KEY)
+                if name is None:
+                    continue
+                if name in self.specs and other_config.get(VM.WARM_POOL_READY_KEY) and record['power_state'] == 'Halted' \
+                        and len(self._ready[name]) < self.specs[name].size:
+                    self._ready[name].append(ref)
+                else:
+                    stale.append(ref)
+
+        for ref in stale:
+            try:
+                self.destroy(xen, ref)
+            except XenAPI.Failure as f:
+                self.log.warning(f"Unable to remove stale warm VM {ref}: {f.details}")
+
+    def destroy(self, xen, ref : str):
+        for vdi in VM.disk_vdis(xen, ref):
+            xen.api.VDI.destroy(vdi)
+        xen.api.VM.destroy(ref)
+        self.log.debug(f"Removed warm VM {ref}")
+
+    def build(self, xen, spec : WarmPoolSpec) -> str:
+        '''
+        Clone template and provision disks, VM is marked as ready when it's done
+        :return: VM ref
+        '''
+        from handlers.graphql.types.vm import SetDisksEntry
+        from xenadapter.sr import SR
+        from xenadapter.template import Template
+        from xenadapter.vdi import VDI
+
+        template = Template(xen, xen.api.VM.get_by_uuid(spec.template))
+        vm = template.clone_as_vm(f"Warm VM ({spec.name})")
+        try:
+            xen.api.VM.add_to_other_config(vm.ref, VM.WARM_POOL_KEY, spec.name)
+            vm.provision_disks([SetDisksEntry(SR=SR(xen, xen.api.SR.get_by_uuid(sr)), size=size)
+                                for sr, size in spec.disks])
+            for vdi in VM.disk_vdis(xen, vm.ref):
+                xen.api.VDI.add_to_other_config(vdi, VDI.WARM_POOL_KEY, spec.name)
+            xen.api.VM.add_to_other_config(vm.ref, VM.WARM_POOL_READY_KEY, 'true')
+        except Exception:
+            self.destroy(xen, vm.ref)
+            raise
+        return vm.ref
+
+    def _build(self, spec : WarmPoolSpec):
+        xen = XenAdapterPool().get()
+        try:
+            with ReDBConnection().get_connection():
+                ref = self.build(xen, spec)
+        except Exception as e:
+            self.log.error(f"Unable to build a VM for warm pool {spec.name}: {e}")
+            capture_exception(e)
+            with self._lock:
+                self._building[spec.name] -= 1
+        else:
+            self.log.debug(f"Warm VM {ref} is ready (pool {spec.name})")
+            with self._lock:
+                self._building[spec.name] -= 1
+                self._ready[spec.name].append(ref)
+        finally:
+            XenAdapterPool().unget(xen)
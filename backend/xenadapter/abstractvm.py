@@ -18,6 +18,7 @@ def keydiff(old_val, new_val):
 
 class AbstractVM(QuotaObject):
     api_class = 'VM'
+    SORT_FIELDS = (*QuotaObject.SORT_FIELDS, 'power_state')
 
     @classmethod
     def process_record(cls, xen, ref, record):
@@ -72,6 +73,17 @@ class AbstractVM(QuotaObject):
                 return False
         return super().check_access(auth, action)
 
+    @classmethod
+    def check_access_many(cls, auth : BasicAuthenticator, refs, action : SerFlag = None):
+        granted = super().check_access_many(auth, refs, action)
+        if not action or not refs:
+            return granted
+
+        blocked_operations = {item['ref']: item['_blocked_operations_']
+                              for item in re.db.table(cls.db_table_name).get_all(*refs).pluck('ref', '_blocked_operations_').run()}
+        return [access and ref in blocked_operations and action.name not in blocked_operations[ref]
+                for ref, access in zip(refs, granted)]
+
     def set_platform(self, platform : dict, return_diff=True):
         if return_diff:
             old_val = {
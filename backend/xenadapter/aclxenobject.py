@@ -53,6 +53,7 @@ class ACLXenObject(XenObject):
     '''
     Abstract class for objects that store ACL information in their other_config
     '''
+    ALLOW_EMPTY_OTHERCONFIG = True  # Objects without access information are visible to everyone
 
 
     @classmethod
@@ -115,20 +116,48 @@ class ACLXenObject(XenObject):
                 return False
 
 
+        if self._check_access_info(access_info, auth, action):
+            self.log.info(f"Access granted to {self} for {auth.get_id()}")
+            return True
+
+        self.log.info(f"Access prohibited to {self} for {auth.get_id()}")
+        return False
+
+    @classmethod
+    def _check_access_info(cls, access_info : Dict[str, List[str]], auth : BasicAuthenticator, action : SerFlag):
         username = f'users/{auth.get_id()}'
         groupnames = [f'groups/{group}' for group in auth.get_user_groups()]
         for userid in (username, *groupnames, 'any'):
             for item in access_info.get(userid, []):
                 if not item:
                     continue
-                available_actions = self.Actions.deserialize(item)
-                if action & available_actions or action == self.Actions.NONE:
-                    self.log.info(f"Access granted to {self} for {auth.get_id()}")
+                available_actions = cls.Actions.deserialize(item)
+                if action & available_actions or action == cls.Actions.NONE:
                     return True
 
-        self.log.info(f"Access prohibited to {self} for {auth.get_id()}")
         return False
 
+    @classmethod
+    def check_access_many(cls, auth : BasicAuthenticator, refs : List[str], action : Optional[SerFlag] = None):
+        '''
+        Batch version of check_access: reads access information of all refs with a single get_all
+        :return list of booleans in order of refs
+        '''
+        if not action:
+            action = cls.Actions.NONE
+        if auth.is_admin() or not refs:
+            return [True] * len(refs)
+
+        access_infos = {item['ref']: item.get('access')
+                        for item in re.db.table(cls.db_table_name).get_all(*refs).pluck('ref', 'access').run()}
+
+        def check(access_info):
+            if not access_info:
+                return cls.ALLOW_EMPTY_OTHERCONFIG
+            return cls._check_access_info(access_info, auth, action)
+
+        return [check(access_infos.get(ref)) for ref in refs]
+
     @classmethod
     def compare_settings(cls, subfield, new_rec, return_diff = False):
         '''
@@ -177,6 +206,25 @@ class ACLXenObject(XenObject):
 
         # if we're here, None means we don't need to update access data
 
+    @classmethod
+    def other_config_with_actions(cls, other_config : Dict[str, str], action : SerFlag, user : str) -> Dict[str, str]:
+        '''
+        Same as manage_actions, but applied to a copy of other_config that is returned instead of being written,
+        so that it could be written together with other changes
+        '''
+        if not isinstance(action, cls.Actions):
+            raise TypeError(f"Unsupported type for 'action': {type(action)}. Expected: {cls.Actions}")
+        try:
+            emperor = json.loads(other_config['vmemperor'])
+        except (JSONDecodeError, KeyError):
+            emperor = {}
+
+        settings = emperor.setdefault('access', {}).setdefault(auth.name, {})
+        user_actions: SerFlag = deserialize_auth_dict(cls, settings).get(user, cls.Actions.NONE) | action
+        if user_actions:
+            settings[user] = user_actions.serialize()
+        return {**other_config, 'vmemperor': json.dumps(emperor)}
+
     @make_change_to_settings('access')
     def manage_actions(self, action : SerFlag, revoke=False, clear=False, user : str = None):
         '''
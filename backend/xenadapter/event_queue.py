@@ -1,10 +1,12 @@
 from sentry_sdk import capture_exception
 import queue
+import time
 from collections import OrderedDict
-from threading import Thread
+from threading import Thread, local
 
 from connman import ReDBConnection
 from loggable import Loggable
+from metrics import EVENT_LAG_SECONDS, EVENT_PROCESSING_SECONDS, EVENT_QUEUE_DEPTH
 
 from tornado.options import options as opts
 
@@ -25,6 +27,8 @@ class EventQueue(queue.Queue, Loggable):
         super().init_log()
         self.log.debug(f"Processing Xen events using {num_workers} workers")
         self.log.debug(f"Event dispatcher configuration: {EVENT_DISPATCHER}")
+        self._received = local() # Time when the event taken by this worker was put into queue
+        EVENT_QUEUE_DEPTH.set_function(self.qsize)
         for i in range(num_workers):
             t = Thread(target=self.process_events)
             t.daemon = True
@@ -34,6 +38,13 @@ class EventQueue(queue.Queue, Loggable):
     def __repr__(self):
         return 'EventQueue'
 
+    def _put(self, item):
+        super()._put((time.monotonic(), item))
+
+    def _get(self):
+        self._received.time, item = super()._get()
+        return item
+
     def process_events(self):
         with ReDBConnection().get_connection():
             xen = XenAdapterPool().get()
@@ -56,6 +67,7 @@ class EventQueue(queue.Queue, Loggable):
                 if log_this:
                     self.log.debug(f"Event: {json.dumps(print_event(event), cls=DateTimeEncoder)}")
 
+                started = time.monotonic()
                 for ev_class in EVENT_DISPATCHER[event['class']]:
                     try:
                         ev_class.process_event(xen, event)
@@ -63,4 +75,7 @@ class EventQueue(queue.Queue, Loggable):
                         capture_exception(e)
                         self.log.error(f"Failed to process event by {ev_class.__name__}: {e}")
 
+                finished = time.monotonic()
+                EVENT_PROCESSING_SECONDS.labels(event['class']).observe(finished - started)
+                EVENT_LAG_SECONDS.labels(event['class']).observe(finished - self._received.time)
                 self.task_done()
@@ -4,6 +4,7 @@ import  constants.re as re
 
 class QuotaObject(ACLXenObject):
     MAIN_OWNER_KEY = 'vmemperor-main-owner'
+    SORT_FIELDS = (*ACLXenObject.SORT_FIELDS, 'main_owner')
 
     @classmethod
     def process_record(cls, xen, ref, record):
@@ -27,14 +28,22 @@ class QuotaObject(ACLXenObject):
 
 
         other_config = self.get_other_config()
-        if owner:
-            other_config[self.MAIN_OWNER_KEY] = owner
-        elif self.MAIN_OWNER_KEY in other_config:
-            del other_config[self.MAIN_OWNER_KEY]
-        else:
+        if not owner and self.MAIN_OWNER_KEY not in other_config:
             return
 
-        self.set_other_config(other_config)
+        self.set_other_config(self.other_config_with_main_owner(other_config, owner))
+
+    @classmethod
+    def other_config_with_main_owner(cls, other_config, owner):
+        '''
+        :return: a copy of other_config with main owner set to owner (or removed if owner is None)
+        '''
+        other_config = dict(other_config)
+        if owner:
+            other_config[cls.MAIN_OWNER_KEY] = owner
+        else:
+            other_config.pop(cls.MAIN_OWNER_KEY, None)
+        return other_config
 
     @classmethod
     def get_main_owner_from_other_config(cls, other_config):
@@ -1,4 +1,6 @@
+import constants.re as re
 from handlers.graphql.types.sr import SRActions, GSR
+from rethinkdb_tools.helper import CHECK_ER
 from xenadapter.aclxenobject import ACLXenObject
 
 
@@ -18,5 +20,39 @@ class SR(ACLXenObject):
         record['space_available'] = int(record['physical_size']) - int(record['physical_utilisation'])
         return super().process_record(xen, ref, record)
 
+    @classmethod
+    def process_event(cls, xen, event):
+        '''
+        Also propagates content_type and is_tools_sr to this SR's VDIs (see VDI.process_record)
+        '''
+        super().process_event(xen, event)
+        if event['class'] not in cls.EVENT_CLASSES or event['operation'] not in ('mod', 'add'):
+            return
+
+        record = re.db.table(cls.db_table_name).get(event['ref']).pluck('content_type', 'is_tools_sr').default(None).run()
+        if not record:
+            return
+
+        from xenadapter.vdi import VDI
+        CHECK_ER(re.db.table(VDI.db_table_name).get_all(event['ref'], index='SR')
+                 .filter(lambda vdi: (vdi['content_type'] != record['content_type']).or_(vdi['is_tools_sr'] != record['is_tools_sr']))
+                 .update(record).run())
 
 
+
+
+    @classmethod
+    def get_content_types(cls, refs, xen):
+        '''
+        Content types of SRs refs, read with a single query (SRs not in DB yet are asked from XenAPI)
+        :return: key: SR ref, value: content type
+        '''
+        refs = list(refs)
+        if not refs:
+            return {}
+        content_types = {item['ref']: item['content_type'] for item in
+                         re.db.table(cls.db_table_name).get_all(*refs).pluck('ref', 'content_type').run()}
+        for ref in refs:
+            if ref not in content_types:
+                content_types[ref] = xen.api.SR.get_content_type(ref)
+        return content_types
@@ -15,21 +15,38 @@ from xenadapter.aclxenobject import ACLXenObject
 from xenadapter.xenobject import XenObject
 
 
-def get_userids(object_type: Type, object_ref: Optional[Union[str, List[str]]], action: str):
-    if issubclass(object_type, ACLXenObject) and object_ref:
-        userids = re.db.table(object_type.db_table_name + '_user')
-        if isinstance(object_ref, str):
-            userids = userids.get_all(object_ref, index='ref')
-        else:
-            userids = userids.get_all(*object_ref, index='ref')
-        userids = userids\
-            .filter(lambda value: value['actions'].set_intersection(['ALL', action]) != [])\
-            .pluck('userid')['userid']\
-            .coerce_to('array').run()
+def get_user_actions(object_type: Type, object_ref: Optional[Union[str, List[str]]]) -> Dict[str, List[str]]:
+    '''
+    Read ACL of objects in a single query
+    :return: key: user ID, value: actions this user is allowed to perform (for multiple refs actions are merged)
+    '''
+    if not (issubclass(object_type, ACLXenObject) and object_ref):
+        return {}
+    rows = re.db.table(object_type.db_table_name + '_user')
+    if isinstance(object_ref, str):
+        rows = rows.get_all(object_ref, index='ref')
     else:
-        userids = []
+        rows = rows.get_all(*object_ref, index='ref')
+    rows = rows.pluck('userid', 'actions').coerce_to('array').run()
+
+    user_actions = {}
+    for row in rows:
+        actions = user_actions.setdefault(row['userid'], [])
+        actions.extend(action for action in row['actions'] if action not in actions)
+    return user_actions
+
+
+def userids_with_action(user_actions: Mapping[str, List[str]], action: str) -> List[str]:
+    '''
+    :param user_actions: result of get_user_actions
+    :return: users allowed to perform action
+    '''
+    return [userid for userid, actions in user_actions.items() if 'ALL' in actions or action in actions]
+
+
+def get_userids(object_type: Type, object_ref: Optional[Union[str, List[str]]], action: str):
+    return userids_with_action(get_user_actions(object_type, object_ref), action)
 
-    return userids
 
 class Task(ACLXenObject):
     api_class = 'task'
@@ -38,10 +55,13 @@ class Task(ACLXenObject):
     GraphQLType = GTask
     Actions = TaskActions
     pending_db_table_name = 'pending_tasks'
+    archive_db_table_name = 'tasks_archive' # Finished tasks moved by TaskCompactor, see taskcompactor.py
     global_pending_lock = threading.Lock()
     pending_values_under_lock = set()
     CancelHandlers : Dict[str, Callable[[], None]] = {}
 
+    SORT_FIELDS = (*ACLXenObject.SORT_FIELDS, 'created')
+
     minor_tasks = ('host.compute_memory_overhead', 'host.compute_free_memory', 'SR.scan', 'VM.update_allowed_operations')
 
     @classmethod
@@ -109,12 +129,20 @@ class Task(ACLXenObject):
         >>> "action": "task action - corresponds to one of access actions",
         >>> "vmemperor": "True if this task was created by vmemperor"
         >>> }
+        and a table tasks_archive for finished tasks archived by TaskCompactor
         :param indexes:
         :return:
         '''
+        my_indexes = ['created', 'object_ref', 'status']
+        my_indexes.extend(indexes or ())
+        super().create_db(indexes=my_indexes) # tasks table survives restarts, but new indexes should still be created
+
         table_list = re.db.table_list().run()
-        if cls.db_table_name not in table_list:
-            super().create_db(indexes=indexes)
+        if cls.archive_db_table_name not in table_list:
+            re.db.table_create(cls.archive_db_table_name, durability='soft', primary_key='ref').run()
+            re.db.table(cls.archive_db_table_name).wait().run()
+            re.db.table(cls.archive_db_table_name).index_create('created').run()
+            re.db.table(cls.archive_db_table_name).index_wait('created').run()
 
         if cls.pending_db_table_name not in table_list:
             re.db.table_create(cls.pending_db_table_name, durability="soft").run()
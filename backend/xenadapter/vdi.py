@@ -7,6 +7,7 @@ import constants
 from authentication import with_default_authentication
 from connman import ReDBConnection
 from handlers.graphql.types.vdi import VDIActions, GVDI
+from handlers.graphql.utils.paging import ListQuery
 from handlers.graphql.utils.querybuilder.querybuilder import QueryBuilder
 from xenadapter.quotaobject import QuotaObject
 from xenadapter.sr import SR
@@ -127,6 +128,7 @@ class VDI(QuotaObject, Attachable):
     EVENT_CLASSES = ['vdi']
     GraphQLType = GVDI
     Actions = VDIActions
+    WARM_POOL_KEY = 'vmemperor-warm-pool' # Name of warm pool of the disk's VM, see warmpool.WarmPool
 
 
     @classmethod
@@ -186,16 +188,35 @@ class VDI(QuotaObject, Attachable):
         except XenAPI.Failure as f:
             raise XenAdapterAPIError(xen.log, "Failed to create VDI:", f.details)
 
+    @classmethod
+    def create_db(cls, indexes=()):
+        '''
+        Besides default indexes, creates an index install_iso ([content_type, is_tools_sr]) for resolve_isos_for_install
+        '''
+        my_indexes = ['SR', 'content_type']
+        my_indexes.extend(indexes)
+        super().create_db(indexes=my_indexes)
+
+        if 'install_iso' not in re.db.table(cls.db_table_name).index_list().run():
+            re.db.table(cls.db_table_name).index_create('install_iso', [re.r.row['content_type'], re.r.row['is_tools_sr']]).run()
+            re.db.table(cls.db_table_name).index_wait('install_iso').run()
+
     @classmethod
     def process_record(cls, xen, ref, record):
+        '''
+        Denormalizes SR's content_type and is_tools_sr into VDI record. They're kept up to date by SR.process_event
+        '''
         new_record = super().process_record(xen, ref, record)
-        new_record['content_type'] = Attachable.SR_type(xen, record)
+        sr = SR(xen, record['SR'])
+        new_record['content_type'] = sr.get_content_type()
+        new_record['is_tools_sr'] = sr.get_is_tools_sr()
         return new_record
 
 
     @classmethod
     def filter_record(cls, xen, record, ref):
-        return not record['is_a_snapshot'] and record['type'] in ('system', 'user', 'ephemeral')
+        return not record['is_a_snapshot'] and record['type'] in ('system', 'user', 'ephemeral') \
+               and cls.WARM_POOL_KEY not in record['other_config']
 
     @staticmethod
     def resolve_all():
@@ -214,15 +235,15 @@ class VDI(QuotaObject, Attachable):
 
             :param root:
             :param info:
-            :param kwargs: Optional keyword arguments for pagination: "page" and "page_size"
+            :param kwargs: Optional keyword arguments for pagination, sorting and filtering, see paging.list_arguments
 
             :return:
             '''
-            additional_string = ""
+            list_query = ListQuery.from_arguments(VDI, kwargs)
             if 'only_isos' in kwargs and kwargs['only_isos'] is not None:
                 operator = "==" if kwargs['only_isos'] else '!='
-                additional_string = f".filter(lambda item: item['content_type'] {operator} 'iso')"
-            builder = QueryBuilder(id=None, info=info,additional_string=additional_string, user_authenticator=info.context.user_authenticator)
+                list_query.filters.append(f"lambda item: item['content_type'] {operator} 'iso'")
+            builder = QueryBuilder(id=None, info=info, list_query=list_query, user_authenticator=info.context.user_authenticator)
             return builder.run_query()
 
 
@@ -8,3 +8,9 @@ class VIF(XenObject):
     db_table_name = 'vifs'
     GraphQLType = GVIF
 
+    @classmethod
+    def create_db(cls, indexes=()):
+        '''
+        Index VM is used by playbook inventories (see playbookinventory.py)
+        '''
+        super().create_db(indexes=['VM', *indexes])
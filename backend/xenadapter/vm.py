@@ -1,6 +1,6 @@
-from typing import Sequence, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Sequence, Mapping
 import crypt
-from rethinkdb.errors import ReqlTimeoutError, ReqlDriverError
 from sentry_sdk import capture_exception
 import constants.re as re
 
@@ -13,18 +13,44 @@ from xenadapter.abstractvm import AbstractVM, set_VCPUs, set_memory
 from xenadapter.helpers import use_logger
 import XenAPI
 import provision
-from xenadapter.xenobject import set_subtype_from_input
+from xenadapter.xenobject import set_subtype_from_input, get_real_value
 from xenadapter.xenobjectdict import XenObjectDict
+from xenadapter import vminstall
 
+from utils.user import get_user_object
 from xentools.os import OSChooser
+from xentools.xenadapterpool import XenAdapterPool
 from exc import *
 
 
+# Sets up disks of new VMs concurrently, see VM.setup_provisioned_disks
+_DISK_SETUP = ThreadPoolExecutor(max_workers=8, thread_name_prefix='disk-setup')
+
+
+def _call_vdi(call):
+    '''
+    Call XenAPI with a XenAdapter of its own, as XenAPI session can't be shared between threads
+    '''
+    xen = XenAdapterPool().get()
+    try:
+        return call(xen)
+    except XenAPI.Failure as f:
+        raise XenAdapterAPIError(xen.log, "Failed to set up a disk", f.details)
+    finally:
+        XenAdapterPool().unget(xen)
+
+
+def _read_vdi_record(ref):
+    return _call_vdi(lambda xen: xen.api.VDI.get_record(ref))
+
+
 class VM (AbstractVM):
     EVENT_CLASSES = ['vm', 'vm_metrics', 'vm_guest_metrics']
     db_table_name = 'vms'
     GraphQLType = GVM
     Actions = VMActions
+    WARM_POOL_KEY = 'vmemperor-warm-pool' # Name of warm pool the VM belongs to, see warmpool.WarmPool
+    WARM_POOL_READY_KEY = 'vmemperor-warm-pool-ready' # Set when warm VM's disks are provisioned
     def __init__(self, xen, ref):
         super().__init__(xen, ref)
 
@@ -78,13 +104,26 @@ class VM (AbstractVM):
 
     @classmethod
     def filter_record(cls, xen, record, ref):
-        return not (record['is_a_template'] or record['is_control_domain'] or record['is_a_snapshot'])
+        return not (record['is_a_template'] or record['is_control_domain'] or record['is_a_snapshot']
+                    or cls.WARM_POOL_KEY in record['other_config'])
 
 
     @classmethod
     def create_db(cls, indexes=None): #ignore indexes
         super(VM, cls).create_db(indexes=['metrics', 'guest_metrics'])
 
+    @classmethod
+    def process_record(cls, xen, ref, record):
+        '''
+        Also saves other_config's first_user (set when OS is installed) as _first_user_ for playbook inventories
+        and resident_on as _resident_on_ for power operation limits (see powerdispatcher)
+        '''
+        new_rec = super().process_record(xen, ref, record)
+        new_rec['_first_user_'] = record.get('other_config', {}).get('first_user')
+        resident_on = record.get('resident_on')
+        new_rec['_resident_on_'] = resident_on if resident_on and resident_on != 'OpaqueRef:NULL' else None
+        return new_rec
+
 
     @classmethod
     def process_metrics_record(cls, xen, record):
@@ -131,15 +170,16 @@ class VM (AbstractVM):
 
 
     @use_logger
-    def create(self,  task : "CustomTask", provision_config : Sequence[SetDisksEntry], net, options : Mapping, template : "Template",  override_pv_args=None, iso=None, install_params=None):
+    def create(self,  task : "CustomTask", provision_config : Sequence[SetDisksEntry], net, options : Mapping, template : "Template",  override_pv_args=None, iso=None, install_params=None, provisioned=False):
         '''
-        Creates a virtual machine and installs an OS
+        Creates a virtual machine and starts OS installation. Steps are persisted in task record,
+        the task is finished by InstallTracker when VM halts after installation
         :param task: a task which logs VM creation process
         :param provision_config: For help see self.set_disks
         :param net: Network object
         :param iso: ISO Image object. If specified, will be mounted
         :param options: VMInput-like object with platform options, memory settings & VCPU settings
-
+        :param provisioned: disks are already provisioned (VM is claimed from a warm pool), they're only set up for the user
         '''
 
         self.user = options.get('main_owner')
@@ -157,13 +197,17 @@ class VM (AbstractVM):
         if 'name_description' in options:
             self.set_name_description(options['name_description'])
 
-        self.set_disks(provision_config)
+        task.set_install_state(vminstall.PROVISION, vm=self.ref)
+        if provisioned:
+            self.setup_provisioned_disks()
+        else:
+            self.set_disks(provision_config)
         if iso:
             try:
                 iso.attach(self, sync=True)
             except XenAdapterAPIError as e:
                 capture_exception(e)
-                task.set_status(progress=0.2, state='failure', error_info_add=f"Failed to attach {iso}: {e.message}")
+                task.set_status(progress=0.2, status='failure', error_info_add=f"Failed to attach {iso}: {e.message}")
                 return
             else:
                 task.set_status(progress=0.2)
@@ -175,7 +219,8 @@ class VM (AbstractVM):
                 net.attach(self, sync=True)
             except XenAdapterAPIError as e:
                 capture_exception(e)
-                task.set_status(progress=0.3, state='failure', error_info_add=f"Failed to attach {net}: {e.message}")
+                task.set_status(progress=0.3, status='failure', error_info_add=f"Failed to attach {net}: {e.message}")
+                return
             else:
                 task.set_status(progress=0.3)
 
@@ -193,6 +238,7 @@ class VM (AbstractVM):
                     self.log.debug("fVM mode will automatically be switched to HVM after reboot")
 
         task.set_status(progress=0.4)
+        task.set_install_state(vminstall.START)
 
         try:
             self.start(False, True)
@@ -204,40 +250,23 @@ class VM (AbstractVM):
 
 
 
-        # Wait for installation to finish
         # remove PV_args
         self.set_PV_args("")
 
-        from constants import need_exit
-
         state = self._get_power_state() # It's crucial to get that value not from cache but from VM itself.
         if state != 'Running':
             task.set_status('failure', error_info_add="Failed to start VM ")
             return
 
-        cur = re.db.table(VM.db_table_name).get(self.ref).changes().run()
-        self.log.debug(f"Waiting for {self} to finish installing")
         if set_hvm_after_install:
             self.set_domain_type("hvm", False)
-        while True:
-            try:
-                change = cur.next(wait=1)
-            except ReqlTimeoutError:
-                if need_exit.is_set():
-                    return
-                else:
-                    continue
-            except ReqlDriverError as e:
-                self.log.error(
-                    f"ReQL error while trying to retrieve VM '{self.ref}': install status: {e}")
-                return
-
-            if change['new_val']['power_state'] == 'Halted':
-                try:
-                    task.set_status(status='success', progress=1)
-                finally:
-                    break
 
+        # Wait for installation to finish: InstallTracker finishes the task when VM halts
+        self.log.debug(f"Waiting for {self} to finish installing")
+        task.set_install_state(vminstall.INSTALLING)
+        # Running has just been read from XAPI: the VM record may still say Halted, and a short run may never be recorded as Running
+        start_time = get_real_value('start_time', self.xen.api.VM_metrics.get_start_time(self._get_metrics()), None)
+        vminstall.InstallTracker().track(task.id, self.ref, started=True, start_time=start_time)
         del self.install
 
 
@@ -250,47 +279,89 @@ class VM (AbstractVM):
         '''
         if not hasattr(self, 'install'):
             raise AttributeError('self.install')
-        from xenadapter.vbd import VBD
-        from xenadapter.vdi import VDI
-        i = 0
+        try:
+            self.provision_disks(provision_config)
+        except XenAdapterAPIError as e:
+            self.task.set_status(status='failure', error_info_add=e.message)
+            raise
+        self.setup_provisioned_disks()
+
+    def provision_disks(self, provision_config : Sequence[SetDisksEntry]):
+        '''
+        Creates disks with XenServer provision. Disks are neither labeled nor given to a user, see setup_provisioned_disks
+        '''
         specs = provision.ProvisionSpec()
-        for entry in provision_config:
-            size = str(int(entry.size))
-            specs.disks.append(provision.Disk(f'{i}', size, entry.SR.get_uuid(), True))
-            i += 1
+        for i, entry in enumerate(provision_config):
+            specs.disks.append(provision.Disk(f'{i}', str(int(entry.size)), entry.SR.get_uuid(), True))
         try:
             provision.setProvisionSpec(self.xen.session, self.ref, specs)
         except Exception as e:
             capture_exception(e)
-            self.task.set_status(status='failure', error_info_add=f'Failed to assign provision specification: {str(e)}')
-            return False
+            raise XenAdapterAPIError(self.log, f'Failed to assign provision specification: {str(e)}')
         else:
             self.log.debug(f"provision spec set {provision_config}")
 
-
         try:
             self.provision()
-        except Exception as e:
-            try:
-                raise e
-            except XenAPI.Failure as f:
-                raise XenAdapterAPIError(self.log, f"Failed to provision: {f.details}")
-            finally:
-                pass
-                #self.destroy_vm(vm_uuid, force=True)
-        else:
+        except XenAPI.Failure as f:
+            raise XenAdapterAPIError(self.log, f"Failed to provision: {f.details}")
+
+    @staticmethod
+    def disk_vdis(xen, ref : str) -> List[str]:
+        '''
+        :return: refs of VDIs attached to VM ref as disks
+        '''
+        return [vbd['VDI'] for vbd in xen.api.VBD.get_all_records_where(f'field "VM" = "{ref}"').values()
+                if vbd['type'] == 'Disk' and vbd['VDI'] != 'OpaqueRef:NULL']
+
+    def leave_warm_pool(self):
+        '''
+        Removes warm pool marks of VM and its disks so that they are stored in DB, see warmpool.WarmPool
+        '''
+        from xenadapter.vdi import VDI
+        try:
+            for vdi in self.disk_vdis(self.xen, self.ref):
+                self.xen.api.VDI.remove_from_other_config(vdi, VDI.WARM_POOL_KEY)
+            self.xen.api.VM.remove_from_other_config(self.ref, self.WARM_POOL_READY_KEY)
+            self.xen.api.VM.remove_from_other_config(self.ref, self.WARM_POOL_KEY)
+        except XenAPI.Failure as f:
+            raise XenAdapterAPIError(self.log, f"Failed to remove {self} from warm pool: {f.details}")
 
 
-            for item in self.get_VBDs():
-                vbd = VBD(self.xen, ref=item)
-                vdi = VDI(self.xen, ref=vbd.get_VDI())
-                sr = SR(self.xen, ref=vdi.get_SR())
-                if sr.get_content_type() != 'iso':
-                    vdi.set_name_label(f"{self.get_name_label()} {vbd.get_userdevice()}")
-                    vdi.set_name_description(f"Created by VMEmperor for VM {self.ref} (UUID {self.get_uuid()})")
-                    # After provision. manage disks actions
-                    vdi.manage_actions(VDI.Actions.ALL, user=self.user)
-                    vdi.set_main_owner(self.user)
+    def setup_provisioned_disks(self):
+        '''
+        Label disks created by provision and give them to self.user.
+        VBDs are read with a single call and SR content types with a single query, then disks are set up concurrently,
+        each one with a single other_config write
+        '''
+        from xenadapter.vdi import VDI
+
+        vbds = self.xen.api.VBD.get_all_records_where(f'field "VM" = "{self.ref}"')
+        devices = {vbd['VDI']: vbd['userdevice'] for vbd in vbds.values() if vbd['VDI'] != 'OpaqueRef:NULL'}
+        if not devices:
+            return
+        if self.user and not get_user_object(self.user):
+            raise XenAdapterArgumentError(self.log, f'Incorrect user name: {self.user}')
+
+        name_label = self.get_name_label()
+        name_description = f"Created by VMEmperor for VM {self.ref} (UUID {self.get_uuid()})"
+        vdi_records = dict(zip(devices, _DISK_SETUP.map(_read_vdi_record, devices)))
+        content_types = SR.get_content_types({record['SR'] for record in vdi_records.values()}, self.xen)
+
+        def setup(ref):
+            other_config = vdi_records[ref]['other_config']
+            if self.user:
+                other_config = VDI.other_config_with_actions(other_config, VDI.Actions.ALL, self.user)
+            other_config = VDI.other_config_with_main_owner(other_config, self.user)
+            _call_vdi(lambda xen: (
+                xen.api.VDI.set_name_label(ref, f"{name_label} {devices[ref]}"),
+                xen.api.VDI.set_name_description(ref, name_description),
+                xen.api.VDI.set_other_config(ref, {k: str(v) for k, v in other_config.items()}),
+            ))
+
+        disks = [ref for ref, record in vdi_records.items() if content_types.get(record['SR']) != 'iso']
+        list(_DISK_SETUP.map(setup, disks)) # Reraises exceptions
+        self.log.debug(f"Disks of {self} are set up: {disks}")
 
 
     @use_logger
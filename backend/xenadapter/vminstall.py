@@ -0,0 +1,113 @@
+from functools import partial
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+from sentry_sdk import capture_exception
+
+import constants.re as re
+from customtask.statuswriter import TaskStatusWriter
+from rethinkdb_tools.helper import CHECK_ER
+from rethinkdb_tools.recordwatcher import RecordWatcher
+from singleton import Singleton
+
+# VM installation steps, stored in install.state field of the create_vm task record
+CLONE = 'clone'
+PROVISION = 'provision'
+START = 'start'
+INSTALLING = 'installing'
+DONE = 'done'
+
+# Steps that are performed synchronously in createvm and can't be resumed after restart
+INTERRUPTIBLE_STATES = (CLONE, PROVISION, START)
+
+
+class InstallTracker(RecordWatcher, metaclass=Singleton):
+    '''
+    Finishes create_vm tasks when their VMs halt after OS installation.
+    VMs are watched with a single changefeed (see RecordWatcher) instead of a thread per installation.
+    Installations are resumed after restart from task records (see resume)
+    '''
+    table_name = 'vms'
+    fields = ('ref', 'power_state', 'start_time')
+
+    def __repr__(self):
+        return "InstallTracker"
+
+    def __init__(self):
+        super().__init__()
+        self._started : Set[str] = set() # VMs that have been seen not halted, so that a stale Halted state is not taken for the end of installation
+        self._start_times : Dict[str, datetime] = {} # start_time of the run of started VMs, Halted records of earlier runs are stale
+
+    def is_done(self, record : dict) -> bool:
+        ref = record['ref']
+        if record['power_state'] != 'Halted':
+            self._started.add(ref)
+            return False
+        if ref not in self._started:
+            return False
+        start_time = self._start_times.get(ref)
+        if start_time and record.get('start_time') and record['start_time'] < start_time:
+            return False # VM metrics of this run have not been written yet
+        self._forget(ref)
+        return True
+
+    def _forget(self, ref : str):
+        self._started.discard(ref)
+        self._start_times.pop(ref, None)
+
+    def track(self, task_id : str, vm_ref : str, started=False, start_time : Optional[datetime] = None):
+        '''
+        Finish task task_id when vm_ref halts. Can be called from any thread
+        :param started: VM is known to have been running, i.e. Halted in DB means it has finished installing
+        :param start_time: start_time (VM_metrics) of that run: Halted records with an earlier start_time are left from before it
+        '''
+        if started:
+            self._loop.call_soon_threadsafe(self._started.add, vm_ref)
+        if start_time:
+            self._loop.call_soon_threadsafe(self._start_times.__setitem__, vm_ref, start_time)
+        self.watch(vm_ref, partial(self.finish, task_id, vm_ref))
+
+    def finish(self, task_id : str, vm_ref : str, record : Optional[dict]):
+        if record:
+            self.log.debug(f"VM {vm_ref} has finished installing (task {task_id})")
+            TaskStatusWriter().update({
+                "ref": task_id,
+                "status": "success",
+                "progress": 1.0,
+                "finished": re.r.now(),
+                "install": {"state": DONE},
+            }, urgent=True)
+        else:
+            self.log.warning(f"VM {vm_ref} has been removed while installing (task {task_id})")
+            self._loop.call_soon_threadsafe(self._forget, vm_ref)
+            self.fail(task_id, f"VM {vm_ref} has been removed while installing")
+
+    @staticmethod
+    def fail(task_id : str, reason : str):
+        TaskStatusWriter().flush()
+        CHECK_ER(re.db.table('tasks').get(task_id).update({
+            "status": "failure",
+            "finished": re.r.now(),
+            "error_info": re.r.row['error_info'].default([]).append(reason),
+        }).run())
+
+    def resume(self):
+        '''
+        Called on startup (requires a RethinkDB connection): resume tracking of installing VMs,
+        fail tasks that were interrupted before VM was started
+        '''
+        try:
+            tasks = re.db.table('tasks')\
+                .filter(lambda task: (task['status'] == 'pending') & task.has_fields({'install': {'state': True}}))\
+                .pluck('ref', 'install')\
+                .coerce_to('array').run()
+            for task in tasks:
+                state = task['install']['state']
+                if state == INSTALLING:
+                    self.log.info(f"Resuming installation of VM {task['install']['vm']} (task {task['ref']})")
+                    self.track(task['ref'], task['install']['vm'], started=True)
+                elif state in INTERRUPTIBLE_STATES:
+                    self.fail(task['ref'], f"VM creation has been interrupted by restart at step: {state}")
+        except Exception as e:
+            self.log.error(f"Unable to resume VM installations: {e}")
+            capture_exception(e)
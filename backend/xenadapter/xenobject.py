@@ -19,6 +19,7 @@ from authentication import BasicAuthenticator
 from handlers.graphql.mutation_utils.cleanup import cleanup_defaults
 
 from handlers.graphql.types.base.gxenobjecttype import GXenObjectType
+from handlers.graphql.utils.paging import sort_key
 from xenadapter.xenobjectmeta import XenObjectMeta
 from xentools.dict_deep_convert import dict_deep_convert
 from xentools.xenadapter import XenAdapter
@@ -125,6 +126,7 @@ class XenObject(metaclass=XenObjectMeta):
     _db_created = False
     FAIL_ON_NON_EXISTENCE = False # Fail if object does not exist in cache database. Usable if you know for sure that filter_record is always true
     OPTIONS_FLOAT_TO_INT = [] #  As GraphQL does not know about big ints, we'll convert floats corresponding to these fields in set_options
+    SORT_FIELDS = ('name_label',) # Fields usable as order_by in list queries, see handlers/graphql/utils/paging.py. Indexed as sort_<field>
 
     def __str__(self):
         return f"<{self.__class__.__name__} \"{self.ref}\">"
@@ -171,6 +173,17 @@ class XenObject(metaclass=XenObjectMeta):
         '''
         return True
 
+    @classmethod
+    def check_access_many(cls, auth: BasicAuthenticator, refs: Collection[str], action: Optional[SerFlag] = None):
+        '''
+        Batch version of check_access
+        :return list of booleans in order of refs
+
+        Implementation details:
+        ACL is disabled, always return True
+        '''
+        return [True] * len(refs)
+
     def manage_actions(self, actions: Collection, revoke=False, user: str = None):
         pass
 
@@ -233,6 +246,13 @@ class XenObject(metaclass=XenObjectMeta):
                 re.db.table(cls.db_table_name).index_wait(index).run()
                 re.db.table(cls.db_table_name).wait().run()
 
+        # Compound indexes for keyset pagination: ties are broken by ref
+        for field in cls.SORT_FIELDS:
+            index = f'sort_{field}'
+            if index not in index_list:
+                re.db.table(cls.db_table_name).index_create(index, lambda row: sort_key(row, field)).run()
+                re.db.table(cls.db_table_name).index_wait(index).run()
+
 
 
 
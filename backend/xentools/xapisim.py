@@ -0,0 +1,912 @@
+'''
+XAPI simulator for load and performance testing without a XenServer.
+
+Implements the subset of XenAPI used by XenAdapter and xenadapter/* classes over XML-RPC: session login,
+event.register/event.from with tokens and snapshots, get_all_records(_where), get_record, get_by_uuid,
+field getters/setters (incl. map add_to_/remove_from_), Async.* tasks and VM/VDI/VBD/VIF/SR/network/host/pool operations.
+Records are held in memory, every change emits an event like XenServer does.
+
+Run from backend directory:
+
+    python -m xentools.xapisim --port 8099 --hosts 4 --vms 1000 --event-rate 50
+
+and point [xenadapter] url to http://localhost:8099 (any username and password are accepted)
+'''
+import argparse
+import copy
+import random
+import re
+import threading
+import time
+import uuid
+import xml.dom.minidom
+from collections import deque
+from socketserver import ThreadingMixIn
+from typing import Callable, Dict, List, Mapping, Optional
+from xmlrpc.client import DateTime
+from xmlrpc.server import SimpleXMLRPCServer
+
+REF_NULL = 'OpaqueRef:NULL'
+API_VERSION = (2, 7)
+DEFAULT_MAX_EVENTS = 100000
+GiB = 2 ** 30
+
+# XAPI class names as used in method names. Event classes are lowercase
+CLASSES = ('pool', 'host', 'host_metrics', 'VM', 'VM_metrics', 'VM_guest_metrics', 'SR', 'PBD', 'VDI', 'VBD',
+           'VIF', 'network', 'console', 'task', 'message')
+CLASS_BY_EVENT_CLASS = {name.lower(): name for name in CLASSES}
+
+# Fields that contain refs of other objects of a class. Kept consistent when objects are created and destroyed
+BACKREFS = {
+    'VBD': (('VM', 'VBDs'), ('VDI', 'VBDs')),
+    'VIF': (('VM', 'VIFs'), ('network', 'VIFs')),
+    'VDI': (('SR', 'VDIs'),),
+    'PBD': (('host', 'PBDs'), ('SR', 'PBDs')),
+    'console': (('VM', 'consoles'),),
+}
+
+
+class Failure(Exception):
+    '''
+    XAPI error, returned to client as ErrorDescription (raised by client as XenAPI.Failure)
+    '''
+    def __init__(self, *details):
+        super().__init__(details)
+        self.details = [str(item) for item in details]
+
+
+def now() -> DateTime:
+    return DateTime(time.strftime('%Y%m%dT%H:%M:%SZ', time.gmtime()))
+
+
+def new_ref() -> str:
+    return f'OpaqueRef:{uuid.uuid4()}'
+
+
+def vm_record(**fields) -> dict:
+    return {
+        'name_label': 'VM', 'name_description': '', 'power_state': 'Halted',
+        'is_a_template': False, 'is_default_template': False, 'is_a_snapshot': False, 'is_control_domain': False,
+        'snapshot_of': REF_NULL, 'snapshots': [], 'snapshot_time': DateTime('19700101T00:00:00Z'), 'parent': REF_NULL,
+        'other_config': {}, 'platform': {'nx': 'true', 'acpi': '1', 'apic': 'true', 'pae': 'true', 'viridian': 'false'},
+        'tags': [], 'blocked_operations': {}, 'allowed_operations': [], 'current_operations': {},
+        'VCPUs_max': '1', 'VCPUs_at_startup': '1', 'VCPUs_params': {},
+        'memory_static_min': str(GiB // 2), 'memory_static_max': str(GiB),
+        'memory_dynamic_min': str(GiB), 'memory_dynamic_max': str(GiB), 'memory_target': str(GiB), 'memory_overhead': '0',
+        'domain_type': 'hvm', 'HVM_boot_policy': 'BIOS order', 'HVM_boot_params': {'order': 'cd'},
+        'PV_args': '', 'PV_bootloader': '', 'PV_bootloader_args': '', 'PV_kernel': '', 'PV_ramdisk': '', 'PV_legacy_args': '',
+        'resident_on': REF_NULL, 'affinity': REF_NULL, 'domid': '-1', 'user_version': '1',
+        'metrics': REF_NULL, 'guest_metrics': REF_NULL, 'VBDs': [], 'VIFs': [], 'consoles': [], 'VGPUs': [], 'VUSBs': [],
+        'xenstore_data': {}, 'blobs': {}, 'bios_strings': {}, 'has_vendor_device': False,
+        'actions_after_shutdown': 'destroy', 'actions_after_reboot': 'restart', 'actions_after_crash': 'restart',
+        'suspend_VDI': REF_NULL, 'suspend_SR': REF_NULL, 'appliance': REF_NULL,
+        **fields,
+    }
+
+
+def vm_metrics_record(**fields) -> dict:
+    return {'memory_actual': str(GiB), 'VCPUs_number': '1', 'VCPUs_utilisation': {}, 'state': [],
+            'start_time': DateTime('19700101T00:00:00Z'), 'install_time': now(), 'last_updated': now(),
+            'other_config': {}, 'hvm': True, 'nested_virt': False, 'nomigrate': False, 'current_domain_type': 'hvm', **fields}
+
+
+def vm_guest_metrics_record(**fields) -> dict:
+    return {'os_version': {'name': 'Ubuntu 18.04 LTS', 'distro': 'ubuntu', 'major': '18', 'minor': '04'},
+            'PV_drivers_version': {'major': '7', 'minor': '20', 'micro': '0', 'build': '9'}, 'PV_drivers_up_to_date': True,
+            'PV_drivers_detected': True, 'networks': {}, 'other': {}, 'disks': {}, 'memory': {}, 'live': True,
+            'last_updated': now(), 'other_config': {}, 'can_use_hotplug_vbd': 'yes', 'can_use_hotplug_vif': 'yes', **fields}
+
+
+def host_record(**fields) -> dict:
+    return {
+        'name_label': 'host', 'name_description': '', 'hostname': 'host', 'address': '127.0.0.1',
+        'API_version_major': API_VERSION[0], 'API_version_minor': API_VERSION[1], 'API_version_vendor': 'XenSource',
+        'enabled': True, 'display': 'enabled', 'sched_policy': 'credit', 'edition': 'xs',
+        'software_version': {'build_number': '1', 'date': '2019-01-01', 'hostname': 'localhost', 'linux': '4.4.0+10',
+                             'network_backend': 'openvswitch', 'platform_name': 'XCP', 'platform_version': '2.7.0',
+                             'product_brand': 'XenServer', 'product_version': '7.6.0', 'xapi': '1.20', 'xen': '4.7.6'},
+        'cpu_info': {'cpu_count': '8', 'socket_count': '1', 'vendor': 'GenuineIntel', 'speed': '2400.000',
+                     'modelname': 'Simulated CPU', 'family': '6', 'model': '63', 'stepping': '2', 'flags': '',
+                     'features': '', 'features_hvm': '', 'features_pv': ''},
+        'memory_overhead': str(GiB // 8), 'metrics': REF_NULL, 'resident_VMs': [], 'PBDs': [], 'PIFs': [], 'PCIs': [],
+        'PGPUs': [], 'PUSBs': [], 'other_config': {}, 'tags': [], 'license_params': {}, 'allowed_operations': [],
+        'current_operations': {}, 'capabilities': [], 'bios_strings': {}, 'logging': {}, 'blobs': {},
+        **fields,
+    }
+
+
+def host_metrics_record(**fields) -> dict:
+    return {'memory_total': str(64 * GiB), 'memory_free': str(60 * GiB), 'live': True, 'last_updated': now(),
+            'other_config': {}, **fields}
+
+
+def pool_record(**fields) -> dict:
+    return {'name_label': 'Simulated pool', 'name_description': '', 'master': REF_NULL, 'default_SR': REF_NULL,
+            'suspend_image_SR': REF_NULL, 'crash_dump_SR': REF_NULL, 'other_config': {}, 'gui_config': {}, 'tags': [],
+            'blobs': {}, 'ha_enabled': False, 'allowed_operations': [], 'current_operations': {}, **fields}
+
+
+def sr_record(**fields) -> dict:
+    return {'name_label': 'SR', 'name_description': '', 'type': 'lvm', 'content_type': 'user', 'shared': True,
+            'physical_size': str(1024 * GiB), 'physical_utilisation': '0', 'virtual_allocation': '0',
+            'VDIs': [], 'PBDs': [], 'other_config': {}, 'sm_config': {}, 'tags': [], 'blobs': {},
+            'allowed_operations': [], 'current_operations': {}, 'is_tools_sr': False, 'local_cache_enabled': False,
+            'clustered': False, 'introduced_by': REF_NULL, **fields}
+
+
+def pbd_record(**fields) -> dict:
+    return {'host': REF_NULL, 'SR': REF_NULL, 'device_config': {}, 'currently_attached': True, 'other_config': {}, **fields}
+
+
+def vdi_record(**fields) -> dict:
+    return {'name_label': 'VDI', 'name_description': '', 'SR': REF_NULL, 'VBDs': [], 'virtual_size': str(10 * GiB),
+            'physical_utilisation': '0', 'type': 'user', 'sharable': False, 'read_only': False, 'managed': True,
+            'missing': False, 'is_a_snapshot': False, 'snapshot_of': REF_NULL, 'snapshots': [], 'parent': REF_NULL,
+            'location': str(uuid.uuid4()), 'other_config': {}, 'sm_config': {}, 'xenstore_data': {}, 'tags': [],
+            'allowed_operations': [], 'current_operations': {}, 'storage_lock': False, 'on_boot': 'persist',
+            'allow_caching': False, 'is_tools_iso': False, 'cbt_enabled': False, **fields}
+
+
+def vbd_record(**fields) -> dict:
+    return {'VM': REF_NULL, 'VDI': REF_NULL, 'device': '', 'userdevice': '0', 'bootable': False, 'mode': 'RW',
+            'type': 'Disk', 'unpluggable': True, 'currently_attached': False, 'empty': False, 'other_config': {},
+            'qos_algorithm_type': '', 'qos_algorithm_params': {}, 'qos_supported_algorithms': [], 'storage_lock': False,
+            'status_code': '0', 'status_detail': '', 'runtime_properties': {}, 'metrics': REF_NULL,
+            'allowed_operations': [], 'current_operations': {}, **fields}
+
+
+def vif_record(**fields) -> dict:
+    mac = ':'.join(f'{random.randint(0, 255):02x}' for _ in range(5))
+    return {'VM': REF_NULL, 'network': REF_NULL, 'device': '0', 'MAC': f'a2:{mac}', 'MTU': '1500',
+            'currently_attached': False, 'other_config': {}, 'qos_algorithm_type': '', 'qos_algorithm_params': {},
+            'locking_mode': 'network_default', 'ipv4_allowed': [], 'ipv6_allowed': [], 'ipv4_addresses': [],
+            'ipv6_addresses': [], 'metrics': REF_NULL, 'allowed_operations': [], 'current_operations': {}, **fields}
+
+
+def network_record(**fields) -> dict:
+    return {'name_label': 'Network', 'name_description': '', 'bridge': 'xenbr0', 'MTU': '1500', 'managed': True,
+            'VIFs': [], 'PIFs': [], 'other_config': {}, 'tags': [], 'blobs': {}, 'assigned_ips': {},
+            'default_locking_mode': 'unlocked', 'allowed_operations': [], 'current_operations': {}, **fields}
+
+
+def console_record(**fields) -> dict:
+    return {'protocol': 'rfb', 'location': '', 'VM': REF_NULL, 'other_config': {}, **fields}
+
+
+def task_record(**fields) -> dict:
+    return {'name_label': '', 'name_description': '', 'status': 'pending', 'progress': 0.0, 'created': now(),
+            'finished': DateTime('19700101T00:00:00Z'), 'result': '', 'error_info': [], 'type': '', 'other_config': {},
+            'resident_on': REF_NULL, 'subtask_of': REF_NULL, 'subtasks': [], 'backtrace': '',
+            'allowed_operations': ['cancel'], 'current_operations': {}, **fields}
+
+
+class XAPISimulator:
+    '''
+    In-memory XAPI. call() implements XML-RPC methods (without session argument),
+    create/modify/destroy change objects and emit events, as XAPI internals do
+    :param task_duration: seconds an Async.* task stays pending before its method is run
+    :param max_events: events kept for event.from. Clients that fall further behind get EVENTS_LOST
+    '''
+    def __init__(self, task_duration=0.0, max_events=DEFAULT_MAX_EVENTS):
+        self.task_duration = task_duration
+        self.objects : Dict[str, Dict[str, dict]] = {name: {} for name in CLASSES}
+        self.sessions = set()
+        self.calls = 0
+        self._lock = threading.Condition(threading.RLock())
+        self._events = deque(maxlen=max_events)
+        self._event_id = 0
+        self._by_uuid : Dict[str, str] = {}
+        self.event_from_calls = 0
+        self.served_token = 0 # Last event returned by event.from
+
+    # Object store
+
+    def get(self, cls : str, ref : str) -> dict:
+        try:
+            return self.objects[cls][ref]
+        except KeyError:
+            raise Failure('HANDLE_INVALID', cls, ref)
+
+    def create(self, cls : str, record : dict, ref : Optional[str] = None) -> str:
+        with self._lock:
+            ref = ref or new_ref()
+            record.setdefault('uuid', str(uuid.uuid4()))
+            self.objects[cls][ref] = record
+            self._by_uuid[record['uuid']] = ref
+            for target_class, field in BACKREFS.get(cls, ()):
+                target = record.get(target_class)
+                if target in self.objects[target_class]:
+                    self.modify(target_class, target, **{field: self.objects[target_class][target][field] + [ref]})
+            self._emit(cls, 'add', ref, record)
+            return ref
+
+    def modify(self, cls : str, ref : str, **fields):
+        with self._lock:
+            record = self.get(cls, ref)
+            record.update(fields)
+            self._emit(cls, 'mod', ref, record)
+
+    def destroy(self, cls : str, ref : str):
+        with self._lock:
+            record = self.get(cls, ref)
+            del self.objects[cls][ref]
+            self._by_uuid.pop(record['uuid'], None)
+            for target_class, field in BACKREFS.get(cls, ()):
+                target = record.get(target_class)
+                if target in self.objects[target_class]:
+                    refs = self.objects[target_class][target][field]
+                    self.modify(target_class, target, **{field: [item for item in refs if item != ref]})
+            self._emit(cls, 'del', ref, record)
+
+    def apply_event(self, event : dict):
+        '''
+        Make a change recorded as an event.from event (i.e. from a real XenServer), emitting the same event.
+        Snapshots are stored as they are, references in other objects are not updated
+        '''
+        cls = CLASS_BY_EVENT_CLASS.get(event['class'], event['class'])
+        ref = event['ref']
+        with self._lock:
+            records = self.objects.setdefault(cls, {})
+            if event['operation'] == 'del':
+                record = records.pop(ref, None) or event['snapshot'] or {}
+                self._by_uuid.pop(record.get('uuid'), None)
+            else:
+                record = copy.deepcopy(event['snapshot'])
+                records[ref] = record
+                if 'uuid' in record:
+                    self._by_uuid[record['uuid']] = ref
+            self._emit(cls, event['operation'], ref, record)
+
+    # Events
+
+    def _emit(self, cls : str, operation : str, ref : str, record : dict):
+        self._event_id += 1
+        self._events.append({
+            'id': str(self._event_id),
+            'timestamp': f'{time.time():.6f}',
+            'class': cls.lower(),
+            'operation': operation,
+            'ref': ref,
+            'snapshot': copy.deepcopy(record),
+        })
+        self._lock.notify_all()
+
+    @property
+    def token(self) -> str:
+        return f'{self._event_id:020d}'
+
+    def event_from(self, classes : List[str], token : str, timeout : float) -> dict:
+        '''
+        Empty token returns all objects as 'add' events. Otherwise waits up to timeout for events after token,
+        only the last event of an object is returned
+        '''
+        wanted = None if '*' in classes else {name.split('/')[0].lower() for name in classes}
+        with self._lock:
+            self.event_from_calls += 1
+            if not token:
+                events = [{'id': str(self._event_id), 'timestamp': f'{time.time():.6f}', 'class': cls.lower(),
+                           'operation': 'add', 'ref': ref, 'snapshot': copy.deepcopy(record)}
+                          for cls, records in self.objects.items() if wanted is None or cls.lower() in wanted
+                          for ref, record in records.items()]
+                self.served_token = self._event_id
+                return {'events': events, 'valid_ref_counts': {}, 'token': self.token}
+
+            since = int(token)
+            oldest = int(self._events[0]['id']) if self._events else self._event_id + 1
+            if since + 1 < oldest:
+                raise Failure('EVENTS_LOST')
+
+            def pending():
+                return [event for event in self._events if int(event['id']) > since
+                        and (wanted is None or event['class'] in wanted)]
+
+            deadline = time.monotonic() + float(timeout)
+            events = pending()
+            while not events and time.monotonic() < deadline:
+                self._lock.wait(deadline - time.monotonic())
+                events = pending()
+
+            latest = {}
+            for event in events:
+                latest.pop((event['class'], event['ref']), None)
+                latest[event['class'], event['ref']] = event
+            self.served_token = self._event_id
+            return {'events': list(latest.values()), 'valid_ref_counts': {}, 'token': self.token}
+
+    # XML-RPC methods
+
+    def login(self, *args) -> str:
+        session = new_ref()
+        with self._lock:
+            self.sessions.add(session)
+        return session
+
+    def call(self, method : str, params : tuple):
+        '''
+        Call a XenAPI method. params don't include session reference
+        '''
+        with self._lock:
+            self.calls += 1
+        if method.startswith('Async.'):
+            return self.call_async(method, params)
+        if method in ('event_from', 'event.from'):
+            return self.event_from(*params)
+
+        cls, _, name = method.partition('.')
+        with self._lock:
+            handler = getattr(self, f'_{cls}_{name}', None)
+            if handler:
+                return handler(*params)
+            if cls not in self.objects or not name:
+                raise Failure('MESSAGE_METHOD_UNKNOWN', method)
+            # Results are marshalled after the lock is released
+            return copy.deepcopy(self.call_generic(cls, name, params))
+
+    def call_generic(self, cls : str, name : str, params : tuple):
+        records = self.objects[cls]
+        if name == 'get_all':
+            return list(records)
+        if name == 'get_all_records':
+            return records
+        if name == 'get_all_records_where':
+            condition = parse_where(params[0])
+            return {ref: record for ref, record in records.items() if condition(record)}
+        if name == 'get_by_uuid':
+            ref = self._by_uuid.get(params[0])
+            if ref not in records:
+                raise Failure('UUID_INVALID', cls, params[0])
+            return ref
+        if name == 'get_by_name_label':
+            return [ref for ref, record in records.items() if record.get('name_label') == params[0]]
+
+        ref, *args = params
+        record = self.get(cls, ref)
+        if name == 'get_record':
+            return record
+        if name == 'destroy':
+            return self.destroy(cls, ref)
+
+        for prefix in ('get_', 'set_', 'add_to_', 'remove_from_', 'add_', 'remove_'):
+            if name.startswith(prefix):
+                field = name[len(prefix):]
+                break
+        else:
+            raise Failure('MESSAGE_METHOD_UNKNOWN', f'{cls}.{name}')
+        if prefix in ('add_', 'remove_'):
+            field += 's' # add_tags/remove_tags
+        if field not in record:
+            raise Failure('MESSAGE_METHOD_UNKNOWN', f'{cls}.{name}')
+
+        if prefix == 'get_':
+            return record[field]
+        if prefix == 'set_':
+            self.modify(cls, ref, **{field: args[0]})
+        elif prefix == 'add_to_':
+            if args[0] in record[field]:
+                raise Failure('MAP_DUPLICATE_KEY', cls, field, ref, args[0])
+            self.modify(cls, ref, **{field: {**record[field], args[0]: args[1]}})
+        elif prefix == 'remove_from_':
+            self.modify(cls, ref, **{field: {k: v for k, v in record[field].items() if k != args[0]}})
+        elif prefix == 'add_':
+            if args[0] not in record[field]:
+                self.modify(cls, ref, **{field: record[field] + [args[0]]})
+        else:
+            self.modify(cls, ref, **{field: [item for item in record[field] if item != args[0]]})
+        return ''
+
+    def call_async(self, method : str, params : tuple) -> str:
+        '''
+        Create a pending task and run the method in a timer thread. Object's current_operations contain the task
+        while it's pending
+        '''
+        name = method[len('Async.'):]
+        cls, _, operation = name.partition('.')
+        subject = params[0] if params and isinstance(params[0], str) and params[0] in self.objects.get(cls, {}) else None
+        with self._lock:
+            master = next(iter(self.objects['pool'].values()), {}).get('master', REF_NULL)
+            task = self.create('task', task_record(name_label=method, resident_on=master))
+            if subject:
+                record = self.objects[cls][subject]
+                self.modify(cls, subject, current_operations={**record['current_operations'], task: operation})
+
+        def run():
+            try:
+                result = self.call(name, params)
+            except Failure as f:
+                fields = {'status': 'failure', 'error_info': f.details}
+            except Exception as e:
+                fields = {'status': 'failure', 'error_info': ['INTERNAL_ERROR', str(e)]}
+            else:
+                value = f'<value>{result}</value>' if isinstance(result, str) and result else ''
+                fields = {'status': 'success', 'result': value}
+            with self._lock:
+                if subject and subject in self.objects[cls]:
+                    operations = self.objects[cls][subject]['current_operations']
+                    self.modify(cls, subject, current_operations={k: v for k, v in operations.items() if k != task})
+                if task in self.objects['task'] and self.objects['task'][task]['status'] == 'pending':
+                    self.modify('task', task, progress=1.0, finished=now(), **fields)
+
+        timer = threading.Timer(self.task_duration, run)
+        timer.daemon = True
+        timer.start()
+        return task
+
+    # Class specific methods. Called with the lock held
+
+    def _session_logout(self, *args):
+        return ''
+
+    def _event_register(self, *args):
+        return ''
+
+    def _event_unregister(self, *args):
+        return ''
+
+    def _host_compute_free_memory(self, ref):
+        return self.get('host_metrics', self.get('host', ref)['metrics'])['memory_free']
+
+    def _host_compute_memory_overhead(self, ref):
+        return self.get('host', ref)['memory_overhead']
+
+    def _task_cancel(self, ref):
+        if self.get('task', ref)['status'] == 'pending':
+            self.modify('task', ref, status='cancelled', finished=now())
+        return ''
+
+    def _check_power_state(self, ref, *allowed):
+        state = self.get('VM', ref)['power_state']
+        if state not in allowed:
+            raise Failure('VM_BAD_POWER_STATE', ref, allowed[0].lower(), state.lower())
+
+    def _set_power_state(self, ref, state, host=REF_NULL):
+        record = self.get('VM', ref)
+        old_host = record['resident_on']
+        fields = {'power_state': state}
+        if state == 'Running' and host != REF_NULL:
+            fields['resident_on'] = host
+            fields['domid'] = str(random.randint(1, 32000))
+        elif state in ('Halted', 'Suspended'):
+            fields['resident_on'] = REF_NULL
+            fields['domid'] = '-1'
+        self.modify('VM', ref, **fields)
+
+        new_host = record['resident_on']
+        if old_host != new_host:
+            if old_host in self.objects['host']:
+                vms = self.objects['host'][old_host]['resident_VMs']
+                self.modify('host', old_host, resident_VMs=[vm for vm in vms if vm != ref])
+            if new_host in self.objects['host']:
+                self.modify('host', new_host, resident_VMs=self.objects['host'][new_host]['resident_VMs'] + [ref])
+        if record['metrics'] in self.objects['VM_metrics'] and state == 'Running' and old_host == REF_NULL:
+            self.modify('VM_metrics', record['metrics'], start_time=now())
+        for vbd in record['VBDs']:
+            self.modify('VBD', vbd, currently_attached=state in ('Running', 'Paused'))
+        for vif in record['VIFs']:
+            self.modify('VIF', vif, currently_attached=state in ('Running', 'Paused'))
+
+    def _choose_host(self) -> str:
+        hosts = list(self.objects['host'])
+        if not hosts:
+            raise Failure('NO_HOSTS_AVAILABLE')
+        return random.choice(hosts)
+
+    def _VM_start(self, ref, start_paused=False, force=False):
+        self._check_power_state(ref, 'Halted')
+        self._set_power_state(ref, 'Paused' if start_paused else 'Running', self._choose_host())
+        return ''
+
+    def _VM_start_on(self, ref, host, start_paused=False, force=False):
+        self._check_power_state(ref, 'Halted')
+        self.get('host', host)
+        self._set_power_state(ref, 'Paused' if start_paused else 'Running', host)
+        return ''
+
+    def _VM_clean_shutdown(self, ref):
+        self._check_power_state(ref, 'Running')
+        self._set_power_state(ref, 'Halted')
+        return ''
+
+    def _VM_hard_shutdown(self, ref):
+        self._check_power_state(ref, 'Running', 'Paused', 'Suspended')
+        self._set_power_state(ref, 'Halted')
+        return ''
+
+    _VM_shutdown = _VM_hard_shutdown
+
+    def _VM_clean_reboot(self, ref):
+        self._check_power_state(ref, 'Running')
+        self.modify('VM', ref, domid=str(random.randint(1, 32000)))
+        return ''
+
+    _VM_hard_reboot = _VM_clean_reboot
+
+    def _VM_pause(self, ref):
+        self._check_power_state(ref, 'Running')
+        self._set_power_state(ref, 'Paused')
+        return ''
+
+    def _VM_unpause(self, ref):
+        self._check_power_state(ref, 'Paused')
+        self._set_power_state(ref, 'Running')
+        return ''
+
+    def _VM_suspend(self, ref):
+        self._check_power_state(ref, 'Running')
+        self._set_power_state(ref, 'Suspended')
+        return ''
+
+    def _VM_resume(self, ref, start_paused=False, force=False):
+        self._check_power_state(ref, 'Suspended')
+        self._set_power_state(ref, 'Paused' if start_paused else 'Running', self._choose_host())
+        return ''
+
+    def _VM_clone(self, ref, name_label, **fields):
+        '''
+        Copies VM record with its disks and network interfaces
+        '''
+        source = self.get('VM', ref)
+        record = copy.deepcopy(source)
+        for field in ('uuid', 'VBDs', 'VIFs', 'consoles', 'snapshots', 'current_operations'):
+            del record[field]
+        record.update(name_label=name_label, power_state='Halted', resident_on=REF_NULL, domid='-1',
+                      is_default_template=False, parent=REF_NULL, **fields)
+        record['other_config'] = {k: v for k, v in record['other_config'].items() if k != 'default_template'}
+        record['metrics'] = self.create('VM_metrics', vm_metrics_record())
+        record['guest_metrics'] = REF_NULL
+        new = self.create('VM', vm_record(**record))
+
+        for vbd in source['VBDs']:
+            vbd_rec = self.get('VBD', vbd)
+            vdi = vbd_rec['VDI']
+            if vbd_rec['type'] == 'Disk' and vdi in self.objects['VDI']:
+                vdi_rec = copy.deepcopy(self.objects['VDI'][vdi])
+                for field in ('uuid', 'VBDs', 'snapshots', 'current_operations'):
+                    del vdi_rec[field]
+                vdi = self.create('VDI', vdi_record(**{**vdi_rec, 'location': str(uuid.uuid4())}))
+            fields_ = {k: v for k, v in vbd_rec.items() if k not in ('uuid', 'VM', 'VDI', 'current_operations')}
+            self.create('VBD', vbd_record(**{**fields_, 'VM': new, 'VDI': vdi, 'currently_attached': False}))
+        for vif in source['VIFs']:
+            vif_rec = self.get('VIF', vif)
+            self.create('VIF', vif_record(VM=new, network=vif_rec['network'], device=vif_rec['device']))
+        self.create('console', console_record(VM=new, location=f'https://localhost/console?ref={new}'))
+        return new
+
+    _VM_copy = _VM_clone
+
+    def _VM_snapshot(self, ref, name_label):
+        snapshot = self._VM_clone(ref, name_label, is_a_template=True, is_a_snapshot=True, snapshot_of=ref,
+                                  snapshot_time=now())
+        self.modify('VM', ref, snapshots=self.get('VM', ref)['snapshots'] + [snapshot])
+        return snapshot
+
+    def _VM_provision(self, ref):
+        '''
+        Creates disks from the provision XML in other_config:disks, see provision.py
+        '''
+        record = self.get('VM', ref)
+        if 'disks' not in record['other_config']:
+            return ''
+        doc = xml.dom.minidom.parseString(record['other_config']['disks'])
+        for disk in doc.getElementsByTagName('disk'):
+            sr = self._by_uuid.get(disk.getAttribute('sr'))
+            if sr not in self.objects['SR']:
+                raise Failure('UUID_INVALID', 'SR', disk.getAttribute('sr'))
+            vdi = self.create('VDI', vdi_record(name_label=f"{record['name_label']} {disk.getAttribute('device')}",
+                                                SR=sr, virtual_size=disk.getAttribute('size')))
+            self.create('VBD', vbd_record(VM=ref, VDI=vdi, userdevice=disk.getAttribute('device'),
+                                          bootable=disk.getAttribute('bootable') == 'true'))
+        return ''
+
+    def _VM_destroy(self, ref):
+        record = self.get('VM', ref)
+        if record['power_state'] != 'Halted':
+            raise Failure('VM_BAD_POWER_STATE', ref, 'halted', record['power_state'].lower())
+        for cls, field in (('VBD', 'VBDs'), ('VIF', 'VIFs'), ('console', 'consoles')):
+            for item in list(record[field]):
+                self.destroy(cls, item)
+        for cls, field in (('VM_metrics', 'metrics'), ('VM_guest_metrics', 'guest_metrics')):
+            if record[field] in self.objects[cls]:
+                self.destroy(cls, record[field])
+        self.destroy('VM', ref)
+        return ''
+
+    def _VDI_create(self, record):
+        self.get('SR', record['SR'])
+        return self.create('VDI', vdi_record(**{k: v for k, v in record.items() if k != 'VBDs'}))
+
+    def _VDI_destroy(self, ref):
+        for vbd in list(self.get('VDI', ref)['VBDs']):
+            if self.get('VBD', vbd)['currently_attached']:
+                raise Failure('VDI_IN_USE', ref, 'destroy')
+            self.destroy('VBD', vbd)
+        self.destroy('VDI', ref)
+        return ''
+
+    def _VBD_create(self, record):
+        vm = self.get('VM', record['VM'])
+        if record.get('VDI', REF_NULL) != REF_NULL:
+            self.get('VDI', record['VDI'])
+        used = {self.objects['VBD'][vbd]['userdevice'] for vbd in vm['VBDs']}
+        if record.get('userdevice') in used:
+            raise Failure('DEVICE_ALREADY_EXISTS', record['userdevice'])
+        return self.create('VBD', vbd_record(**record))
+
+    def _VBD_insert(self, ref, vdi):
+        self.get('VDI', vdi)
+        self.modify('VBD', ref, VDI=vdi, empty=False)
+        self.modify('VDI', vdi, VBDs=self.objects['VDI'][vdi]['VBDs'] + [ref])
+        return ''
+
+    def _VBD_eject(self, ref):
+        vdi = self.get('VBD', ref)['VDI']
+        self.modify('VBD', ref, VDI=REF_NULL, empty=True)
+        if vdi in self.objects['VDI']:
+            self.modify('VDI', vdi, VBDs=[vbd for vbd in self.objects['VDI'][vdi]['VBDs'] if vbd != ref])
+        return ''
+
+    def _VBD_plug(self, ref):
+        self.modify('VBD', ref, currently_attached=True)
+        return ''
+
+    def _VBD_unplug(self, ref):
+        self.modify('VBD', ref, currently_attached=False)
+        return ''
+
+    _VBD_unplug_force = _VBD_unplug
+
+    def _VIF_create(self, record):
+        self.get('VM', record['VM'])
+        self.get('network', record['network'])
+        return self.create('VIF', vif_record(**record))
+
+    def _VIF_plug(self, ref):
+        self.modify('VIF', ref, currently_attached=True)
+        return ''
+
+    def _VIF_unplug(self, ref):
+        self.modify('VIF', ref, currently_attached=False)
+        return ''
+
+    _VIF_unplug_force = _VIF_unplug
+
+    def _network_create(self, record):
+        return self.create('network', network_record(**record))
+
+
+WHERE_TERM = re.compile(r'field\s+"(\w+)"\s*=\s*"([^"]*)"')
+
+
+def parse_where(expression : str) -> Callable[[dict], bool]:
+    '''
+    Supports conjunctions of field "name" = "value" terms: enough for get_all_records_where used by this project
+    '''
+    terms = WHERE_TERM.findall(expression)
+    if not terms and expression.strip() not in ('', 'true'):
+        raise Failure('INVALID_EXPRESSION', expression)
+
+    def as_string(value):
+        if isinstance(value, bool):
+            return str(value).lower()
+        return str(value)
+
+    return lambda record: all(as_string(record.get(field)) == value for field, value in terms)
+
+
+def populate(simulator : XAPISimulator, hosts=2, srs=2, networks=2, templates=4, vms=100, disks_per_vm=1,
+             running=0.5, seed=None) -> dict:
+    '''
+    Generate a synthetic pool
+    :param running: fraction of VMs that are running
+    :return: refs of created objects by class
+    '''
+    rng = random.Random(seed)
+    refs = {name: [] for name in ('host', 'SR', 'network', 'template', 'VM')}
+    for i in range(hosts):
+        metrics = simulator.create('host_metrics', host_metrics_record())
+        refs['host'].append(simulator.create('host', host_record(name_label=f'host{i}', hostname=f'host{i}',
+                                                                 address=f'10.0.0.{i + 1}', metrics=metrics)))
+    for i in range(srs):
+        refs['SR'].append(simulator.create('SR', sr_record(name_label=f'Storage {i}')))
+    iso_sr = simulator.create('SR', sr_record(name_label='ISO library', type='iso', content_type='iso', shared=True))
+    for sr in refs['SR'] + [iso_sr]:
+        for host in refs['host']:
+            simulator.create('PBD', pbd_record(host=host, SR=sr))
+    for i in range(5):
+        simulator.create('VDI', vdi_record(name_label=f'install-{i}.iso', SR=iso_sr, virtual_size=str(GiB)))
+    for i in range(networks):
+        refs['network'].append(simulator.create('network', network_record(name_label=f'Network {i}', bridge=f'xenbr{i}')))
+
+    simulator.create('pool', pool_record(master=refs['host'][0] if refs['host'] else REF_NULL,
+                                         default_SR=refs['SR'][0] if refs['SR'] else REF_NULL))
+
+    for i in range(templates):
+        other_config = {'default_template': 'true', 'linux_template': 'true', 'install-methods': 'http,ftp,nfs',
+                        'install-repository': 'http://archive.ubuntu.com/ubuntu', 'install-distro': 'debianlike',
+                        'debian-release': 'bionic'}
+        refs['template'].append(simulator.create('VM', vm_record(
+            name_label=f'Ubuntu Bionic Beaver 18.04 ({i})', is_a_template=True, is_default_template=True,
+            other_config=other_config, PV_bootloader='eliloader', HVM_boot_policy='', domain_type='pv')))
+
+    for i in range(vms):
+        metrics = simulator.create('VM_metrics', vm_metrics_record())
+        guest_metrics = simulator.create('VM_guest_metrics', vm_guest_metrics_record())
+        vm = simulator.create('VM', vm_record(name_label=f'vm{i}', metrics=metrics, guest_metrics=guest_metrics))
+        for device in range(disks_per_vm):
+            sr = rng.choice(refs['SR'])
+            vdi = simulator.create('VDI', vdi_record(name_label=f'vm{i} {device}', SR=sr,
+                                                     virtual_size=str(rng.choice((10, 20, 40)) * GiB)))
+            simulator.create('VBD', vbd_record(VM=vm, VDI=vdi, userdevice=str(device), bootable=device == 0))
+        if refs['network']:
+            network = rng.choice(refs['network'])
+            simulator.create('VIF', vif_record(VM=vm, network=network, device='0'))
+            simulator.modify('VM_guest_metrics', guest_metrics,
+                             networks={'0/ip': f'10.1.{i // 250}.{i % 250 + 1}', '0/ipv4/0': f'10.1.{i // 250}.{i % 250 + 1}'})
+        simulator.create('console', console_record(VM=vm, location=f'https://localhost/console?ref={vm}'))
+        if refs['host'] and rng.random() < running:
+            with simulator._lock:
+                simulator._set_power_state(vm, 'Running', rng.choice(refs['host']))
+        refs['VM'].append(vm)
+    return refs
+
+
+# Synthetic load: name -> function changing a random object
+def _vm_metrics(simulator, rng, vms):
+    metrics = simulator.objects['VM'][rng.choice(vms)]['metrics']
+    simulator.modify('VM_metrics', metrics, memory_actual=str(rng.randint(GiB // 2, GiB)), last_updated=now())
+
+
+def _host_metrics(simulator, rng, vms):
+    metrics = rng.choice(list(simulator.objects['host_metrics']))
+    simulator.modify('host_metrics', metrics, memory_free=str(rng.randint(8, 60) * GiB), last_updated=now())
+
+
+def _vm_rename(simulator, rng, vms):
+    vm = rng.choice(vms)
+    simulator.modify('VM', vm, name_description=f'Changed at {time.time():.3f}')
+
+
+def _vm_power(simulator, rng, vms):
+    vm = rng.choice(vms)
+    state = simulator.objects['VM'][vm]['power_state']
+    if state == 'Running':
+        simulator.call_async('Async.VM.clean_shutdown', (vm,))
+    elif state == 'Halted':
+        simulator.call_async('Async.VM.start', (vm, False, False))
+
+
+def _vdi_rename(simulator, rng, vms):
+    vdis = [ref for ref, record in simulator.objects['VDI'].items() if record['type'] == 'user']
+    if vdis:
+        simulator.modify('VDI', rng.choice(vdis), name_description=f'Changed at {time.time():.3f}')
+
+
+LOAD_KINDS = {
+    'vm_metrics': _vm_metrics,
+    'host_metrics': _host_metrics,
+    'vm_rename': _vm_rename,
+    'vm_power': _vm_power,
+    'vdi_rename': _vdi_rename,
+}
+DEFAULT_MIX = {'vm_metrics': 5, 'host_metrics': 1, 'vm_rename': 2, 'vm_power': 1, 'vdi_rename': 1}
+
+
+def parse_mix(text : str) -> Dict[str, float]:
+    '''
+    "vm_metrics=5,vm_power=1" -> {"vm_metrics": 5.0, "vm_power": 1.0}
+    '''
+    mix = {}
+    for item in filter(None, text.split(',')):
+        name, _, weight = item.partition('=')
+        if name not in LOAD_KINDS:
+            raise ValueError(f"Unknown load kind: {name}. Choose from: {', '.join(LOAD_KINDS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class LoadGenerator:
+    '''
+    Changes random objects at a given rate (changes per second) with kinds of changes chosen by weights in mix
+    '''
+    def __init__(self, simulator : XAPISimulator, rate : float, mix : Mapping[str, float] = None, seed=None):
+        self.simulator = simulator
+        self.rate = rate
+        self.mix = dict(mix or DEFAULT_MIX)
+        self.changes = 0
+        self._rng = random.Random(seed)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='xapisim-load', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def step(self):
+        vms = [ref for ref, record in self.simulator.objects['VM'].items() if not record['is_a_template']]
+        if not vms:
+            return
+        kind = self._rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        LOAD_KINDS[kind](self.simulator, self._rng, vms)
+        self.changes += 1
+
+    def _run(self):
+        interval = 1.0 / self.rate
+        next_time = time.monotonic()
+        while not self._stop.is_set():
+            self.step()
+            next_time += interval
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                self._stop.wait(delay)
+
+
+class XAPIServer(ThreadingMixIn, SimpleXMLRPCServer):
+    '''
+    XML-RPC front end of XAPISimulator. Responses are wrapped the way XAPI does it: {"Status": "Success", "Value": ...}
+    '''
+    daemon_threads = True
+
+    def __init__(self, simulator : XAPISimulator, host='127.0.0.1', port=0):
+        super().__init__((host, port), allow_none=True, logRequests=False)
+        self.simulator = simulator
+        self.register_instance(self)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _dispatch(self, method, params):
+        try:
+            if method.startswith('session.login') or method.startswith('session.slave_local'):
+                return {'Status': 'Success', 'Value': self.simulator.login(*params)}
+            session, *params = params
+            if session not in self.simulator.sessions:
+                return {'Status': 'Failure', 'ErrorDescription': ['SESSION_INVALID', str(session)]}
+            return {'Status': 'Success', 'Value': self.simulator.call(method, tuple(params))}
+        except Failure as f:
+            return {'Status': 'Failure', 'ErrorDescription': f.details}
+        except (TypeError, ValueError, IndexError) as e:
+            return {'Status': 'Failure', 'ErrorDescription': ['MESSAGE_PARAMETER_COUNT_MISMATCH', method, str(e)]}
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name='xapisim', daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description='XAPI simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--hosts', type=int, default=2)
+    parser.add_argument('--srs', type=int, default=2)
+    parser.add_argument('--networks', type=int, default=2)
+    parser.add_argument('--templates', type=int, default=4)
+    parser.add_argument('--vms', type=int, default=100)
+    parser.add_argument('--disks-per-vm', type=int, default=1)
+    parser.add_argument('--running', type=float, default=0.5, help='Fraction of running VMs')
+    parser.add_argument('--event-rate', type=float, default=0, help='Object changes per second, 0 - none')
+    parser.add_argument('--mix', default='', help=f"Weights of changes, e.g. vm_metrics=5,vm_power=1. Kinds: {', '.join(LOAD_KINDS)}")
+    parser.add_argument('--task-duration', type=float, default=0.5, help='Seconds an Async task stays pending')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    simulator = XAPISimulator(task_duration=args.task_duration)
+    refs = populate(simulator, hosts=args.hosts, srs=args.srs, networks=args.networks, templates=args.templates,
+                    vms=args.vms, disks_per_vm=args.disks_per_vm, running=args.running, seed=args.seed)
+    server = XAPIServer(simulator, args.host, args.port)
+    print(f"Simulated pool: {', '.join(f'{len(items)} {name}s' for name, items in refs.items())}")
+    print(f"Serving XAPI on {server.url}")
+    if args.event_rate:
+        LoadGenerator(simulator, args.event_rate, parse_mix(args.mix) or None, seed=args.seed).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ import queue
 
 from tornado.options import options as opts
 
+from metrics import XEN_ADAPTERS_CREATED, XEN_ADAPTERS_IDLE
 from xentools.xenadapter import XenAdapter
 from singleton import Singleton
 
@@ -10,12 +11,15 @@ class XenAdapterPool(metaclass=Singleton):
     def __init__(self):
         self._xens = queue.Queue()
         self._asyncio_xens = asyncio.Queue()
+        XEN_ADAPTERS_IDLE.labels('sync').set_function(self._xens.qsize)
+        XEN_ADAPTERS_IDLE.labels('asyncio').set_function(self._asyncio_xens.qsize)
 
     def get(self):
         if not self._xens.empty():
            return self._xens.get()
         else:
             xen = XenAdapter({**opts.group_dict('xenadapter'), **opts.group_dict('rethinkdb')}, nosingleton=True)
+            XEN_ADAPTERS_CREATED.labels('sync').inc()
             xen.log.debug("Getting new XenAdapter from XenAdapterPool: Empty queue!")
             return xen
 
@@ -28,6 +32,7 @@ class XenAdapterPool(metaclass=Singleton):
             return await self._asyncio_xens.get()
         else:
             xen = XenAdapter({**opts.group_dict('xenadapter'), **opts.group_dict('rethinkdb')}, nosingleton=True)
+            XEN_ADAPTERS_CREATED.labels('asyncio').inc()
             xen.log.debug("Getting new XenAdapter from XenAdapterPool (for AsyncIO): Empty queue!")
             return xen
 
@@ -0,0 +1,180 @@
+import asyncio
+import os
+import struct
+import unittest
+from unittest.mock import patch
+
+from handlers.rest.consolebroker import ConsoleViewer, ConsoleSession
+from handlers.rest.rfb import ServerInit, ServerHandshake, ServerMessageSplitter, ClientMessageSplitter, \
+    BROKER_PIXEL_FORMAT, RFB_VERSION_3_8, ENCODING_RAW, ENCODING_HEXTILE, ENCODING_DESKTOP_SIZE, client_handshake
+
+
+def framebuffer_update(*rects):
+    return struct.pack('!BxH', 0, len(rects)) + b''.join(rects)
+
+
+def rect(width, height, encoding, payload=b''):
+    return struct.pack('!HHHHi', 0, 0, width, height, encoding) + payload
+
+
+def hextile_rect():
+    # 32x16: one raw tile and one tile with background and two uncoloured subrects
+    raw_tile = b'\x01' + b'\x00' * 16 * 16 * 4
+    subrects_tile = b'\x0a' + b'\xff' * 4 + b'\x02' + b'\x00' * 4
+    return rect(32, 16, ENCODING_HEXTILE, raw_tile + subrects_tile)
+
+
+class FakeWriter:
+    def __init__(self):
+        self.data = b''
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class RFBTest(unittest.TestCase):
+    def test_server_splitter(self):
+        bell = b'\x02'
+        cut_text = struct.pack('!B3xI', 3, 5) + b'hello'
+        raw = framebuffer_update(rect(2, 2, ENCODING_RAW, b'\x00' * 16), hextile_rect())
+        stream = raw + bell + cut_text
+
+        for chunk_size in (1, 7, len(stream)):
+            splitter = ServerMessageSplitter(4)
+            boundaries = []
+            for offset in range(0, len(stream), chunk_size):
+                boundaries.extend((offset + position, message_type)
+                                  for position, message_type in splitter.feed(stream[offset:offset + chunk_size]))
+            self.assertEqual([(len(raw), 0), (len(raw) + 1, 2), (len(stream), 3)], boundaries)
+            self.assertTrue(splitter.at_boundary)
+
+        splitter = ServerMessageSplitter(4, (640, 480))
+        splitter.feed(framebuffer_update(rect(800, 600, ENCODING_DESKTOP_SIZE))[:-2])
+        self.assertFalse(splitter.at_boundary)
+        splitter.feed(framebuffer_update(rect(800, 600, ENCODING_DESKTOP_SIZE))[-2:])
+        self.assertEqual((800, 600), splitter.desktop_size)
+
+    def test_client_splitter(self):
+        key = struct.pack('!BBxxI', 4, 1, 0x61)
+        encodings = struct.pack('!BxH2i', 2, 2, 5, 0)
+        splitter = ClientMessageSplitter()
+        self.assertEqual([key], splitter.feed(key + encodings[:3]))
+        self.assertEqual([encodings], splitter.feed(encodings[3:]))
+
+    def test_server_handshake(self):
+        server_init = ServerInit(640, 480, BROKER_PIXEL_FORMAT, b'vm')
+        handshake = ServerHandshake(server_init)
+        self.assertEqual(b'\x01\x01', handshake.feed(RFB_VERSION_3_8))
+        self.assertEqual(b'\x00\x00\x00\x00', handshake.feed(b'\x01'))
+        self.assertEqual(server_init.pack(), handshake.feed(b'\x01\x04'))
+        self.assertTrue(handshake.done)
+        self.assertEqual(b'\x04', handshake.leftover)
+
+    def test_client_handshake(self):
+        loop = asyncio.new_event_loop()
+        reader = asyncio.StreamReader(loop=loop)
+        reader.feed_data(b'RFB 003.003\n' + struct.pack('!I', 1) + struct.pack('!HH', 1024, 768) + b'\x00' * 16 +
+                         struct.pack('!I', 2) + b'vm')
+        writer = FakeWriter()
+        try:
+            server_init = loop.run_until_complete(client_handshake(reader, writer))
+        finally:
+            loop.close()
+        self.assertEqual((1024, 768, b'vm'), (server_init.width, server_init.height, server_init.name))
+        self.assertTrue(writer.data.startswith(b'RFB 003.003\n\x01\x00'))
+
+
+@patch.dict(os.environ, {'DOCKER': '1'})
+class ConsoleSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.viewers = []
+
+    def tearDown(self):
+        for viewer in self.viewers:
+            viewer.close()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+    def join(self, session, view_only=False):
+        received = []
+
+        async def send(data):
+            received.append(data)
+
+        viewer = ConsoleViewer(send, lambda: None, view_only=view_only)
+        self.viewers.append(viewer)
+        session.attach(viewer)
+        for message in (RFB_VERSION_3_8, b'\x01', b'\x01'):
+            self.loop.run_until_complete(session.viewer_message(viewer, message))
+        return viewer, received
+
+    def test_fan_out(self):
+        async def run():
+            reader = asyncio.StreamReader()
+            writer = FakeWriter()
+            session = ConsoleSession('console', reader, writer, ServerInit(32, 16, BROKER_PIXEL_FORMAT, b'vm'))
+            return reader, writer, session
+
+        reader, writer, session = self.loop.run_until_complete(run())
+        controller, controller_received = self.join(session)
+        viewer, viewer_received = self.join(session, view_only=True)
+        self.assertIs(controller, session.controller)
+
+        update = framebuffer_update(hextile_rect())
+        reader.feed_data(update)
+        reader.feed_data(update[:10])
+
+        async def read_some():
+            task = asyncio.ensure_future(session.run())
+            await asyncio.sleep(0.01)
+            return task
+
+        task = self.loop.run_until_complete(read_some())
+        late, late_received = self.join(session, view_only=True)
+        self.assertIn(late, session.pending)
+
+        reader.feed_data(update[10:] + b'\x02')
+        reader.feed_eof()
+        self.loop.run_until_complete(task)
+
+        self.assertEqual(update * 2 + b'\x02', b''.join(controller_received)[-len(update) * 2 - 1:])
+        self.assertEqual(b''.join(controller_received), b''.join(viewer_received))
+        # Late viewer gets its handshake and then the stream from the next message boundary
+        self.assertTrue(b''.join(late_received).endswith(b'vm\x02'))
+        self.assertTrue(writer.closed)
+
+    def test_input_from_controller_only(self):
+        writer = FakeWriter()
+        session = ConsoleSession('console', asyncio.StreamReader(loop=self.loop), writer,
+                                 ServerInit(32, 16, BROKER_PIXEL_FORMAT, b'vm'))
+        controller, _ = self.join(session)
+        viewer, _ = self.join(session, view_only=True)
+        writer.data = b''
+
+        key = struct.pack('!BBxxI', 4, 1, 0x61)
+        pointer = struct.pack('!BBHH', 5, 0, 1, 1)
+        self.loop.run_until_complete(session.viewer_message(viewer, key + pointer))
+        self.assertEqual(b'', writer.data)
+        self.loop.run_until_complete(session.viewer_message(controller, key))
+        self.assertEqual(key, writer.data)
+
+        # Incremental update requests are not forwarded while another one is outstanding
+        writer.data = b''
+        request = struct.pack('!BBHHHH', 3, 1, 0, 0, 32, 16)
+        self.loop.run_until_complete(session.viewer_message(viewer, request))
+        self.assertEqual(b'', writer.data)
+
+        session.detach(controller)
+        self.assertIsNone(session.controller)
+        session.detach(viewer)
+        self.assertTrue(session.finished)
@@ -0,0 +1,73 @@
+import asyncio
+import unittest
+
+from handlers.rest.consoleproxy import ConsoleProxy, ConsoleConnectError, open_upstream
+
+
+class FakeWriter:
+    def __init__(self):
+        self.data = b''
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class ConsoleProxyTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_large_reads_are_coalesced(self):
+        async def run():
+            reader = asyncio.StreamReader(limit=1024 * 1024)
+            for _ in range(1000):
+                reader.feed_data(b'x' * 1000)
+            reader.feed_eof()
+
+            frames = []
+
+            async def send(data):
+                frames.append(data)
+
+            proxy = ConsoleProxy(reader, FakeWriter(), send, min_read_size=4096, max_read_size=65536)
+            await proxy.server_to_client()
+            return proxy, frames
+
+        proxy, frames = self.loop.run_until_complete(run())
+        self.assertEqual(1000 * 1000, sum(len(frame) for frame in frames))
+        self.assertEqual(65536, max(len(frame) for frame in frames))
+        self.assertLess(len(frames), 30)
+        self.assertEqual(len(frames), proxy.stats.frames_down)
+
+    def test_client_to_server(self):
+        writer = FakeWriter()
+        proxy = ConsoleProxy(asyncio.StreamReader(), writer, None)
+        self.loop.run_until_complete(proxy.client_to_server(b'key'))
+        self.assertEqual(b'key', writer.data)
+        self.assertEqual(3, proxy.stats.bytes_up)
+
+    def test_connect_refused(self):
+        async def run():
+            async def handle(reader, writer):
+                await reader.readuntil(b'\r\n\r\n')
+                writer.write(b'HTTP/1.1 404 Not Found\r\n\r\n')
+                writer.close()
+
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                await open_upstream(f'http://127.0.0.1:{port}/console?ref=OpaqueRef:1', b'token', 'localhost')
+            finally:
+                server.close()
+
+        with self.assertRaises(ConsoleConnectError):
+            self.loop.run_until_complete(run())
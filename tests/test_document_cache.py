@@ -0,0 +1,69 @@
+import unittest
+
+import graphene
+
+from tornadoql.document_cache import DocumentCache, PersistedQueryNotFound, PersistedQueryHashMismatch
+
+
+class Query(graphene.ObjectType):
+    hello = graphene.String(name=graphene.String(default_value="world"))
+
+    def resolve_hello(root, info, name):
+        return f"Hello {name}"
+
+
+schema = graphene.Schema(query=Query)
+
+
+class DocumentCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = DocumentCache(max_size=2)
+
+    def test_cache_hit(self):
+        first = self.cache.document_from_string(schema, '{ hello }')
+        second = self.cache.document_from_string(schema, '{ hello }')
+        self.assertIs(first, second)
+        self.assertEqual(1, self.cache.hits)
+        self.assertEqual(1, self.cache.misses)
+
+    def test_execute(self):
+        result = schema.execute('{ hello(name: "cache") }', backend=self.cache)
+        self.assertFalse(result.errors)
+        self.assertEqual({'hello': 'Hello cache'}, result.data)
+        result = schema.execute('{ hello(name: "cache") }', backend=self.cache)
+        self.assertEqual({'hello': 'Hello cache'}, result.data)
+        self.assertEqual(1, self.cache.hits)
+
+    def test_validation_errors_are_cached(self):
+        for _ in range(2):
+            result = schema.execute('{ goodbye }', backend=self.cache)
+            self.assertTrue(result.invalid)
+            self.assertEqual(1, len(result.errors))
+        self.assertEqual(1, self.cache.misses)
+
+    def test_lru_eviction(self):
+        self.cache.document_from_string(schema, '{ a: hello }')
+        self.cache.document_from_string(schema, '{ b: hello }')
+        self.cache.document_from_string(schema, '{ a: hello }')  # a is now most recently used
+        self.cache.document_from_string(schema, '{ c: hello }')
+        self.assertEqual(2, len(self.cache))
+        self.assertIsNotNone(self.cache.get_query(DocumentCache.query_hash('{ a: hello }')))
+        self.assertIsNone(self.cache.get_query(DocumentCache.query_hash('{ b: hello }')))
+
+    def test_persisted_query(self):
+        query = '{ hello }'
+        extensions = {'persistedQuery': {'version': 1, 'sha256Hash': DocumentCache.query_hash(query)}}
+        with self.assertRaises(PersistedQueryNotFound):
+            self.cache.resolve_query(None, extensions)
+
+        self.assertEqual(query, self.cache.resolve_query(query, extensions))
+        self.cache.document_from_string(schema, query)
+        self.assertEqual(query, self.cache.resolve_query(None, extensions))
+
+    def test_persisted_query_hash_mismatch(self):
+        extensions = {'persistedQuery': {'version': 1, 'sha256Hash': DocumentCache.query_hash('{ hello }')}}
+        with self.assertRaises(PersistedQueryHashMismatch):
+            self.cache.resolve_query('{ other: hello }', extensions)
+
+    def test_no_extensions(self):
+        self.assertEqual('{ hello }', self.cache.resolve_query('{ hello }', None))
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from benchmarks.event_ingestion import IngestionStats, load_batches, record
+from benchmarks.stats import summarize
+from xentools.xapisim import XAPIServer, XAPISimulator, populate
+
+
+@patch.dict(os.environ, {'DOCKER': '1'})
+class EventIngestionTest(unittest.TestCase):
+    def test_record_and_replay(self):
+        simulator = XAPISimulator()
+        populate(simulator, hosts=1, vms=3, templates=1, seed=1)
+        server = XAPIServer(simulator)
+        server.start()
+        try:
+            with tempfile.NamedTemporaryFile(suffix='.jsonl') as file:
+                result = record(server.url, 'root', 'password', 0, file.name)
+                batch, = load_batches(file.name)
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual((1, len(batch)), (result['batches'], result['events']))
+
+        replayed = XAPISimulator()
+        for event in batch:
+            replayed.apply_event(event)
+        for cls in ('VM', 'VM_metrics', 'host', 'SR', 'VDI', 'VBD'):
+            self.assertEqual(simulator.objects[cls], replayed.objects[cls], cls)
+
+        vm = next(iter(replayed.objects['VM']))
+        token = replayed.token
+        replayed.apply_event({'class': 'vm', 'operation': 'del', 'ref': vm, 'snapshot': None})
+        self.assertNotIn(vm, replayed.objects['VM'])
+        event, = replayed.event_from(['vm'], token, 0)['events']
+        self.assertEqual(('del', vm), (event['operation'], event['ref']))
+
+    def test_stats(self):
+        self.assertEqual({'p50': 3000.0, 'p90': 5000.0, 'p99': 5000.0, 'mean': 3000.0, 'max': 5000.0},
+                         summarize([5, 1, 3, 2, 4]))
+        self.assertIsNone(summarize([]))
+
+        class Insert:
+            statement = 'insert'
+
+        stats = IngestionStats()
+        stats.local.event_class = 'vm'
+        stats.on_query(Insert())
+        stats.on_query(object())
+        stats.local.event_class = None
+        stats.on_query(Insert())
+        stats.on_processed('vm', 0, 0)
+        stats.on_processed('vm', 0, 0)
+
+        result = stats.as_dict()
+        self.assertEqual(2, result['events'])
+        self.assertEqual((1.0, 0.5), (result['db_queries_per_event'], result['db_writes_per_event']))
+        self.assertEqual(2, result['classes']['vm']['events'])
@@ -0,0 +1,45 @@
+import json
+import os
+import unittest
+from unittest.mock import patch
+
+import constants.auth
+from benchmarks.graphql_latency import LagProbes, QueryStats, assign_owners
+from xentools.xapisim import XAPISimulator, populate
+
+
+@patch.dict(os.environ, {'DOCKER': '1'})
+class GraphQLLatencyTest(unittest.TestCase):
+    @patch.object(constants.auth, 'name', 'DummyAuth')
+    def test_assign_owners(self):
+        simulator = XAPISimulator()
+        refs = populate(simulator, hosts=1, vms=3, templates=1, disks_per_vm=2, seed=1)
+        owners = assign_owners(simulator, refs['VM'], ['alice', 'bob'])
+        self.assertEqual(['users/alice', 'users/bob', 'users/alice'], [owners[vm] for vm in refs['VM']])
+
+        vm = simulator.objects['VM'][refs['VM'][1]]
+        access = json.loads(vm['other_config']['vmemperor'])['access']['DummyAuth']
+        self.assertEqual(['users/bob'], list(access))
+        for vbd in vm['VBDs']:
+            vdi = simulator.objects['VDI'][simulator.objects['VBD'][vbd]['VDI']]
+            self.assertEqual(['users/bob'], list(json.loads(vdi['other_config']['vmemperor'])['access']['DummyAuth']))
+        self.assertEqual({}, assign_owners(simulator, refs['VM'], []))
+
+    def test_stats(self):
+        probes = LagProbes()
+        probes.send('probe 0', 'OpaqueRef:1', 2)
+        self.assertFalse(probes.done)
+        probes.on_update(0, {'nameLabel': 'probe 0'})
+        probes.on_update(0, {'nameLabel': 'probe 0'})
+        probes.on_update(1, {'nameLabel': 'other'})
+        probes.on_update(1, None)
+        self.assertFalse(probes.done)
+        probes.on_update(1, {'nameLabel': 'probe 0'})
+        self.assertTrue(probes.done)
+        self.assertEqual((1, 2, 2), tuple(probes.as_dict()[key] for key in ('probes', 'expected', 'received')))
+
+        stats = QueryStats()
+        stats.on_response('vm', 'user', 0.002, True)
+        stats.on_response('vm', 'user', 0.004, False)
+        result = stats.as_dict()['vm']['user']
+        self.assertEqual((2, 1, 4.0), (result['requests'], result['errors'], result['ms']['max']))
@@ -0,0 +1,46 @@
+import unittest
+
+import graphene
+
+from handlers.graphql.utils.loaders import BatchLoader
+
+
+class Item(graphene.ObjectType):
+    id = graphene.Int()
+    double = graphene.Int()
+
+    def resolve_double(root, info):
+        return info.context['loader'].load(root['id'])
+
+
+class Query(graphene.ObjectType):
+    items = graphene.List(Item)
+
+    def resolve_items(root, info):
+        return [{'id': id} for id in (1, 2, 3, 2)]
+
+
+schema = graphene.Schema(query=Query)
+
+
+class BatchLoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+
+        def batch_function(keys):
+            self.batches.append(list(keys))
+            return [key * 2 for key in keys]
+
+        self.loader = BatchLoader(batch_function)
+
+    def test_one_batch_per_tick(self):
+        result = schema.execute('{ items { id double } }', context_value={'loader': self.loader})
+        self.assertFalse(result.errors)
+        self.assertEqual([2, 4, 6, 4], [item['double'] for item in result.data['items']])
+        self.assertEqual([[1, 2, 3]], self.batches)
+
+    def test_cache(self):
+        for _ in range(2):
+            result = schema.execute('{ items { double } }', context_value={'loader': self.loader})
+            self.assertFalse(result.errors)
+        self.assertEqual([[1, 2, 3]], self.batches)
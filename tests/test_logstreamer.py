@@ -0,0 +1,85 @@
+import asyncio
+import pathlib
+import tempfile
+import unittest
+
+from handlers.rest.logstreamer import LogStreamer
+from utils.inotify import Inotify, IN_MODIFY, IN_CREATE
+
+
+class LogStreamerTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name) / 'stdout'
+
+    def tearDown(self):
+        self.directory.cleanup()
+        self.loop.close()
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+    def append(self, data):
+        with open(self.path, 'ab') as file:
+            file.write(data)
+
+    def follow(self, streamer, offset=0):
+        received = []
+        tailer = self.loop.run_until_complete(
+            streamer.subscribe(self.path, lambda offset, data: received.append((offset, data)), offset))
+        return tailer, received
+
+    def wait(self, condition, timeout=2.0):
+        async def run():
+            deadline = self.loop.time() + timeout
+            while not condition() and self.loop.time() < deadline:
+                await asyncio.sleep(0.01)
+
+        self.loop.run_until_complete(run())
+
+    def check_streaming(self, streamer):
+        first, first_received = self.follow(streamer)
+        self.append(b'one\ntw')
+        self.wait(lambda: first_received)
+        self.assertEqual([(0, b'one\n')], first_received)
+
+        second, second_received = self.follow(streamer, offset=4)
+        self.assertIs(first, second)
+        self.assertEqual([], second_received)
+
+        self.append(b'o\n')
+        self.wait(lambda: second_received)
+        self.assertEqual([(0, b'one\n'), (4, b'two\n')], first_received)
+        self.assertEqual([(4, b'two\n')], second_received)
+
+        late, late_received = self.follow(streamer, offset=4)
+        self.assertEqual([(4, b'two\n')], late_received)
+
+        self.assertEqual(3, len(first.subscribers))
+        for subscriber in list(first.subscribers):
+            streamer.unsubscribe(first, subscriber)
+        self.assertEqual({}, streamer.tailers)
+        self.assertIsNone(first.file)
+
+    def test_inotify(self):
+        streamer = LogStreamer()
+        streamer._start_watching()
+        self.assertIsNotNone(streamer._inotify)
+        self.check_streaming(streamer)
+        self.assertIsNone(streamer._inotify)
+
+    def test_polling(self):
+        streamer = LogStreamer(poll_interval=0.01, use_inotify=False)
+        self.check_streaming(streamer)
+        self.assertIsNone(streamer._poll_task)
+
+    def test_inotify_events(self):
+        inotify = Inotify()
+        try:
+            wd = inotify.add_watch(self.directory.name, IN_MODIFY | IN_CREATE)
+            self.append(b'line\n')
+            events = inotify.read_events()
+        finally:
+            inotify.close()
+        self.assertEqual([(wd, 'stdout')], sorted({(event.wd, event.name) for event in events}))
+        self.assertTrue(any(event.mask & IN_CREATE for event in events))
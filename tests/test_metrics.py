@@ -0,0 +1,63 @@
+import asyncio
+import os
+import unittest
+from unittest.mock import patch
+
+import rethinkdb.ast
+from metrics import Counter, Gauge, Histogram, Registry, timed_connection, RETHINKDB_QUERY_SECONDS
+
+
+class Connection:
+    def _start(self, term, **global_optargs):
+        return term
+
+
+class AsyncConnection:
+    async def _start(self, term, **global_optargs):
+        return term
+
+
+def run_query(connection, term):
+    return connection._start(term)
+
+
+@patch.dict(os.environ, {'DOCKER': '1'})
+class MetricsTest(unittest.TestCase):
+    def test_render(self):
+        registry = Registry()
+        counter = Counter('requests_total', "Requests", ['path'], registry=registry)
+        gauge = Gauge('queue_depth', "Queue depth", registry=registry)
+        histogram = Histogram('latency_seconds', "Latency", buckets=(0.1, 1.0), registry=registry)
+        counter.labels('/a"b').inc()
+        counter.labels('/a"b').inc(2)
+        gauge.set_function(lambda: 7)
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        with self.assertRaises(ValueError):
+            counter.labels()
+        with self.assertRaises(ValueError):
+            Gauge('queue_depth', "Again", registry=registry)
+
+        self.assertEqual('''# HELP requests_total Requests
+# TYPE requests_total counter
+requests_total{path="/a\\"b"} 3.0
+# HELP queue_depth Queue depth
+# TYPE queue_depth gauge
+queue_depth 7.0
+# HELP latency_seconds Latency
+# TYPE latency_seconds histogram
+latency_seconds_bucket{le="0.1"} 1.0
+latency_seconds_bucket{le="1.0"} 2.0
+latency_seconds_bucket{le="+Inf"} 3.0
+latency_seconds_sum 5.55
+latency_seconds_count 3.0
+''', registry.render())
+
+    def test_timed_connection(self):
+        self.assertIs(timed_connection(Connection), timed_connection(Connection))
+        term = rethinkdb.ast.Table('vms')
+        self.assertIs(term, run_query(timed_connection(Connection)(), term))
+        self.assertIs(term, asyncio.get_event_loop().run_until_complete(run_query(timed_connection(AsyncConnection)(), term)))
+        samples = {tuple(labels): value for name, labels, value in RETHINKDB_QUERY_SECONDS.samples() if name.endswith('_count')}
+        self.assertEqual(2, samples[(('site', f'{__name__}.test_timed_connection'),)])
@@ -0,0 +1,125 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+
+from serflag import SerFlag
+
+from handlers.graphql.mutation_utils.mutationmethod import MutationHelper, MutationMethod
+from xenadapter.task import userids_with_action
+
+
+class Actions(SerFlag):
+    rename = 1
+    change_domain_type = 2
+    ALL = rename | change_domain_type
+
+
+class Mutable:
+    ref = 'OpaqueRef:1'
+
+    def __init__(self):
+        self.values = {'name_label': 'old', 'domain_type': 'hvm'}
+
+    def check_access(self, auth, action):
+        return action != Actions.change_domain_type
+
+    def __getattr__(self, name):
+        if name.startswith('get_'):
+            return lambda: self.values[name[4:]]
+        if name.startswith('set_'):
+            def setter(value):
+                if value == 'broken':
+                    raise ValueError("Invalid value")
+                self.values[name[4:]] = value
+            return setter
+        raise AttributeError(name)
+
+
+class SharedMutable(Mutable):
+    '''
+    Re-created with its own XenAdapter by concurrent setters, all instances share values
+    '''
+    values = {}
+    xens = []
+
+    def __init__(self, xen=None, ref=None):
+        self.xens.append(xen)
+
+
+class MutationHelperTest(unittest.TestCase):
+    def setUp(self):
+        self.auth = MagicMock()
+        self.auth.is_admin.return_value = False
+        self.auth.get_id.return_value = 'john'
+        self.inserted = []
+
+    def perform(self, mutable, mutations, **changes):
+        helper = MutationHelper(mutations, SimpleNamespace(user_authenticator=self.auth), mutable)
+        changes = SimpleNamespace(**{'name_label': None, 'name_description': None, 'domain_type': None, **changes})
+        with patch('handlers.graphql.mutation_utils.mutationmethod.get_user_actions',
+                   return_value={'john': ['rename'], 'jane': ['ALL'], 'jim': ['launch']}) as user_actions, \
+                patch.object(MutationHelper, 'insert_tasks', side_effect=self.inserted.append):
+            result = helper.perform_mutations(changes)
+        return result, user_actions
+
+    def test_bulk_insert(self):
+        mutable = Mutable()
+        mutations = [MutationMethod(func="name_label", access_action=Actions.rename),
+                     MutationMethod(func="name_description", access_action=Actions.rename)]
+        (granted, reason), user_actions = self.perform(mutable, mutations, name_label='new')
+
+        self.assertTrue(granted)
+        self.assertEqual('new', mutable.values['name_label'])
+        self.assertEqual(1, len(self.inserted))
+        self.assertEqual(1, user_actions.call_count)
+        task, = self.inserted[0]
+        self.assertEqual('success', task['status'])
+        self.assertEqual({'john': ['remove'], 'jane': ['remove']}, task['access'])
+        self.assertEqual('users/john', task['who'])
+        self.assertLessEqual(task['created'], task['finished'])
+        self.assertNotIn('call', task)
+
+    def test_failures(self):
+        mutable = Mutable()
+        mutations = [MutationMethod(func="name_label", access_action=Actions.rename),
+                     MutationMethod(func="domain_type", access_action=Actions.change_domain_type)]
+        (granted, reason), _ = self.perform(mutable, mutations, name_label='new', domain_type='pv')
+
+        self.assertFalse(granted)
+        self.assertIn('Access denied', reason)
+        self.assertEqual('old', mutable.values['name_label'])
+        task, = self.inserted[0]
+        self.assertEqual('failure', task['status'])
+        self.assertEqual([reason], task['error_info'])
+
+        self.inserted.clear()
+        (granted, reason), _ = self.perform(mutable, mutations[:1], name_label='broken')
+        self.assertTrue(granted)
+        task, = self.inserted[0]
+        self.assertEqual('failure', task['status'])
+        self.assertEqual(['Invalid value'], task['error_info'])
+
+    def test_concurrent(self):
+        SharedMutable.values.update({'name_label': 'old', 'domain_type': 'hvm'})
+        SharedMutable.xens.clear()
+        mutable = SharedMutable()
+        mutations = [MutationMethod(func="name_label", access_action=Actions.rename),
+                     MutationMethod(func="domain_type", access_action=Actions.rename, concurrent=True)]
+        with patch('handlers.graphql.mutation_utils.mutationmethod.XenAdapterPool') as pool, \
+                patch('handlers.graphql.mutation_utils.mutationmethod.ReDBConnection'):
+            (granted, reason), _ = self.perform(mutable, mutations, name_label='new', domain_type='broken')
+
+        self.assertTrue(granted)
+        self.assertEqual('new', SharedMutable.values['name_label'])
+        self.assertEqual('hvm', SharedMutable.values['domain_type'])
+        self.assertEqual([None, pool.return_value.get.return_value], SharedMutable.xens)
+        pool.return_value.unget.assert_called_once_with(pool.return_value.get.return_value)
+        tasks = self.inserted[0]
+        self.assertEqual(['success', 'failure'], [task['status'] for task in tasks])
+        self.assertEqual(['Invalid value'], tasks[1]['error_info'])
+        self.assertTrue(all('item' not in task and 'call' not in task for task in tasks))
+
+    def test_userids_with_action(self):
+        user_actions = {'john': ['rename'], 'jane': ['ALL'], 'jim': ['launch']}
+        self.assertEqual(['john', 'jane'], userids_with_action(user_actions, 'rename'))
+        self.assertEqual(['jane', 'jim'], userids_with_action(user_actions, 'launch'))
@@ -0,0 +1,24 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from xenadapter.vdi import VDI
+
+
+@patch('constants.auth.name', 'ldap')
+class OtherConfigTest(unittest.TestCase):
+    def test_actions_and_owner(self):
+        other_config = {'key': 'value', 'vmemperor': json.dumps({'access': {'ldap': {'users/eva': ['plug']}}})}
+
+        updated = VDI.other_config_with_actions(other_config, VDI.Actions.ALL, 'users/john')
+        updated = VDI.other_config_with_actions(updated, VDI.Actions.rename, 'users/eva')
+        updated = VDI.other_config_with_main_owner(updated, 'users/john')
+
+        self.assertEqual({'access': {'ldap': {'users/eva': (VDI.Actions.plug | VDI.Actions.rename).serialize(),
+                                              'users/john': ['ALL']}}},
+                         json.loads(updated['vmemperor']))
+        self.assertEqual('users/john', updated[VDI.MAIN_OWNER_KEY])
+        self.assertEqual('value', updated['key'])
+        self.assertNotIn(VDI.MAIN_OWNER_KEY, other_config)
+
+        self.assertNotIn(VDI.MAIN_OWNER_KEY, VDI.other_config_with_main_owner(updated, None))
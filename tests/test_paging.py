@@ -0,0 +1,74 @@
+import unittest
+from types import SimpleNamespace
+
+from rethinkdb import RethinkDB
+
+from handlers.graphql.utils.paging import ListQuery, sort_key
+
+r = RethinkDB()
+re = SimpleNamespace(r=r, db=r.db('test'))
+
+
+class FakeVM:
+    db_table_name = 'vms'
+    SORT_FIELDS = ('name_label', 'power_state')
+
+
+class ListQueryTest(unittest.TestCase):
+    def compile(self, query_string):
+        return eval(query_string, {'re': re})
+
+    def test_empty(self):
+        list_query = ListQuery.from_arguments(FakeVM, {})
+        self.assertFalse(list_query)
+        self.assertEqual('', list_query.table_string())
+        self.assertEqual('', list_query.array_string())
+
+    def test_first_page(self):
+        list_query = ListQuery(FakeVM, first=10, order_by='name_label')
+        self.assertEqual(".order_by(index='sort_name_label').limit(10)", list_query.table_string())
+        self.compile("re.db.table('vms')" + list_query.table_string())
+        self.compile("re.r.expr([])" + list_query.array_string())
+
+    def test_after(self):
+        list_query = ListQuery(FakeVM, first=10, after='OpaqueRef:1', order_by='name_label', desc=True)
+        table_string = list_query.table_string()
+        self.assertIn(".between(re.r.minval, re.db.table('vms').get('OpaqueRef:1')"
+                      ".do(lambda after: re.r.branch(after.eq(None), re.r.maxval, [after['name_label'].default(''), after['ref']])), "
+                      "right_bound='open', index='sort_name_label')", table_string)
+        self.assertIn("re.r.desc('sort_name_label')", table_string)
+        self.compile("re.db.table('vms')" + table_string)
+        self.compile("re.r.expr([])" + list_query.array_string())
+
+    def test_deleted_after(self):
+        # The key of a removed "after" item falls back to the start of the list in both directions
+        list_query = ListQuery(FakeVM, first=10, after='OpaqueRef:1', order_by='name_label')
+        table_string = list_query.table_string()
+        self.assertIn("re.r.branch(after.eq(None), re.r.minval, ", table_string)
+        self.assertIn(", re.r.maxval, left_bound='open', index='sort_name_label')", table_string)
+        self.compile("re.db.table('vms')" + table_string)
+        array_string = list_query.array_string()
+        self.assertIn("re.r.branch(after.eq(None), re.r.minval, ", array_string)
+        self.compile("re.r.expr([])" + array_string)
+
+    def test_unset_sort_field(self):
+        # null keys aren't indexed, so unset fields are sorted as empty strings both in indexes and in arrays
+        index_function = str(r.expr({}).do(lambda row: sort_key(row, 'main_owner')))
+        self.assertRegex(index_function, r"\[(var_\d+)\['main_owner'\]\.default\(''\), \1\['ref'\]\]")
+        list_query = ListQuery(FakeVM, order_by='power_state')
+        self.assertEqual(".order_by(lambda item: [item['power_state'].default(''), item['ref']])", list_query.array_string())
+
+    def test_after_by_ref(self):
+        list_query = ListQuery(FakeVM, first=5, after='OpaqueRef:1')
+        self.assertEqual(".between('OpaqueRef:1', re.r.maxval, left_bound='open', index='ref').order_by(index='ref').limit(5)",
+                         list_query.table_string())
+
+    def test_filter_values_are_literals(self):
+        list_query = ListQuery(FakeVM, filter={'name_label': "a') or 1 or ('", 'power_state': 'Running', 'main_owner': None})
+        self.assertEqual(2, len(list_query.filters))
+        self.compile("re.db.table('vms')" + list_query.table_string())
+        self.compile("re.r.expr([])" + list_query.array_string())
+
+    def test_unsupported_order(self):
+        with self.assertRaises(ValueError):
+            ListQuery(FakeVM, order_by='created')
@@ -0,0 +1,26 @@
+import unittest
+
+from playbookinventory import build_hosts, dynamic_inventory, static_inventory
+
+
+class PlaybookInventoryTest(unittest.TestCase):
+    def test_build_hosts(self):
+        rows = [
+            {'VM': 'OpaqueRef:1', 'device': '1', 'ipv4': '10.0.0.2', 'name_label': 'web', 'first_user': None},
+            {'VM': 'OpaqueRef:1', 'device': '0', 'ipv4': '10.0.0.1', 'name_label': 'web', 'first_user': None},
+            {'VM': 'OpaqueRef:2', 'device': '0', 'ipv4': None, 'name_label': 'db', 'first_user': 'admin'},
+            {'VM': 'OpaqueRef:2', 'device': '10', 'ipv4': '10.0.1.5', 'name_label': 'db', 'first_user': 'admin'},
+            {'VM': 'OpaqueRef:3', 'device': '0', 'ipv4': None, 'name_label': 'no-drivers', 'first_user': None},
+        ]
+        hosts, unreachable = build_hosts(['OpaqueRef:1', 'OpaqueRef:2', 'OpaqueRef:3', 'OpaqueRef:4'], rows)
+
+        self.assertEqual({
+            'web': {'ansible_user': 'root', 'ansible_host': '10.0.0.1'},
+            'db': {'ansible_user': 'admin', 'ansible_host': '10.0.1.5'},
+        }, dict(hosts))
+        self.assertEqual(['OpaqueRef:3', 'OpaqueRef:4'], unreachable)
+
+        self.assertEqual({'all': {'hosts': dict(hosts)}}, static_inventory(hosts))
+        inventory = dynamic_inventory(hosts)
+        self.assertEqual(['web', 'db'], inventory['all']['hosts'])
+        self.assertEqual('10.0.1.5', inventory['_meta']['hostvars']['db']['ansible_host'])
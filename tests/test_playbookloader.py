@@ -0,0 +1,67 @@
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from playbookloader import PlaybookLoader, PlaybookWatcher
+
+
+class PlaybookLoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.ansible_dir = Path(self.directory.name)
+        self.playbook_dir = self.ansible_dir / 'nginx'
+        (self.playbook_dir / 'group_vars').mkdir(parents=True)
+        (self.playbook_dir / 'vmemperor.conf').write_text(
+            'playbook: main.yml\n'
+            'name: Nginx\n'
+            'variables:\n'
+            '  port:\n'
+            '    type: int\n')
+        (self.playbook_dir / 'group_vars' / 'all').write_text('port: 80\n')
+        (self.playbook_dir / 'main.yml').write_text('- hosts: all\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_fingerprint(self):
+        signature = PlaybookLoader.stat_signature(self.playbook_dir)
+        content_hash = PlaybookLoader.content_hash(self.playbook_dir)
+
+        os.utime(self.playbook_dir / 'group_vars' / 'all', ns=(0, 0))
+        self.assertNotEqual(signature, PlaybookLoader.stat_signature(self.playbook_dir))
+        self.assertEqual(content_hash, PlaybookLoader.content_hash(self.playbook_dir))
+
+        (self.playbook_dir / 'group_vars' / 'all').write_text('port: 8080\n')
+        self.assertNotEqual(content_hash, PlaybookLoader.content_hash(self.playbook_dir))
+
+    @patch.dict(os.environ, {'DOCKER': '1'})
+    def test_parse(self):
+        loader = PlaybookLoader(self.playbook_dir, save=False)
+        self.assertTrue(loader.loaded)
+        self.assertEqual('nginx', loader.get_id())
+        self.assertEqual(80, loader.get_variables()['port']['value'])
+        self.assertEqual(['port'], loader.get_variables_locations()['group_vars'])
+
+        (self.playbook_dir / 'main.yml').unlink()
+        self.assertFalse(PlaybookLoader(self.playbook_dir, save=False).loaded)
+
+    def test_watcher(self):
+        watcher = PlaybookWatcher(self.ansible_dir)
+        try:
+            self.assertFalse(watcher.wait(0))
+
+            timer = threading.Timer(0.1, (self.playbook_dir / 'group_vars' / 'all').write_text, ['port: 8080\n'])
+            timer.start()
+            self.assertTrue(watcher.wait(2, debounce=0.05))
+            timer.join()
+
+            (self.ansible_dir / 'apache' / 'host_vars').mkdir(parents=True)
+            self.assertTrue(watcher.wait(2, debounce=0.05))
+            (self.ansible_dir / 'apache' / 'host_vars' / 'all').write_text('port: 80\n')
+            self.assertTrue(watcher.wait(2, debounce=0.05))
+            self.assertFalse(watcher.wait(0))
+        finally:
+            watcher.close()
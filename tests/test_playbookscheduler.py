@@ -0,0 +1,93 @@
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from customtask.customtask import CustomTask
+from playbookscheduler import PlaybookScheduler, PlaybookJob, PlaybookQueueFull, link_tree, replace_file
+from xenadapter.task import Task
+
+
+@patch.dict(os.environ, {'DOCKER': '1'})
+class PlaybookSchedulerTest(unittest.TestCase):
+    def test_priorities(self):
+        self.reports = []
+        self.scheduler = PlaybookScheduler(max_running=1, max_queued=3, nosingleton=True)
+        self.scheduler.report_positions = lambda jobs: self.reports.append({job.task_id: job.position for job in jobs})
+        started = []
+        release = threading.Event()
+        done = threading.Event()
+
+        def run(name):
+            started.append(name)
+            if name == 'first':
+                release.wait(5)
+            if name == 'normal':
+                done.set()
+
+        def job(name, priority=0):
+            return PlaybookJob(name, lambda: run(name), priority)
+
+        self.scheduler.submit(job('first'))
+        low = job('low')
+        self.scheduler.submit(low)
+        self.scheduler.submit(job('normal', 1))
+        self.scheduler.submit(job('urgent', 5))
+        self.assertEqual({'urgent': 1, 'normal': 2, 'low': 3}, self.reports[-1])
+
+        with self.assertRaises(PlaybookQueueFull):
+            self.scheduler.submit(job('overflow'))
+
+        self.assertTrue(self.scheduler.cancel(low))
+        self.assertFalse(self.scheduler.cancel(low))
+        self.scheduler.submit(job('urgent-last', 5))
+        self.assertEqual({'urgent-last': 2, 'normal': 3}, self.reports[-1])
+
+        release.set()
+        self.assertTrue(done.wait(5))
+        self.scheduler._executor.shutdown()
+        self.assertEqual(['first', 'urgent', 'urgent-last', 'normal'], started)
+        self.assertEqual(0, self.scheduler.running)
+
+    @patch('playbookscheduler.TaskStatusWriter')
+    def test_report_positions(self, writer):
+        scheduler = PlaybookScheduler(max_running=1, max_queued=3, nosingleton=True)
+        waiting, dispatched = PlaybookJob('waiting', print), PlaybookJob('dispatched', print)
+        waiting.position = 2
+        scheduler.report_positions([waiting, dispatched])
+        writer.return_value.update.assert_called_once_with({'ref': 'waiting', 'progress': -2})
+        scheduler._executor.shutdown()
+
+    @patch('customtask.customtask.TaskStatusWriter')
+    def test_cancel_started_job(self, writer):
+        task = CustomTask.__new__(CustomTask)
+        task.id = 'task-1'
+        with patch.dict(Task.CancelHandlers):
+            task.set_cancel_handler(lambda: False)
+            with self.assertRaises(ValueError):
+                Task.CancelHandlers['task-1']()
+            writer.return_value.update.assert_not_called()
+
+            task.set_cancel_handler(lambda: True)
+            Task.CancelHandlers['task-1']()
+            record, = writer.return_value.update.call_args[0]
+            self.assertEqual('cancelled', record['status'])
+
+
+class WorkspaceTest(unittest.TestCase):
+    def test_link_tree(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = Path(directory) / 'playbook'
+            (source / 'group_vars').mkdir(parents=True)
+            (source / 'group_vars' / 'all').write_text('a: 1\n')
+            (source / 'main.yml').write_text('- hosts: all\n')
+            workspace = Path(directory) / 'workspace'
+
+            link_tree(source, workspace)
+            self.assertEqual(2, os.stat(workspace / 'main.yml').st_nlink)
+            replace_file(workspace / 'group_vars' / 'all').write_text('a: 2\n')
+
+            self.assertEqual('a: 1\n', (source / 'group_vars' / 'all').read_text())
+            self.assertEqual('a: 2\n', (workspace / 'group_vars' / 'all').read_text())
@@ -0,0 +1,64 @@
+import os
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from powerdispatcher import PowerDispatcher, PowerJob
+
+
+@patch.dict(os.environ, {'DOCKER': '1'})
+class PowerDispatcherTest(unittest.TestCase):
+    def test_limits(self):
+        dispatcher = PowerDispatcher(max_per_host=1, max_per_pool=2, nosingleton=True)
+        lock = threading.Lock()
+        running = []
+        peaks = {'pool': 0, 'host': 0}
+        finished = []
+        all_finished = threading.Event()
+
+        def perform(job):
+            with lock:
+                running.append(job)
+                peaks['pool'] = max(peaks['pool'], len(running))
+                peaks['host'] = max(peaks['host'], max(sum(1 for item in running if item.host == host)
+                                                       for host in ('host-a', 'host-b')))
+            time.sleep(0.05)
+            with lock:
+                running.remove(job)
+            if job.vm_ref == 'vm-broken':
+                raise ValueError("Broken")
+            job.status = 'success'
+
+        def on_finish(job):
+            finished.append(job)
+            if len(finished) == 6:
+                all_finished.set()
+
+        jobs = [PowerJob(ref, host, 'start', on_finish=on_finish) for ref, host in
+                [('vm-1', 'host-a'), ('vm-2', 'host-a'), ('vm-3', 'host-a'),
+                 ('vm-4', 'host-b'), ('vm-5', None), ('vm-broken', None)]]
+        with patch.object(dispatcher, 'perform', perform):
+            dispatcher.submit(jobs)
+            self.assertTrue(all_finished.wait(5))
+
+        self.assertEqual({'pool': 2, 'host': 1}, peaks)
+        # Job for host-b doesn't wait for host-a jobs
+        self.assertLess(finished.index(jobs[3]), finished.index(jobs[2]))
+        self.assertEqual(('failure', 'Broken'), (jobs[5].status, jobs[5].error))
+        self.assertEqual((0, 0), (dispatcher.running, dispatcher.queued))
+        self.assertEqual({}, dispatcher._running_per_host)
+
+
+class PowerChoiceTest(unittest.TestCase):
+    def test_power_states(self):
+        from handlers.graphql.mutations.vm import choose_shutdown, choose_reboot, choose_suspend, ShutdownForce
+
+        self.assertEqual("Power state is Halted, expected: Running, Paused or Suspended", choose_shutdown({'power_state': 'Halted'}))
+        self.assertEqual("Power state is Paused, expected: Running", choose_shutdown({'power_state': 'Paused'}, ShutdownForce.CLEAN))
+        self.assertEqual('hard_shutdown', choose_shutdown({'power_state': 'Suspended'}, ShutdownForce.HARD)[0])
+        self.assertEqual("Power state is Suspended, expected: Running or Paused",
+                         choose_reboot({'power_state': 'Suspended'}, ShutdownForce.HARD))
+        self.assertEqual('clean_reboot', choose_reboot({'power_state': 'Running', '_resident_on_': 'host-1'})[0])
+        self.assertEqual("Power state is Halted, expected: Running", choose_suspend({'power_state': 'Halted'}))
+        self.assertEqual(('suspend', 'host-1'), choose_suspend({'power_state': 'Running', '_resident_on_': 'host-1'})[::3])
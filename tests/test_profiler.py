@@ -0,0 +1,54 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from profiler import Profiler
+
+
+def wait_for_profile(stop : threading.Event):
+    stop.wait(5)
+
+
+@patch.dict(os.environ, {'DOCKER': '1'})
+class ProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=wait_for_profile, args=(self.stop,), name='Waiter', daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.stop.set()
+        self.thread.join()
+        self.directory.cleanup()
+
+    def test_profile(self):
+        profiler = Profiler(directory=self.directory.name, interval=0.01, nosingleton=True)
+        future = profiler.start(0.2)
+        self.assertIs(profiler.start(0.2), future)
+        files = future.result(5)
+
+        self.assertGreater(files.samples, 1)
+        stacks = files.stacks.read_text().splitlines()
+        waiter = [line for line in stacks if line.startswith('Waiter;')]
+        self.assertEqual(len(waiter), 1)
+        stack, count = waiter[0].rsplit(' ', 1)
+        self.assertEqual(int(count), files.samples)
+        self.assertIn(';wait_for_profile (', stack)
+        self.assertFalse(any(line.startswith('Profiler;') for line in stacks))
+
+        threads = files.threads.read_text()
+        self.assertIn('Thread Waiter', threads)
+        self.assertIn('wait_for_profile', threads)
+        next_future = profiler.start(0.01)
+        self.assertIsNot(next_future, future)
+        next_future.result(5)
+
+    def test_invalid_duration(self):
+        profiler = Profiler(directory=self.directory.name, interval=0.01, nosingleton=True)
+        for duration in (float('nan'), float('inf'), 0, -1):
+            with self.assertRaises(ValueError):
+                profiler.start(duration)
+        self.assertIsNone(profiler._running)
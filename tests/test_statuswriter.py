@@ -0,0 +1,82 @@
+import os
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+from customtask.statuswriter import TaskStatusWriter
+
+
+@patch.dict(os.environ, {'DOCKER': '1'})
+class TaskStatusWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.written = []
+        self.threads = []
+        self.failures = 0 # Number of next inserts to fail
+        self.flushed = threading.Event()
+
+        def insert(records, conflict):
+            query = MagicMock()
+            if self.failures:
+                self.failures -= 1
+                query.run.side_effect = ConnectionError("RethinkDB is down")
+                return query
+            self.written.append([dict(record) for record in records])
+            self.threads.append(threading.current_thread())
+            self.flushed.set()
+            query.run.return_value = {'errors': 0, 'skipped': 0}
+            return query
+
+        db = MagicMock()
+        db.table.return_value.insert.side_effect = insert
+        self.patches = [patch('customtask.statuswriter.re.db', db), patch('customtask.statuswriter.ReDBConnection')]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def test_coalescing(self):
+        writer = TaskStatusWriter(flush_interval=0.1, table_name='tasks', nosingleton=True)
+        writer.update({'ref': 'a', 'progress': 0.1})
+        writer.update({'ref': 'a', 'progress': 0.2, 'result': 'vm'})
+        writer.update({'ref': 'b', 'progress': 0.5})
+        self.assertEqual([], self.written)
+
+        self.assertTrue(self.flushed.wait(2))
+        self.assertEqual([[{'ref': 'a', 'progress': 0.2, 'result': 'vm'}, {'ref': 'b', 'progress': 0.5}]], self.written)
+        self.assertEqual((1, 3), (writer.writes, writer.updates))
+
+    def test_urgent(self):
+        writer = TaskStatusWriter(flush_interval=60, table_name='tasks', nosingleton=True)
+        writer.update({'ref': 'a', 'progress': 0.5})
+        writer.update({'ref': 'b', 'progress': 0.3})
+        writer.update({'ref': 'a', 'status': 'success'}, urgent=True)
+
+        self.assertEqual([[{'ref': 'a', 'progress': 0.5, 'status': 'success'}, {'ref': 'b', 'progress': 0.3}]], self.written)
+        self.assertIsNone(writer._due)
+        writer.flush()
+        self.assertEqual(1, len(self.written))
+
+    def test_single_flusher_thread(self):
+        writer = TaskStatusWriter(flush_interval=0.05, table_name='tasks', nosingleton=True)
+        for progress in (0.1, 0.2):
+            self.flushed.clear()
+            writer.update({'ref': 'a', 'progress': progress})
+            self.assertTrue(self.flushed.wait(2))
+
+        self.assertEqual([[{'ref': 'a', 'progress': 0.1}], [{'ref': 'a', 'progress': 0.2}]], self.written)
+        self.assertIs(self.threads[0], self.threads[1])
+        self.assertIs(self.threads[0], writer._flusher)
+
+    def test_failed_write_is_retried(self):
+        writer = TaskStatusWriter(flush_interval=0.05, table_name='tasks', nosingleton=True)
+        self.failures = 1
+        with self.assertRaises(ConnectionError):
+            writer.update({'ref': 'a', 'status': 'success', 'progress': 0.5}, urgent=True)
+        self.assertEqual([], self.written)
+        writer.update({'ref': 'a', 'progress': 1.0})
+
+        self.assertTrue(self.flushed.wait(2))
+        self.assertEqual([[{'ref': 'a', 'status': 'success', 'progress': 1.0}]], self.written)
+        self.assertEqual(1, writer.writes)
@@ -0,0 +1,51 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from rethinkdb import RethinkDB, ast
+
+from taskcompactor import write_jsonl_archive, TaskCompactor, ARCHIVE_FILE
+
+r = RethinkDB()
+
+
+def terms(query):
+    yield query
+    for arg in list(getattr(query, '_args', [])) + list(getattr(query, 'optargs', {}).values()):
+        yield from terms(arg)
+
+
+class TaskArchiveTest(unittest.TestCase):
+    def test_append_jsonl(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'tasks.jsonl.gz')
+            created = datetime(2019, 1, 1, tzinfo=timezone.utc)
+            write_jsonl_archive(file_name, [{'ref': 'OpaqueRef:1', 'created': created}])
+            write_jsonl_archive(file_name, [{'ref': 'OpaqueRef:2', 'created': created}])
+
+            with gzip.open(file_name, 'rt', encoding='utf-8') as file:
+                docs = [json.loads(line) for line in file]
+
+        self.assertEqual(['OpaqueRef:1', 'OpaqueRef:2'], [doc['ref'] for doc in docs])
+        self.assertEqual(created.isoformat(), docs[0]['created'])
+
+    def test_invalid_settings(self):
+        with self.assertRaises(ValueError):
+            TaskCompactor(30, 100, archive='s3')
+        with self.assertRaises(ValueError):
+            TaskCompactor(30, 100, archive=ARCHIVE_FILE)
+
+    @patch.dict(os.environ, {'DOCKER': '1'})
+    @patch('taskcompactor.re.db', r.db('vmemperor'))
+    def test_overflowing_objects_query(self):
+        query = TaskCompactor(30, 100).overflowing_objects_query()
+        groups = [term for term in terms(query) if isinstance(term, ast.Group)]
+        self.assertEqual(len(groups), 1)
+        group = groups[0]
+        self.assertIsInstance(group._args[0], ast.Filter)
+        self.assertNotIn('index', group.optargs) # group(index=...) fails on anything but a table
+        self.assertEqual(group._args[1].data, 'object_ref')
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+from taskwatcher import TaskWatcher
+
+
+class AsyncConnection:
+    async def __aenter__(self):
+        return None
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+@patch.dict(os.environ, {'DOCKER': '1'})
+@patch('rethinkdb_tools.recordwatcher.ReDBConnection')
+class TaskWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def wait(self, condition, timeout=2.0):
+        async def run():
+            deadline = self.loop.time() + timeout
+            while not condition() and self.loop.time() < deadline:
+                await asyncio.sleep(0.01)
+
+        self.loop.run_until_complete(run())
+
+    def test_callbacks(self, _):
+        watcher = TaskWatcher(nosingleton=True)
+        watcher._loop = self.loop
+        watcher._wakeup = asyncio.Event(loop=self.loop)
+        results = []
+
+        threads = [threading.Thread(target=watcher.watch, args=(task_id, lambda record: results.append(record)))
+                   for task_id in ('task-1', 'task-2', 'task-2')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.wait(lambda: watcher.watched == 2)
+        self.assertEqual({'task-1', 'task-2'}, watcher._unchecked)
+        self.assertTrue(watcher._wakeup.is_set())
+
+        watcher._on_change('task-1', {'ref': 'task-1', 'status': 'pending'})
+        watcher._on_change('unknown', {'ref': 'unknown', 'status': 'success'})
+        self.assertEqual(2, watcher.watched)
+
+        success = {'ref': 'task-1', 'status': 'success', 'result': 'OpaqueRef:1'}
+        watcher._on_change('task-1', success)
+        self.wait(lambda: results)
+        self.assertEqual([success], results)
+        watcher._on_change('task-1', success)
+
+        watcher._on_change('task-2', None)
+        self.wait(lambda: len(results) == 3)
+        self.assertEqual([success, None, None], results)
+        self.assertEqual(0, watcher.watched)
+
+    def test_not_started(self, _):
+        with self.assertRaises(RuntimeError):
+            TaskWatcher(nosingleton=True).watch('task', print)
+
+    @patch('rethinkdb_tools.recordwatcher.RECONNECT_DELAY', 0.01)
+    def test_check_failure(self, connection):
+        connection.return_value.get_async_connection.side_effect = AsyncConnection
+        queried = []
+
+        async def run(conn):
+            queried.append(True)
+            if len(queried) == 1:
+                raise ConnectionError("RethinkDB is down")
+            return [{'ref': 'task-1', 'status': 'success'}]
+
+        db = MagicMock()
+        db.table.return_value.get_all.return_value.pluck.return_value.coerce_to.return_value.run.side_effect = run
+        watcher = TaskWatcher(nosingleton=True)
+        watcher._loop = self.loop
+        watcher._wakeup = asyncio.Event(loop=self.loop)
+        results = []
+        watcher._register('task-1', results.append)
+
+        with patch('rethinkdb_tools.recordwatcher.re.db', db):
+            checker = self.loop.create_task(watcher._check_unchecked())
+            self.wait(lambda: results)
+            checker.cancel()
+            self.loop.run_until_complete(asyncio.gather(checker, return_exceptions=True))
+
+        self.assertEqual(2, len(queried))
+        self.assertEqual([{'ref': 'task-1', 'status': 'success'}], results)
+        self.assertEqual(0, watcher.watched)
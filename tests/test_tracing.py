@@ -0,0 +1,64 @@
+import unittest
+from types import SimpleNamespace
+
+from metrics import CALLS
+from tornadoql.tracing import Trace
+from tornadoql.tracing_middleware import GraphQLTracing
+
+
+def make_info(trace, parent_type, field_name, *path):
+    return SimpleNamespace(context=SimpleNamespace(trace=trace), path=list(path), parent_type=parent_type,
+                           field_name=field_name, return_type='String')
+
+
+def resolve_with_calls(reql, xapi, value):
+    def resolver(root, info, *args, **kwargs):
+        CALLS.reql += reql
+        CALLS.xapi += xapi
+        return value
+    return resolver
+
+
+class TracingTest(unittest.TestCase):
+    def test_untraced_request(self):
+        info = make_info(None, 'Query', 'vms', 'vms')
+        self.assertEqual(GraphQLTracing.resolve(resolve_with_calls(1, 1, 'result'), None, info), 'result')
+
+    def test_resolvers(self):
+        trace = Trace()
+        self.assertEqual(GraphQLTracing.resolve(resolve_with_calls(2, 0, 'vms'), None,
+                                                make_info(trace, 'Query', 'vms', 'vms')), 'vms')
+        for i in range(3):
+            GraphQLTracing.resolve(resolve_with_calls(1, 1, 'vbds'), None,
+                                   make_info(trace, 'GVM', 'VBDs', 'vms', i, 'VBDs'))
+        trace.finish(100)
+
+        fields = {field['field']: field for field in trace.fields()}
+        self.assertEqual(fields['Query.vms']['count'], 1)
+        self.assertEqual(fields['Query.vms']['reql'], 2)
+        self.assertEqual(fields['Query.vms']['xapi'], 0)
+        self.assertEqual(fields['GVM.VBDs']['count'], 3)
+        self.assertEqual(fields['GVM.VBDs']['reql'], 3)
+        self.assertEqual(fields['GVM.VBDs']['xapi'], 3)
+
+        extension = trace.as_extension()
+        self.assertEqual(extension['version'], 1)
+        self.assertEqual(extension['responseSize'], 100)
+        self.assertGreaterEqual(extension['duration'], 0)
+        resolvers = extension['execution']['resolvers']
+        self.assertEqual(len(resolvers), 4)
+        self.assertEqual(resolvers[1]['path'], ['vms', 0, 'VBDs'])
+        self.assertEqual(resolvers[1]['parentType'], 'GVM')
+        self.assertEqual(resolvers[1]['reql'], 1)
+        self.assertTrue(extension['startTime'].endswith('Z'))
+
+    def test_failing_resolver(self):
+        trace = Trace()
+
+        def resolver(root, info):
+            CALLS.xapi += 1
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            GraphQLTracing.resolve(resolver, None, make_info(trace, 'Mutation', 'vmStart', 'vmStart'))
+        self.assertEqual(trace.resolvers[0].xapi, 1)
@@ -0,0 +1,43 @@
+import unittest
+
+from utils.usersearch import UserSearchIndex
+
+USERS = [
+    {'id': '1', 'username': 'jdoe', 'name': 'John Doe'},
+    {'id': '2', 'username': 'doe', 'name': 'Jane Doe'},
+    {'id': '3', 'username': 'asmith', 'name': 'Alice Smith'},
+]
+
+GROUPS = [
+    {'id': '10', 'username': 'admins', 'name': 'Administrators'},
+]
+
+
+class UserSearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = UserSearchIndex()
+        self.index.update(USERS, GROUPS)
+
+    def ids(self, *args, **kwargs):
+        return [item['id'] for item in self.index.search(*args, **kwargs)]
+
+    def test_ranking(self):
+        self.assertEqual(['users/2', 'users/1'], self.ids('doe'))
+
+    def test_short_query_matches_prefixes(self):
+        self.assertEqual(['groups/10', 'users/3'], self.ids('a'))
+        self.assertEqual([], self.ids('oe'))
+
+    def test_substring(self):
+        self.assertEqual(['groups/10'], self.ids('MINIS'))
+
+    def test_limit(self):
+        self.assertEqual(1, len(self.ids('doe', limit=1)))
+        self.assertEqual(4, len(self.ids('')))
+
+    def test_incremental_update(self):
+        self.index.update([{'id': '1', 'username': 'jdoe', 'name': 'John Roe'}, USERS[2]], GROUPS)
+        self.assertEqual(['users/1'], self.ids('roe'))
+        self.assertEqual(['users/1'], self.ids('doe'))
+        self.assertEqual(3, len(self.index))
+        self.assertEqual([], self.ids('jane'))
@@ -0,0 +1,84 @@
+import asyncio
+import os
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from xenadapter.vminstall import InstallTracker, DONE
+
+
+@patch.dict(os.environ, {'DOCKER': '1'})
+@patch('rethinkdb_tools.recordwatcher.ReDBConnection')
+class InstallTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_loop(self, condition=lambda: True, timeout=2.0):
+        async def run():
+            deadline = self.loop.time() + timeout
+            await asyncio.sleep(0)
+            while not condition() and self.loop.time() < deadline:
+                await asyncio.sleep(0.01)
+
+        self.loop.run_until_complete(run())
+
+    def make_tracker(self):
+        tracker = InstallTracker(nosingleton=True)
+        tracker._loop = self.loop
+        tracker._wakeup = asyncio.Event(loop=self.loop)
+        return tracker
+
+    @patch('xenadapter.vminstall.TaskStatusWriter')
+    def test_install(self, writer, _):
+        tracker = self.make_tracker()
+        tracker.track('task-1', 'vm-1')
+        self.run_loop()
+
+        # VM record may still say Halted right after start
+        tracker._on_change('vm-1', {'ref': 'vm-1', 'power_state': 'Halted'})
+        self.assertEqual(1, tracker.watched)
+        tracker._on_change('vm-1', {'ref': 'vm-1', 'power_state': 'Running'})
+        tracker._on_change('vm-1', {'ref': 'vm-1', 'power_state': 'Halted'})
+        self.run_loop(lambda: writer.return_value.update.called)
+
+        record, = writer.return_value.update.call_args[0]
+        self.assertEqual(('task-1', 'success', DONE), (record['ref'], record['status'], record['install']['state']))
+        self.assertEqual(0, tracker.watched)
+        self.assertEqual(set(), tracker._started)
+
+    @patch('xenadapter.vminstall.TaskStatusWriter')
+    def test_resumed(self, writer, _):
+        tracker = self.make_tracker()
+        tracker.track('task-1', 'vm-1', started=True)
+        self.run_loop()
+        tracker._on_change('vm-1', {'ref': 'vm-1', 'power_state': 'Halted'})
+        self.run_loop(lambda: writer.return_value.update.called)
+        self.assertEqual(0, tracker.watched)
+
+    @patch('xenadapter.vminstall.TaskStatusWriter')
+    def test_started_with_start_time(self, writer, _):
+        tracker = self.make_tracker()
+        previous_run, this_run = datetime(2019, 1, 1, tzinfo=timezone.utc), datetime(2019, 1, 2, tzinfo=timezone.utc)
+        tracker.track('task-1', 'vm-1', started=True, start_time=this_run)
+        self.run_loop()
+
+        # Stale record written before the VM was started
+        tracker._on_change('vm-1', {'ref': 'vm-1', 'power_state': 'Halted', 'start_time': previous_run})
+        self.assertEqual(1, tracker.watched)
+        # A short run may never be recorded as Running
+        tracker._on_change('vm-1', {'ref': 'vm-1', 'power_state': 'Halted', 'start_time': this_run})
+        self.run_loop(lambda: writer.return_value.update.called)
+        self.assertEqual(0, tracker.watched)
+        self.assertEqual({}, tracker._start_times)
+
+    def test_removed(self, _):
+        tracker = self.make_tracker()
+        with patch.object(InstallTracker, 'fail') as fail:
+            tracker.track('task-1', 'vm-1')
+            self.run_loop()
+            tracker._on_change('vm-1', None)
+            self.run_loop(lambda: fail.called)
+        fail.assert_called_once_with('task-1', 'VM vm-1 has been removed while installing')
@@ -0,0 +1,106 @@
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, call, patch
+
+from warmpool import WarmPool, WarmPoolSpec, load_specs
+from xenadapter.vdi import VDI
+from xenadapter.vm import VM
+
+DISKS = (('sr-1', 10 * 2 ** 30),)
+
+
+@patch.dict(os.environ, {'DOCKER': '1'})
+class WarmPoolTest(unittest.TestCase):
+    def make_pool(self, *sizes):
+        specs = [WarmPoolSpec(name=f'pool-{i}', template=f'template-{i}', size=size, disks=DISKS)
+                 for i, size in enumerate(sizes)]
+        pool = WarmPool(specs, max_building=2, nosingleton=True)
+        pool._executor = MagicMock()
+        return pool
+
+    def test_load_specs(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as file:
+            json.dump([{'name': 'ubuntu', 'template': 'template-0', 'size': 2,
+                        'disks': [{'SR': 'sr-1', 'size': 10 * 2 ** 30}]}], file)
+            file.flush()
+            spec, = load_specs(file.name)
+            self.assertEqual(WarmPoolSpec('ubuntu', 'template-0', 2, DISKS), spec)
+
+            file.seek(0)
+            json.dump([{'name': 'ubuntu', 'template': 'template-0', 'size': 1}] * 2, file)
+            file.truncate()
+            file.flush()
+            with self.assertRaises(ValueError):
+                load_specs(file.name)
+
+    def test_claim_and_refill(self):
+        pool = self.make_pool(2, 1)
+        pool.refill()
+        self.assertEqual(3, pool.building)
+        self.assertEqual(3, pool._executor.submit.call_count)
+        pool.refill()
+        self.assertEqual(3, pool._executor.submit.call_count)
+
+        pool._building = {'pool-0': 0, 'pool-1': 0}
+        pool._ready = {'pool-0': ['vm-1', 'vm-2'], 'pool-1': ['vm-3']}
+        self.assertIsNone(pool.claim('template-0', [('sr-1', 2 ** 30)]))
+        self.assertIsNone(pool.claim('template-2', DISKS))
+        self.assertEqual(0, pool.building)
+
+        self.assertEqual('vm-1', pool.claim('template-0', [('sr-1', float(10 * 2 ** 30))]))
+        self.assertEqual(1, pool.building)
+        self.assertEqual('vm-3', pool.claim('template-1', DISKS))
+        self.assertIsNone(pool.claim('template-1', DISKS))
+        self.assertEqual(2, pool.building)
+        self.assertEqual(1, pool.ready)
+
+    def test_scan(self):
+        pool = self.make_pool(1)
+        xen = MagicMock()
+        ready = {VM.WARM_POOL_KEY: 'pool-0', VM.WARM_POOL_READY_KEY: 'true'}
+        xen.api.VM.get_all_records_where.return_value = {
+            'vm-1': {'other_config': ready, 'power_state': 'Halted'},
+            'vm-2': {'other_config': ready, 'power_state': 'Halted'},
+            'vm-3': {'other_config': {VM.WARM_POOL_KEY: 'pool-0'}, 'power_state': 'Halted'},
+            'vm-4': {'other_config': {**ready, VM.WARM_POOL_KEY: 'removed'}, 'power_state': 'Halted'},
+            'vm-5': {'other_config': {}, 'power_state': 'Running'},
+        }
+        with patch.object(WarmPool, 'destroy') as destroy:
+            pool.scan(xen)
+        self.assertEqual({'pool-0': ['vm-1']}, pool._ready)
+        self.assertEqual(['vm-2', 'vm-3', 'vm-4'], [call[0][1] for call in destroy.call_args_list])
+
+    def test_warm_vms_are_not_stored(self):
+        record = {'is_a_template': False, 'is_control_domain': False, 'is_a_snapshot': False, 'other_config': {}}
+        self.assertTrue(VM.filter_record(None, record, 'vm-1'))
+        record['other_config'] = {VM.WARM_POOL_KEY: 'pool-0'}
+        self.assertFalse(VM.filter_record(None, record, 'vm-1'))
+
+    def test_warm_disks_are_not_stored(self):
+        record = {'is_a_snapshot': False, 'type': 'user', 'other_config': {}}
+        self.assertTrue(VDI.filter_record(None, record, 'vdi-1'))
+        record['other_config'] = {VDI.WARM_POOL_KEY: 'pool-0'}
+        self.assertFalse(VDI.filter_record(None, record, 'vdi-1'))
+
+    def test_disk_marks(self):
+        xen = MagicMock()
+        xen.api.VBD.get_all_records_where.return_value = {
+            'vbd-1': {'type': 'Disk', 'VDI': 'vdi-1'},
+            'vbd-2': {'type': 'CD', 'VDI': 'vdi-2'},
+            'vbd-3': {'type': 'Disk', 'VDI': 'OpaqueRef:NULL'},
+        }
+        pool = self.make_pool(1)
+        vm = MagicMock(ref='vm-1')
+        with patch('xenadapter.template.Template') as template, patch('xenadapter.sr.SR'):
+            template.return_value.clone_as_vm.return_value = vm
+            self.assertEqual('vm-1', pool.build(xen, pool.specs['pool-0']))
+        xen.api.VDI.add_to_other_config.assert_called_once_with('vdi-1', VDI.WARM_POOL_KEY, 'pool-0')
+
+        VM.leave_warm_pool(SimpleNamespace(xen=xen, ref='vm-1', log=MagicMock(), disk_vdis=VM.disk_vdis,
+                                           WARM_POOL_KEY=VM.WARM_POOL_KEY, WARM_POOL_READY_KEY=VM.WARM_POOL_READY_KEY))
+        xen.api.VDI.remove_from_other_config.assert_called_once_with('vdi-1', VDI.WARM_POOL_KEY)
+        xen.api.VM.remove_from_other_config.assert_has_calls([call('vm-1', VM.WARM_POOL_READY_KEY),
+                                                              call('vm-1', VM.WARM_POOL_KEY)])
@@ -0,0 +1,120 @@
+import os
+import time
+import unittest
+from unittest.mock import patch
+
+import XenAPI
+import provision
+from xenadapter.xenobject import get_real_value
+from xentools.xapisim import XAPIServer, XAPISimulator, LoadGenerator, populate
+
+
+@patch.dict(os.environ, {'DOCKER': '1'})
+class XAPISimulatorTest(unittest.TestCase):
+    def setUp(self):
+        self.simulator = XAPISimulator(task_duration=0)
+        self.refs = populate(self.simulator, hosts=2, vms=5, templates=1, seed=1)
+        self.server = XAPIServer(self.simulator)
+        self.server.start()
+        self.session = XenAPI.Session(self.server.url)
+        self.session.xenapi.login_with_password('root', 'password')
+        self.api = self.session.xenapi
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def wait_task(self, task):
+        deadline = time.monotonic() + 2
+        while self.api.task.get_status(task) == 'pending' and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.api.task.get_record(task)
+
+    def test_records_match_schema(self):
+        from xenadapter.vm import VM
+        from xenadapter.host import Host
+        from xenadapter.sr import SR
+        from xenadapter.vdi import VDI
+        from xenadapter.vbd import VBD
+        from xenadapter.vif import VIF
+        from xenadapter.network import Network
+        from xenadapter.template import Template
+
+        self.assertEqual('2.7', self.session.API_version)
+        for cls in (VM, Host, SR, VDI, VBD, VIF, Network):
+            records = getattr(self.api, cls.api_class).get_all_records()
+            self.assertTrue(records, cls)
+            for ref, record in records.items():
+                if cls is VM and record['is_a_template']:
+                    self.assertTrue(Template.filter_record(None, record, ref))
+                    continue
+                self.assertTrue(cls.filter_record(None, record, ref), (cls, record))
+                {k: get_real_value(k, v, cls.GraphQLType) for k, v in record.items() if k in cls.GraphQLType._meta.fields}
+
+        vms = self.api.VM.get_all_records_where('field "is_a_template" = "false"')
+        self.assertEqual(set(self.refs['VM']), set(vms))
+
+    def test_events(self):
+        initial = self.api.event_from(['vm', 'vbd'], '', 1.0)
+        self.assertEqual({'add'}, {event['operation'] for event in initial['events']})
+        self.assertEqual(len(self.refs['VM']) + len(self.refs['template']) + len(self.simulator.objects['VBD']),
+                         len(initial['events']))
+
+        vm = self.refs['VM'][0]
+        self.api.VM.set_name_label(vm, 'first')
+        self.api.VM.set_name_label(vm, 'second')
+        self.api.VM.add_to_other_config(vm, 'key', 'value')
+        self.api.host.set_name_label(self.refs['host'][0], 'host')
+        changes = self.api.event_from(['vm'], initial['token'], 1.0)
+        event, = changes['events']
+        self.assertEqual(('mod', vm, 'second', {'key': 'value'}),
+                         (event['operation'], event['ref'], event['snapshot']['name_label'],
+                          event['snapshot']['other_config']))
+
+        start = time.monotonic()
+        self.assertEqual([], self.api.event_from(['vm'], changes['token'], 0.2)['events'])
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+        self.simulator._events.clear()
+        with self.assertRaises(XenAPI.Failure) as failure:
+            self.api.event_from(['vm'], initial['token'], 0.1)
+        self.assertEqual(['EVENTS_LOST'], failure.exception.details)
+
+    def test_async_power(self):
+        vm = next(ref for ref in self.refs['VM'] if self.api.VM.get_power_state(ref) == 'Halted')
+        record = self.wait_task(self.api.Async.VM.start(vm, False, False))
+        self.assertEqual('success', record['status'])
+        self.assertEqual('Running', self.api.VM.get_power_state(vm))
+        host = self.api.VM.get_resident_on(vm)
+        self.assertIn(vm, self.api.host.get_resident_VMs(host))
+        self.assertEqual({}, self.api.VM.get_current_operations(vm))
+
+        record = self.wait_task(self.api.Async.VM.start(vm, False, False))
+        self.assertEqual(('failure', 'VM_BAD_POWER_STATE'), (record['status'], record['error_info'][0]))
+
+    def test_clone_and_provision(self):
+        template = self.refs['template'][0]
+        vm = self.api.VM.clone(template, 'new')
+        spec = provision.ProvisionSpec()
+        sr = self.refs['SR'][0]
+        spec.disks.append(provision.Disk('0', str(2 ** 30), self.api.SR.get_uuid(sr), True))
+        provision.setProvisionSpec(self.session, vm, spec)
+        self.api.VM.provision(vm)
+
+        vbd, = self.api.VBD.get_all_records_where(f'field "VM" = "{vm}"').values()
+        self.assertEqual(str(2 ** 30), self.api.VDI.get_virtual_size(vbd['VDI']))
+        self.assertIn(vbd['VDI'], self.api.SR.get_VDIs(sr))
+
+        self.api.VDI.destroy(vbd['VDI'])
+        self.assertEqual([], self.api.VM.get_VBDs(vm))
+        self.api.VM.destroy(vm)
+        with self.assertRaises(XenAPI.Failure):
+            self.api.VM.get_record(vm)
+
+    def test_load(self):
+        token = self.api.event_from(['*'], '', 1.0)['token']
+        generator = LoadGenerator(self.simulator, rate=100, seed=1)
+        for _ in range(20):
+            generator.step()
+        self.assertEqual(20, generator.changes)
+        self.assertTrue(self.api.event_from(['*'], token, 1.0)['events'])